@@ -0,0 +1,104 @@
+"""近似最近傍（IVF-flat）インデックスのベンチマーク
+
+クラスタ構造を持つ合成ベクトルでNumpyVectorStoreを構築し、nlistごとの学習・割り当て時間と
+nprobeごとの recall@k（総当たり検索が基準）・p50/p99レイテンシを表示する。
+
+    python benchmarks/bench_ann.py --chunks 500000 --nlist 1024 2048 --nprobe 8 16 32 64
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.models.numpy_vector_store import NumpyVectorStore
+
+
+class PrecomputedEmbeddings(Embeddings):
+    def __init__(self, vectors: np.ndarray):
+        self.vectors = vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.vectors[[int(t) for t in texts]].tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.vectors[int(text)].tolist()
+
+
+def make_vectors(n: int, dim: int, clusters: int, noise: float, rng) -> np.ndarray:
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, n)
+    return centers[labels] + noise * rng.standard_normal((n, dim)).astype(np.float32)
+
+
+def timed_search(store: NumpyVectorStore, queries: np.ndarray, k: int):
+    results, times = [], []
+    for query in queries:
+        start = time.perf_counter()
+        rows = store._top_rows(query, k)
+        times.append(time.perf_counter() - start)
+        results.append({row for row, _ in rows})
+    p50, p99 = np.percentile(np.array(times) * 1000, [50, 99])
+    return results, p50, p99
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chunks", type=int, default=200_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=1000)
+    parser.add_argument("--noise", type=float, default=0.5, help="クラスタ中心からのばらつき（大きいほど難しい）")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, nargs="+", default=[256, 1024])
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 8, 16, 32, 64])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = make_vectors(args.chunks, args.dim, args.clusters, args.noise, rng)
+    queries = make_vectors(args.queries, args.dim, args.clusters, args.noise, np.random.default_rng(1))
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    directory = tempfile.mkdtemp(prefix="bench_ann_")
+    try:
+        # 学習は明示的に行うため、自動学習の閾値は件数より大きくしておく
+        store = NumpyVectorStore(
+            directory, PrecomputedEmbeddings(vectors), index="ivf", ivf_min_train_rows=args.chunks + 1
+        )
+        for start in range(0, args.chunks, 10_000):
+            ids = [str(i) for i in range(start, min(start + 10_000, args.chunks))]
+            store.add_texts(ids, [{}] * len(ids), ids)
+
+        ivf, store.index = store.index, None
+        exact, p50, p99 = timed_search(store, queries, args.k)
+        store.index = ivf
+
+        print(f"chunks: {args.chunks:,}  dim: {args.dim}  k: {args.k}")
+        print(f"{'index':<8}{'nlist':>7}{'build s':>9}{'nprobe':>8}{'p50 ms':>9}{'p99 ms':>9}{'recall@k':>10}")
+        print(f"{'flat':<8}{'-':>7}{'-':>9}{'-':>8}{p50:>9.2f}{p99:>9.2f}{1.0:>10.3f}")
+
+        for nlist in args.nlist:
+            # 再構築は同じ設定の新しいインデックスを作って差し替える
+            store.index.nlist = nlist
+            start = time.perf_counter()
+            store.build_ann_index()
+            build_seconds = time.perf_counter() - start
+            for nprobe in args.nprobe:
+                store.index.nprobe = nprobe
+                results, p50, p99 = timed_search(store, queries, args.k)
+                recall = np.mean([len(r & e) / args.k for r, e in zip(results, exact)])
+                print(f"{'ivf':<8}{nlist:>7}{build_seconds:>9.1f}{nprobe:>8}{p50:>9.2f}{p99:>9.2f}{recall:>10.3f}")
+        store.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""連続バッチングのベンチマーク
+
+ランダム初期化の小さなLlamaで、同時に届いたリクエストを1件ずつmodel.generateで
+処理する場合（GenerationExecutor, max_workers=1）とContinuousBatchSchedulerで
+まとめてデコードする場合の合計tokens/secとレイテンシ（p50/p99）を比較する。
+生成するトークン数はリクエストごとにばらつかせ、途中での追加・除外が起きるようにする。
+
+    python benchmarks/bench_batch_scheduler.py --requests 64 --concurrency 16 --max-batch-size 16
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import numpy as np
+import torch
+from transformers import LlamaConfig, LlamaForCausalLM
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.models.batch_scheduler import ContinuousBatchScheduler, SamplingParams
+from src.models.generation_executor import GenerationExecutor
+
+
+def build_model(args):
+    torch.manual_seed(0)
+    config = LlamaConfig(
+        vocab_size=args.vocab_size,
+        hidden_size=args.hidden_size,
+        intermediate_size=args.hidden_size * 4,
+        num_hidden_layers=args.layers,
+        num_attention_heads=args.hidden_size // 64,
+        num_key_value_heads=max(1, args.hidden_size // 256),
+        max_position_embeddings=4096,
+        pad_token_id=0,
+        eos_token_id=None,
+        bos_token_id=None
+    )
+    model = LlamaForCausalLM(config).eval()
+    model.generation_config.eos_token_id = None
+    model.generation_config.pad_token_id = 0
+    return model
+
+
+def make_requests(args):
+    rng = np.random.default_rng(0)
+    requests = []
+    for _ in range(args.requests):
+        prompt = rng.integers(1, args.vocab_size, size=int(rng.integers(args.min_prompt, args.max_prompt))).tolist()
+        requests.append((prompt, int(rng.integers(args.min_new_tokens, args.max_new_tokens))))
+    return requests
+
+
+async def run_clients(submit, requests, concurrency: int):
+    latencies, tokens = [], 0
+    pending = iter(requests)
+
+    async def client():
+        nonlocal tokens
+        for prompt, max_new_tokens in pending:
+            start = time.perf_counter()
+            tokens += await submit(prompt, max_new_tokens)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies = np.array(latencies) * 1000
+    return tokens / elapsed, np.percentile(latencies, 50), np.percentile(latencies, 99)
+
+
+async def main_async(args):
+    torch.set_num_threads(args.threads or torch.get_num_threads())
+    model = build_model(args)
+    requests = make_requests(args)
+
+    executor = GenerationExecutor(max_workers=1, max_queue=len(requests))
+
+    def generate_one(prompt, max_new_tokens):
+        with torch.inference_mode():
+            output = model.generate(
+                torch.tensor([prompt]), max_new_tokens=max_new_tokens, do_sample=True,
+                temperature=0.7, top_p=0.9
+            )
+        return output.shape[1] - len(prompt)
+
+    async def sequential(prompt, max_new_tokens):
+        return (await executor.run(generate_one, prompt, max_new_tokens)).output
+
+    scheduler = ContinuousBatchScheduler(
+        model, max_batch_size=args.max_batch_size, max_queue=len(requests), eos_token_ids=[]
+    )
+
+    async def batched(prompt, max_new_tokens):
+        params = SamplingParams(max_new_tokens=max_new_tokens, temperature=0.7, top_p=0.9)
+        return len((await scheduler.submit(prompt, params)).token_ids)
+
+    # ウォームアップ
+    await sequential(requests[0][0], 4)
+    await batched(requests[0][0], 4)
+
+    print(f"{'mode':>13} {'tokens/s':>10} {'p50 ms':>10} {'p99 ms':>10}")
+    for name, submit in (("one-at-a-time", sequential), ("continuous", batched)):
+        tokens_per_second, p50, p99 = await run_clients(submit, requests, args.concurrency)
+        print(f"{name:>13} {tokens_per_second:>10.1f} {p50:>10.1f} {p99:>10.1f}")
+
+    metrics = scheduler.get_metrics()
+    print(f"mean decode batch size: {metrics['batch_size_histogram']['mean']:.1f}, "
+          f"steps: {metrics['steps']}, prefills: {metrics['prefills']}")
+    scheduler.stop()
+    executor.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--max-batch-size", type=int, default=16)
+    parser.add_argument("--min-prompt", type=int, default=32)
+    parser.add_argument("--max-prompt", type=int, default=256)
+    parser.add_argument("--min-new-tokens", type=int, default=16)
+    parser.add_argument("--max-new-tokens", type=int, default=128)
+    parser.add_argument("--hidden-size", type=int, default=512)
+    parser.add_argument("--layers", type=int, default=8)
+    parser.add_argument("--vocab-size", type=int, default=32000)
+    parser.add_argument("--threads", type=int, default=0)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
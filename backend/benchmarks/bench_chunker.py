@@ -0,0 +1,94 @@
+"""チャンカーのマイクロベンチマーク
+
+従来のdecode方式（ウィンドウごとにtokenizer.decode）と
+オフセットマッピング方式（TokenChunker）を比較する。
+
+    python benchmarks/bench_chunker.py --docs 50 --paragraphs 200
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from transformers import AutoTokenizer
+
+from src.models.chunker import TokenChunker
+
+SENTENCES = [
+    "Pythonは汎用のプログラミング言語であり、コードの可読性を重視して設計されている。",
+    "機械学習はデータから規則性を学習し、予測や分類を行う手法の総称である。",
+    "Python is a high-level, general-purpose programming language.",
+    "Its design philosophy emphasizes code readability with the use of significant indentation.",
+    "アセトアミノフェンは解熱鎮痛薬の一種で、頭痛や発熱の緩和に用いられる。",
+    "Error code E1102 indicates that the connection to the upstream server timed out.",
+]
+
+
+def make_document(paragraphs: int, rng: random.Random) -> str:
+    return "\n\n".join(
+        " ".join(rng.choice(SENTENCES) for _ in range(rng.randint(2, 6)))
+        for _ in range(paragraphs)
+    )
+
+
+def legacy_chunk_text(tokenizer, text: str, chunk_size: int, chunk_overlap: int):
+    """従来のRAGSystem.chunk_textの実装"""
+    tokens = tokenizer.encode(text)
+    chunks = []
+    start = 0
+    while start < len(tokens):
+        chunks.append(tokenizer.decode(tokens[start:start + chunk_size], skip_special_tokens=True))
+        start += chunk_size - chunk_overlap
+    return chunks
+
+
+def timed(fn, repeat: int):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tokenizer", default="intfloat/multilingual-e5-small")
+    parser.add_argument("--docs", type=int, default=20)
+    parser.add_argument("--paragraphs", type=int, default=200)
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--chunk-overlap", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    tokenizer = AutoTokenizer.from_pretrained(args.tokenizer)
+    rng = random.Random(0)
+    docs = [make_document(args.paragraphs, rng) for _ in range(args.docs)]
+    total_chars = sum(len(doc) for doc in docs)
+    chunker = TokenChunker(tokenizer, args.chunk_size, args.chunk_overlap)
+
+    legacy_time, legacy_chunks = timed(
+        lambda: [legacy_chunk_text(tokenizer, doc, args.chunk_size, args.chunk_overlap) for doc in docs],
+        args.repeat
+    )
+    single_time, single_chunks = timed(lambda: [chunker.chunk(doc) for doc in docs], args.repeat)
+    batch_time, batch_chunks = timed(lambda: chunker.chunk_many(docs), args.repeat)
+
+    print(f"documents: {len(docs)}, characters: {total_chars:,}")
+    print(f"{'method':<24}{'seconds':>10}{'MB/s':>10}{'chunks':>10}")
+    for name, seconds, chunks in [
+        ("decode per window", legacy_time, legacy_chunks),
+        ("offsets (per doc)", single_time, single_chunks),
+        ("offsets (batched)", batch_time, batch_chunks),
+    ]:
+        count = sum(len(c) for c in chunks)
+        print(f"{name:<24}{seconds:>10.4f}{total_chars / seconds / 1e6:>10.2f}{count:>10}")
+    print(f"speedup (batched vs decode): {legacy_time / batch_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
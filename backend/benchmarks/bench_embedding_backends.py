@@ -0,0 +1,91 @@
+"""埋め込みバックエンドのベンチマーク
+
+同じチャンク集合に対して各バックエンドのスループット（chunks/sec）と
+単一クエリのレイテンシ（p50/p99）を計測し、sentence-transformers（基準）との
+最大コサイン距離が許容値（COMPATIBILITY_TOLERANCE）に収まるかを表示する。
+
+    python benchmarks/bench_embedding_backends.py --backends sentence_transformers onnx onnx_int8 torch_int8 --threads 4
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.models.embedding_backends import COMPATIBILITY_TOLERANCE, create_embeddings, max_cosine_distance
+from src.utils.rag_config import RAG_CONFIG
+
+SENTENCES = [
+    "Pythonは汎用のプログラミング言語であり、コードの可読性を重視して設計されている。",
+    "機械学習はデータから規則性を学習し、予測や分類を行う手法の総称である。",
+    "Python is a high-level, general-purpose programming language.",
+    "Its design philosophy emphasizes code readability with the use of significant indentation.",
+    "アセトアミノフェンは解熱鎮痛薬の一種で、頭痛や発熱の緩和に用いられる。",
+    "Error code E1102 indicates that the connection to the upstream server timed out.",
+]
+QUERIES = ["Pythonの特徴は？", "アセトアミノフェンの副作用", "What does error E1102 mean?"]
+
+
+def make_chunks(n: int, rng: random.Random):
+    """実際のチャンクに近い、長さのばらつきがあるテキスト"""
+    return [" ".join(rng.choice(SENTENCES) for _ in range(rng.randint(1, 12))) for _ in range(n)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--backends", nargs="+",
+                        default=["sentence_transformers", "torch", "torch_int8", "onnx", "onnx_int8"])
+    parser.add_argument("--chunks", type=int, default=512)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--threads", type=int, default=0)
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--queries", type=int, default=50)
+    args = parser.parse_args()
+
+    model_name = RAG_CONFIG['embedding_model']
+    chunks = make_chunks(args.chunks, random.Random(0))
+    config = {
+        **RAG_CONFIG['embedding'],
+        'device': args.device,
+        'batch_size': args.batch_size,
+        'num_threads': args.threads,
+    }
+
+    reference = create_embeddings(model_name, {**config, 'backend': 'sentence_transformers'})
+    print(f"model: {model_name}  chunks: {args.chunks}  batch: {args.batch_size}  threads: {args.threads or 'default'}")
+    print(f"{'backend':<24}{'load s':>8}{'chunks/s':>10}{'query p50':>11}{'query p99':>11}{'max dist':>10}  compatible")
+
+    for backend in args.backends:
+        start = time.perf_counter()
+        embeddings = reference if backend == 'sentence_transformers' else create_embeddings(
+            model_name, {**config, 'backend': backend}
+        )
+        load_seconds = time.perf_counter() - start
+
+        embeddings.embed_documents(chunks[:args.batch_size])  # ウォームアップ
+        start = time.perf_counter()
+        embeddings.embed_documents(chunks)
+        throughput = len(chunks) / (time.perf_counter() - start)
+
+        latencies = []
+        for i in range(args.queries):
+            start = time.perf_counter()
+            embeddings.embed_query(QUERIES[i % len(QUERIES)])
+            latencies.append(time.perf_counter() - start)
+        p50, p99 = np.percentile(np.array(latencies) * 1000, [50, 99])
+
+        distance = max_cosine_distance(embeddings, reference, chunks[:128] + QUERIES)
+        tolerance = COMPATIBILITY_TOLERANCE[backend]
+        compatible = "yes" if distance <= max(tolerance, 1e-6) else f"NO (> {tolerance})"
+        print(
+            f"{backend:<24}{load_seconds:>8.1f}{throughput:>10.1f}{p50:>9.1f}ms{p99:>9.1f}ms"
+            f"{distance:>10.2e}  {compatible}"
+        )
+
+
+if __name__ == "__main__":
+    main()
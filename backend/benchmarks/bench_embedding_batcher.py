@@ -0,0 +1,100 @@
+"""クエリ埋め込みのマイクロバッチのベンチマーク
+
+同時接続数ごとに、1クエリずつ埋め込む場合（スレッドで並列実行）とEmbeddingBatcherで
+まとめる場合のスループットとレイテンシ（p50/p99）を比較する。
+既定では行列積で順伝播のコストを模した埋め込みを使い、--backend を指定すると
+実際の埋め込みモデル（RAG_CONFIG['embedding']の設定）を使う。
+
+    python benchmarks/bench_embedding_batcher.py --concurrency 1 8 32 64 --requests 512
+    python benchmarks/bench_embedding_batcher.py --backend onnx
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from typing import List
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.models.embedding_batcher import EmbeddingBatcher
+
+
+class SyntheticEmbeddings:
+    """e5-small相当の行列サイズの全結合層をlayers回通す埋め込み（計算量のみを模す）"""
+
+    def __init__(self, dim: int = 384, hidden: int = 1536, seq_len: int = 32, layers: int = 4):
+        rng = np.random.default_rng(0)
+        self.w1 = rng.standard_normal((dim, hidden)).astype(np.float32) / np.sqrt(dim)
+        self.w2 = rng.standard_normal((hidden, dim)).astype(np.float32) / np.sqrt(hidden)
+        self.dim = dim
+        self.seq_len = seq_len
+        self.layers = layers
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        x = np.ones((len(texts) * self.seq_len, self.dim), dtype=np.float32)
+        for _ in range(self.layers):
+            x = np.maximum(x @ self.w1, 0) @ self.w2
+            x /= np.linalg.norm(x, axis=1, keepdims=True)
+        pooled = x.reshape(len(texts), self.seq_len, self.dim).mean(axis=1)
+        return pooled.tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+async def run_load(embed, concurrency: int, n_requests: int):
+    latencies = []
+    counter = iter(range(n_requests))
+
+    async def client():
+        for i in counter:
+            start = time.perf_counter()
+            await embed(f"query {i}")
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies = np.array(latencies) * 1000
+    return n_requests / elapsed, np.percentile(latencies, 50), np.percentile(latencies, 99)
+
+
+async def main_async(args):
+    if args.backend:
+        from src.models.embedding_backends import create_embeddings
+        from src.utils.rag_config import RAG_CONFIG
+        config = dict(RAG_CONFIG['embedding'], backend=args.backend)
+        embeddings = create_embeddings(RAG_CONFIG['embedding_model'], config)
+    else:
+        embeddings = SyntheticEmbeddings()
+    embeddings.embed_documents(["warm up"] * 4)
+
+    print(f"{'concurrency':>11} {'mode':>8} {'qps':>9} {'p50 ms':>8} {'p99 ms':>8} {'mean batch':>10}")
+    for concurrency in args.concurrency:
+        single = await run_load(
+            lambda text: asyncio.to_thread(embeddings.embed_query, text), concurrency, args.requests
+        )
+        batcher = EmbeddingBatcher(embeddings.embed_documents, args.max_batch_size, args.max_wait_ms)
+        batched = await run_load(batcher.embed, concurrency, args.requests)
+        mean_batch = batcher.get_metrics()["batch_size_histogram"]["mean"]
+        await batcher.close()
+
+        for mode, (qps, p50, p99), batch in (("single", single, 1.0), ("batched", batched, mean_batch)):
+            print(f"{concurrency:>11} {mode:>8} {qps:>9.1f} {p50:>8.2f} {p99:>8.2f} {batch:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 64])
+    parser.add_argument("--requests", type=int, default=512)
+    parser.add_argument("--max-batch-size", type=int, default=32)
+    parser.add_argument("--max-wait-ms", type=float, default=2.0)
+    parser.add_argument("--backend", default=None, help="実モデルを使う場合の埋め込みバックエンド")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
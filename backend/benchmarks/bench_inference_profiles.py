@@ -0,0 +1,106 @@
+"""LLMの推論プロファイルのベンチマーク（CPU）
+
+小さいランダム初期化のLlamaを一時ディレクトリに保存し、プロファイルごとに別プロセスで
+load_causal_lm で読み込んで、モデルの重みのバイト数・プロセスの常駐メモリ（RSS）・
+ウォームアップ後の貪欲法デコードの tokens/sec を比較する。
+--model に実際のモデル（パスまたはHugging FaceのID）を指定するとそのモデルで計測する。
+
+    python benchmarks/bench_inference_profiles.py --profiles fp32 bf16 int8 --threads 4
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.models.inference_profiles import (
+    configure_threads, load_causal_lm, model_memory_bytes, resident_memory_bytes, resolve_profile
+)
+
+
+def save_tiny_model(args, directory: str) -> str:
+    import torch
+    from transformers import LlamaConfig, LlamaForCausalLM
+
+    torch.manual_seed(0)
+    config = LlamaConfig(
+        vocab_size=args.vocab_size,
+        hidden_size=args.hidden_size,
+        intermediate_size=args.hidden_size * 4,
+        num_hidden_layers=args.layers,
+        num_attention_heads=args.hidden_size // 64,
+        num_key_value_heads=max(1, args.hidden_size // 256),
+        max_position_embeddings=4096,
+        pad_token_id=0,
+        eos_token_id=None,
+        bos_token_id=None
+    )
+    LlamaForCausalLM(config).save_pretrained(directory)
+    return directory
+
+
+def run_profile(model_path: str, profile_name: str, args) -> dict:
+    """1つのプロファイルを計測（RSSを分けるため子プロセスで実行する）"""
+    import torch
+
+    configure_threads(args.threads)
+    profile = resolve_profile(profile_name)
+    baseline_rss = resident_memory_bytes()
+    start = time.perf_counter()
+    model = load_causal_lm(model_path, profile)
+    load_seconds = time.perf_counter() - start
+
+    prompt = torch.randint(1, 1000, (1, args.prompt_tokens))
+
+    def generate():
+        with torch.inference_mode():
+            model.generate(
+                prompt, max_new_tokens=args.new_tokens, min_new_tokens=args.new_tokens,
+                do_sample=False, pad_token_id=0
+            )
+
+    generate()  # ウォームアップ
+    times = []
+    for _ in range(args.repeats):
+        start = time.perf_counter()
+        generate()
+        times.append(time.perf_counter() - start)
+    return {
+        "profile": profile_name,
+        "load_s": load_seconds,
+        "model_mb": model_memory_bytes(model) / 1024 ** 2,
+        "rss_mb": resident_memory_bytes() / 1024 ** 2,
+        "rss_delta_mb": (resident_memory_bytes() - baseline_rss) / 1024 ** 2,
+        "tokens_per_s": args.new_tokens / sorted(times)[len(times) // 2],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default=None)
+    parser.add_argument("--profiles", nargs="+", default=["fp32", "bf16", "int8"])
+    parser.add_argument("--prompt-tokens", type=int, default=128)
+    parser.add_argument("--new-tokens", type=int, default=32)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--hidden-size", type=int, default=512)
+    parser.add_argument("--layers", type=int, default=8)
+    parser.add_argument("--vocab-size", type=int, default=32000)
+    parser.add_argument("--threads", type=int, default=0)
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as directory:
+        model_path = args.model or save_tiny_model(args, directory)
+        print(f"{'profile':>8} {'load s':>8} {'model MB':>9} {'RSS MB':>8} {'+RSS MB':>8} {'tokens/s':>9}")
+        for profile_name in args.profiles:
+            with context.Pool(1) as pool:
+                result = pool.apply(run_profile, (model_path, profile_name, args))
+            print(f"{result['profile']:>8} {result['load_s']:>8.2f} {result['model_mb']:>9.1f} "
+                  f"{result['rss_mb']:>8.1f} {result['rss_delta_mb']:>8.1f} {result['tokens_per_s']:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
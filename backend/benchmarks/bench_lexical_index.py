@@ -0,0 +1,111 @@
+"""語彙インデックス（BM25）と密ベクトル検索のレイテンシ比較
+
+合成コーパスでインデックスを構築し、クエリごとのレイテンシ（p50/p99）を
+密ベクトルのみ（NumPyの全件内積）・BM25のみ・ハイブリッド（両方＋RRF）で測定する。
+
+    python benchmarks/bench_lexical_index.py --chunks 200000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.models.lexical_index import LexicalIndex, reciprocal_rank_fusion
+
+KANA = "あいうえおかきくけこさしすせそたちつてとなにぬねのはひふへほまみむめもやゆよらりるれろわん"
+KANJI = "薬剤症状治療副作用発熱頭痛検査診断患者医師病院血圧心臓肝臓腎臓"
+
+
+def make_vocab(size: int, rng: random.Random):
+    english = [
+        "".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(3, 10)))
+        for _ in range(size)
+    ]
+    japanese = [
+        "".join(rng.choice(KANJI + KANA) for _ in range(rng.randint(2, 5)))
+        for _ in range(size // 4)
+    ]
+    return english, japanese
+
+
+def make_chunk(english, japanese, rng: random.Random, words: int) -> str:
+    # Zipf分布で語を選び、自然言語らしい頻度分布にする
+    parts = []
+    for _ in range(words):
+        if rng.random() < 0.3:
+            parts.append(japanese[min(int(rng.paretovariate(1.1)) - 1, len(japanese) - 1)])
+        else:
+            parts.append(english[min(int(rng.paretovariate(1.1)) - 1, len(english) - 1)])
+    return " ".join(parts)
+
+
+def percentiles(samples):
+    samples = np.array(samples) * 1000
+    return np.percentile(samples, 50), np.percentile(samples, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chunks", type=int, default=100_000)
+    parser.add_argument("--words", type=int, default=120, help="words per chunk")
+    parser.add_argument("--vocab", type=int, default=50_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=8)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    english, japanese = make_vocab(args.vocab, rng)
+    ids = [f"chunk-{i}" for i in range(args.chunks)]
+
+    index = LexicalIndex()
+    start = time.perf_counter()
+    batch = 10_000
+    for i in range(0, args.chunks, batch):
+        texts = [make_chunk(english, japanese, rng, args.words) for _ in ids[i:i + batch]]
+        index.add(ids[i:i + batch], texts)
+    index.merge()
+    build_time = time.perf_counter() - start
+
+    vectors = np.random.default_rng(0).standard_normal((args.chunks, args.dim), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    # クエリは索引済みの語から一様に選ぶ（薬品名やエラーコードなど、頻度の低い語を含む検索を想定）
+    indexed_terms = list(index.vocab)
+    queries = [" ".join(rng.sample(indexed_terms, rng.randint(2, 6))) for _ in range(args.queries)]
+    query_vectors = np.random.default_rng(1).standard_normal((args.queries, args.dim), dtype=np.float32)
+
+    def dense_search(vector, k):
+        scores = vectors @ vector
+        top = np.argpartition(-scores, k - 1)[:k]
+        return [ids[i] for i in top[np.argsort(-scores[top])]]
+
+    dense_times, lexical_times, hybrid_times = [], [], []
+    for query, vector in zip(queries, query_vectors):
+        start = time.perf_counter()
+        dense = dense_search(vector, args.k * 4)
+        dense_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        lexical = index.search(query, args.k * 4)
+        lexical_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        reciprocal_rank_fusion([dense_search(vector, args.k * 4), [i for i, _ in index.search(query, args.k * 4)]])[:args.k]
+        hybrid_times.append(time.perf_counter() - start)
+
+    postings = len(index._post_docs)
+    print(f"chunks: {args.chunks:,}  terms: {len(index.vocab):,}  postings: {postings:,}  build: {build_time:.1f}s")
+    print(f"{'search':<14}{'p50 ms':>10}{'p99 ms':>10}")
+    for name, samples in [("dense only", dense_times), ("bm25 only", lexical_times), ("hybrid (rrf)", hybrid_times)]:
+        p50, p99 = percentiles(samples)
+        print(f"{name:<14}{p50:>10.3f}{p99:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""量子化ストレージのベンチマーク（メモリ・レイテンシ・recall@k）
+
+クラスタ構造を持つ合成ベクトルでNumpyVectorStoreを構築し、
+float32の完全一致検索を基準に int8 / binary の各oversample設定を比較する。
+走査するコード行列のサイズが検索時に常駐させる必要のあるメモリ量になる。
+
+    python benchmarks/bench_quantization.py --chunks 100000 --oversample 2 4 8
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.models.numpy_vector_store import NumpyVectorStore
+
+
+class PrecomputedEmbeddings(Embeddings):
+    def __init__(self, vectors: np.ndarray):
+        self.vectors = vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.vectors[[int(t) for t in texts]].tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.vectors[int(text)].tolist()
+
+
+def make_vectors(n: int, dim: int, clusters: int, rng) -> np.ndarray:
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, n)
+    return centers[labels] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chunks", type=int, default=50_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--oversample", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--block-size", type=int, default=8192)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = make_vectors(args.chunks, args.dim, args.clusters, rng)
+    queries = make_vectors(args.queries, args.dim, args.clusters, np.random.default_rng(1))
+    embeddings = PrecomputedEmbeddings(vectors)
+
+    directory = tempfile.mkdtemp(prefix="bench_quant_")
+    try:
+        stores = {}
+        for quantization in ["none", "int8", "binary"]:
+            path = os.path.join(directory, quantization)
+            store = NumpyVectorStore(
+                path, embeddings, quantization=quantization, search_block_size=args.block_size
+            )
+            for start in range(0, args.chunks, 10_000):
+                ids = [str(i) for i in range(start, min(start + 10_000, args.chunks))]
+                store.add_texts(ids, [{}] * len(ids), ids)
+            stores[quantization] = store
+
+        exact_results = []
+        exact_times = []
+        for query in queries:
+            start = time.perf_counter()
+            rows = stores["none"]._top_rows(query / np.linalg.norm(query), args.k)
+            exact_times.append(time.perf_counter() - start)
+            exact_results.append({row for row, _ in rows})
+
+        scanned = {
+            "none": stores["none"]._vectors[:args.chunks].nbytes,
+            "int8": stores["int8"]._codes[:args.chunks].nbytes,
+            "binary": stores["binary"]._codes[:args.chunks].nbytes,
+        }
+
+        print(f"chunks: {args.chunks:,}  dim: {args.dim}  k: {args.k}")
+        print(f"{'mode':<12}{'oversample':>11}{'scan MB':>10}{'saved':>8}{'p50 ms':>9}{'p99 ms':>9}{'recall@k':>10}")
+        p50, p99 = np.percentile(np.array(exact_times) * 1000, [50, 99])
+        print(f"{'float32':<12}{'-':>11}{scanned['none'] / 1e6:>10.1f}{'-':>8}{p50:>9.2f}{p99:>9.2f}{1.0:>10.3f}")
+
+        for quantization in ["int8", "binary"]:
+            store = stores[quantization]
+            saved = 1 - scanned[quantization] / scanned["none"]
+            for oversample in args.oversample:
+                store.oversample = oversample
+                times, recalls = [], []
+                for query, expected in zip(queries, exact_results):
+                    start = time.perf_counter()
+                    rows = store._top_rows(query / np.linalg.norm(query), args.k)
+                    times.append(time.perf_counter() - start)
+                    recalls.append(len({row for row, _ in rows} & expected) / args.k)
+                p50, p99 = np.percentile(np.array(times) * 1000, [50, 99])
+                print(
+                    f"{quantization:<12}{oversample:>11}{scanned[quantization] / 1e6:>10.1f}"
+                    f"{saved:>8.0%}{p50:>9.2f}{p99:>9.2f}{np.mean(recalls):>10.3f}"
+                )
+
+        for store in stores.values():
+            store.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""WebScraper.bulk_scrape の並列取得のベンチマーク
+
+ローカルのスタブHTTPサーバー（応答ごとに --latency-ms だけ待つ）に対して、
+同時リクエスト数（max_workers）ごとの URLs/sec を計測する。
+ドメインごとの上限は既定で同時リクエスト数と同じにし、全体の上限による伸びを見る。
+
+    python benchmarks/bench_scraper.py --concurrency 1 2 4 8 16 32 --urls 256 --latency-ms 50
+    python benchmarks/bench_scraper.py --concurrency 8 32 --per-domain 4 --hosts 127.0.0.1 localhost
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.scrapers.web_scraper import WebScraper
+
+
+def make_handler(latency: float, paragraphs: int):
+    paragraph = "The quick brown fox jumps over the lazy dog while the scraper measures throughput. " * 3
+
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # キープアライブ
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            time.sleep(latency)
+            body = (
+                f"<html><head><title>Page {self.path}</title></head><body><article>"
+                + "".join(f"<p>{paragraph} ({i})</p>" for i in range(paragraphs))
+                + "</article></body></html>"
+            ).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return StubHandler
+
+
+async def run(urls, concurrency: int, per_domain: int, parser_workers: int) -> float:
+    config = {
+        'max_workers': concurrency,
+        'per_domain_concurrency': per_domain or concurrency,
+        'parser_workers': parser_workers,
+    }
+    async with WebScraper(config) as scraper:
+        # ウォームアップ（接続とワーカープロセスの起動を計測に含めない）
+        await scraper.bulk_scrape(urls[:concurrency])
+        scraper.clear_cache()
+        start = time.perf_counter()
+        results = await scraper.bulk_scrape(urls)
+        elapsed = time.perf_counter() - start
+    failed = sum(result is None for result in results.values())
+    if failed:
+        print(f"  {failed} URLs failed")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--urls", type=int, default=256)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--paragraphs", type=int, default=20)
+    parser.add_argument("--per-domain", type=int, default=0)  # 0なら同時リクエスト数と同じ
+    parser.add_argument("--parser-workers", type=int, default=2)
+    parser.add_argument("--hosts", nargs="+", default=["127.0.0.1"])
+    args = parser.parse_args()
+
+    logging.getLogger("src.scrapers.web_scraper").setLevel(logging.WARNING)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(args.latency_ms / 1000, args.paragraphs))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+    urls = [f"http://{args.hosts[i % len(args.hosts)]}:{port}/page/{i}" for i in range(args.urls)]
+
+    print(f"{'concurrency':>11} {'seconds':>8} {'URLs/s':>8} {'speedup':>8}")
+    baseline = None
+    for concurrency in args.concurrency:
+        elapsed = asyncio.run(run(urls, concurrency, args.per_domain, args.parser_workers))
+        rate = len(urls) / elapsed
+        baseline = baseline or rate
+        print(f"{concurrency:>11} {elapsed:>8.2f} {rate:>8.1f} {rate / baseline:>7.1f}x")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""投機的デコードのベンチマーク（CPU）
+
+対象モデルだけで生成する場合（model.generate）とSpeculativeDecoderでドラフトモデルと
+組み合わせる場合の tokens/sec、受け入れ率、1回の検証あたりのトークン数を比較する。
+
+既定では小さいランダム初期化のLlamaを対象モデルにし、その先頭 --draft-layers 層だけを
+使うモデルをドラフトにする（ランダムの重みでは受け入れ率が実運用より低くなる）。
+--target-model と --draft-model に同じトークナイザーのモデル（パスまたはHugging FaceのID）を
+指定すると、実際の組み合わせで計測できる。
+
+    python benchmarks/bench_speculative.py --draft-layers 2 --num-draft-tokens 4
+    python benchmarks/bench_speculative.py --target-model codellama/CodeLlama-7b-Instruct-hf \\
+        --draft-model TinyLlama/TinyLlama_v1.1 --temperature 0
+"""
+import argparse
+import copy
+import os
+import sys
+import time
+
+import numpy as np
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer, LlamaConfig, LlamaForCausalLM
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.models.speculative import SpeculativeDecoder
+
+PROMPTS = [
+    "Question: What are the common side effects of metformin?\n\nAnswer:",
+    "Question: Write a Python function that returns the n-th Fibonacci number.\n\nAnswer:",
+    "Question: How does insulin regulate blood glucose?\n\nAnswer:",
+    "Question: Explain the difference between a list and a tuple in Python.\n\nAnswer:",
+]
+
+
+def build_tiny_models(args):
+    torch.manual_seed(0)
+    config = LlamaConfig(
+        vocab_size=args.vocab_size,
+        hidden_size=args.hidden_size,
+        intermediate_size=args.hidden_size * 4,
+        num_hidden_layers=args.layers,
+        num_attention_heads=args.hidden_size // 64,
+        num_key_value_heads=max(1, args.hidden_size // 256),
+        max_position_embeddings=4096,
+        pad_token_id=0,
+        eos_token_id=None,
+        bos_token_id=None
+    )
+    target = LlamaForCausalLM(config).eval()
+    target.generation_config.pad_token_id = 0
+    # 対象モデルの先頭の層と埋め込み・出力層を共有するドラフト
+    draft_config = copy.deepcopy(config)
+    draft_config.num_hidden_layers = args.draft_layers
+    draft = LlamaForCausalLM(draft_config).eval()
+    draft.load_state_dict(target.state_dict(), strict=False)
+
+    rng = np.random.default_rng(0)
+    prompts = [rng.integers(1, args.vocab_size, size=64).tolist() for _ in range(args.requests)]
+    return target, draft, prompts
+
+
+def load_models(args):
+    tokenizer = AutoTokenizer.from_pretrained(args.target_model)
+    target = AutoModelForCausalLM.from_pretrained(args.target_model, torch_dtype=torch.float32).eval()
+    draft = AutoModelForCausalLM.from_pretrained(args.draft_model, torch_dtype=torch.float32).eval()
+    prompts = [tokenizer(PROMPTS[i % len(PROMPTS)])["input_ids"] for i in range(args.requests)]
+    return target, draft, prompts
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--target-model", default=None)
+    parser.add_argument("--draft-model", default=None)
+    parser.add_argument("--requests", type=int, default=8)
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    parser.add_argument("--num-draft-tokens", type=int, default=4)
+    parser.add_argument("--max-draft-tokens", type=int, default=8)
+    parser.add_argument("--no-adaptive", action="store_true")
+    parser.add_argument("--temperature", type=float, default=0.0)
+    parser.add_argument("--top-p", type=float, default=0.9)
+    parser.add_argument("--hidden-size", type=int, default=512)
+    parser.add_argument("--layers", type=int, default=8)
+    parser.add_argument("--draft-layers", type=int, default=2)
+    parser.add_argument("--vocab-size", type=int, default=32000)
+    parser.add_argument("--threads", type=int, default=0)
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.threads or torch.get_num_threads())
+    if args.target_model and args.draft_model:
+        target, draft, prompts = load_models(args)
+    else:
+        target, draft, prompts = build_tiny_models(args)
+
+    def make_decoder():
+        return SpeculativeDecoder(
+            target, draft,
+            num_draft_tokens=args.num_draft_tokens,
+            max_draft_tokens=args.max_draft_tokens,
+            adaptive=not args.no_adaptive
+        )
+
+    decoder = make_decoder()
+    sampling = {"do_sample": True, "temperature": args.temperature, "top_p": args.top_p} \
+        if args.temperature > 0 else {"do_sample": False}
+
+    def baseline(prompt):
+        with torch.inference_mode():
+            output = target.generate(
+                torch.tensor([prompt]), max_new_tokens=args.max_new_tokens, min_new_tokens=args.max_new_tokens,
+                **sampling
+            )
+        return output.shape[1] - len(prompt)
+
+    def speculative(prompt):
+        return len(decoder.generate(
+            prompt, args.max_new_tokens, temperature=args.temperature, top_p=args.top_p
+        ).token_ids)
+
+    # ウォームアップ
+    baseline(prompts[0])
+    speculative(prompts[0])
+    decoder = make_decoder()  # ウォームアップの分を統計に含めない
+
+    results = {}
+    print(f"{'mode':>12} {'tokens/s':>10} {'p50 ms':>10}")
+    for name, run in (("target only", baseline), ("speculative", speculative)):
+        latencies, tokens = [], 0
+        start = time.perf_counter()
+        for prompt in prompts:
+            request_start = time.perf_counter()
+            tokens += run(prompt)
+            latencies.append(time.perf_counter() - request_start)
+        results[name] = tokens / (time.perf_counter() - start)
+        print(f"{name:>12} {results[name]:>10.1f} {np.percentile(np.array(latencies) * 1000, 50):>10.1f}")
+
+    metrics = decoder.get_metrics()
+    print(f"acceptance rate: {metrics['acceptance_rate']:.2f}, tokens per verification: "
+          f"{metrics['tokens_per_step']:.2f}, speedup: {results['speculative'] / results['target only']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""APIサーバーの起動時間のベンチマーク
+
+1. `src.api.main` のインポート時間（別プロセスで複数回計測した中央値）
+2. uvicornを起動してから /api/health が応答するまでの時間（リクエスト受付開始）
+3. /api/ready が200を返すまでの時間（埋め込みとLLMのウォームアップ完了）と各段階の内訳
+
+    python benchmarks/bench_startup.py --port 8765 --timeout 600
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure_import(repeat: int) -> float:
+    code = (
+        "import time; start = time.perf_counter(); import src.api.main; "
+        "print(time.perf_counter() - start)"
+    )
+    times = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", code], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout
+        times.append(float(output.strip().splitlines()[-1]))
+    return statistics.median(times)
+
+
+def fetch(url: str):
+    """ステータスコードとJSONを返す（接続できなければNone）"""
+    try:
+        with urllib.request.urlopen(url, timeout=1) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read() or b"{}")
+    except (urllib.error.URLError, ConnectionError, TimeoutError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=600.0)
+    parser.add_argument("--import-repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"import src.api.main: {measure_import(args.import_repeat) * 1000:.0f} ms (median)")
+
+    base_url = f"http://127.0.0.1:{args.port}/api"
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "src.api.main:app", "--port", str(args.port), "--log-level", "warning"],
+        cwd=BACKEND_DIR
+    )
+    try:
+        time_to_health = None
+        state = {}
+        while time.perf_counter() - start < args.timeout:
+            if time_to_health is None:
+                if fetch(f"{base_url}/health") is not None:
+                    time_to_health = time.perf_counter() - start
+                    print(f"time to /api/health: {time_to_health * 1000:.0f} ms")
+            else:
+                result = fetch(f"{base_url}/ready")
+                if result is not None:
+                    state = result[1]
+                    if state.get("ready") or state.get("stage") == "failed":
+                        break
+            time.sleep(0.05)
+        time_to_ready = time.perf_counter() - start
+
+        if state.get("ready"):
+            print(f"time to /api/ready: {time_to_ready:.2f} s")
+        else:
+            print(f"not ready after {time_to_ready:.1f} s (stage: {state.get('stage')}, error: {state.get('error')})")
+        for stage, seconds in state.get("timings", {}).items():
+            print(f"  {stage:<16}{seconds:8.2f} s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""統計取得（/api/stats）のベンチマーク
+
+チャンク数を増やしながら、従来の方法（ベクトルストアの全件get()で件数を数え、
+全ソースを列挙）と、永続化カウンタ＋カーソルによる1ページ取得のレイテンシを比較する。
+
+    python benchmarks/bench_stats.py --sizes 10000 100000 500000
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.models.numpy_vector_store import NumpyVectorStore
+from src.models.source_registry import SourceRegistry
+
+
+class TinyEmbeddings(Embeddings):
+    """件数のみを測るための小さな乱数ベクトル"""
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return np.random.default_rng(len(texts)).standard_normal((len(texts), 8)).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+def percentiles(fn, repeat: int):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return np.percentile(np.array(times) * 1000, [50, 99])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 50_000, 200_000])
+    parser.add_argument("--chunks-per-source", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--limit", type=int, default=50)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="bench_stats_")
+    try:
+        store = NumpyVectorStore(os.path.join(directory, "store"), TinyEmbeddings())
+        registry = SourceRegistry(os.path.join(directory, "registry.sqlite3"))
+        sources = {}
+        added = 0
+
+        print(f"{'chunks':>10}{'sources':>9}{'get() p50':>12}{'get() p99':>12}{'counter p50':>13}{'counter p99':>13}")
+        for size in sorted(args.sizes):
+            while added < size:
+                url = f"https://example.com/doc/{added // args.chunks_per_source}"
+                n = min(args.chunks_per_source, size - added)
+                ids = [f"{url}#{added + i}" for i in range(n)]
+                texts = ["本文" * 100] * n
+                store.add_texts(texts, [{"source": url}] * n, ids)
+                info = {"title": url, "chunk_count": n, "added_at": "2024-01-01T00:00:00"}
+                sources[url] = info
+                registry.upsert_source("general", url, info)
+                added += n
+
+            def legacy():
+                total_chunks = len(store.get()["ids"])
+                listing = [{"url": url, **info} for url, info in sources.items()]
+                return total_chunks, listing
+
+            def counters():
+                counts = registry.get_counts("general")
+                page, _ = registry.list_sources("general", limit=args.limit)
+                return counts, page
+
+            assert legacy()[0] == counters()[0]["total_chunks"]
+            legacy_p50, legacy_p99 = percentiles(legacy, max(3, args.repeat // 4))
+            counter_p50, counter_p99 = percentiles(counters, args.repeat)
+            print(
+                f"{size:>10,}{len(sources):>9,}{legacy_p50:>10.2f}ms{legacy_p99:>10.2f}ms"
+                f"{counter_p50:>11.3f}ms{counter_p99:>11.3f}ms"
+            )
+        store.close()
+        registry.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
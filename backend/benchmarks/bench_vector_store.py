@@ -0,0 +1,95 @@
+"""ベクトルストアのバックエンド比較（コールドスタートと検索レイテンシ）
+
+合成ベクトルでNumpyVectorStore（float32/float16）と、インストールされていれば
+ChromaVectorStoreを構築し、再オープンにかかる時間とクエリのp50/p99を測定する。
+
+    python benchmarks/bench_vector_store.py --chunks 100000
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.models.vector_store import create_vector_store
+
+
+class PrecomputedEmbeddings(Embeddings):
+    """テキストとして渡された行番号のベクトルを返す"""
+
+    def __init__(self, vectors: np.ndarray):
+        self.vectors = vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.vectors[[int(t) for t in texts]].tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.vectors[int(text)].tolist()
+
+
+def build(backend, directory, embeddings, n, options, batch=5000):
+    store = create_vector_store(backend, directory, embeddings, "bench", options)
+    start = time.perf_counter()
+    for i in range(0, n, batch):
+        ids = [str(j) for j in range(i, min(i + batch, n))]
+        store.add_texts(ids, [{"source": f"doc-{int(j) // 20}"} for j in ids], ids)
+    build_time = time.perf_counter() - start
+    store.close()
+    return build_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chunks", type=int, default=50_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=8)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((args.chunks, args.dim), dtype=np.float32)
+    embeddings = PrecomputedEmbeddings(vectors)
+    queries = rng.standard_normal((args.queries, args.dim), dtype=np.float32)
+
+    backends = [("numpy", {"dtype": "float32"}), ("numpy", {"dtype": "float16"})]
+    try:
+        import langchain_chroma  # noqa: F401
+        backends.append(("chroma", {}))
+    except ImportError:
+        print("langchain_chroma is not installed; skipping chroma")
+
+    print(f"chunks: {args.chunks:,}  dim: {args.dim}")
+    print(f"{'backend':<18}{'build s':>10}{'open ms':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for backend, options in backends:
+        directory = tempfile.mkdtemp(prefix="bench_vs_")
+        try:
+            build_time = build(backend, directory, embeddings, args.chunks, options)
+
+            start = time.perf_counter()
+            store = create_vector_store(backend, directory, embeddings, "bench", options)
+            store.similarity_search_by_vector(queries[0], k=args.k)
+            open_time = time.perf_counter() - start
+
+            latencies = []
+            for query in queries:
+                start = time.perf_counter()
+                store.similarity_search_by_vector(query, k=args.k)
+                latencies.append(time.perf_counter() - start)
+            store.close()
+
+            p50, p99 = np.percentile(np.array(latencies) * 1000, [50, 99])
+            name = f"{backend}/{options.get('dtype', 'hnsw')}"
+            print(f"{name:<18}{build_time:>10.2f}{open_time * 1000:>10.1f}{p50:>10.2f}{p99:>10.2f}")
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,27 @@
 import os
 import sys
 
+import pytest
+
 # プロジェクトのルートディレクトリをPythonパスに追加
 project_root = os.path.dirname(os.path.abspath(__file__))
-sys.path.insert(0, project_root)
\ No newline at end of file
+sys.path.insert(0, project_root)
+
+
+def _word_tokenizer(words):
+    """オフセットを返す単語単位のテスト用トークナイザー"""
+    from tokenizers import Tokenizer, models, pre_tokenizers
+    from transformers import PreTrainedTokenizerFast
+
+    vocab = {"[UNK]": 0}
+    for word in words:
+        vocab.setdefault(word, len(vocab))
+    tokenizer = Tokenizer(models.WordLevel(vocab=vocab, unk_token="[UNK]"))
+    tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+    return PreTrainedTokenizerFast(tokenizer_object=tokenizer, unk_token="[UNK]")
+
+
+@pytest.fixture
+def make_tokenizer():
+    """単語リストからテスト用トークナイザーを作る関数（チャンク分割・コンテキストのテストで共用）"""
+    return _word_tokenizer
@@ -1,23 +1,96 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks, Request
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel, HttpUrl, validator
 from typing import List, Optional, Dict
-from ..models.rag_system import RAGSystem
 import uvicorn
 import asyncio
+import json
 import logging
+import time
 from datetime import datetime
 
+from ..models.generation_executor import GenerationQueueFull
+
 # ロギングの設定
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# RAGシステムのグローバルインスタンス（起動後にバックグラウンドで作成）
+rag_system = None
+
+# 起動・ウォームアップの状態（/api/ready で返す）
+startup_state = {
+    "stage": "starting",
+    "ready": False,
+    "error": None,
+    "timings": {}
+}
+_process_started_at = time.perf_counter()
+
+
+async def warm_up():
+    """RAGシステムを作成し、埋め込みとLLMを1回ずつ実行して温める"""
+    global rag_system
+    timings = startup_state["timings"]
+    try:
+        start = time.perf_counter()
+        startup_state["stage"] = "loading_rag_system"
+        from ..models.rag_system import RAGSystem
+        rag_system = await asyncio.to_thread(RAGSystem)
+        timings["rag_system"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        startup_state["stage"] = "warming_embeddings"
+        await asyncio.to_thread(rag_system.embeddings.embed_query, "warm up")
+        timings["embeddings"] = time.perf_counter() - start
+
+        # 取り込みはLLMを使わないので、キューのワーカーはLLMのウォームアップ前に起動する
+        rag_system.start_ingestion()
+
+        start = time.perf_counter()
+        startup_state["stage"] = "warming_llm"
+        await rag_system.warm_up_model()
+        timings["llm"] = time.perf_counter() - start
+
+        startup_state["stage"] = "ready"
+        startup_state["ready"] = True
+        timings["time_to_ready"] = time.perf_counter() - _process_started_at
+        logger.info(f"Service ready in {timings['time_to_ready']:.1f}s")
+    except Exception as e:
+        startup_state["stage"] = "failed"
+        startup_state["error"] = str(e)
+        logger.error(f"Error during warm-up: {str(e)}")
+        logger.exception(e)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # モデルのロードを待たずにリクエストの受け付けを開始する
+    task = asyncio.create_task(warm_up())
+    yield
+    task.cancel()
+    if rag_system is not None:
+        await rag_system.stop_ingestion()
+
+
+def get_rag_system():
+    """RAGシステムを返す（作成前は503）"""
+    if rag_system is None:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Service is starting ({startup_state['stage']})"
+        )
+    return rag_system
+
+
 # FastAPIアプリケーションの初期化（重複を削除）
 app = FastAPI(
     title="RAG System API",
     description="LLaMA 3.2-1bを使用したRAGシステムのAPI",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # タイムアウト設定
@@ -42,9 +115,6 @@ app.add_middleware(
     expose_headers=["*"]
 )
 
-# RAGシステムのグローバルインスタンス
-rag_system = RAGSystem()
-
 # リクエスト/レスポンスモデル
 class URLInput(BaseModel):
     url: HttpUrl
@@ -63,6 +133,22 @@ class URLInput(BaseModel):
             raise ValueError('Category must be either "general" or "code"')
         return v
 
+class BulkURLInput(BaseModel):
+    urls: List[HttpUrl]
+    category: str = "general"
+
+    @validator('urls')
+    def urls_must_not_be_empty(cls, v):
+        if not v:
+            raise ValueError('urls must not be empty')
+        return v
+
+    @validator('category')
+    def validate_category(cls, v):
+        if v not in ["general", "code"]:
+            raise ValueError('Category must be either "general" or "code"')
+        return v
+
 class SearchQuery(BaseModel):
     query: str
     k: Optional[int] = 2
@@ -102,26 +188,34 @@ class SearchResponse(BaseModel):
     answer: str
     sources: List[SearchResult]
     processing_time: Optional[float] = None
+    timings: Optional[Dict[str, float]] = None  # 生成の待ち時間・実行時間（秒）
+    stop_reason: Optional[str] = None  # 生成が止まった理由（'eos'・'length'・'stop'・'repetition'・'deadline'）
+    generated_tokens: Optional[int] = None
+    generation_stats: Optional[Dict[str, float]] = None  # tokens/sec（投機的デコードでは受け入れ率なども）
     timestamp: Optional[datetime] = None
 
 class SystemStats(BaseModel):
     total_documents: int
     total_chunks: int
-    sources: List[Dict[str, str]]
+    categories: Dict[str, Dict[str, int]]
+    sources: List[Dict]
+    next_cursor: Optional[str] = None  # 次ページの取得に渡すカーソル
     last_updated: datetime
 
 # APIエンドポイント
 @app.post("/api/documents/add", response_model=Dict)
-async def add_document(url_input: URLInput, background_tasks: BackgroundTasks):
-    """新しいドキュメントの追加（非同期）"""
+async def add_document(url_input: URLInput):
+    """新しいドキュメントの追加（取り込みキューに登録し、ジョブIDを返す）"""
+    rag = get_rag_system()
     try:
-        # バックグラウンドタスクとしてドキュメント追加を実行
-        background_tasks.add_task(rag_system.add_from_url, str(url_input.url))
-        
+        job_id = (await asyncio.to_thread(rag.enqueue_urls, [str(url_input.url)], url_input.category))[0]
+
         return {
             "status": "accepted",
-            "message": "Document processing started",
-            "url": str(url_input.url)
+            "message": "Document processing queued",
+            "job_id": job_id,
+            "url": str(url_input.url),
+            "category": url_input.category
         }
     except ValueError as e:
         logger.error(f"Validation error: {str(e)}")
@@ -133,32 +227,102 @@ async def add_document(url_input: URLInput, background_tasks: BackgroundTasks):
             detail=f"Failed to process document: {str(e)}"
         )
 
+
+@app.post("/api/documents/bulk", response_model=Dict)
+async def add_documents_bulk(bulk_input: BulkURLInput):
+    """複数のドキュメントを一括で取り込みキューに登録"""
+    rag = get_rag_system()
+    max_urls = rag.ingestion_config['max_bulk_urls']
+    if len(bulk_input.urls) > max_urls:
+        raise HTTPException(status_code=413, detail=f"Too many URLs (max {max_urls})")
+    try:
+        urls = [str(url) for url in bulk_input.urls]
+        job_ids = await asyncio.to_thread(rag.enqueue_urls, urls, bulk_input.category)
+        return {
+            "status": "accepted",
+            "category": bulk_input.category,
+            "jobs": [{"job_id": job_id, "url": url} for job_id, url in zip(job_ids, urls)]
+        }
+    except Exception as e:
+        logger.error(f"Error queueing documents: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to queue documents: {str(e)}"
+        )
+
+
+@app.get("/api/jobs/{job_id}", response_model=Dict)
+async def get_job(job_id: str):
+    """取り込みジョブの状態（段階・進捗・試行回数・エラー）"""
+    rag = get_rag_system()
+    job = await asyncio.to_thread(rag.ingestion_queue.get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    return job
+
 @app.post("/api/search")
 async def search(query: SearchQuery):
+    rag = get_rag_system()
     try:
-        response = await rag_system.generate_answer(
+        start_time = time.perf_counter()
+        response = await rag.generate_answer(
             query.query,
             query.k,
-            model_type=query.model_type
+            model_type=query.model
         )
+        processing_time = time.perf_counter() - start_time
         
         return SearchResponse(
+            query=query.query,
             answer=response["answer"],
             sources=response["sources"],
             processing_time=processing_time,
+            timings=response.get("timings"),
+            stop_reason=response.get("stop_reason"),
+            generated_tokens=response.get("generated_tokens"),
+            generation_stats=response.get("generation_stats"),
             timestamp=datetime.now()
         )
+    except GenerationQueueFull as e:
+        logger.warning(f"Rejected search: {str(e)}")
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
         logger.error(f"Error during search: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/api/search/stream")
+async def search_stream(query: SearchQuery, request: Request):
+    """検索結果と生成中の回答をServer-Sent Eventsで逐次返す（sources → token → done）"""
+    rag = get_rag_system()
+
+    async def events():
+        stream = rag.stream_answer(query.query, query.k, model_type=query.model)
+        try:
+            async for event in stream:
+                # クライアントが切断したら生成を止める
+                if await request.is_disconnected():
+                    logger.info("Client disconnected, stopping generation")
+                    break
+                data = json.dumps(event["data"], ensure_ascii=False, default=str)
+                yield f"event: {event['event']}\ndata: {data}\n\n"
+        finally:
+            await stream.aclose()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 # main.py に追加
 @app.post("/api/database/clear", response_model=Dict)
 async def clear_database():
     """データベースの全データを削除"""
+    rag = get_rag_system()
     try:
-        success = await rag_system.clear_database()
+        success = await rag.clear_database()
         if success:
             return {
                 "status": "success",
@@ -176,24 +340,71 @@ async def clear_database():
             detail=f"Error clearing database: {str(e)}"
         )
 
+@app.post("/api/database/index/rebuild", response_model=Dict)
+async def rebuild_index(category: Optional[str] = Query(None, pattern="^(general|code)$")):
+    """ベクトル検索のIVFインデックスを現在のコーパスで学習し直す（numpyバックエンドのみ）"""
+    rag = get_rag_system()
+    try:
+        rebuilt = await rag.rebuild_ann_index(category)
+    except Exception as e:
+        logger.error(f"Error rebuilding index: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error rebuilding index: {str(e)}"
+        )
+    return {
+        "status": "success",
+        "rebuilt": rebuilt
+    }
+
+@app.delete("/api/documents", response_model=Dict)
+async def delete_document(url: str, category: str = Query("general", pattern="^(general|code)$")):
+    """URLを指定してドキュメントのチャンクを削除"""
+    rag = get_rag_system()
+    if rag.source_registry.get_source(category, url) is None:
+        raise HTTPException(status_code=404, detail=f"Source not found: {url}")
+    success = await rag.delete_source(url, category)
+    if not success:
+        raise HTTPException(
+            status_code=500,
+            detail="Failed to delete document"
+        )
+    return {
+        "status": "success",
+        "message": "Document deleted successfully",
+        "url": url,
+        "category": category
+    }
+
+
 @app.get("/api/stats", response_model=SystemStats)
-async def get_stats():
-    """システム統計の取得"""
+async def get_stats(
+    category: Optional[str] = Query(None, pattern="^(general|code)$"),
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500)
+):
+    """システム統計の取得（件数は永続化したカウンタ、ソース一覧はカーソルでページ分割）"""
+    rag = get_rag_system()
     try:
-        stats = rag_system.get_statistics()
+        registry = rag.source_registry
+        categories = {name: registry.get_counts(name) for name in ("general", "code")}
+        page = rag.list_sources(category, cursor, limit)
         sources = [
             {
-                "url": source.get("url", ""),
-                "title": source.get("title", ""),
-                "chunk_count": source.get("chunk_count", 0),
-                "added_at": source.get("added_at", ""),
+                "url": source["url"],
+                "title": source.get("title") or "",
+                "chunk_count": source["chunk_count"],
+                "added_at": source.get("added_at") or "",
+                "category": source["category"],
             }
-            for source in stats["sources"]
+            for source in page["sources"]
         ]
         return SystemStats(
-            total_documents=stats["total_documents"],
-            total_chunks=stats["total_chunks"],
+            total_documents=sum(counts["total_documents"] for counts in categories.values()),
+            total_chunks=sum(counts["total_chunks"] for counts in categories.values()),
+            categories=categories,
             sources=sources,
+            next_cursor=page["next_cursor"],
             last_updated=datetime.now()
         )
     except Exception as e:
@@ -204,15 +415,56 @@ async def get_stats():
         )
 
 
+@app.get("/api/sources", response_model=Dict)
+async def list_sources(
+    category: Optional[str] = Query(None, pattern="^(general|code)$"),
+    url: Optional[str] = None,
+    added_after: Optional[str] = None,
+    added_before: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500)
+):
+    """登録済みソースの一覧（カーソルでページ分割、URL・追加日時で絞り込み）"""
+    rag = get_rag_system()
+    try:
+        return rag.list_sources(
+            category, cursor, limit, url=url, added_after=added_after, added_before=added_before
+        )
+    except Exception as e:
+        logger.error(f"Error listing sources: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to list sources: {str(e)}"
+        )
+
+
+@app.get("/api/metrics", response_model=Dict)
+async def get_metrics():
+    """実行時メトリクス（モデルプールのヒット・ロード・解放など）"""
+    return get_rag_system().get_metrics()
+
 
 @app.get("/api/health")
 async def health_check():
-    """ヘルスチェック"""
+    """ヘルスチェック（プロセスの生存確認、モデルのロード完了は待たない）"""
     return {
         "status": "healthy",
         "timestamp": datetime.now().isoformat()
     }
 
+
+@app.get("/api/ready")
+async def readiness_check():
+    """レディネスチェック（ウォームアップ完了まで503）"""
+    content = {
+        "ready": startup_state["ready"],
+        "stage": startup_state["stage"],
+        "error": startup_state["error"],
+        "timings": startup_state["timings"],
+        "timestamp": datetime.now().isoformat()
+    }
+    return JSONResponse(status_code=200 if startup_state["ready"] else 503, content=content)
+
 # グローバルなエラーハンドラー
 @app.exception_handler(ValueError)
 async def validation_exception_handler(request, exc):
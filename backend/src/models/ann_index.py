@@ -0,0 +1,196 @@
+from typing import List, Optional, Tuple
+import logging
+import math
+import os
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def spherical_kmeans(vectors: np.ndarray, n_clusters: int, n_iter: int = 20, seed: int = 0,
+                     block_size: int = 65536) -> np.ndarray:
+    """正規化済みベクトルを内積（コサイン）でクラスタリングし、正規化した重心を返す"""
+    rng = np.random.default_rng(seed)
+    n = len(vectors)
+    centroids = vectors[rng.choice(n, size=n_clusters, replace=False)].astype(np.float32)
+
+    for _ in range(n_iter):
+        labels = assign_clusters(vectors, centroids, block_size)
+        order = np.argsort(labels, kind="stable")
+        counts = np.bincount(labels, minlength=n_clusters)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        filled = counts > 0
+
+        sums = np.zeros_like(centroids)
+        sums[filled] = np.add.reduceat(vectors[order], starts[filled], axis=0)
+        # 空のクラスタはランダムな点で置き換える
+        sums[~filled] = vectors[rng.choice(n, size=int((~filled).sum()), replace=False)]
+
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        centroids = (sums / norms).astype(np.float32)
+    return centroids
+
+
+def assign_clusters(vectors: np.ndarray, centroids: np.ndarray, block_size: int = 65536) -> np.ndarray:
+    """各ベクトルを内積が最大の重心に割り当てる"""
+    labels = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), block_size):
+        block = np.asarray(vectors[start:start + block_size], dtype=np.float32)
+        labels[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return labels
+
+
+class IVFIndex:
+    """IVF-flat（転置ファイル）による近似最近傍インデックス
+
+    k-meansの重心でベクトル空間をnlist個のリストに分け、検索時はクエリに近い
+    nprobe個のリストに属する行だけを候補として返す。候補のスコア計算と
+    ベクトル本体の保持はベクトルストア側で行い、ここでは行番号の割り当てのみを
+    `centroids.npy` と `assignments.npy`（行ごとのリスト番号、未割り当ては-1）に保存する。
+
+    検索はストアのロックを取らずに候補を求めるため、リストと割り当て配列は
+    作り直した配列の参照を差し替えて更新し、読み出し中の配列を置き換えない。
+    """
+
+    name = "ivf"
+
+    def __init__(self, directory: str, nlist: int = 0, nprobe: int = 16, min_train_rows: int = 20_000,
+                 kmeans_iters: int = 20, train_points_per_list: int = 64):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.nlist = nlist  # 0なら学習時の件数から決める（4√n）
+        self.nprobe = nprobe
+        self.min_train_rows = min_train_rows
+        self.kmeans_iters = kmeans_iters
+        self.train_points_per_list = train_points_per_list
+
+        self.centroids: Optional[np.ndarray] = None
+        self._assignments: Optional[np.memmap] = None
+        # (リストの開始位置, リスト順の行番号, 未統合の追加行) を1つの参照で差し替える
+        self._lists: Tuple[np.ndarray, np.ndarray, List[List[int]]] = (
+            np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int64), []
+        )
+        self._pending_count = 0
+
+        if os.path.exists(self._centroids_path) and os.path.exists(self._assignments_path):
+            self.centroids = np.load(self._centroids_path)
+            self._assignments = np.load(self._assignments_path, mmap_mode="r+")
+            self._build_lists(len(self.centroids))
+            logger.info(f"Loaded IVF index with {len(self.centroids)} lists from {directory}")
+
+    @property
+    def _centroids_path(self) -> str:
+        return os.path.join(self.directory, "centroids.npy")
+
+    @property
+    def _assignments_path(self) -> str:
+        return os.path.join(self.directory, "assignments.npy")
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    def resize(self, capacity: int) -> None:
+        """割り当て配列をベクトル行列の容量に合わせて拡張"""
+        if not self.trained or len(self._assignments) >= capacity:
+            return
+        tmp_path = self._assignments_path + ".tmp"
+        grown = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.int32, shape=(capacity,))
+        grown[:] = -1
+        grown[:len(self._assignments)] = self._assignments
+        grown.flush()
+        del grown
+        # 検索中の古い配列はファイルを置き換えても読める
+        os.replace(tmp_path, self._assignments_path)
+        self._assignments = np.load(self._assignments_path, mmap_mode="r+")
+
+    def train(self, sample: np.ndarray, n_rows: int, capacity: int) -> None:
+        """サンプルからk-meansで重心を求め、割り当てを空にする"""
+        nlist = self.nlist or max(1, int(4 * math.sqrt(n_rows)))
+        nlist = min(nlist, len(sample))
+        centroids = spherical_kmeans(sample, nlist, self.kmeans_iters)
+        np.save(self._centroids_path, centroids)
+
+        tmp_path = self._assignments_path + ".tmp"
+        assignments = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.int32, shape=(capacity,))
+        assignments[:] = -1
+        assignments.flush()
+        del assignments
+        os.replace(tmp_path, self._assignments_path)
+        self._assignments = np.load(self._assignments_path, mmap_mode="r+")
+        self._build_lists(len(centroids))
+        # 重心は最後に設定する（検索はこれを見て学習済みと判断する）
+        self.centroids = centroids
+
+    def empty_copy(self, directory: str) -> "IVFIndex":
+        """同じ設定の未学習のインデックス（別のディレクトリで学習し直して差し替える用）"""
+        return IVFIndex(
+            directory, nlist=self.nlist, nprobe=self.nprobe, min_train_rows=self.min_train_rows,
+            kmeans_iters=self.kmeans_iters, train_points_per_list=self.train_points_per_list
+        )
+
+    def training_sample_size(self, n_rows: int) -> int:
+        nlist = self.nlist or max(1, int(4 * math.sqrt(n_rows)))
+        return min(n_rows, nlist * self.train_points_per_list)
+
+    def add(self, rows: np.ndarray, vectors: np.ndarray) -> None:
+        """行を最も近いリストに追加（既存の行は割り当てを付け替える）"""
+        rows = np.asarray(rows, dtype=np.int64)
+        labels = assign_clusters(vectors, self.centroids)
+        self._assignments[rows] = labels
+        self._assignments.flush()
+        _, list_rows, pending = self._lists
+        for row, label in zip(rows.tolist(), labels.tolist()):
+            pending[label].append(row)
+        self._pending_count += len(rows)
+        # 差分が増えたらリストに統合する
+        if self._pending_count > max(50_000, len(list_rows) // 10):
+            self._build_lists(len(self.centroids))
+
+    def _build_lists(self, n_lists: int) -> None:
+        assigned = np.flatnonzero(self._assignments >= 0)
+        labels = np.asarray(self._assignments[assigned])
+        order = np.argsort(labels, kind="stable")
+        counts = np.bincount(labels, minlength=n_lists)
+        self._lists = (
+            np.concatenate([[0], np.cumsum(counts)]).astype(np.int64),
+            assigned[order].astype(np.int64),
+            [[] for _ in range(n_lists)]
+        )
+        self._pending_count = 0
+
+    def candidates(self, query: np.ndarray, nprobe: Optional[int] = None) -> np.ndarray:
+        """クエリに近いnprobe個のリストに属する行番号"""
+        offsets, list_rows, pending = self._lists
+        assignments = self._assignments
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        scores = self.centroids @ query
+        probes = np.argpartition(-scores, nprobe - 1)[:nprobe]
+
+        parts = []
+        for label in probes.tolist():
+            parts.append(list_rows[offsets[label]:offsets[label + 1]])
+            if pending[label]:
+                parts.append(np.array(pending[label], dtype=np.int64))
+        rows = np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+        # 付け替え済みの古いエントリを除外
+        rows = rows[np.isin(assignments[rows], probes)]
+        return np.unique(rows)
+
+    def get_stats(self) -> dict:
+        if not self.trained:
+            return {"type": self.name, "trained": False}
+        offsets, _, pending = self._lists
+        sizes = np.diff(offsets) + np.array([len(p) for p in pending])
+        return {
+            "type": self.name,
+            "trained": True,
+            "nlist": len(self.centroids),
+            "nprobe": self.nprobe,
+            "max_list_size": int(sizes.max()) if len(sizes) else 0,
+        }
+
+    def close(self) -> None:
+        self._assignments = None
@@ -0,0 +1,145 @@
+from typing import Dict, List, Optional
+from collections import OrderedDict
+from dataclasses import dataclass
+import copy
+import logging
+import threading
+import time
+
+import numpy as np
+
+from .lexical_index import tokenize
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _CacheEntry:
+    key: tuple
+    vector: np.ndarray
+    terms: Optional[tuple]
+    answer: Dict
+    created_at: float
+    generation_time: float
+
+
+class SemanticAnswerCache:
+    """クエリ埋め込みの類似度で回答を再利用するキャッシュ（TTL・LRU）
+
+    薬剤名・用量・数値・否定が1語違うだけの質問は埋め込みの類似度が閾値を超えることがあるため、
+    require_term_match が有効なら保存時のクエリと語の並びが一致する場合だけ再利用する
+    （大文字小文字・全角半角・空白・記号の違いだけを同じ質問とみなす）。
+    """
+
+    def __init__(self, similarity_threshold: float = 0.95, max_entries: int = 1000, ttl_seconds: float = 3600,
+                 require_term_match: bool = True):
+        self.similarity_threshold = similarity_threshold
+        self.require_term_match = require_term_match
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+
+        self._entries: "OrderedDict[int, _CacheEntry]" = OrderedDict()
+        self._next_id = 0
+        self._epochs: Dict[str, int] = {}
+        self._global_epoch = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.saved_generation_seconds = 0.0
+        self.invalidations = 0
+
+    @staticmethod
+    def _normalize(vector: List[float]) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _expire(self, now: float) -> None:
+        expired = [
+            entry_id for entry_id, entry in self._entries.items()
+            if now - entry.created_at > self.ttl_seconds
+        ]
+        for entry_id in expired:
+            del self._entries[entry_id]
+
+    @staticmethod
+    def _terms(query: Optional[str]) -> Optional[tuple]:
+        return tuple(tokenize(query)) if query is not None else None
+
+    def lookup(self, query_vector: List[float], model_type: str, category: str, k: int,
+               query: Optional[str] = None) -> Optional[Dict]:
+        """類似クエリの回答を検索（閾値未満、または語が一致しなければNone）"""
+        key = (model_type, category, k)
+        vector = self._normalize(query_vector)
+        terms = self._terms(query)
+        with self._lock:
+            self._expire(time.time())
+            candidates = [
+                (entry_id, entry) for entry_id, entry in self._entries.items()
+                if entry.key == key and (not self.require_term_match or entry.terms == terms)
+            ]
+            if candidates:
+                matrix = np.stack([entry.vector for _, entry in candidates])
+                similarities = matrix @ vector
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.similarity_threshold:
+                    entry_id, entry = candidates[best]
+                    self._entries.move_to_end(entry_id)
+                    self.hits += 1
+                    self.saved_generation_seconds += entry.generation_time
+                    logger.info(f"Semantic cache hit (similarity={similarities[best]:.3f})")
+                    return copy.deepcopy(entry.answer)
+
+            self.misses += 1
+            return None
+
+    def epoch(self, category: str) -> tuple:
+        """カテゴリの無効化世代（生成中に無効化された回答の保存を防ぐ）"""
+        return (self._global_epoch, self._epochs.get(category, 0))
+
+    def store(self, query_vector: List[float], model_type: str, category: str, k: int,
+              answer: Dict, generation_time: float, epoch: Optional[tuple] = None,
+              query: Optional[str] = None) -> None:
+        """回答を保存し、上限を超えた分を古い順に削除"""
+        entry = _CacheEntry(
+            key=(model_type, category, k),
+            vector=self._normalize(query_vector),
+            terms=self._terms(query),
+            answer=copy.deepcopy(answer),
+            created_at=time.time(),
+            generation_time=generation_time
+        )
+        with self._lock:
+            if epoch is not None and epoch != self.epoch(category):
+                return
+            self._entries[self._next_id] = entry
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, category: Optional[str] = None) -> None:
+        """カテゴリ（省略時は全体）のエントリを破棄"""
+        with self._lock:
+            if category is None:
+                self._global_epoch += 1
+                removed = len(self._entries)
+                self._entries.clear()
+            else:
+                self._epochs[category] = self._epochs.get(category, 0) + 1
+                stale = [entry_id for entry_id, entry in self._entries.items() if entry.key[1] == category]
+                for entry_id in stale:
+                    del self._entries[entry_id]
+                removed = len(stale)
+            self.invalidations += removed
+
+    def get_stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "saved_generation_seconds": round(self.saved_generation_seconds, 3),
+            "invalidations": self.invalidations
+        }
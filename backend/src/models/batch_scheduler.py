@@ -0,0 +1,408 @@
+from typing import Callable, Dict, List, Optional, Sequence
+from collections import deque
+from dataclasses import dataclass
+import asyncio
+import logging
+import threading
+import time
+
+from .embedding_batcher import Histogram
+from .generation_executor import GenerationQueueFull
+from .generation_control import StopConditions
+
+logger = logging.getLogger(__name__)
+
+# 停止文字列の判定でデコードする末尾のトークン数
+_STOP_STRING_WINDOW = 16
+
+
+@dataclass
+class SamplingParams:
+    max_new_tokens: int = 256
+    temperature: float = 0.7  # 0以下なら貪欲法
+    top_p: float = 0.9
+    repetition_penalty: float = 1.0
+    stop_token_ids: Sequence[int] = ()
+    stop_strings: Sequence[str] = ()
+    # 繰り返し・締め切りなども含めた停止条件（止まった理由がfinish_reasonになる）
+    conditions: Optional[StopConditions] = None
+
+
+@dataclass
+class BatchedGeneration:
+    token_ids: List[int]
+    finish_reason: str  # 'eos', 'stop', 'length'（conditionsを指定した場合は 'repetition', 'deadline' も）
+    queue_seconds: float  # バッチに入るまでの待ち時間
+    run_seconds: float  # バッチに入ってから終了までの時間
+
+
+class _Sequence:
+    """スケジューラ内で生成中の1リクエスト"""
+
+    def __init__(self, prompt_ids: List[int], params: SamplingParams, future: asyncio.Future,
+                 loop: asyncio.AbstractEventLoop, on_token: Optional[Callable[[int], None]]):
+        self.prompt_ids = prompt_ids
+        self.params = params
+        self.future = future
+        self.loop = loop
+        self.on_token = on_token
+        self.generated: List[int] = []
+        self.finish_reason: Optional[str] = None
+        self.cancelled = False
+        self.submitted_at = time.perf_counter()
+        self.admitted_at: Optional[float] = None
+
+
+def _set_result(future: asyncio.Future, result) -> None:
+    if not future.done():
+        future.set_result(result)
+
+
+def _set_exception(future: asyncio.Future, error: Exception) -> None:
+    if not future.done():
+        future.set_exception(error)
+
+
+class ContinuousBatchScheduler:
+    """同時のリクエストを1つのデコードバッチにまとめる連続バッチング
+
+    専用スレッドが1ステップごとに、待機中のリクエストをプリフィルしてバッチに加え、
+    全シーケンスの次のトークンを1回の順伝播で求め、終了したシーケンスをバッチから外す
+    （iteration-level scheduling）。長さの違うシーケンスはKVキャッシュを左詰めの
+    パディングで揃え、attention_maskとposition_idsで各シーケンスの実際の位置を与える。
+    temperature・top_p・繰り返しペナルティ・停止条件はリクエストごとに指定できる。
+    """
+
+    def __init__(self, model, tokenizer=None, max_batch_size: int = 8, max_prefill_tokens: int = 4096,
+                 max_queue: int = 64, eos_token_ids: Optional[Sequence[int]] = None):
+        import torch
+        from transformers import DynamicCache
+
+        self._torch = torch
+        self._cache_class = DynamicCache
+        self.model = model
+        self.tokenizer = tokenizer
+        self.device = model.device
+        self.max_batch_size = max_batch_size
+        self.max_prefill_tokens = max_prefill_tokens
+        self.max_queue = max_queue
+
+        if eos_token_ids is None:
+            eos_token_ids = model.generation_config.eos_token_id
+        if isinstance(eos_token_ids, int):
+            eos_token_ids = [eos_token_ids]
+        self.eos_token_ids = set(eos_token_ids or [])
+        pad_token_id = getattr(tokenizer, "pad_token_id", None) if tokenizer is not None else None
+        if pad_token_id is None:
+            pad_token_id = next(iter(self.eos_token_ids), 0)
+        self.pad_token_id = pad_token_id  # パディング位置はマスクされるので値は何でもよい
+
+        # 待機中のリクエスト（イベントループとスケジューラのスレッドで共有）
+        self._waiting: "deque[_Sequence]" = deque()
+        self._condition = threading.Condition()
+        self._stopped = False
+
+        # バッチの状態（スケジューラのスレッドのみが触る）
+        self._active: List[_Sequence] = []
+        self._cache = None  # 層ごとの (key, value)、形状は (batch, heads, seq, head_dim)
+        self._attention_mask = None  # (batch, seq)
+
+        self.batch_sizes = Histogram()
+        self._stats = {
+            "submitted": 0,
+            "completed": 0,
+            "cancelled": 0,
+            "failed": 0,
+            "rejected": 0,
+            "steps": 0,
+            "prefills": 0,
+            "prefill_tokens": 0,
+            "generated_tokens": 0,
+            "busy_seconds": 0.0,
+        }
+
+        self._thread = threading.Thread(target=self._run, name="batch-scheduler", daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def from_config(cls, model, tokenizer, config: Dict) -> "ContinuousBatchScheduler":
+        return cls(
+            model,
+            tokenizer,
+            max_batch_size=config.get('max_batch_size', 8),
+            max_prefill_tokens=config.get('max_prefill_tokens', 4096),
+            max_queue=config.get('max_queue', 64)
+        )
+
+    async def submit(self, prompt_ids: Sequence[int], params: SamplingParams,
+                     on_token: Optional[Callable[[int], None]] = None) -> BatchedGeneration:
+        """プロンプトのトークン列を投入し、生成の完了を待つ
+
+        on_tokenを指定すると、生成したトークンごとにイベントループ上で呼ばれる。
+        """
+        loop = asyncio.get_running_loop()
+        sequence = _Sequence(list(prompt_ids), params, loop.create_future(), loop, on_token)
+        with self._condition:
+            if self._stopped:
+                raise RuntimeError("Batch scheduler is stopped")
+            if len(self._waiting) >= self.max_queue:
+                self._stats["rejected"] += 1
+                raise GenerationQueueFull(f"Batch scheduler queue is full ({self.max_queue} waiting)")
+            self._waiting.append(sequence)
+            self._stats["submitted"] += 1
+            self._condition.notify()
+
+        try:
+            return await sequence.future
+        except asyncio.CancelledError:
+            # 次のステップでバッチから外される
+            sequence.cancelled = True
+            raise
+
+    def _run(self) -> None:
+        torch = self._torch
+        while True:
+            with self._condition:
+                while not self._stopped and not self._waiting and not self._active:
+                    self._condition.wait()
+                if self._stopped:
+                    break
+                admitted = self._take_admissions()
+
+            start = time.perf_counter()
+            try:
+                with torch.inference_mode():
+                    if admitted:
+                        self._prefill(admitted)
+                        self._retire_finished()
+                    if self._active:
+                        self._decode_step()
+                        self._retire_finished()
+            except Exception as e:
+                logger.error(f"Error in batch scheduler step: {str(e)}")
+                logger.exception(e)
+                self._fail_batch(admitted, e)
+            finally:
+                self._stats["busy_seconds"] += time.perf_counter() - start
+
+    def _take_admissions(self) -> List[_Sequence]:
+        """バッチの空きとプリフィルのトークン予算の範囲で待機中のリクエストを取り出す"""
+        admitted, prefill_tokens = [], 0
+        while self._waiting and len(self._active) + len(admitted) < self.max_batch_size:
+            sequence = self._waiting[0]
+            if sequence.cancelled or sequence.future.done():
+                self._waiting.popleft()
+                self._stats["cancelled"] += 1
+                continue
+            if admitted and prefill_tokens + len(sequence.prompt_ids) > self.max_prefill_tokens:
+                break
+            self._waiting.popleft()
+            admitted.append(sequence)
+            prefill_tokens += len(sequence.prompt_ids)
+        return admitted
+
+    def _prefill(self, sequences: List[_Sequence]) -> None:
+        """新しいシーケンスのプロンプトを左詰めでまとめて処理し、バッチに加える"""
+        torch = self._torch
+        width = max(len(sequence.prompt_ids) for sequence in sequences)
+        input_ids = torch.full((len(sequences), width), self.pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(sequences), width), dtype=torch.long)
+        for i, sequence in enumerate(sequences):
+            length = len(sequence.prompt_ids)
+            input_ids[i, width - length:] = torch.tensor(sequence.prompt_ids, dtype=torch.long)
+            attention_mask[i, width - length:] = 1
+        input_ids = input_ids.to(self.device)
+        attention_mask = attention_mask.to(self.device)
+        position_ids = (attention_mask.cumsum(-1) - 1).clamp(min=0)
+
+        output = self.model(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            position_ids=position_ids,
+            use_cache=True
+        )
+        now = time.perf_counter()
+        for sequence in sequences:
+            sequence.admitted_at = now
+        self._stats["prefills"] += 1
+        self._stats["prefill_tokens"] += int(attention_mask.sum())
+
+        self._merge(sequences, self._to_legacy(output.past_key_values), attention_mask)
+        self._append_tokens(sequences, self._sample(output.logits[:, -1, :], sequences))
+
+    def _merge(self, sequences: List[_Sequence], cache, attention_mask) -> None:
+        """プリフィルしたKVキャッシュを左側のパディングで長さを揃えて既存のバッチに結合"""
+        if not self._active:
+            self._active = list(sequences)
+            self._cache = cache
+            self._attention_mask = attention_mask
+            return
+
+        functional = self._torch.nn.functional
+        width = max(self._attention_mask.shape[1], attention_mask.shape[1])
+
+        def pad_kv(tensor):
+            return functional.pad(tensor, (0, 0, width - tensor.shape[-2], 0))
+
+        def pad_mask(mask):
+            return functional.pad(mask, (width - mask.shape[1], 0))
+
+        self._cache = tuple(
+            (
+                self._torch.cat([pad_kv(old_key), pad_kv(new_key)], dim=0),
+                self._torch.cat([pad_kv(old_value), pad_kv(new_value)], dim=0),
+            )
+            for (old_key, old_value), (new_key, new_value) in zip(self._cache, cache)
+        )
+        self._attention_mask = self._torch.cat([pad_mask(self._attention_mask), pad_mask(attention_mask)], dim=0)
+        self._active.extend(sequences)
+
+    def _decode_step(self) -> None:
+        """バッチ内の全シーケンスの次のトークンを1回の順伝播で求める"""
+        torch = self._torch
+        input_ids = torch.tensor(
+            [[sequence.generated[-1]] for sequence in self._active], dtype=torch.long, device=self.device
+        )
+        self._attention_mask = torch.cat(
+            [self._attention_mask, self._attention_mask.new_ones((len(self._active), 1))], dim=1
+        )
+        position_ids = self._attention_mask.sum(-1, keepdim=True) - 1
+
+        output = self.model(
+            input_ids=input_ids,
+            attention_mask=self._attention_mask,
+            position_ids=position_ids,
+            past_key_values=self._cache_class.from_legacy_cache(self._cache),
+            use_cache=True
+        )
+        self._cache = self._to_legacy(output.past_key_values)
+        self._stats["steps"] += 1
+        self.batch_sizes.observe(len(self._active))
+        self._append_tokens(self._active, self._sample(output.logits[:, -1, :], self._active))
+
+    @staticmethod
+    def _to_legacy(cache):
+        return cache.to_legacy_cache() if hasattr(cache, "to_legacy_cache") else tuple(cache)
+
+    def _sample(self, logits, sequences: List[_Sequence]) -> List[int]:
+        """リクエストごとのtemperature・top_p・繰り返しペナルティで次のトークンを選ぶ"""
+        torch = self._torch
+        logits = logits.float()
+        for i, sequence in enumerate(sequences):
+            penalty = sequence.params.repetition_penalty
+            if penalty != 1.0:
+                seen = torch.tensor(sequence.prompt_ids + sequence.generated, device=logits.device).unique()
+                scores = logits[i, seen]
+                logits[i, seen] = torch.where(scores > 0, scores / penalty, scores * penalty)
+
+        next_tokens = logits.argmax(dim=-1)
+        temperatures = torch.tensor(
+            [sequence.params.temperature for sequence in sequences], dtype=torch.float32, device=logits.device
+        )
+        greedy = temperatures <= 0
+        if not bool(greedy.all()):
+            top_p = torch.tensor(
+                [sequence.params.top_p for sequence in sequences], dtype=torch.float32, device=logits.device
+            )
+            probs = torch.softmax(logits / temperatures.clamp(min=1e-5).unsqueeze(1), dim=-1)
+            sorted_probs, sorted_ids = probs.sort(dim=-1, descending=True)
+            # 累積確率がtop_pに達するまでのトークンを残す（先頭は常に残る）
+            outside = sorted_probs.cumsum(dim=-1) - sorted_probs > top_p.unsqueeze(1)
+            sorted_probs = sorted_probs.masked_fill(outside, 0.0)
+            sampled = sorted_ids.gather(-1, torch.multinomial(sorted_probs, 1)).squeeze(-1)
+            next_tokens = torch.where(greedy, next_tokens, sampled)
+        return next_tokens.tolist()
+
+    def _append_tokens(self, sequences: List[_Sequence], tokens: List[int]) -> None:
+        for sequence, token in zip(sequences, tokens):
+            sequence.generated.append(token)
+            self._stats["generated_tokens"] += 1
+            if sequence.on_token is not None:
+                sequence.loop.call_soon_threadsafe(sequence.on_token, token)
+
+            params = sequence.params
+            if token in self.eos_token_ids or token in params.stop_token_ids:
+                sequence.finish_reason = "eos"
+            elif params.stop_strings and self.tokenizer is not None and self._hit_stop_string(sequence):
+                sequence.finish_reason = "stop"
+            elif params.conditions is not None and params.conditions.update(token, self._decode) is not None:
+                sequence.finish_reason = params.conditions.reason
+            elif len(sequence.generated) >= params.max_new_tokens:
+                sequence.finish_reason = "length"
+
+    def _hit_stop_string(self, sequence: _Sequence) -> bool:
+        tail = self.tokenizer.decode(sequence.generated[-_STOP_STRING_WINDOW:], skip_special_tokens=True)
+        return any(stop in tail for stop in sequence.params.stop_strings)
+
+    def _decode(self, token_ids: List[int]) -> str:
+        return self.tokenizer.decode(token_ids, skip_special_tokens=True) if self.tokenizer is not None else ""
+
+    def _retire_finished(self) -> None:
+        """終了・キャンセルしたシーケンスをバッチから外し、結果を返す"""
+        keep = []
+        now = time.perf_counter()
+        for i, sequence in enumerate(self._active):
+            if sequence.cancelled or sequence.future.done():
+                self._stats["cancelled"] += 1
+            elif sequence.finish_reason:
+                self._stats["completed"] += 1
+                result = BatchedGeneration(
+                    token_ids=list(sequence.generated),
+                    finish_reason=sequence.finish_reason,
+                    queue_seconds=sequence.admitted_at - sequence.submitted_at,
+                    run_seconds=now - sequence.admitted_at
+                )
+                sequence.loop.call_soon_threadsafe(_set_result, sequence.future, result)
+            else:
+                keep.append(i)
+
+        if len(keep) == len(self._active):
+            return
+        if not keep:
+            self._active, self._cache, self._attention_mask = [], None, None
+            return
+
+        index = self._torch.tensor(keep, dtype=self._torch.long, device=self.device)
+        attention_mask = self._attention_mask.index_select(0, index)
+        # 残ったシーケンスのどれにも使われていない先頭の列を削る
+        start = int(attention_mask.any(dim=0).nonzero()[0])
+        self._attention_mask = attention_mask[:, start:]
+        self._cache = tuple(
+            (key.index_select(0, index)[:, :, start:], value.index_select(0, index)[:, :, start:])
+            for key, value in self._cache
+        )
+        self._active = [self._active[i] for i in keep]
+
+    def _fail_batch(self, admitted: List[_Sequence], error: Exception) -> None:
+        """順伝播が失敗したらバッチ内の全リクエストにエラーを返して状態を初期化"""
+        failed = {id(sequence): sequence for sequence in self._active + admitted}
+        for sequence in failed.values():
+            self._stats["failed"] += 1
+            sequence.loop.call_soon_threadsafe(_set_exception, sequence.future, error)
+        self._active, self._cache, self._attention_mask = [], None, None
+
+    def get_metrics(self) -> Dict:
+        busy = self._stats["busy_seconds"]
+        with self._condition:
+            waiting = len(self._waiting)
+        return {
+            **self._stats,
+            "active": len(self._active),
+            "waiting": waiting,
+            "max_batch_size": self.max_batch_size,
+            "tokens_per_second": self._stats["generated_tokens"] / busy if busy else 0.0,
+            "batch_size_histogram": self.batch_sizes.to_dict(),
+        }
+
+    def stop(self) -> None:
+        """スケジューラのスレッドを止め、待機中のリクエストにエラーを返す"""
+        with self._condition:
+            self._stopped = True
+            waiting = list(self._waiting)
+            self._waiting.clear()
+            self._condition.notify_all()
+        self._thread.join(timeout=10)
+        error = RuntimeError("Batch scheduler is stopped")
+        for sequence in waiting + self._active:
+            sequence.loop.call_soon_threadsafe(_set_exception, sequence.future, error)
+        self._active, self._cache, self._attention_mask = [], None, None
@@ -0,0 +1,72 @@
+from typing import List, Sequence, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class TokenChunker:
+    """トークン数でテキストを分割するチャンカー
+
+    Fastトークナイザーのオフセットマッピングを使い、1回のトークナイズで
+    元のテキストを文字位置で切り出す（decodeを行わないため書式も保持される）。
+    """
+
+    def __init__(self, tokenizer, chunk_size: int = 500, chunk_overlap: int = 50):
+        if chunk_overlap >= chunk_size:
+            raise ValueError("chunk_overlap must be smaller than chunk_size")
+        self.tokenizer = tokenizer
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+
+    @property
+    def supports_offsets(self) -> bool:
+        return bool(getattr(self.tokenizer, "is_fast", False))
+
+    def chunk(self, text: str) -> List[str]:
+        """1つのテキストを分割"""
+        return self.chunk_many([text])[0]
+
+    def chunk_many(self, texts: Sequence[str], batch_size: int = 32) -> List[List[str]]:
+        """複数のテキストをまとめてトークナイズして分割"""
+        if not self.supports_offsets:
+            return [self._chunk_by_decode(text) for text in texts]
+
+        results = []
+        for i in range(0, len(texts), batch_size):
+            batch = list(texts[i:i + batch_size])
+            encoded = self.tokenizer(
+                batch,
+                add_special_tokens=False,
+                return_offsets_mapping=True,
+                return_attention_mask=False,
+                return_token_type_ids=False,
+                verbose=False
+            )
+            for text, offsets in zip(batch, encoded["offset_mapping"]):
+                results.append(self._split_by_offsets(text, offsets))
+        return results
+
+    def _split_by_offsets(self, text: str, offsets: Sequence[Tuple[int, int]]) -> List[str]:
+        chunks = []
+        step = self.chunk_size - self.chunk_overlap
+        start = 0
+        while start < len(offsets):
+            window = offsets[start:start + self.chunk_size]
+            chunk = text[window[0][0]:window[-1][1]].strip()
+            if chunk:
+                chunks.append(chunk)
+            if start + self.chunk_size >= len(offsets):
+                break
+            start += step
+        return chunks
+
+    def _chunk_by_decode(self, text: str) -> List[str]:
+        """オフセットを返さないトークナイザー用（従来の方式）"""
+        tokens = self.tokenizer.encode(text)
+        chunks = []
+        start = 0
+        while start < len(tokens):
+            chunk_tokens = tokens[start:start + self.chunk_size]
+            chunks.append(self.tokenizer.decode(chunk_tokens, skip_special_tokens=True))
+            start += self.chunk_size - self.chunk_overlap
+        return chunks
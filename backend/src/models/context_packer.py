@@ -0,0 +1,257 @@
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from dataclasses import dataclass, field
+import logging
+import threading
+
+from ..utils.text_utils import content_hash
+
+logger = logging.getLogger(__name__)
+
+# コンテキスト内のスパンの区切り
+CONTEXT_SEPARATOR = "\n\n---\n\n"
+
+
+@dataclass
+class ContextSpan:
+    """プロンプトに入れる連続したテキスト（同じソースの隣接チャンクを結合したもの）"""
+    text: str
+    source: str
+    score: float
+    chunk_indices: List[int] = field(default_factory=list)
+    tokens: int = 0
+    truncated: bool = False
+
+
+@dataclass
+class PackedContext:
+    context: str
+    spans: List[ContextSpan]
+    context_tokens: int
+    budget_tokens: int
+    duplicates: int = 0
+    merged: int = 0
+    dropped: int = 0
+
+
+def _doc_score(doc: Dict) -> float:
+    return float(doc.get('fusion_score', doc.get('score', 0.0)))
+
+
+def _overlap_length(a: str, b: str, min_chars: int) -> int:
+    """aの末尾とbの先頭が重なる文字数（min_chars未満なら0）"""
+    if len(a) < min_chars or len(b) < min_chars:
+        return 0
+    head = b[:min_chars]
+    # 最も前の位置から調べる（重なりが最長のものを採用）
+    pos = a.find(head, max(0, len(a) - len(b)))
+    while pos != -1:
+        if b.startswith(a[pos:]):
+            return len(a) - pos
+        pos = a.find(head, pos + 1)
+    return 0
+
+
+class ContextPacker:
+    """検索結果をトークン数の予算内でコンテキストにまとめる
+
+    同じソースで隣り合う（チャンク分割の重複を持つ）チャンクは1つのテキストに結合し、
+    重複は除いてから、スコアの高い順に予算に収まるだけ入れる。予算は質問を含む
+    プロンプトの残りの部分から計算するため、質問が切り詰められることは無い。
+    """
+
+    def __init__(self, max_prompt_tokens: int = 1024, min_span_tokens: int = 32,
+                 min_overlap_chars: int = 16, separator: str = CONTEXT_SEPARATOR):
+        self.max_prompt_tokens = max_prompt_tokens
+        self.min_span_tokens = min_span_tokens
+        self.min_overlap_chars = min_overlap_chars
+        self.separator = separator
+        self._lock = threading.Lock()
+        self._stats = {
+            "packs": 0,
+            "context_tokens": 0,
+            "duplicate_chunks": 0,
+            "merged_chunks": 0,
+            "dropped_spans": 0,
+            "truncated_spans": 0,
+            "overflow_trims": 0,
+        }
+
+    @classmethod
+    def from_config(cls, config: Dict) -> "ContextPacker":
+        return cls(
+            max_prompt_tokens=config.get('max_prompt_tokens', 1024),
+            min_span_tokens=config.get('min_span_tokens', 32),
+            min_overlap_chars=config.get('min_overlap_chars', 16)
+        )
+
+    @staticmethod
+    def format_span(text: str, source: str) -> str:
+        return f"{text}\nSource: {source}"
+
+    def merge(self, docs: Sequence[Dict]) -> Tuple[List[ContextSpan], int, int]:
+        """重複を除き、同じソースの隣接チャンクを結合する
+
+        Returns: (スコア順のスパン, 除いた重複の数, 結合したチャンクの数)
+        """
+        seen = set()
+        unique = []
+        for doc in docs:
+            key = content_hash(doc['content'])
+            if key not in seen:
+                seen.add(key)
+                unique.append(doc)
+        duplicates = len(docs) - len(unique)
+
+        by_source: Dict[str, List[Dict]] = {}
+        for doc in unique:
+            by_source.setdefault(doc['metadata'].get('source', 'Unknown'), []).append(doc)
+
+        spans = []
+        merged = 0
+        for source, source_docs in by_source.items():
+            indexed = sorted(
+                (doc for doc in source_docs if isinstance(doc['metadata'].get('chunk_index'), int)),
+                key=lambda doc: doc['metadata']['chunk_index']
+            )
+            span = None
+            for doc in indexed:
+                index = doc['metadata']['chunk_index']
+                if span is not None and index == span.chunk_indices[-1] + 1:
+                    overlap = _overlap_length(span.text, doc['content'], self.min_overlap_chars)
+                    span.text = span.text + doc['content'][overlap:] if overlap else f"{span.text}\n{doc['content']}"
+                    span.chunk_indices.append(index)
+                    span.score = max(span.score, _doc_score(doc))
+                    merged += 1
+                    continue
+                span = ContextSpan(doc['content'], source, _doc_score(doc), [index])
+                spans.append(span)
+            # チャンク番号の無い古いデータはそのまま使う
+            spans.extend(
+                ContextSpan(doc['content'], source, _doc_score(doc))
+                for doc in source_docs if not isinstance(doc['metadata'].get('chunk_index'), int)
+            )
+
+        # 他のスパンにそのまま含まれるものも重複として除く
+        spans.sort(key=lambda span: len(span.text), reverse=True)
+        kept = []
+        for span in spans:
+            container = next((other for other in kept if span.text in other.text), None)
+            if container is None:
+                kept.append(span)
+            else:
+                container.score = max(container.score, span.score)
+                duplicates += 1
+        kept.sort(key=lambda span: span.score, reverse=True)
+        return kept, duplicates, merged
+
+    def pack(self, tokenizer, docs: Sequence[Dict], reserved_tokens: int) -> PackedContext:
+        """コンテキストを作る（reserved_tokensは質問とテンプレートのトークン数）"""
+        spans, duplicates, merged = self.merge(docs)
+        budget = max(0, self.max_prompt_tokens - reserved_tokens)
+
+        # 本文と出典の行をまとめて1回でトークナイズする
+        texts = [span.text for span in spans]
+        source_lines = [self.format_span("", span.source) for span in spans]
+        encoded = self._encode(tokenizer, texts + source_lines + [self.separator])
+        text_ids, text_offsets = encoded[0][:len(spans)], encoded[1][:len(spans)]
+        source_counts = [len(ids) for ids in encoded[0][len(spans):-1]]
+        separator_count = len(encoded[0][-1])
+
+        packed = []
+        remaining = budget
+        for span, ids, offsets, source_count in zip(spans, text_ids, text_offsets, source_counts):
+            overhead = source_count + (separator_count if packed else 0)
+            cost = len(ids) + overhead
+            if cost <= remaining:
+                span.tokens = cost
+            elif remaining - overhead >= self.min_span_tokens:
+                keep = remaining - overhead
+                span.text = self._truncate(tokenizer, span.text, ids, offsets, keep)
+                span.tokens = keep + overhead
+                span.truncated = True
+            else:
+                continue
+            packed.append(span)
+            remaining -= span.tokens
+
+        context = self.separator.join(self.format_span(span.text, span.source) for span in packed)
+        result = PackedContext(
+            context=context,
+            spans=packed,
+            context_tokens=budget - remaining,
+            budget_tokens=budget,
+            duplicates=duplicates,
+            merged=merged,
+            dropped=len(spans) - len(packed)
+        )
+        with self._lock:
+            self._stats["packs"] += 1
+            self._stats["context_tokens"] += result.context_tokens
+            self._stats["duplicate_chunks"] += duplicates
+            self._stats["merged_chunks"] += merged
+            self._stats["dropped_spans"] += result.dropped
+            self._stats["truncated_spans"] += sum(span.truncated for span in packed)
+        return result
+
+    def fit(self, tokenizer, packed: PackedContext, render: Callable[[str], str]) -> PackedContext:
+        """組み立てたプロンプト全体を数え直し、予算を超えた分を最後のスパンから削る
+
+        packのトークン数は部分ごとに数えた合計で、BPEは結合した境界で結果が変わるため
+        予算をわずかに超えることがある。超えたままだとLLM側の切り詰めで末尾の"Answer:"が
+        落ちるので、render（コンテキストからモデルに渡すプロンプト全体を作る）の結果で確かめる。
+        """
+        while packed.spans:
+            excess = len(tokenizer(render(packed.context))["input_ids"]) - self.max_prompt_tokens
+            if excess <= 0:
+                break
+            span = packed.spans[-1]
+            ids, offsets = (values[0] for values in self._encode(tokenizer, [span.text]))
+            keep = len(ids) - excess
+            text = self._truncate(tokenizer, span.text, ids, offsets, keep) if keep >= self.min_span_tokens else ""
+            if text and text != span.text:
+                span.text = text
+                span.tokens -= excess
+                span.truncated = True
+            else:
+                packed.spans.pop()
+                packed.dropped += 1
+                excess = span.tokens
+            packed.context_tokens -= excess
+            packed.context = self.separator.join(self.format_span(span.text, span.source) for span in packed.spans)
+            with self._lock:
+                self._stats["overflow_trims"] += 1
+        return packed
+
+    @staticmethod
+    def _encode(tokenizer, texts: List[str]) -> Tuple[List[List[int]], List[Optional[List[Tuple[int, int]]]]]:
+        """トークンIDと（Fastトークナイザーなら）文字位置のオフセット"""
+        if not texts:
+            return [], []
+        if getattr(tokenizer, "is_fast", False):
+            encoded = tokenizer(
+                texts,
+                add_special_tokens=False,
+                return_offsets_mapping=True,
+                return_attention_mask=False,
+                return_token_type_ids=False,
+                verbose=False
+            )
+            return encoded["input_ids"], encoded["offset_mapping"]
+        ids = [tokenizer.encode(text, add_special_tokens=False) for text in texts]
+        return ids, [None] * len(texts)
+
+    @staticmethod
+    def _truncate(tokenizer, text: str, ids: List[int], offsets, keep: int) -> str:
+        """先頭からkeepトークン分のテキスト"""
+        if offsets is not None:
+            return text[:offsets[keep - 1][1]].rstrip()
+        return tokenizer.decode(ids[:keep], skip_special_tokens=True).rstrip()
+
+    def get_metrics(self) -> Dict:
+        with self._lock:
+            packs = self._stats["packs"]
+            return {
+                **self._stats,
+                "max_prompt_tokens": self.max_prompt_tokens,
+                "mean_context_tokens": self._stats["context_tokens"] / packs if packs else 0.0,
+            }
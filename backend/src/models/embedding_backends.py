@@ -0,0 +1,209 @@
+from typing import Dict, List
+from abc import abstractmethod
+import logging
+import os
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+# 各バックエンドのベクトルとsentence-transformers（基準）とのコサイン距離の許容値
+COMPATIBILITY_TOLERANCE = {
+    "sentence_transformers": 0.0,
+    "torch": 1e-4,
+    "onnx": 1e-4,
+    "onnx_int8": 0.02,
+    "torch_int8": 0.02,
+}
+
+
+def resolve_device(device: str) -> str:
+    """'auto' をCUDAが使えればcuda、それ以外はcpuに解決"""
+    if device != "auto":
+        return device
+    try:
+        import torch
+        return "cuda" if torch.cuda.is_available() else "cpu"
+    except ImportError:
+        return "cpu"
+
+
+class BucketedEmbeddings(Embeddings):
+    """長さでまとめたバッチでトランスフォーマーを実行する埋め込みの基底クラス
+
+    テキストをトークン数で並べ替えてからbatch_size件ずつ処理し、バッチ内の最長に
+    合わせてパディングするため、長短が混在する入力でもパディングの無駄が少ない。
+    出力はsentence-transformersのe5と同じく平均プーリング後にL2正規化する。
+    """
+
+    def __init__(self, tokenizer, batch_size: int = 32, max_length: int = 512):
+        self.tokenizer = tokenizer
+        self.batch_size = batch_size
+        self.max_length = max_length
+
+    @abstractmethod
+    def _forward(self, input_ids: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+        """トークンごとの隠れ状態 (batch, seq, dim) を返す"""
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        encoded = self.tokenizer(
+            texts, add_special_tokens=True, truncation=True, max_length=self.max_length, verbose=False
+        )["input_ids"]
+        order = np.argsort([len(ids) for ids in encoded], kind="stable")
+
+        result = None
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            padded = self.tokenizer.pad(
+                {"input_ids": [encoded[i] for i in batch]}, padding="longest", return_tensors="np"
+            )
+            input_ids = padded["input_ids"].astype(np.int64)
+            attention_mask = padded["attention_mask"].astype(np.int64)
+            hidden = self._forward(input_ids, attention_mask)
+
+            mask = attention_mask[:, :, None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+            pooled /= np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+
+            if result is None:
+                result = np.zeros((len(texts), pooled.shape[1]), dtype=np.float32)
+            result[batch] = pooled
+        return result
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        return self._encode(list(texts)).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._encode([text])[0].tolist()
+
+
+class TorchEmbeddings(BucketedEmbeddings):
+    """transformersのモデルをそのまま実行（quantize=Trueで線形層を動的int8量子化）"""
+
+    def __init__(self, model_name: str, device: str = "cpu", quantize: bool = False,
+                 num_threads: int = 0, **kwargs):
+        import torch
+        from transformers import AutoModel, AutoTokenizer
+
+        super().__init__(AutoTokenizer.from_pretrained(model_name), **kwargs)
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        model = AutoModel.from_pretrained(model_name).eval()
+        if quantize:
+            # 動的量子化はCPUのみ対応
+            device = "cpu"
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        self.device = device
+        self.model = model.to(device)
+        self._torch = torch
+
+    def _forward(self, input_ids, attention_mask):
+        torch = self._torch
+        with torch.inference_mode():
+            output = self.model(
+                input_ids=torch.from_numpy(input_ids).to(self.device),
+                attention_mask=torch.from_numpy(attention_mask).to(self.device)
+            )
+        return output.last_hidden_state.float().cpu().numpy()
+
+
+def export_onnx(model_name: str, path: str, quantize: bool = False) -> str:
+    """モデルをONNXに書き出す（quantize=Trueなら重みを動的int8量子化したファイルも作る）"""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    if not os.path.exists(path):
+        logger.info(f"Exporting {model_name} to ONNX: {path}")
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        model = AutoModel.from_pretrained(model_name).eval()
+        sample = tokenizer(["export sample"], return_tensors="pt")
+        torch.onnx.export(
+            model,
+            (sample["input_ids"], sample["attention_mask"]),
+            path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "last_hidden_state": {0: "batch", 1: "sequence"},
+            },
+            opset_version=17
+        )
+
+    if not quantize:
+        return path
+    quantized_path = path.replace(".onnx", ".int8.onnx")
+    if not os.path.exists(quantized_path):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        logger.info(f"Quantizing ONNX model: {quantized_path}")
+        quantize_dynamic(path, quantized_path, weight_type=QuantType.QInt8)
+    return quantized_path
+
+
+class OnnxEmbeddings(BucketedEmbeddings):
+    """ONNX Runtimeで書き出し済みのグラフを実行（CPU向け）"""
+
+    def __init__(self, onnx_path: str, tokenizer, num_threads: int = 0, **kwargs):
+        import onnxruntime as ort
+
+        super().__init__(tokenizer, **kwargs)
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+            options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+        self._input_names = {node.name for node in self.session.get_inputs()}
+
+    def _forward(self, input_ids, attention_mask):
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self._input_names:
+            feeds["token_type_ids"] = np.zeros_like(input_ids)
+        return self.session.run(None, {name: feeds[name] for name in self._input_names})[0]
+
+
+def create_embeddings(model_name: str, config: Dict) -> Embeddings:
+    """設定に応じた埋め込みバックエンドを作成
+
+    backend: 'sentence_transformers'（基準）, 'torch', 'torch_int8', 'onnx', 'onnx_int8'
+    """
+    backend = config.get('backend', 'sentence_transformers')
+    device = resolve_device(config.get('device', 'auto'))
+    num_threads = config.get('num_threads', 0)
+    batch_options = {'batch_size': config.get('batch_size', 32), 'max_length': config.get('max_length', 512)}
+
+    if backend == 'sentence_transformers':
+        from langchain_huggingface import HuggingFaceEmbeddings
+        if num_threads:
+            import torch
+            torch.set_num_threads(num_threads)
+        return HuggingFaceEmbeddings(
+            model_name=model_name,
+            model_kwargs={'device': device},
+            encode_kwargs={'batch_size': batch_options['batch_size']}
+        )
+    if backend in ('torch', 'torch_int8'):
+        return TorchEmbeddings(
+            model_name, device=device, quantize=backend == 'torch_int8', num_threads=num_threads, **batch_options
+        )
+    if backend in ('onnx', 'onnx_int8'):
+        from transformers import AutoTokenizer
+        onnx_path = export_onnx(model_name, config['onnx_path'], quantize=backend == 'onnx_int8')
+        return OnnxEmbeddings(
+            onnx_path, AutoTokenizer.from_pretrained(model_name), num_threads=num_threads, **batch_options
+        )
+    raise ValueError(f"Unknown embedding backend: {backend}")
+
+
+def max_cosine_distance(candidate: Embeddings, reference: Embeddings, texts: List[str]) -> float:
+    """同じテキストに対する2つのバックエンドのベクトルの最大コサイン距離"""
+    a = np.asarray(candidate.embed_documents(texts), dtype=np.float32)
+    b = np.asarray(reference.embed_documents(texts), dtype=np.float32)
+    a /= np.linalg.norm(a, axis=1, keepdims=True)
+    b /= np.linalg.norm(b, axis=1, keepdims=True)
+    return float(1.0 - (a * b).sum(axis=1).min())
@@ -0,0 +1,159 @@
+from typing import Callable, Dict, List, Optional, Sequence
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# ヒストグラムの区切り（値が上限以下の最初のバケットに数える）
+_HISTOGRAM_BOUNDS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+
+class Histogram:
+    """固定の区切りで件数を数える簡易ヒストグラム"""
+
+    def __init__(self, bounds: Sequence[int] = _HISTOGRAM_BOUNDS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.total = 0
+        self.sum = 0
+
+    def observe(self, value: int) -> None:
+        for i, bound in enumerate(self.bounds):
+            if value <= bound:
+                break
+        else:
+            i = len(self.bounds)
+        self.counts[i] += 1
+        self.total += 1
+        self.sum += value
+
+    def to_dict(self) -> Dict:
+        labels = [f"<={bound}" for bound in self.bounds] + [f">{self.bounds[-1]}"]
+        return {
+            "buckets": dict(zip(labels, self.counts)),
+            "count": self.total,
+            "mean": self.sum / self.total if self.total else 0.0,
+        }
+
+
+class EmbeddingBatcher:
+    """同時に届いたクエリをまとめて1回で埋め込むマイクロバッチャー
+
+    キューに溜まったクエリをmax_batch_size件までまとめてスレッドで埋め込む。埋め込み中に
+    届いたクエリは次のバッチに入るため、負荷が高いほどバッチが大きくなる。直前のバッチが
+    複数件だった（同時のリクエストがある）ときだけ最大max_wait_msまで後続を待つので、
+    単発のクエリには待ち時間が加わらない。各リクエストは自分のテキストのベクトルだけを受け取る。
+    """
+
+    def __init__(self, embed_batch: Callable[[List[str]], List[List[float]]],
+                 max_batch_size: int = 32, max_wait_ms: float = 2.0):
+        self.embed_batch = embed_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._last_batch_size = 0
+        self.batch_sizes = Histogram()
+        self.queue_depths = Histogram()
+        self._stats = {
+            "requests": 0,
+            "batches": 0,
+            "errors": 0,
+            "queue_wait_seconds": 0.0,
+            "embed_seconds": 0.0,
+        }
+
+    @classmethod
+    def from_config(cls, embed_batch: Callable[[List[str]], List[List[float]]], config: Dict) -> "EmbeddingBatcher":
+        return cls(
+            embed_batch,
+            max_batch_size=config.get('max_batch_size', 32),
+            max_wait_ms=config.get('max_wait_ms', 2.0)
+        )
+
+    def _ensure_worker(self) -> None:
+        # キューとワーカーは最初に呼ばれたイベントループ上で作る
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done() or self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+
+    async def embed(self, text: str) -> List[float]:
+        """クエリを埋め込む（他のリクエストとまとめて実行される）"""
+        self._ensure_worker()
+        future = self._loop.create_future()
+        self._stats["requests"] += 1
+        self._queue.put_nowait((text, future, time.perf_counter()))
+        return await future
+
+    async def _collect(self) -> list:
+        batch = [await self._queue.get()]
+        self.queue_depths.observe(self._queue.qsize() + 1)
+        # 同時のリクエストが無ければ待たずに実行する
+        wait = self.max_wait if self._last_batch_size > 1 else 0.0
+        deadline = self._loop.time() + wait
+        while len(batch) < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            remaining = deadline - self._loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        # 待ちきれずにキャンセルされたリクエストは除く
+        return [item for item in batch if not item[1].done()]
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._collect()
+            if not batch:
+                continue
+
+            start = time.perf_counter()
+            self._last_batch_size = len(batch)
+            self.batch_sizes.observe(len(batch))
+            self._stats["batches"] += 1
+            self._stats["queue_wait_seconds"] += sum(start - enqueued for _, _, enqueued in batch)
+            try:
+                vectors = await asyncio.to_thread(self.embed_batch, [text for text, _, _ in batch])
+            except Exception as e:
+                self._stats["errors"] += 1
+                logger.error(f"Error embedding query batch: {str(e)}")
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            finally:
+                self._stats["embed_seconds"] += time.perf_counter() - start
+
+            for (_, future, _), vector in zip(batch, vectors):
+                if not future.done():
+                    future.set_result(vector)
+
+    def get_metrics(self) -> Dict:
+        requests, batches = self._stats["requests"], self._stats["batches"]
+        return {
+            **self._stats,
+            "mean_queue_wait_ms": 1000 * self._stats["queue_wait_seconds"] / requests if requests else 0.0,
+            "mean_embed_ms": 1000 * self._stats["embed_seconds"] / batches if batches else 0.0,
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "batch_size_histogram": self.batch_sizes.to_dict(),
+            "queue_depth_histogram": self.queue_depths.to_dict(),
+        }
+
+    async def close(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
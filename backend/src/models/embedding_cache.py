@@ -0,0 +1,186 @@
+from typing import Dict, List, Optional
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from ..utils.text_utils import normalize_text
+
+logger = logging.getLogger(__name__)
+
+# SQLiteのプレースホルダ数の上限を超えないようにバッチで問い合わせる
+_SQLITE_BATCH = 500
+
+
+class EmbeddingCache:
+    """埋め込みベクトルのディスクキャッシュ（SQLite・LRU削除）"""
+
+    def __init__(self, path: str, max_entries: int = 500_000):
+        self.path = path
+        self.max_entries = max_entries
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                vector BLOB NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings(last_access)"
+        )
+        self.conn.commit()
+
+        self.entries = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(model_name: str, text: str) -> str:
+        """キャッシュキー（モデル名＋正規化テキストのハッシュ）"""
+        payload = f"{model_name}\0{normalize_text(text)}".encode('utf-8')
+        return hashlib.sha256(payload).hexdigest()
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        """キーに対応するベクトルを取得（見つかったものだけ返す）"""
+        found = {}
+        unique_keys = list(dict.fromkeys(keys))
+        with self._lock:
+            for i in range(0, len(unique_keys), _SQLITE_BATCH):
+                batch = unique_keys[i:i + _SQLITE_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self.conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                    batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+
+            if found:
+                now = time.time()
+                self.conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self.conn.commit()
+
+            self.hits += len(found)
+            self.misses += len(unique_keys) - len(found)
+        return found
+
+    def put_many(self, items: Dict[str, List[float]]) -> None:
+        """ベクトルを保存し、上限を超えた分を古い順に削除"""
+        if not items:
+            return
+        now = time.time()
+        rows = [
+            (key, np.asarray(vector, dtype=np.float32).tobytes(), now)
+            for key, vector in items.items()
+        ]
+        with self._lock:
+            before = self.conn.total_changes
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector, last_access) VALUES (?, ?, ?)",
+                rows
+            )
+            self.entries += self.conn.total_changes - before
+            self._evict()
+            self.conn.commit()
+
+    def _evict(self) -> None:
+        overflow = self.entries - self.max_entries
+        if overflow <= 0:
+            return
+        self.conn.execute(
+            """
+            DELETE FROM embeddings WHERE key IN (
+                SELECT key FROM embeddings ORDER BY last_access LIMIT ?
+            )
+            """,
+            (overflow,)
+        )
+        self.entries -= overflow
+        self.evictions += overflow
+        logger.info(f"Evicted {overflow} entries from embedding cache")
+
+    def clear(self) -> None:
+        """キャッシュの全削除"""
+        with self._lock:
+            self.conn.execute("DELETE FROM embeddings")
+            self.conn.commit()
+            self.entries = 0
+
+    def get_stats(self) -> Dict:
+        """ヒット率などの統計情報"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": self.entries,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self.conn.close()
+
+
+class CachedEmbeddings(Embeddings):
+    """EmbeddingCacheを経由してドキュメントを埋め込むラッパー"""
+
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache, model_name: str):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model_name = model_name
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self.cache.make_key(self.model_name, text) for text in texts]
+        try:
+            vectors = self.cache.get_many(keys)
+        except Exception as e:
+            logger.error(f"Error reading embedding cache: {str(e)}")
+            vectors = {}
+
+        # キャッシュに無いテキストのみを埋め込む（同一テキストは1回だけ）
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors and key not in missing:
+                missing[key] = text
+
+        if missing:
+            logger.info(f"Embedding {len(missing)} of {len(texts)} texts (cache miss)")
+            new_vectors = self.embeddings.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), new_vectors))
+            try:
+                self.cache.put_many(computed)
+            except Exception as e:
+                logger.error(f"Error writing embedding cache: {str(e)}")
+            vectors.update(computed)
+
+        return [vectors[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
+
+
+def build_cached_embeddings(embeddings: Embeddings, model_name: str, config: Dict) -> Optional[CachedEmbeddings]:
+    """設定に従ってキャッシュ付き埋め込みを作成（無効時はNone）"""
+    if not config.get('enabled', False):
+        return None
+    cache = EmbeddingCache(config['path'], config.get('max_entries', 500_000))
+    return CachedEmbeddings(embeddings, cache, model_name)
@@ -0,0 +1,151 @@
+from typing import Callable, Dict, List, Optional, Sequence
+from collections import Counter
+import re
+import time
+
+# 説明を求める質問（長めの回答を許す）
+_EXPLANATION_PATTERN = re.compile(
+    r"\b(why|how|explain|describe|compare|difference)\b|なぜ|どうして|どのように|説明|比較|違い|仕組み",
+    re.IGNORECASE
+)
+# 事実を問う質問（短い回答で十分）
+_FACTOID_PATTERN = re.compile(
+    r"^\s*(who|what|when|where|which|how (many|much|old|long))\b|とは|誰|いつ|どこ|何|いくつ",
+    re.IGNORECASE
+)
+
+
+def classify_query(query: str, model_type: str = "llama") -> str:
+    """生成の長さを決めるための質問の種類（'code'・'explanation'・'factoid'・'default'）"""
+    if model_type == "codellama":
+        return "code"
+    if _EXPLANATION_PATTERN.search(query):
+        return "explanation"
+    if _FACTOID_PATTERN.search(query):
+        return "factoid"
+    return "default"
+
+
+def resolve_max_new_tokens(requested: Optional[int], prompt_tokens: int, max_length: int) -> int:
+    """生成するトークン数の上限（指定値とプロンプトの残りの長さの小さい方）"""
+    remaining = max(1, max_length - prompt_tokens)
+    return min(requested, remaining) if requested else remaining
+
+
+class StopConditions:
+    """1回の生成を止める条件と、止まった理由
+
+    停止文字列・同じn-gramの繰り返し・締め切り時刻を生成したトークンごとに調べる。
+    reasonは 'stop'（停止文字列）・'repetition'・'deadline'・'cancelled' のほか、
+    どれにも当たらなければ終了時に 'eos' か 'length' になる。
+    """
+
+    def __init__(self, stop_strings: Sequence[str] = (), repeat_ngram_size: int = 0,
+                 max_ngram_repeats: int = 3, max_seconds: Optional[float] = None):
+        self.stop_strings = tuple(stop for stop in stop_strings if stop)
+        self.repeat_ngram_size = repeat_ngram_size
+        self.max_ngram_repeats = max_ngram_repeats
+        self.max_seconds = max_seconds
+        self.reason: Optional[str] = None
+        self.generated_tokens = 0
+        self._tokens: List[int] = []
+        self._ngrams: Counter = Counter()
+        self._deadline: Optional[float] = None
+        # 停止文字列の判定でデコードする末尾のトークン数（1トークンは1文字以上）
+        self._window = max((len(stop) for stop in self.stop_strings), default=0) + 1
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict]) -> "StopConditions":
+        config = config or {}
+        return cls(
+            stop_strings=config.get('stop_strings', ()),
+            repeat_ngram_size=config.get('repeat_ngram_size', 0),
+            max_ngram_repeats=config.get('max_ngram_repeats', 3),
+            max_seconds=config.get('max_seconds')
+        )
+
+    def start(self) -> None:
+        """締め切りの計測を始める（生成の開始時に呼ぶ）"""
+        if self.max_seconds:
+            self._deadline = time.monotonic() + self.max_seconds
+
+    def update(self, token_id: int, decode: Callable[[List[int]], str]) -> Optional[str]:
+        """生成したトークンを1つ追加し、止める理由（続けるならNone）を返す"""
+        if self.reason is not None:
+            return self.reason
+        if self._deadline is None:
+            self.start()
+        self._tokens.append(token_id)
+        self.generated_tokens += 1
+
+        n = self.repeat_ngram_size
+        if n and len(self._tokens) >= n:
+            ngram = tuple(self._tokens[-n:])
+            self._ngrams[ngram] += 1
+            if self._ngrams[ngram] >= self.max_ngram_repeats:
+                self.reason = "repetition"
+                return self.reason
+
+        if self.stop_strings:
+            tail = decode(self._tokens[-self._window:])
+            if any(stop in tail for stop in self.stop_strings):
+                self.reason = "stop"
+                return self.reason
+
+        if self._deadline is not None and time.monotonic() >= self._deadline:
+            self.reason = "deadline"
+        return self.reason
+
+    def finish(self, reason: str) -> str:
+        """条件に当たらずに終わった場合の理由を記録（'eos'・'length'・'cancelled'）"""
+        if self.reason is None:
+            self.reason = reason
+        return self.reason
+
+    def trim(self, text: Optional[str]) -> Optional[str]:
+        """最初の停止文字列より前のテキスト"""
+        if not text:
+            return text
+        for stop in self.stop_strings:
+            index = text.find(stop)
+            if index != -1:
+                text = text[:index]
+        return text.strip() or None
+
+
+class StopStringFilter:
+    """逐次出力するテキストから停止文字列とそれ以降を取り除く
+
+    停止文字列の先頭と一致する可能性のある末尾は、続きが来るまで出力を保留する。
+    """
+
+    def __init__(self, stop_strings: Sequence[str]):
+        self.stop_strings = tuple(stop for stop in stop_strings if stop)
+        self.stopped = False
+        self._pending = ""
+
+    def feed(self, text: str) -> str:
+        """出力してよいテキスト"""
+        if self.stopped:
+            return ""
+        self._pending += text
+        index = min((i for i in (self._pending.find(stop) for stop in self.stop_strings) if i != -1), default=-1)
+        if index != -1:
+            self.stopped = True
+            ready, self._pending = self._pending[:index], ""
+            return ready
+        hold = max((self._partial_match(stop) for stop in self.stop_strings), default=0)
+        ready, self._pending = self._pending[:len(self._pending) - hold], self._pending[len(self._pending) - hold:]
+        return ready
+
+    def flush(self) -> str:
+        """保留していたテキスト（生成の終了時に呼ぶ）"""
+        ready, self._pending = ("" if self.stopped else self._pending), ""
+        return ready
+
+    def _partial_match(self, stop: str) -> int:
+        """保留中のテキストの末尾と一致する停止文字列の先頭部分の長さ"""
+        for length in range(min(len(stop) - 1, len(self._pending)), 0, -1):
+            if self._pending.endswith(stop[:length]):
+                return length
+        return 0
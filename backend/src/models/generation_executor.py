@@ -0,0 +1,155 @@
+from typing import Any, Callable, Deque, Dict, Optional
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+import asyncio
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# 待ち時間・実行時間の統計に使う直近のサンプル数
+_TIMING_SAMPLES = 1000
+
+
+class GenerationQueueFull(Exception):
+    """生成キューが上限に達している"""
+
+
+@dataclass
+class GenerationResult:
+    output: Any
+    queue_seconds: float  # ワーカーが空くまでの待ち時間
+    run_seconds: float  # ワーカーでの実行時間
+    stop_reason: Optional[str] = None  # 生成が止まった理由（'eos'・'length'・'stop'など）
+    generated_tokens: int = 0
+    speculative: Optional[Dict] = None  # 投機的デコードの受け入れ率・tokens/secなど
+
+
+def _summarize(samples: Deque[float]) -> Dict[str, float]:
+    if not samples:
+        return {"count": 0, "mean_ms": 0.0, "p50_ms": 0.0, "p95_ms": 0.0, "max_ms": 0.0}
+    ordered = sorted(samples)
+    return {
+        "count": len(ordered),
+        "mean_ms": 1000 * sum(ordered) / len(ordered),
+        "p50_ms": 1000 * ordered[len(ordered) // 2],
+        "p95_ms": 1000 * ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        "max_ms": 1000 * ordered[-1],
+    }
+
+
+class GenerationExecutor:
+    """LLMの生成をイベントループの外で実行する上限付きワーカープール
+
+    同時に実行する生成はmax_workers件まで、待機はmax_queue件までで、それを超える
+    投入はGenerationQueueFullで拒否する。モデルはプロセス内で共有するため
+    ワーカーはスレッド（torchの演算中はGILを解放する）。待機中に呼び出し元が
+    キャンセルされた生成は実行されない。待ち時間と実行時間は別々に記録する。
+    """
+
+    def __init__(self, max_workers: int = 1, max_queue: int = 32):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="generation")
+        self._lock = threading.Lock()
+        self._pending = 0  # 待機中＋実行中
+        self._running = 0
+        self._queue_times: Deque[float] = deque(maxlen=_TIMING_SAMPLES)
+        self._run_times: Deque[float] = deque(maxlen=_TIMING_SAMPLES)
+        self._stats = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "rejected": 0,
+            "cancelled": 0,
+        }
+
+    @classmethod
+    def from_config(cls, config: Dict) -> "GenerationExecutor":
+        return cls(max_workers=config.get('max_workers', 1), max_queue=config.get('max_queue', 32))
+
+    async def run(self, fn: Callable, *args, **kwargs) -> GenerationResult:
+        """fnをワーカーで実行し、結果と待ち時間・実行時間を返す"""
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                self._stats["rejected"] += 1
+                raise GenerationQueueFull(
+                    f"Generation queue is full ({self.max_queue} waiting, {self.max_workers} running)"
+                )
+            self._pending += 1
+            self._stats["submitted"] += 1
+
+        submitted_at = time.perf_counter()
+
+        def task():
+            started_at = time.perf_counter()
+            with self._lock:
+                self._running += 1
+                self._queue_times.append(started_at - submitted_at)
+            try:
+                return fn(*args, **kwargs), started_at
+            finally:
+                finished_at = time.perf_counter()
+                with self._lock:
+                    self._running -= 1
+                    self._pending -= 1
+                    self._run_times.append(finished_at - started_at)
+
+        try:
+            future = self._executor.submit(task)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            raise
+
+        try:
+            output, started_at = await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            with self._lock:
+                self._stats["cancelled"] += 1
+                # 開始前なら取り消す（実行中の生成は最後まで走り、終了時に数から外れる）
+                if future.cancel():
+                    self._pending -= 1
+            raise
+        except Exception:
+            with self._lock:
+                self._stats["failed"] += 1
+            raise
+
+        finished_at = time.perf_counter()
+        with self._lock:
+            self._stats["completed"] += 1
+        return GenerationResult(
+            output=output,
+            queue_seconds=started_at - submitted_at,
+            run_seconds=finished_at - started_at
+        )
+
+    def get_metrics(self) -> Dict:
+        with self._lock:
+            return {
+                **self._stats,
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "running": self._running,
+                "queued": self._pending - self._running,
+                "queue_wait": _summarize(self._queue_times),
+                "run_time": _summarize(self._run_times),
+            }
+
+    def shutdown(self, wait: bool = False) -> None:
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+
+_default_executor: Optional[GenerationExecutor] = None
+
+
+def get_default_executor() -> GenerationExecutor:
+    """executorを指定しないモデルが共有する既定のワーカープール"""
+    global _default_executor
+    if _default_executor is None:
+        from ..utils.rag_config import RAG_CONFIG
+        _default_executor = GenerationExecutor.from_config(RAG_CONFIG['generation'])
+    return _default_executor
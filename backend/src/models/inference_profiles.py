@@ -0,0 +1,113 @@
+from typing import Dict, Optional
+from dataclasses import dataclass
+import logging
+import os
+import resource
+import sys
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class InferenceProfile:
+    """LLMの読み込み方（精度・量子化・配置）"""
+    name: str
+    dtype: str  # torchのdtype名
+    device: str  # 'cpu' またはGPUに自動配置する 'auto'
+    quantize_int8: bool = False  # 線形層を動的int8量子化（CPUのみ）
+
+
+INFERENCE_PROFILES = {
+    'gpu_fp16': InferenceProfile('gpu_fp16', 'float16', 'auto'),
+    'fp32': InferenceProfile('fp32', 'float32', 'cpu'),
+    'bf16': InferenceProfile('bf16', 'bfloat16', 'cpu'),
+    'int8': InferenceProfile('int8', 'float32', 'cpu', quantize_int8=True),
+}
+
+
+def resolve_profile(name: str = 'auto', cuda_available: Optional[bool] = None) -> InferenceProfile:
+    """プロファイル名から設定を取得（'auto' ならCUDAが使えればgpu_fp16、無ければfp32）"""
+    if name == 'auto':
+        if cuda_available is None:
+            import torch
+            cuda_available = torch.cuda.is_available()
+        name = 'gpu_fp16' if cuda_available else 'fp32'
+    if name not in INFERENCE_PROFILES:
+        raise ValueError(f"Unknown inference profile: {name}")
+    return INFERENCE_PROFILES[name]
+
+
+def configure_threads(num_threads: int = 0, num_interop_threads: int = 0) -> None:
+    """torchのintra-op・inter-opスレッド数を設定（0なら変更しない）"""
+    import torch
+
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    if num_interop_threads:
+        try:
+            torch.set_num_interop_threads(num_interop_threads)
+        except RuntimeError as e:
+            # 並列処理を一度でも実行した後は変更できない
+            logger.warning(f"Could not set inter-op threads: {str(e)}")
+
+
+def apply_profile(model, profile: InferenceProfile):
+    """読み込み済みのモデルをプロファイルのdtype・量子化に変換"""
+    import torch
+
+    # 読み込み時にdtypeを指定済みなら変換しない（device_mapで配置したモデルは移動できない）
+    dtype = getattr(torch, profile.dtype)
+    if model.dtype != dtype:
+        model = model.to(dtype)
+    model = model.eval()
+    if profile.quantize_int8:
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+
+def load_causal_lm(model_id: str, profile: InferenceProfile, **kwargs):
+    """プロファイルに従ってCausalLMを読み込む"""
+    import torch
+    from transformers import AutoModelForCausalLM
+
+    options = {'torch_dtype': getattr(torch, profile.dtype), 'low_cpu_mem_usage': True, **kwargs}
+    if profile.device == 'auto':
+        options['device_map'] = "auto"
+    return apply_profile(AutoModelForCausalLM.from_pretrained(model_id, **options), profile)
+
+
+def model_memory_bytes(model) -> int:
+    """モデルの重みとバッファのバイト数（量子化した線形層のパック済みの重みも含む）"""
+    total = 0
+    for value in model.state_dict().values():
+        tensors = value if isinstance(value, tuple) else (value,)
+        for tensor in tensors:
+            if hasattr(tensor, "element_size"):
+                total += tensor.numel() * tensor.element_size()
+    return total
+
+
+def resident_memory_bytes() -> int:
+    """プロセスの常駐メモリ（RSS）のバイト数"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # /procが無い環境では最大RSS（macOSはバイト、Linuxはキロバイト）
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def profile_report(profile: InferenceProfile, model, tokens: int, seconds: float) -> Dict:
+    """プロファイルのメモリ使用量と生成速度"""
+    import torch
+
+    return {
+        "profile": profile.name,
+        "dtype": profile.dtype,
+        "quantized_int8": profile.quantize_int8,
+        "num_threads": torch.get_num_threads(),
+        "model_bytes": model_memory_bytes(model),
+        "resident_bytes": resident_memory_bytes(),
+        "tokens_per_second": tokens / seconds if seconds else 0.0,
+    }
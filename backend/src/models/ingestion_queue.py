@@ -0,0 +1,365 @@
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import asyncio
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# 取り込みの段階（progressは完了した段階の割合と実行中の段階の進み具合から求める）
+STAGES = ("fetch", "parse", "embed", "store")
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+
+_JOB_COLUMNS = (
+    "id, url, category, status, stage, progress, attempts, max_attempts, next_run_at, "
+    "created_at, started_at, finished_at, error, result"
+)
+
+
+class PermanentIngestionError(Exception):
+    """再試行しても成功しない取り込みの失敗（内容が無い、404など）"""
+
+
+def backoff_delay(attempt: int, base_seconds: float, max_seconds: float, jitter: float = 0.1) -> float:
+    """attempt回目の失敗後に待つ秒数（指数バックオフ、同時の再試行が揃わないように揺らす）"""
+    delay = min(max_seconds, base_seconds * (2 ** max(0, attempt - 1)))
+    return delay * (1.0 + random.uniform(-jitter, jitter))
+
+
+def stage_progress(stage: str, fraction: float = 0.0) -> float:
+    """段階とその中の進み具合からジョブ全体の進捗（0〜1）を求める"""
+    index = STAGES.index(stage)
+    return (index + min(max(fraction, 0.0), 1.0)) / len(STAGES)
+
+
+class IngestionQueue:
+    """URLの取り込みジョブをSQLite（WALモード）に永続化するキュー
+
+    ジョブは queued → running → succeeded / failed と遷移し、失敗した場合は
+    next_run_at を先に延ばして queued に戻す。実行中にプロセスが終了した
+    ジョブは再起動時に recover() で queued に戻す。同じソース（category, url）の
+    ジョブは同時に1つだけ実行する。
+    """
+
+    def __init__(self, path: str, max_attempts: int = 5):
+        self.path = path
+        self.max_attempts = max_attempts
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                category TEXT NOT NULL,
+                status TEXT NOT NULL,
+                stage TEXT,
+                progress REAL NOT NULL DEFAULT 0,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL,
+                next_run_at REAL NOT NULL,
+                created_at TEXT NOT NULL,
+                started_at TEXT,
+                finished_at TEXT,
+                error TEXT,
+                result TEXT,
+                seq INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS idx_jobs_ready ON jobs(status, next_run_at, seq);
+            CREATE INDEX IF NOT EXISTS idx_jobs_source ON jobs(category, url, status);
+            """
+        )
+        self.conn.commit()
+
+    def enqueue_many(self, items: Iterable[Tuple[str, str]]) -> List[str]:
+        """(URL, カテゴリ) の列をジョブとして登録し、ジョブIDを返す（1トランザクション）"""
+        now = time.time()
+        created_at = datetime.now().isoformat()
+        rows = [
+            (uuid.uuid4().hex, url, category, QUEUED, self.max_attempts, now, created_at)
+            for url, category in items
+        ]
+        with self._lock, self.conn:
+            seq = self.conn.execute("SELECT COALESCE(MAX(seq), 0) FROM jobs").fetchone()[0]
+            self.conn.executemany(
+                "INSERT INTO jobs (id, url, category, status, max_attempts, next_run_at, created_at, seq) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [row + (seq + i + 1,) for i, row in enumerate(rows)]
+            )
+        return [row[0] for row in rows]
+
+    def enqueue(self, url: str, category: str = "general") -> str:
+        return self.enqueue_many([(url, category)])[0]
+
+    def claim(self, now: Optional[float] = None) -> Optional[Dict]:
+        """実行可能なジョブを登録順に1つ取り出して running にする（無ければNone）"""
+        now = time.time() if now is None else now
+        with self._lock, self.conn:
+            row = self.conn.execute(
+                f"""
+                SELECT {_JOB_COLUMNS} FROM jobs AS job
+                WHERE status = ? AND next_run_at <= ?
+                  AND NOT EXISTS (
+                      SELECT 1 FROM jobs AS other
+                      WHERE other.status = ? AND other.category = job.category AND other.url = job.url
+                  )
+                ORDER BY next_run_at, seq LIMIT 1
+                """,
+                (QUEUED, now, RUNNING)
+            ).fetchone()
+            if row is None:
+                return None
+            job = self._row_to_job(row)
+            job.update(
+                status=RUNNING, stage=STAGES[0], progress=0.0,
+                attempts=job["attempts"] + 1, started_at=datetime.now().isoformat(), error=None
+            )
+            self.conn.execute(
+                "UPDATE jobs SET status = ?, stage = ?, progress = 0, attempts = ?, started_at = ?, error = NULL "
+                "WHERE id = ?",
+                (RUNNING, job["stage"], job["attempts"], job["started_at"], job["id"])
+            )
+        return job
+
+    def update_progress(self, job_id: str, stage: str, progress: float) -> None:
+        with self._lock, self.conn:
+            self.conn.execute(
+                "UPDATE jobs SET stage = ?, progress = ? WHERE id = ?", (stage, progress, job_id)
+            )
+
+    def complete(self, job_id: str, result: Optional[Dict] = None) -> None:
+        with self._lock, self.conn:
+            self.conn.execute(
+                "UPDATE jobs SET status = ?, progress = 1, finished_at = ?, result = ? WHERE id = ?",
+                (SUCCEEDED, datetime.now().isoformat(), json.dumps(result or {}), job_id)
+            )
+
+    def fail(self, job_id: str, error: str, retry_delay: Optional[float]) -> bool:
+        """失敗を記録（retry_delayがあり試行回数が残っていれば再試行する）。再試行するならTrue"""
+        with self._lock, self.conn:
+            row = self.conn.execute(
+                "SELECT attempts, max_attempts FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            if row is None:
+                return False
+            attempts, max_attempts = row
+            if retry_delay is not None and attempts < max_attempts:
+                self.conn.execute(
+                    "UPDATE jobs SET status = ?, next_run_at = ?, error = ? WHERE id = ?",
+                    (QUEUED, time.time() + retry_delay, error, job_id)
+                )
+                return True
+            self.conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, error = ? WHERE id = ?",
+                (FAILED, datetime.now().isoformat(), error, job_id)
+            )
+            return False
+
+    def recover(self) -> int:
+        """前回の実行中に中断されたジョブを queued に戻す（起動時に呼ぶ）"""
+        with self._lock, self.conn:
+            return self.conn.execute(
+                "UPDATE jobs SET status = ?, stage = NULL, progress = 0 WHERE status = ?", (QUEUED, RUNNING)
+            ).rowcount
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self.conn.execute(f"SELECT {_JOB_COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def counts(self) -> Dict[str, int]:
+        """状態ごとのジョブ数（queuedのうち再試行待ちの数も含む）"""
+        with self._lock:
+            rows = self.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+            waiting = self.conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = ? AND attempts > 0", (QUEUED,)
+            ).fetchone()[0]
+        counts = {status: 0 for status in (QUEUED, RUNNING, SUCCEEDED, FAILED)}
+        counts.update(dict(rows))
+        counts["retry_waiting"] = waiting
+        return counts
+
+    @staticmethod
+    def _row_to_job(row) -> Dict:
+        (job_id, url, category, status, stage, progress, attempts, max_attempts, next_run_at,
+         created_at, started_at, finished_at, error, result) = row
+        return {
+            "id": job_id,
+            "url": url,
+            "category": category,
+            "status": status,
+            "stage": stage,
+            "progress": progress,
+            "attempts": attempts,
+            "max_attempts": max_attempts,
+            "next_run_at": next_run_at,
+            "created_at": created_at,
+            "started_at": started_at,
+            "finished_at": finished_at,
+            "error": error,
+            "result": json.loads(result) if result else None
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self.conn.close()
+
+
+# ジョブの処理関数: (ジョブ, 進捗の通知 (stage, fraction)) -> 結果の辞書。ワーカーのスレッドで実行する
+IngestionHandler = Callable[[Dict, Callable[[str, float], None]], Optional[Dict]]
+
+
+class IngestionWorkers:
+    """キューのジョブを一定数のワーカーで処理する
+
+    処理は専用のスレッドプールで実行するため、取り込みが大量にあっても
+    イベントループや検索の埋め込みで使う既定のスレッドプールを占有しない。
+    一時的な失敗は指数バックオフで再試行し、PermanentIngestionError は再試行しない。
+    """
+
+    def __init__(self, queue: IngestionQueue, handler: IngestionHandler, num_workers: int = 2,
+                 poll_interval: float = 0.5, retry_base_seconds: float = 2.0, retry_max_seconds: float = 300.0,
+                 throughput_window_seconds: float = 60.0):
+        self.queue = queue
+        self.handler = handler
+        self.num_workers = num_workers
+        self.poll_interval = poll_interval
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.throughput_window_seconds = throughput_window_seconds
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+
+        # メトリクス（ワーカーのスレッドから更新する）
+        self._metrics_lock = threading.Lock()
+        self.completed = 0
+        self.failed = 0
+        self.retried = 0
+        self.stage_seconds = {stage: 0.0 for stage in STAGES}
+        self._finished_at = deque()
+
+    @classmethod
+    def from_config(cls, queue: IngestionQueue, handler: IngestionHandler, config: Dict) -> "IngestionWorkers":
+        return cls(
+            queue, handler,
+            num_workers=config['num_workers'],
+            poll_interval=config['poll_interval_seconds'],
+            retry_base_seconds=config['retry_base_seconds'],
+            retry_max_seconds=config['retry_max_seconds']
+        )
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def start(self) -> None:
+        """ワーカーを起動（イベントループ上で呼ぶ）"""
+        if self._tasks:
+            return
+        recovered = self.queue.recover()
+        if recovered:
+            logger.info(f"Re-queued {recovered} interrupted ingestion jobs")
+        self._executor = ThreadPoolExecutor(max_workers=self.num_workers, thread_name_prefix="ingestion")
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.num_workers)]
+
+    async def stop(self) -> None:
+        """ワーカーを止める（実行中のジョブは次回の起動時に再実行される）"""
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def notify(self) -> None:
+        """ジョブが追加されたことを待機中のワーカーに知らせる"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _worker(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await loop.run_in_executor(self._executor, self.queue.claim)
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await loop.run_in_executor(self._executor, self.run_job, job)
+
+    def run_job(self, job: Dict) -> None:
+        """1つのジョブを実行し、結果をキューに記録（ワーカーのスレッドで実行）"""
+        timer = {"stage": STAGES[0], "started": time.perf_counter()}
+
+        def finish_stage() -> float:
+            now = time.perf_counter()
+            with self._metrics_lock:
+                self.stage_seconds[timer["stage"]] += now - timer["started"]
+            return now
+
+        def report(stage: str, fraction: float = 0.0) -> None:
+            if stage != timer["stage"]:
+                timer.update(stage=stage, started=finish_stage())
+            self.queue.update_progress(job["id"], stage, stage_progress(stage, fraction))
+
+        try:
+            result = self.handler(job, report)
+            self.queue.complete(job["id"], result)
+            with self._metrics_lock:
+                self.completed += 1
+                self._finished_at.append(time.monotonic())
+            logger.info(f"Ingestion job {job['id']} for {job['url']} succeeded")
+        except Exception as e:
+            permanent = isinstance(e, PermanentIngestionError)
+            delay = None if permanent else backoff_delay(
+                job["attempts"], self.retry_base_seconds, self.retry_max_seconds
+            )
+            retrying = self.queue.fail(job["id"], f"{timer['stage']}: {str(e)}", delay)
+            with self._metrics_lock:
+                if retrying:
+                    self.retried += 1
+                else:
+                    self.failed += 1
+            if retrying:
+                logger.warning(
+                    f"Ingestion job {job['id']} failed at {timer['stage']} "
+                    f"(attempt {job['attempts']}), retrying in {delay:.1f}s: {str(e)}"
+                )
+            else:
+                logger.error(f"Ingestion job {job['id']} for {job['url']} failed: {str(e)}")
+        finally:
+            finish_stage()
+
+    def get_metrics(self) -> Dict:
+        now = time.monotonic()
+        with self._metrics_lock:
+            while self._finished_at and now - self._finished_at[0] > self.throughput_window_seconds:
+                self._finished_at.popleft()
+            recent = len(self._finished_at)
+        return {
+            "workers": self.num_workers,
+            "running": self.running,
+            "queue": self.queue.counts(),
+            "completed": self.completed,
+            "failed": self.failed,
+            "retried": self.retried,
+            "jobs_per_minute": recent * 60.0 / self.throughput_window_seconds,
+            "stage_seconds": dict(self.stage_seconds),
+        }
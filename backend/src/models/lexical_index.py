@@ -0,0 +1,423 @@
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from collections import Counter, defaultdict
+import json
+import logging
+import math
+import os
+import re
+import threading
+import unicodedata
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 英数字の識別子（error_code, torch.nn, E1102 など）と日本語の連続部分
+_TOKEN_RE = re.compile(r'[a-z0-9]+(?:[_\-.][a-z0-9]+)*|[ぁ-んァ-ヶー一-龥々]+')
+_CJK_RE = re.compile(r'[ぁ-んァ-ヶー一-龥々]')
+_SUBPART_RE = re.compile(r'[_\-.]')
+# トークン化を変えたら上げる（保存済みのインデックスは読み込まずにストアから作り直す）
+_TOKENIZER_VERSION = 2
+
+
+def tokenize(text: str) -> List[str]:
+    """英語は単語単位、日本語は文字bigramでトークン化
+
+    . _ - でつないだ識別子は全体に加えて各部分も出す（torch.nn.linear → torch, nn, linear）。
+    """
+    text = unicodedata.normalize('NFKC', text).lower()
+    tokens = []
+    for match in _TOKEN_RE.finditer(text):
+        token = match.group()
+        if _CJK_RE.match(token):
+            if len(token) == 1:
+                tokens.append(token)
+            else:
+                tokens.extend(token[i:i + 2] for i in range(len(token) - 1))
+        else:
+            tokens.append(token)
+            parts = _SUBPART_RE.split(token)
+            if len(parts) > 1:
+                tokens.extend(parts)
+    return tokens
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """複数の順位リストをReciprocal Rank Fusionで統合"""
+    scores: Dict[str, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] += 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class LexicalIndex:
+    """BM25の転置インデックス
+
+    ポスティングはCSR形式のNumPy配列（語ごとの文書番号・出現回数）で保持し、
+    追加分は小さな差分に貯めて一定量ごとに配列へマージする。
+    削除は墓標で管理し、マージ時に取り除く。
+
+    保存はマージ済みの配列のスナップショットと、その後の追加・削除を追記するログに分ける。
+    スナップショットを書き直すのはマージが起きた後だけで、それ以外の save() は
+    前回の保存以降の操作をログに追記するだけなので、コーパスの大きさに依らない。
+    """
+
+    def __init__(self, directory: Optional[str] = None, k1: float = 1.2, b: float = 0.75,
+                 merge_threshold: int = 200_000):
+        self.directory = directory
+        self.k1 = k1
+        self.b = b
+        self.merge_threshold = merge_threshold
+        self._lock = threading.RLock()
+        # ファイルの書き込みの直列化（検索用の_lockはファイルの書き込み中は持たない）
+        self._save_lock = threading.Lock()
+        self._reset()
+        if directory and os.path.exists(self._meta_path):
+            self.load()
+
+    def _reset(self) -> None:
+        self.vocab: Dict[str, int] = {}
+        self.doc_ids: List[str] = []
+        self._doc_index: Dict[str, int] = {}
+        self._doc_lengths = np.zeros(0, dtype=np.int32)
+        self._alive = np.zeros(0, dtype=bool)
+        self._live_count = 0
+        self._total_length = 0
+        # マージ済みポスティング（CSR）
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._post_docs = np.zeros(0, dtype=np.int32)
+        self._post_tfs = np.zeros(0, dtype=np.int32)
+        self._post_impacts = np.zeros(0, dtype=np.float32)
+        # 検索時のスコア累積用（クエリ間で再利用）
+        self._scores = np.zeros(0, dtype=np.float32)
+        # 未マージの差分（_merged_docs以降の文書番号）
+        self._pending: Dict[int, List[Tuple[int, int]]] = defaultdict(list)
+        self._pending_count = 0
+        self._merged_docs = 0
+        # 前回の保存以降の操作（ログに追記する）とスナップショットの世代
+        self._unsaved_ops: List[Dict] = []
+        self._snapshot_stale = True
+        self._generation = 0
+
+    @property
+    def _meta_path(self) -> str:
+        return os.path.join(self.directory, "lexical_index.json")
+
+    @property
+    def _arrays_path(self) -> str:
+        return os.path.join(self.directory, "lexical_index.npz")
+
+    @property
+    def _log_path(self) -> str:
+        return os.path.join(self.directory, "lexical_index.log")
+
+    def __len__(self) -> int:
+        return self._live_count
+
+    def add(self, ids: Sequence[str], texts: Sequence[str]) -> None:
+        """文書を追加（同じIDがあれば置き換え）"""
+        self._add_counts(ids, [Counter(tokenize(text)) for text in texts])
+
+    def _add_counts(self, ids: Sequence[str], term_counts: Sequence[Dict[str, int]]) -> None:
+        """語ごとの出現回数で文書を追加（ログの再生でも使う）"""
+        with self._lock:
+            self.remove([doc_id for doc_id in ids if doc_id in self._doc_index])
+            if self.directory:
+                self._unsaved_ops.append({"add": list(ids), "terms": [dict(counts) for counts in term_counts]})
+
+            start, end = len(self.doc_ids), len(self.doc_ids) + len(ids)
+            if end > len(self._alive):
+                # 容量を倍々に広げる（追加のたびに全文書分の配列をコピーしない）
+                grow = max(end, 2 * len(self._alive)) - len(self._alive)
+                self._doc_lengths = np.concatenate([self._doc_lengths, np.zeros(grow, dtype=np.int32)])
+                self._alive = np.concatenate([self._alive, np.zeros(grow, dtype=bool)])
+
+            for doc, (doc_id, counts) in enumerate(zip(ids, term_counts), start):
+                for term, tf in counts.items():
+                    term_id = self.vocab.setdefault(term, len(self.vocab))
+                    self._pending[term_id].append((doc, tf))
+                self._pending_count += len(counts)
+                self._doc_lengths[doc] = sum(counts.values())
+                self.doc_ids.append(doc_id)
+                self._doc_index[doc_id] = doc
+
+            self._alive[start:end] = True
+            self._live_count += len(ids)
+            self._total_length += int(self._doc_lengths[start:end].sum())
+
+            if self._pending_count >= self.merge_threshold:
+                self.merge()
+
+    def remove(self, ids: Iterable[str]) -> None:
+        """文書を削除（墓標を立てる）"""
+        with self._lock:
+            removed = []
+            for doc_id in ids:
+                doc = self._doc_index.pop(doc_id, None)
+                if doc is None or not self._alive[doc]:
+                    continue
+                removed.append(doc_id)
+                self._alive[doc] = False
+                self._live_count -= 1
+                self._total_length -= int(self._doc_lengths[doc])
+            if removed and self.directory:
+                self._unsaved_ops.append({"remove": removed})
+
+    def merge(self) -> None:
+        """差分と墓標をCSR配列に反映"""
+        with self._lock:
+            n_terms = len(self.vocab)
+            term_ids = np.repeat(
+                np.arange(len(self._offsets) - 1, dtype=np.int32), np.diff(self._offsets)
+            )
+            docs, tfs = self._post_docs, self._post_tfs
+
+            if self._pending:
+                pending_terms = np.fromiter(
+                    (term for term, postings in self._pending.items() for _ in postings), dtype=np.int32
+                )
+                pending = np.array(
+                    [posting for postings in self._pending.values() for posting in postings], dtype=np.int32
+                ).reshape(-1, 2)
+                term_ids = np.concatenate([term_ids, pending_terms])
+                docs = np.concatenate([docs, pending[:, 0]])
+                tfs = np.concatenate([tfs, pending[:, 1]])
+
+            keep = self._alive[docs] if len(docs) else np.zeros(0, dtype=bool)
+            term_ids, docs, tfs = term_ids[keep], docs[keep], tfs[keep]
+            order = np.lexsort((docs, term_ids))
+
+            self._post_docs = docs[order]
+            self._post_tfs = tfs[order]
+            counts = np.bincount(term_ids, minlength=n_terms)
+            self._offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+            self._post_impacts = self._impacts(self._post_docs, self._post_tfs)
+            self._pending = defaultdict(list)
+            self._pending_count = 0
+            self._merged_docs = len(self.doc_ids)
+            self._snapshot_stale = True
+
+    def _impacts(self, docs: np.ndarray, tfs: np.ndarray) -> np.ndarray:
+        """BM25の語ごとの寄与（idfを除く部分）"""
+        avg_length = self._total_length / self._live_count if self._live_count else 1.0
+        tfs = tfs.astype(np.float32)
+        norm = self.k1 * (1.0 - self.b + self.b * self._doc_lengths[docs] / avg_length)
+        return (tfs * (self.k1 + 1.0) / (tfs + norm)).astype(np.float32)
+
+    def _postings(self, term_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        """語のポスティング（文書番号とBM25寄与）"""
+        if term_id < len(self._offsets) - 1:
+            start, end = self._offsets[term_id], self._offsets[term_id + 1]
+            docs, impacts = self._post_docs[start:end], self._post_impacts[start:end]
+        else:
+            docs, impacts = np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32)
+
+        pending = self._pending.get(term_id)
+        if pending:
+            extra = np.array(pending, dtype=np.int32)
+            docs = np.concatenate([docs, extra[:, 0]])
+            impacts = np.concatenate([impacts, self._impacts(extra[:, 0], extra[:, 1])])
+        return docs, impacts
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        """BM25スコアの上位k件を返す"""
+        with self._lock:
+            if self._live_count == 0:
+                return []
+            term_ids = {self.vocab[t] for t in tokenize(query) if t in self.vocab}
+            if not term_ids:
+                return []
+
+            if len(self._scores) < len(self.doc_ids):
+                self._scores = np.zeros(len(self.doc_ids), dtype=np.float32)
+
+            # 各文書は語ごとに1回しか現れないため、累積配列へ直接加算できる
+            n_docs = self._live_count
+            touched = []
+            for term_id in term_ids:
+                docs, impacts = self._postings(term_id)
+                if not len(docs):
+                    continue
+                df = len(docs)
+                idf = math.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+                self._scores[docs] += idf * impacts
+                touched.append(docs)
+
+            if not touched:
+                return []
+            touched = np.concatenate(touched) if len(touched) > 1 else touched[0]
+            scores = self._scores[touched]
+            self._scores[touched] = 0.0
+            scores[~self._alive[touched]] = -np.inf
+
+            # 同じ文書は最大で語数回重複するので、その分多めに候補を取る
+            n_candidates = min(k * len(term_ids), len(touched))
+            top = np.argpartition(-scores, n_candidates - 1)[:n_candidates]
+            top = top[np.argsort(-scores[top], kind="stable")]
+
+            results = []
+            seen = set()
+            for i in top:
+                doc = int(touched[i])
+                if doc in seen or scores[i] == -np.inf:
+                    continue
+                seen.add(doc)
+                results.append((self.doc_ids[doc], float(scores[i])))
+                if len(results) == k:
+                    break
+            return results
+
+    def save(self) -> None:
+        """ディスクへ保存（マージ後はスナップショットを書き直し、それ以外は操作をログに追記）"""
+        if not self.directory:
+            return
+        with self._save_lock:
+            with self._lock:
+                ops, self._unsaved_ops = self._unsaved_ops, []
+                if not self._snapshot_stale:
+                    snapshot = None
+                else:
+                    # マージ済みの配列は置き換えるだけで書き換えないため、参照を取り出せばよい
+                    self._generation += 1
+                    self._snapshot_stale = False
+                    snapshot = {
+                        "generation": self._generation,
+                        "vocab": list(self.vocab),
+                        "doc_ids": self.doc_ids[:self._merged_docs],
+                        "alive": self._alive[:self._merged_docs].copy(),
+                        "doc_lengths": self._doc_lengths[:self._merged_docs].copy(),
+                        "offsets": self._offsets,
+                        "post_docs": self._post_docs,
+                        "post_tfs": self._post_tfs,
+                        "pending": self._pending_documents(),
+                    }
+
+            os.makedirs(self.directory, exist_ok=True)
+            if snapshot is None:
+                if ops:
+                    new_log = not os.path.exists(self._log_path)
+                    with open(self._log_path, "a", encoding="utf-8") as f:
+                        if new_log:
+                            f.write(json.dumps({"generation": self._generation}) + "\n")
+                        f.writelines(json.dumps(op, ensure_ascii=False) + "\n" for op in ops)
+                return
+            try:
+                self._write_snapshot(snapshot)
+            except Exception:
+                with self._lock:
+                    self._snapshot_stale = True
+                raise
+
+    def _pending_documents(self) -> Dict:
+        """未マージの生きている文書の追加操作（スナップショットと一緒にログの先頭に書く）"""
+        terms = list(self.vocab)
+        counts: Dict[int, Dict[str, int]] = defaultdict(dict)
+        for term_id, postings in self._pending.items():
+            for doc, tf in postings:
+                if self._alive[doc]:
+                    counts[doc][terms[term_id]] = tf
+        docs = [doc for doc in range(self._merged_docs, len(self.doc_ids)) if self._alive[doc]]
+        return {"add": [self.doc_ids[doc] for doc in docs], "terms": [counts.get(doc, {}) for doc in docs]}
+
+    def _write_snapshot(self, snapshot: Dict) -> None:
+        """スナップショットを書き、ログを世代の行と未マージの文書だけにする（一時ファイルから置き換え）"""
+        # 削除済み文書を詰めて保存する
+        alive = snapshot["alive"]
+        live = np.flatnonzero(alive)
+        remap = np.full(len(alive), -1, dtype=np.int32)
+        remap[live] = np.arange(len(live), dtype=np.int32)
+        post_docs = snapshot["post_docs"]
+        offsets = snapshot["offsets"]
+        term_ids = np.repeat(np.arange(len(offsets) - 1, dtype=np.int32), np.diff(offsets))
+        keep = alive[post_docs] if len(post_docs) else np.zeros(0, dtype=bool)
+        counts = np.bincount(term_ids[keep], minlength=len(snapshot["vocab"]))
+
+        arrays_tmp = self._arrays_path + ".tmp.npz"
+        np.savez(
+            arrays_tmp,
+            offsets=np.concatenate([[0], np.cumsum(counts)]).astype(np.int64),
+            post_docs=remap[post_docs[keep]],
+            post_tfs=snapshot["post_tfs"][keep],
+            doc_lengths=snapshot["doc_lengths"][live]
+        )
+        meta_tmp = self._meta_path + ".tmp"
+        with open(meta_tmp, "w", encoding="utf-8") as f:
+            json.dump({
+                "generation": snapshot["generation"],
+                "tokenizer": _TOKENIZER_VERSION,
+                "vocab": snapshot["vocab"],
+                "doc_ids": [snapshot["doc_ids"][i] for i in live]
+            }, f, ensure_ascii=False)
+        log_tmp = self._log_path + ".tmp"
+        with open(log_tmp, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"generation": snapshot["generation"]}) + "\n")
+            if snapshot["pending"]["add"]:
+                f.write(json.dumps(snapshot["pending"], ensure_ascii=False) + "\n")
+        os.replace(arrays_tmp, self._arrays_path)
+        os.replace(meta_tmp, self._meta_path)
+        os.replace(log_tmp, self._log_path)
+
+    def load(self) -> None:
+        """ディスクから読み込み（スナップショットの後にログの操作を再生）"""
+        with self._lock:
+            try:
+                with open(self._meta_path, encoding="utf-8") as f:
+                    meta = json.load(f)
+                if meta.get("tokenizer", 1) != _TOKENIZER_VERSION:
+                    logger.info(f"Lexical index in {self.directory} uses an older tokenizer; it will be rebuilt")
+                    self._reset()
+                    return
+                arrays = np.load(self._arrays_path)
+                self._reset()
+                self.vocab = {term: i for i, term in enumerate(meta["vocab"])}
+                self.doc_ids = meta["doc_ids"]
+                self._doc_index = {doc_id: i for i, doc_id in enumerate(self.doc_ids)}
+                self._offsets = arrays["offsets"]
+                self._post_docs = arrays["post_docs"]
+                self._post_tfs = arrays["post_tfs"]
+                self._doc_lengths = arrays["doc_lengths"]
+                self._alive = np.ones(len(self.doc_ids), dtype=bool)
+                self._live_count = len(self.doc_ids)
+                self._total_length = int(self._doc_lengths.sum())
+                self._post_impacts = self._impacts(self._post_docs, self._post_tfs)
+                self._merged_docs = len(self.doc_ids)
+                self._generation = meta.get("generation", 0)
+                self._snapshot_stale = False
+                replayed = self._replay_log()
+                logger.info(
+                    f"Loaded lexical index with {self._live_count} documents from {self.directory} "
+                    f"({replayed} logged operations)"
+                )
+            except Exception as e:
+                logger.error(f"Error loading lexical index: {str(e)}")
+                self._reset()
+
+    def _replay_log(self) -> int:
+        """スナップショットと同じ世代のログの操作を再生（古い世代のログは反映済みなので無視）"""
+        if not os.path.exists(self._log_path):
+            return 0
+        with open(self._log_path, encoding="utf-8") as f:
+            lines = [line for line in f if line.strip()]
+        if not lines or json.loads(lines[0]).get("generation") != self._generation:
+            return 0
+        replayed = 0
+        for line in lines[1:]:
+            try:
+                op = json.loads(line)
+            except json.JSONDecodeError:
+                # 書き込み途中で終了した最後の行
+                logger.warning(f"Skipping truncated lexical index log entry in {self.directory}")
+                break
+            if "add" in op:
+                self._add_counts(op["add"], op["terms"])
+            else:
+                self.remove(op["remove"])
+            replayed += 1
+        # 再生した操作はログに書かれているので、次の保存で書き直さない
+        self._unsaved_ops = []
+        return replayed
+
+    def clear(self) -> None:
+        with self._lock:
+            self._reset()
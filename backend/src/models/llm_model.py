@@ -1,17 +1,385 @@
-from transformers import AutoModelForCausalLM, AutoTokenizer
+from transformers import AutoTokenizer, StoppingCriteria, StoppingCriteriaList, TextStreamer
 import torch
 from abc import ABC, abstractmethod
-from typing import Optional
+from typing import AsyncIterator, Callable, Dict, List, Optional
+import asyncio
+import gc
 import logging
-from dataclasses import dataclass
+import threading
+from dataclasses import dataclass, replace
+from .generation_executor import GenerationExecutor, GenerationResult, get_default_executor
+from .batch_scheduler import ContinuousBatchScheduler, SamplingParams
+from .prefix_cache import PrefixKVCache
+from .generation_control import StopConditions, StopStringFilter, resolve_max_new_tokens
+from .speculative import SpeculativeDecoder
+from .inference_profiles import configure_threads, load_causal_lm, model_memory_bytes, profile_report, resolve_profile
 
 logger = logging.getLogger(__name__)
 
+class AsyncTextStreamer(TextStreamer):
+    """model.generateが確定したテキストをイベントループのキューへ渡すストリーマー"""
+
+    def __init__(self, tokenizer, loop: asyncio.AbstractEventLoop, queue: asyncio.Queue, skip_prompt: bool = True):
+        super().__init__(tokenizer, skip_prompt=skip_prompt, skip_special_tokens=True)
+        self.loop = loop
+        self.queue = queue
+
+    def on_finalized_text(self, text: str, stream_end: bool = False):
+        if text:
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, text)
+
+
+class CancelCriteria(StoppingCriteria):
+    """イベントがセットされたら生成を止める（クライアントの切断時など）"""
+
+    def __init__(self, event: threading.Event):
+        self.event = event
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return torch.full((input_ids.shape[0],), self.event.is_set(), dtype=torch.bool, device=input_ids.device)
+
+
+class StopConditionCriteria(StoppingCriteria):
+    """StopConditions（停止文字列・繰り返し・締め切り）で生成を止める（バッチサイズ1用）"""
+
+    def __init__(self, conditions: StopConditions, decode: Callable[[List[int]], str], prompt_length: int):
+        self.conditions = conditions
+        self.decode = decode
+        self.prompt_length = prompt_length
+
+    def __call__(self, input_ids, scores, **kwargs):
+        stop = False
+        if input_ids.shape[1] > self.prompt_length:
+            stop = self.conditions.update(int(input_ids[0, -1]), self.decode) is not None
+        return torch.full((input_ids.shape[0],), stop, dtype=torch.bool, device=input_ids.device)
+
+
 class BaseLLM(ABC):
+    def __init__(self, device: Optional[str] = None, executor: Optional[GenerationExecutor] = None,
+                 batching: Optional[Dict] = None, prefix_cache: Optional[Dict] = None,
+                 stopping: Optional[Dict] = None, speculative: Optional[Dict] = None,
+                 inference: Optional[Dict] = None):
+        # 推論プロファイル（精度・量子化・スレッド数）
+        self.inference = inference or {}
+        self.profile = resolve_profile(self.inference.get('profile', 'auto'))
+        self.profile_report: Optional[Dict] = None
+        if self.profile.device == 'cpu':
+            device = "cpu"
+        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        self.model = None
+        self.tokenizer = None
+        # 生成はイベントループを止めないようにワーカープールで実行する
+        self.executor = executor or get_default_executor()
+        # 連続バッチングの設定（有効ならロード後に同時のリクエストを1つのバッチでデコードする）
+        self.batching = batching or {}
+        self.scheduler: Optional[ContinuousBatchScheduler] = None
+        # 共通のプロンプト接頭辞（固定の前置きなど）のKVキャッシュ
+        self.prefix_cache = PrefixKVCache.from_config(prefix_cache) \
+            if prefix_cache and prefix_cache.get('enabled') else None
+        # 生成を止める条件（停止文字列・繰り返し・締め切り）の設定
+        self.stopping = stopping or {}
+        # 投機的デコードの設定（有効ならロード後にドラフトモデルを読み込む）
+        self.speculative = speculative or {}
+        self.speculative_decoder: Optional[SpeculativeDecoder] = None
+
+    @abstractmethod
+    def load_model(self) -> bool:
+        pass
+
     @abstractmethod
-    async def generate_response(self, prompt: str, max_length: int, temperature: float, top_p: float) -> str:
+    def _generate(self, prompt: str, max_length: int, temperature: float, top_p: float,
+                  max_new_tokens: Optional[int] = None, conditions: Optional[StopConditions] = None,
+                  stats: Optional[Dict] = None) -> Optional[str]:
+        """ブロッキングの生成（ワーカーのスレッドで実行される、statsには投機的デコードの統計が入る）"""
         pass
 
+    async def generate(
+        self,
+        prompt: str,
+        max_length: int = 2048,
+        temperature: float = 0.7,
+        top_p: float = 0.9,
+        max_new_tokens: Optional[int] = None
+    ) -> GenerationResult:
+        """ワーカープール（連続バッチングが有効ならスケジューラ）で生成し、回答とキューの待ち時間・実行時間を返す
+
+        生成するトークン数はmax_new_tokensとプロンプトの残りの長さ（max_length - プロンプト）の小さい方。
+        """
+        conditions = self.stop_conditions()
+        stats = {}
+        if self.scheduler is not None:
+            result = await self._generate_batched(prompt, max_length, temperature, top_p, max_new_tokens, conditions)
+        else:
+            result = await self.executor.run(
+                self._generate, prompt, max_length, temperature, top_p, max_new_tokens, conditions, stats
+            )
+        return replace(
+            result,
+            stop_reason=conditions.reason,
+            generated_tokens=conditions.generated_tokens,
+            speculative=stats or None
+        )
+
+    async def stream(
+        self,
+        prompt: str,
+        max_length: int = 2048,
+        temperature: float = 0.7,
+        top_p: float = 0.9,
+        max_new_tokens: Optional[int] = None,
+        conditions: Optional[StopConditions] = None,
+        stats: Optional[Dict] = None
+    ) -> AsyncIterator[str]:
+        """生成したテキストを確定した順に返す（途中で閉じると生成を止める）
+
+        止まった理由は渡したconditionsのreasonに、投機的デコードの統計はstatsに記録される。
+        停止文字列以降のテキストは返さない。
+        """
+        loop = asyncio.get_running_loop()
+        chunks: asyncio.Queue = asyncio.Queue()
+        formatted_prompt = self._format_prompt(prompt)
+        batched = self.scheduler is not None
+        conditions = conditions or self.stop_conditions()
+        text_filter = StopStringFilter(conditions.stop_strings)
+
+        if batched:
+            streamer = AsyncTextStreamer(self.tokenizer, loop, chunks, skip_prompt=False)
+            prompt_ids = self.tokenizer(formatted_prompt, truncation=True, max_length=max_length // 2)["input_ids"]
+            params = SamplingParams(
+                max_new_tokens=resolve_max_new_tokens(max_new_tokens, len(prompt_ids), max_length),
+                temperature=temperature,
+                top_p=top_p,
+                repetition_penalty=1.1,
+                conditions=conditions
+            )
+            task = asyncio.ensure_future(self.scheduler.submit(
+                prompt_ids, params, on_token=lambda token: streamer.put(torch.tensor([token]))
+            ))
+            # キャンセル時はスケジューラがバッチから外す
+            stop = None
+        else:
+            streamer = AsyncTextStreamer(self.tokenizer, loop, chunks)
+            stop = threading.Event()
+
+            def run():
+                inputs = self.tokenizer(
+                    formatted_prompt,
+                    return_tensors="pt",
+                    truncation=True,
+                    max_length=max_length // 2
+                ).to(self.device)
+                self._generate_ids(
+                    inputs, max_length, temperature, top_p, max_new_tokens, conditions,
+                    stats=stats, streamer=streamer, cancel=stop
+                )
+
+            task = asyncio.ensure_future(self.executor.run(run))
+
+        def finish(_):
+            # 残りのテキストを出してから終端を送る（キューの順序はスレッドからの投入順）
+            if batched and not task.cancelled() and task.exception() is None:
+                streamer.end()
+                conditions.finish(task.result().finish_reason)
+            loop.call_soon_threadsafe(chunks.put_nowait, None)
+
+        task.add_done_callback(finish)
+        try:
+            while True:
+                chunk = await chunks.get()
+                if chunk is None:
+                    break
+                text = text_filter.feed(chunk)
+                if text:
+                    yield text
+            # 生成中の例外（キューの上限など）を呼び出し元に伝える
+            await task
+            text = text_filter.flush()
+            if text:
+                yield text
+        finally:
+            if stop is not None:
+                stop.set()
+            if not task.done():
+                conditions.finish("cancelled")
+                task.cancel()
+
+    def stop_conditions(self) -> StopConditions:
+        """1回の生成に使う停止条件"""
+        return StopConditions.from_config(self.stopping)
+
+    def _decode_tokens(self, token_ids: List[int]) -> str:
+        return self.tokenizer.decode(token_ids, skip_special_tokens=True)
+
+    def _generate_ids(self, inputs, max_length: int, temperature: float, top_p: float,
+                      max_new_tokens: Optional[int], conditions: StopConditions, stats: Optional[Dict] = None,
+                      streamer: Optional[TextStreamer] = None, cancel: Optional[threading.Event] = None):
+        """プロンプトと生成したトークンのID列（投機的デコードが有効ならドラフトモデルと組み合わせる）"""
+        conditions.start()
+        if self.speculative_decoder is not None:
+            prompt_ids = inputs["input_ids"][0].tolist()
+            if streamer is not None:
+                streamer.put(inputs["input_ids"].cpu())
+            output = self.speculative_decoder.generate(
+                prompt_ids,
+                max_new_tokens=resolve_max_new_tokens(max_new_tokens, len(prompt_ids), max_length),
+                temperature=temperature,
+                top_p=top_p,
+                eos_token_ids=[self.tokenizer.eos_token_id],
+                should_stop=lambda token: (
+                    conditions.update(token, self._decode_tokens) is not None
+                    or (cancel is not None and cancel.is_set())
+                ),
+                on_token=(lambda token: streamer.put(torch.tensor([token]))) if streamer is not None else None
+            )
+            if streamer is not None:
+                streamer.end()
+            if stats is not None:
+                stats.update(output.stats())
+            cancelled = cancel is not None and cancel.is_set()
+            conditions.finish("cancelled" if cancelled else output.finish_reason)
+            return prompt_ids + output.token_ids
+
+        criteria = [CancelCriteria(cancel)] if cancel is not None else []
+        outputs = self.model.generate(
+            **inputs,
+            temperature=temperature,
+            top_p=top_p,
+            do_sample=True,
+            pad_token_id=self.tokenizer.pad_token_id,
+            eos_token_id=self.tokenizer.eos_token_id,
+            repetition_penalty=1.1,
+            streamer=streamer,
+            **self._reuse_prefix(inputs),
+            **self._control_kwargs(inputs, max_length, max_new_tokens, conditions, *criteria)
+        )
+        cancelled = cancel is not None and cancel.is_set()
+        conditions.finish("cancelled" if cancelled else self._finish_reason(outputs[0]))
+        return outputs[0]
+
+    def _control_kwargs(self, inputs, max_length: int, max_new_tokens: Optional[int],
+                        conditions: StopConditions, *criteria: StoppingCriteria) -> Dict:
+        """generateに渡す生成トークン数の上限と停止条件"""
+        prompt_length = inputs["input_ids"].shape[1]
+        return {
+            "max_new_tokens": resolve_max_new_tokens(max_new_tokens, prompt_length, max_length),
+            "stopping_criteria": StoppingCriteriaList([
+                StopConditionCriteria(conditions, self._decode_tokens, prompt_length), *criteria
+            ])
+        }
+
+    def _finish_reason(self, output_ids) -> str:
+        """条件に当たらずに終わった生成の理由（EOSか上限か）"""
+        return "eos" if int(output_ids[-1]) == self.tokenizer.eos_token_id else "length"
+
+    def _reuse_prefix(self, inputs) -> Dict:
+        """共通の接頭辞のKVキャッシュがあれば、generateに渡すpast_key_valuesを返す"""
+        if self.prefix_cache is None:
+            return {}
+        try:
+            return self.prefix_cache.prepare(self.model, inputs["input_ids"][0].tolist())
+        except Exception as e:
+            logger.error(f"Error preparing prefix cache: {str(e)}")
+            return {}
+
+    def _format_prompt(self, prompt: str) -> str:
+        """モデルに渡すプロンプトの形式"""
+        return prompt
+
+    def _extract_response(self, formatted_prompt: str, generated_text: str) -> Optional[str]:
+        """生成したテキストから回答部分を取り出す"""
+        return generated_text.strip() or None
+
+    def _start_speculative(self) -> None:
+        """ロード後にドラフトモデルを読み込み、投機的デコードを有効にする（設定で有効な場合）"""
+        if not self.speculative.get('enabled') or self.speculative_decoder is not None:
+            return
+        if self.scheduler is not None:
+            logger.warning("Speculative decoding is not used while continuous batching is enabled")
+            return
+        draft_model_id = self.speculative.get('draft_model_id')
+        try:
+            # 提案したトークンIDを対象モデルがそのまま検証するため、トークナイザーが同じものに限る
+            draft_tokenizer = AutoTokenizer.from_pretrained(draft_model_id, token=True)
+            probe = "def answer(question):\n    return 'Insulin lowers blood glucose.'"
+            if draft_tokenizer(probe)["input_ids"] != self.tokenizer(probe)["input_ids"]:
+                logger.error(f"Draft model {draft_model_id} does not share the tokenizer, speculative decoding disabled")
+                return
+            draft = load_causal_lm(draft_model_id, self.profile, token=True)
+            self.speculative_decoder = SpeculativeDecoder.from_config(self.model, draft, self.speculative)
+            logger.info(f"Speculative decoding enabled with draft model {draft_model_id}")
+        except Exception as e:
+            logger.error(f"Error loading draft model: {str(e)}")
+
+    def _start_scheduler(self) -> None:
+        """ロード後に連続バッチングのスケジューラを起動（設定で有効な場合）"""
+        if self.batching.get('enabled') and self.scheduler is None:
+            self.scheduler = ContinuousBatchScheduler.from_config(self.model, self.tokenizer, self.batching)
+
+    async def _generate_batched(self, prompt: str, max_length: int, temperature: float, top_p: float,
+                                max_new_tokens: Optional[int], conditions: StopConditions) -> GenerationResult:
+        formatted_prompt = self._format_prompt(prompt)
+        prompt_ids = self.tokenizer(formatted_prompt, truncation=True, max_length=max_length // 2)["input_ids"]
+        params = SamplingParams(
+            max_new_tokens=resolve_max_new_tokens(max_new_tokens, len(prompt_ids), max_length),
+            temperature=temperature,
+            top_p=top_p,
+            repetition_penalty=1.1,
+            conditions=conditions
+        )
+        output = await self.scheduler.submit(prompt_ids, params)
+        conditions.finish(output.finish_reason)
+        generated_text = self.tokenizer.decode(output.token_ids, skip_special_tokens=True)
+        return GenerationResult(
+            output=conditions.trim(self._extract_response(formatted_prompt, generated_text)),
+            queue_seconds=output.queue_seconds,
+            run_seconds=output.run_seconds
+        )
+
+    async def generate_response(
+        self,
+        prompt: str,
+        max_length: int = 2048,
+        temperature: float = 0.7,
+        top_p: float = 0.9,
+        max_new_tokens: Optional[int] = None
+    ) -> Optional[str]:
+        """Generate a response"""
+        result = await self.generate(prompt, max_length, temperature, top_p, max_new_tokens)
+        return result.output
+
+    def memory_footprint(self) -> int:
+        """ロード済みモデルのパラメータとバッファのバイト数"""
+        if self.model is None:
+            return 0
+        footprint = model_memory_bytes(self.model)
+        if self.speculative_decoder is not None:
+            footprint += model_memory_bytes(self.speculative_decoder.draft)
+        return footprint
+
+    def record_profile(self, tokens: int, seconds: float) -> Dict:
+        """ウォームアップ後の生成からプロファイルのメモリ使用量とtokens/secを記録"""
+        self.profile_report = profile_report(self.profile, self.model, tokens, seconds)
+        logger.info(
+            f"Inference profile {self.profile.name}: {self.profile_report['model_bytes'] / 1024 ** 2:.0f} MB model, "
+            f"{self.profile_report['resident_bytes'] / 1024 ** 2:.0f} MB resident, "
+            f"{self.profile_report['tokens_per_second']:.1f} tokens/s"
+        )
+        return self.profile_report
+
+    def unload(self) -> None:
+        """モデルを解放（次回の生成時に再ロードされる）"""
+        if self.scheduler is not None:
+            self.scheduler.stop()
+            self.scheduler = None
+        if self.prefix_cache is not None:
+            self.prefix_cache.clear()
+        self.speculative_decoder = None
+        self.model = None
+        self.tokenizer = None
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
 @dataclass
 class LLMConfig:
     max_length: int = 512
@@ -22,12 +390,13 @@ class LLMConfig:
     num_beams: int = 5  # ビームサーチのパラメータを追加
 
 
-class LlamaModel:
-    def __init__(self):
+class LlamaModel(BaseLLM):
+    def __init__(self, device: str = None, executor: Optional[GenerationExecutor] = None,
+                 batching: Optional[Dict] = None, prefix_cache: Optional[Dict] = None,
+                 stopping: Optional[Dict] = None, speculative: Optional[Dict] = None,
+                 inference: Optional[Dict] = None):
+        super().__init__(device, executor, batching, prefix_cache, stopping, speculative, inference)
         self.model_id = "meta-llama/Llama-3.2-1b"
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        self.model = None
-        self.tokenizer = None
         self.config = LLMConfig()
         print(f"Initializing LlamaModel with device: {self.device}")
 
@@ -43,15 +412,12 @@ class LlamaModel:
             if self.tokenizer.pad_token is None:
                 self.tokenizer.pad_token = self.tokenizer.eos_token
             
-            print("Loading model...")
-            self.model = AutoModelForCausalLM.from_pretrained(
-                self.model_id,
-                device_map="auto",
-                torch_dtype=torch.float16,
-                token=True,
-                low_cpu_mem_usage=True
-            )
+            print(f"Loading model with inference profile {self.profile.name}...")
+            configure_threads(self.inference.get('num_threads', 0), self.inference.get('num_interop_threads', 0))
+            self.model = load_causal_lm(self.model_id, self.profile, token=True)
             
+            self._start_scheduler()
+            self._start_speculative()
             print("Model loaded successfully!")
             return True
             
@@ -59,12 +425,15 @@ class LlamaModel:
             print(f"Error loading model: {str(e)}")
             return False
 
-    async def generate_response(
+    def _generate(
         self,
         prompt: str,
         max_length: int = 2048,
         temperature: float = 0.7,
-        top_p: float = 0.9
+        top_p: float = 0.9,
+        max_new_tokens: Optional[int] = None,
+        conditions: Optional[StopConditions] = None,
+        stats: Optional[Dict] = None
     ) -> Optional[str]:
         """Generate a response"""
         if not self.model or not self.tokenizer:
@@ -75,7 +444,7 @@ class LlamaModel:
             logger.info(f"Processing prompt:\n{prompt}")
             
             # プロンプトにanswer:を追加して、回答の開始位置を明確にする
-            complete_prompt = f"{prompt}\nanswer:"
+            complete_prompt = self._format_prompt(prompt)
             
             # 入力の準備
             inputs = self.tokenizer(
@@ -87,23 +456,17 @@ class LlamaModel:
             ).to(self.device)
             
             # 生成
-            outputs = self.model.generate(
-                **inputs,
-                max_length=max_length,
-                temperature=temperature,
-                top_p=top_p,
-                do_sample=True,
-                pad_token_id=self.tokenizer.pad_token_id,
-                eos_token_id=self.tokenizer.eos_token_id,
-                repetition_penalty=1.1
+            conditions = conditions or self.stop_conditions()
+            output_ids = self._generate_ids(
+                inputs, max_length, temperature, top_p, max_new_tokens, conditions, stats=stats
             )
             
             # デコードして応答を取得
-            full_text = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
+            full_text = self.tokenizer.decode(output_ids, skip_special_tokens=True)
             
             # "answer:"以降の部分のみを抽出
             try:
-                response = full_text.split("Answer:")[-1].strip()
+                response = conditions.trim(full_text.split("Answer:")[-1].strip())
             except:
                 response = None
             
@@ -120,6 +483,14 @@ class LlamaModel:
             logger.exception(e)
             return None
 
+    def _format_prompt(self, prompt: str) -> str:
+        # プロンプトにanswer:を追加して、回答の開始位置を明確にする
+        return f"{prompt}\nanswer:"
+
+    def _extract_response(self, formatted_prompt: str, generated_text: str) -> Optional[str]:
+        # "answer:"以降の部分のみを抽出（_generateと同じ）
+        return (formatted_prompt + generated_text).split("Answer:")[-1].strip() or None
+
     def __del__(self):
         """クリーンアップ"""
         try:
@@ -135,11 +506,12 @@ class LlamaModel:
 
 
 class CodeLlamaModel(BaseLLM):
-    def __init__(self, device: str = None):
-        super().__init__(device)
+    def __init__(self, device: str = None, executor: Optional[GenerationExecutor] = None,
+                 batching: Optional[Dict] = None, prefix_cache: Optional[Dict] = None,
+                 stopping: Optional[Dict] = None, speculative: Optional[Dict] = None,
+                 inference: Optional[Dict] = None):
+        super().__init__(device, executor, batching, prefix_cache, stopping, speculative, inference)
         self.model_id = "tyson0420/codellama-7B-instruct-slerp"
-        self.model = None
-        self.tokenizer = None
         print(f"Initializing CodeLlamaModel with device: {self.device}")
 
     def load_model(self) -> bool:
@@ -150,15 +522,12 @@ class CodeLlamaModel(BaseLLM):
                 token=True,
             )
             
-            print("Loading model...")
-            self.model = AutoModelForCausalLM.from_pretrained(
-                self.model_id,
-                device_map="auto",
-                torch_dtype=torch.float16,
-                token=True,
-                low_cpu_mem_usage=True
-            )
+            print(f"Loading model with inference profile {self.profile.name}...")
+            configure_threads(self.inference.get('num_threads', 0), self.inference.get('num_interop_threads', 0))
+            self.model = load_causal_lm(self.model_id, self.profile, token=True)
             
+            self._start_scheduler()
+            self._start_speculative()
             print("CodeLlama model loaded successfully!")
             return True
             
@@ -166,12 +535,15 @@ class CodeLlamaModel(BaseLLM):
             print(f"Error loading model: {str(e)}")
             return False
 
-    async def generate_response(
+    def _generate(
         self,
         prompt: str,
         max_length: int = 2048,
         temperature: float = 0.7,
-        top_p: float = 0.9
+        top_p: float = 0.9,
+        max_new_tokens: Optional[int] = None,
+        conditions: Optional[StopConditions] = None,
+        stats: Optional[Dict] = None
     ) -> Optional[str]:
         if not self.model or not self.tokenizer:
             if not self.load_model():
@@ -179,7 +551,7 @@ class CodeLlamaModel(BaseLLM):
 
         try:
             # CodeLLaMa用のプロンプトフォーマット
-            formatted_prompt = f"[INST] {prompt} [/INST]"
+            formatted_prompt = self._format_prompt(prompt)
             
             inputs = self.tokenizer(
                 formatted_prompt,
@@ -189,22 +561,16 @@ class CodeLlamaModel(BaseLLM):
                 max_length=max_length//2
             ).to(self.device)
             
-            outputs = self.model.generate(
-                **inputs,
-                max_length=max_length,
-                temperature=temperature,
-                top_p=top_p,
-                do_sample=True,
-                pad_token_id=self.tokenizer.pad_token_id,
-                eos_token_id=self.tokenizer.eos_token_id,
-                repetition_penalty=1.1
+            conditions = conditions or self.stop_conditions()
+            output_ids = self._generate_ids(
+                inputs, max_length, temperature, top_p, max_new_tokens, conditions, stats=stats
             )
             
-            full_text = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
+            full_text = self.tokenizer.decode(output_ids, skip_special_tokens=True)
             
             # [INST]タグの後の部分を抽出
             try:
-                response = full_text.split("[/INST]")[-1].strip()
+                response = conditions.trim(full_text.split("[/INST]")[-1].strip())
             except:
                 response = full_text[len(formatted_prompt):].strip()
             
@@ -215,6 +581,10 @@ class CodeLlamaModel(BaseLLM):
             logger.exception(e)
             return None
 
+    def _format_prompt(self, prompt: str) -> str:
+        # CodeLLaMa用のプロンプトフォーマット
+        return f"[INST] {prompt} [/INST]"
+
     def __del__(self):
         if hasattr(self, 'model'):
             del self.model
@@ -0,0 +1,165 @@
+from typing import Callable, Dict, Optional
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+_GB = 1024 ** 3
+
+
+class ModelPool:
+    """LLMをメモリ予算内で常駐させるプール
+
+    モデルはmodel_typeごとに1つだけ保持し、予算を超える場合は使用中でないものを
+    最終使用の古い順に解放する。ロードはスレッドで行い、同じモデルへの同時要求は
+    1回のロードを共有する（single-flight）。リクエストは use() でモデルを借りるため、
+    共有の self.llm を書き換える必要がない。
+    """
+
+    def __init__(self, factory: Callable[[str], object], memory_budget_bytes: int,
+                 estimated_sizes: Optional[Dict[str, int]] = None):
+        self.factory = factory
+        self.memory_budget_bytes = memory_budget_bytes
+        self.estimated_sizes = dict(estimated_sizes or {})
+        self._models: "OrderedDict[str, object]" = OrderedDict()  # 最近使ったものが末尾
+        self._sizes: Dict[str, int] = {}
+        self._in_use: Dict[str, int] = {}
+        self._loading: Dict[str, asyncio.Future] = {}
+        self._stats = {
+            "hits": 0,
+            "loads": 0,
+            "shared_loads": 0,
+            "load_failures": 0,
+            "evictions": 0,
+            "load_seconds": 0.0,
+        }
+
+    @classmethod
+    def from_config(cls, factory: Callable[[str], object], config: Dict) -> "ModelPool":
+        return cls(
+            factory,
+            memory_budget_bytes=int(config['memory_budget_gb'] * _GB),
+            estimated_sizes={
+                name: int(size_gb * _GB) for name, size_gb in config.get('estimated_sizes_gb', {}).items()
+            }
+        )
+
+    @property
+    def used_bytes(self) -> int:
+        return sum(self._sizes.values())
+
+    def is_resident(self, model_type: str) -> bool:
+        return model_type in self._models
+
+    def resident_models(self) -> Dict[str, object]:
+        """常駐中のモデル（model_type → モデル）"""
+        return dict(self._models)
+
+    async def get(self, model_type: str):
+        """常駐していればそのまま、なければロードして返す"""
+        if model_type in self._models:
+            self._models.move_to_end(model_type)
+            self._stats["hits"] += 1
+            return self._models[model_type]
+
+        loading = self._loading.get(model_type)
+        if loading is not None:
+            self._stats["shared_loads"] += 1
+            return await asyncio.shield(loading)
+
+        future = asyncio.get_running_loop().create_future()
+        self._loading[model_type] = future
+        try:
+            model = await self._load(model_type)
+            future.set_result(model)
+            return model
+        except Exception as e:
+            future.set_exception(e)
+            # 待っている要求が無い場合に「未取得の例外」警告を出さない
+            future.exception()
+            raise
+        finally:
+            del self._loading[model_type]
+
+    @asynccontextmanager
+    async def use(self, model_type: str):
+        """モデルを借りる（使用中のモデルは解放対象にならない）"""
+        self._in_use[model_type] = self._in_use.get(model_type, 0) + 1
+        try:
+            yield await self.get(model_type)
+        finally:
+            self._in_use[model_type] -= 1
+
+    def warm(self, model_type: str) -> asyncio.Task:
+        """バックグラウンドでロードを開始"""
+        async def _warm():
+            try:
+                await self.get(model_type)
+            except Exception as e:
+                logger.error(f"Error warming model {model_type}: {str(e)}")
+
+        return asyncio.get_running_loop().create_task(_warm())
+
+    async def _load(self, model_type: str):
+        # ロード前に見積もりサイズ分の空きを作る
+        self._evict_to_fit(self.estimated_sizes.get(model_type, 0), exclude=model_type)
+
+        start = time.perf_counter()
+        model = self.factory(model_type)
+        loaded = await asyncio.to_thread(model.load_model)
+        elapsed = time.perf_counter() - start
+        if not loaded:
+            self._stats["load_failures"] += 1
+            raise RuntimeError(f"Failed to load model: {model_type}")
+
+        size = model.memory_footprint()
+        self._stats["loads"] += 1
+        self._stats["load_seconds"] += elapsed
+        self.estimated_sizes[model_type] = size
+        self._evict_to_fit(size, exclude=model_type)
+        self._models[model_type] = model
+        self._sizes[model_type] = size
+        logger.info(f"Loaded {model_type} in {elapsed:.1f}s ({size / _GB:.2f} GB resident)")
+        return model
+
+    def _evict_to_fit(self, incoming_bytes: int, exclude: str) -> None:
+        """予算に収まるまで使用中でないモデルを古い順に解放"""
+        for model_type in list(self._models):
+            if self.used_bytes + incoming_bytes <= self.memory_budget_bytes:
+                return
+            if model_type == exclude or self._in_use.get(model_type, 0) > 0:
+                continue
+            self.evict(model_type)
+
+        if self.used_bytes + incoming_bytes > self.memory_budget_bytes:
+            logger.warning(
+                f"Model pool exceeds memory budget: {(self.used_bytes + incoming_bytes) / _GB:.2f} GB "
+                f"> {self.memory_budget_bytes / _GB:.2f} GB (models in use cannot be evicted)"
+            )
+
+    def evict(self, model_type: str) -> None:
+        """モデルを解放"""
+        model = self._models.pop(model_type, None)
+        if model is None:
+            return
+        self._sizes.pop(model_type, None)
+        self._stats["evictions"] += 1
+        model.unload()
+        logger.info(f"Evicted {model_type} from model pool")
+
+    def get_metrics(self) -> Dict:
+        requests = self._stats["hits"] + self._stats["loads"] + self._stats["shared_loads"]
+        return {
+            **self._stats,
+            "hit_rate": self._stats["hits"] / requests if requests else 0.0,
+            "memory_budget_bytes": self.memory_budget_bytes,
+            "used_bytes": self.used_bytes,
+            "resident": {
+                model_type: {"bytes": self._sizes[model_type], "in_use": self._in_use.get(model_type, 0)}
+                for model_type in self._models
+            },
+            "loading": list(self._loading),
+        }
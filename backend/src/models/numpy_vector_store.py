@@ -0,0 +1,568 @@
+from typing import Dict, List, NamedTuple, Optional, Sequence
+import copy
+import glob
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import uuid
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from .vector_store import SearchHit, VectorStore, cosine_to_relevance
+from .quantization import create_quantizer
+from .ann_index import IVFIndex
+
+logger = logging.getLogger(__name__)
+
+_SQLITE_BATCH = 500
+# int8のスケールは件数が倍になるたびにこの件数まで求め直す
+_CALIBRATION_ROWS = 100_000
+
+
+class _SearchView(NamedTuple):
+    """検索が読み出す状態（書き込みは新しい配列を作り、この組ごと参照を差し替える）"""
+    size: int
+    count: int
+    vectors: Optional[np.ndarray]
+    codes: Optional[np.ndarray]
+    alive: np.ndarray
+    quantizer: object
+
+
+class NumpyVectorStore(VectorStore):
+    """メモリマップした.npy行列による完全一致（総当たり）検索のベクトルストア
+
+    埋め込みは正規化して `vectors.npy`（float32またはfloat16）に行単位で保存し、
+    本文とメタデータはSQLiteのサイドカーに保存する。ファイルはmmapで開くため
+    起動時の読み込みが不要で、複数のワーカープロセスが同じページを共有できる。
+
+    quantizationに 'int8' または 'binary' を指定すると、検索時は量子化コードだけを
+    走査して k × oversample 件の候補を選び、候補のみをfloatベクトルで再スコアする。
+
+    index='ivf' では近いnprobe個のリストの行のみを検索する（学習前は総当たり）。
+    k-meansの学習は build_ann_index() で行い、件数が ivf_min_train_rows に達したときと、
+    前回の学習から ivf_retrain_growth 倍に増えたときはバックグラウンドで自動的に呼ぶ。
+
+    削除した行は空き行として記録し、次の追加で再利用する。内容のハッシュを含む
+    チャンクIDは内容が変わると新しいIDになるため、再取り込みを繰り返しても
+    行列ファイルと走査する行数が生きている件数の最大値を超えて増えないようにする。
+
+    検索はロックを取らない。書き込みはロックの中で行い、最後に件数・行列・生存フラグ・
+    量子化器の参照の組（_SearchView）を差し替える。拡張や量子化の学習し直しは新しい
+    配列を作ってから差し替えるため、走査中の検索は取り出した時点の配列を読み続けられる。
+    本文とメタデータはスレッドごとの読み取り用接続（WAL）で読み、書き込みを待たない。
+    """
+
+    def __init__(self, persist_directory: str, embedding_function: Embeddings,
+                 dtype: str = "float32", search_block_size: int = 65536, initial_capacity: int = 1024,
+                 quantization: str = "none", oversample: int = 4,
+                 index: str = "flat", nlist: int = 0, nprobe: int = 16, ivf_min_train_rows: int = 20_000,
+                 ivf_retrain_growth: float = 4.0):
+        super().__init__(persist_directory, embedding_function)
+        self.directory = os.path.join(persist_directory, "flat_index")
+        os.makedirs(self.directory, exist_ok=True)
+        self.dtype = np.dtype(dtype)
+        self.search_block_size = search_block_size
+        self.initial_capacity = initial_capacity
+        self.oversample = oversample
+
+        self._lock = threading.RLock()
+        self._readers = threading.local()
+        self._readers_lock = threading.Lock()
+        self._reader_conns: List[sqlite3.Connection] = []
+        self.conn = sqlite3.connect(self._metadata_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS chunks (
+                id TEXT PRIMARY KEY,
+                row INTEGER NOT NULL UNIQUE,
+                source TEXT,
+                document TEXT,
+                metadata TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_chunks_source ON chunks(source);
+            CREATE TABLE IF NOT EXISTS store_info (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+            """
+        )
+        self.conn.commit()
+
+        self._vectors: Optional[np.memmap] = None
+        self._size = int(self._info("size", 0))
+        if os.path.exists(self._vectors_path):
+            self._vectors = np.load(self._vectors_path, mmap_mode="r+")
+
+        self._alive = np.zeros(self._capacity, dtype=bool)
+        rows = [row for (row,) in self.conn.execute("SELECT row FROM chunks")]
+        self._alive[rows] = True
+        self._count = len(rows)
+        # 削除済みで再利用できる行（小さい行番号から使う）
+        self._free_rows = np.flatnonzero(~self._alive[:self._size])[::-1].tolist()
+
+        self.quantizer = create_quantizer(quantization, self.directory)
+        self._codes: Optional[np.memmap] = None
+        if self.quantizer is not None:
+            if os.path.exists(self._codes_path):
+                self._codes = np.load(self._codes_path, mmap_mode="r+")
+            elif self._vectors is not None:
+                self.refit_quantizer()
+
+        if index == "ivf":
+            # 前回の再構築が途中で止まった場合の作りかけ・置き換え前のディレクトリを消す
+            for leftover in glob.glob(f"{glob.escape(self._ivf_directory)}.*"):
+                shutil.rmtree(leftover, ignore_errors=True)
+            self.index: Optional[IVFIndex] = IVFIndex(
+                self._ivf_directory, nlist=nlist, nprobe=nprobe, min_train_rows=ivf_min_train_rows
+            )
+        elif index == "flat":
+            self.index = None
+        else:
+            raise ValueError(f"Unknown index type: {index}")
+        # 0なら件数が増えても学習し直さない
+        self.ivf_retrain_growth = ivf_retrain_growth
+        self._ivf_trained_rows = int(self._info("ivf_trained_rows", self._count))
+        self._build_lock = threading.Lock()
+        self._build_thread: Optional[threading.Thread] = None
+        # 再構築中に追加・上書きされた行（差し替えの直前に新しいインデックスへ割り当てる）
+        self._rows_during_build: Optional[List[int]] = None
+        self._closed = False
+        self._publish()
+
+    @property
+    def _metadata_path(self) -> str:
+        return os.path.join(self.directory, "metadata.sqlite3")
+
+    @property
+    def _ivf_directory(self) -> str:
+        return os.path.join(self.directory, "ivf")
+
+    @property
+    def _vectors_path(self) -> str:
+        return os.path.join(self.directory, "vectors.npy")
+
+    @property
+    def _codes_path(self) -> str:
+        return os.path.join(self.directory, f"codes_{self.quantizer.name}.npy")
+
+    @property
+    def _capacity(self) -> int:
+        return 0 if self._vectors is None else self._vectors.shape[0]
+
+    def _info(self, key: str, default=None):
+        row = self.conn.execute("SELECT value FROM store_info WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def _reader(self) -> sqlite3.Connection:
+        """スレッドごとの読み取り用の接続"""
+        conn = getattr(self._readers, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self._metadata_path, check_same_thread=False)
+            self._readers.conn = conn
+            with self._readers_lock:
+                self._reader_conns.append(conn)
+        return conn
+
+    def _publish(self) -> None:
+        """書き込み後の状態を検索に公開（ロックの中で呼ぶ）"""
+        self._view = _SearchView(
+            self._size, self._count, self._vectors, self._codes, self._alive, self.quantizer
+        )
+
+    def _set_info(self, key: str, value) -> None:
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO store_info (key, value) VALUES (?, ?)", (key, value))
+
+    @staticmethod
+    def _grow_file(path: str, old: Optional[np.memmap], size: int, shape: tuple, dtype) -> np.memmap:
+        """行列ファイルを指定サイズで作り直し、既存の行をコピー"""
+        tmp_path = path + ".tmp"
+        grown = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=dtype, shape=shape)
+        if old is not None:
+            grown[:size] = old[:size]
+        grown.flush()
+        del grown
+        os.replace(tmp_path, path)
+        return np.load(path, mmap_mode="r+")
+
+    def _ensure_capacity(self, needed: int, dim: int) -> None:
+        """容量が足りなければ2倍に拡張した行列ファイルを作り直す"""
+        if self._vectors is not None and needed <= self._capacity:
+            return
+        if self._vectors is not None and self._vectors.shape[1] != dim:
+            raise ValueError(f"Embedding dimension mismatch: {dim} != {self._vectors.shape[1]}")
+
+        # 検索中の古い行列はファイルを置き換えても読めるため、新しい行列を作って参照を差し替える
+        capacity = max(self.initial_capacity, needed, self._capacity * 2)
+        self._vectors = self._grow_file(self._vectors_path, self._vectors, self._size, (capacity, dim), self.dtype)
+        if self.quantizer is not None:
+            self._codes = self._grow_file(
+                self._codes_path, self._codes, self._size,
+                (capacity, self.quantizer.code_width(dim)), self.quantizer.dtype
+            )
+
+        if self.index is not None:
+            self.index.resize(capacity)
+
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:len(self._alive)] = self._alive
+        self._alive = alive
+
+    def refit_quantizer(self) -> None:
+        """保存済みの全ベクトルから量子化パラメータを求め直してコードを再生成"""
+        if self.quantizer is None or self._vectors is None:
+            return
+        with self._lock:
+            # 検索中のコードと量子化パラメータは組で読まれるため、両方を作り直してから差し替える
+            capacity, dim = self._vectors.shape
+            quantizer = copy.copy(self.quantizer)
+            alive_rows = np.flatnonzero(self._alive[:self._size])
+            if len(alive_rows):
+                sample = alive_rows[:: max(1, len(alive_rows) // _CALIBRATION_ROWS)]
+                quantizer.fit(np.asarray(self._vectors[sample], dtype=np.float32))
+                self._set_info("quantizer_fit_rows", len(alive_rows))
+            codes = self._grow_file(
+                self._codes_path, None, 0, (capacity, quantizer.code_width(dim)), quantizer.dtype
+            )
+            if quantizer.fitted:
+                for start in range(0, self._size, self.search_block_size):
+                    end = min(start + self.search_block_size, self._size)
+                    block = np.asarray(self._vectors[start:end], dtype=np.float32)
+                    codes[start:end] = quantizer.encode(block)
+            codes.flush()
+            self.quantizer, self._codes = quantizer, codes
+            self._publish()
+            logger.info(f"Rebuilt {self.quantizer.name} codes for {len(alive_rows)} vectors")
+
+    def build_ann_index(self) -> bool:
+        """現在の全ベクトルでIVFの重心を学習し直し、新しいインデックスに差し替える
+
+        k-meansと全行の割り当ては取り出した時点の行列に対してロックの外で行い、
+        その間に追加・上書きされた行は差し替えの直前に割り当てる。検索と取り込みは止めない。
+        管理APIからの再構築と、件数が増えたときのバックグラウンドの学習で使う。
+        """
+        if self.index is None:
+            return False
+        with self._build_lock:
+            with self._lock:
+                view = self._view
+                if self._closed or view.vectors is None:
+                    return False
+                self._rows_during_build = []
+
+            build_directory = f"{self._ivf_directory}.build-{uuid.uuid4().hex[:8]}"
+            try:
+                alive_rows = np.flatnonzero(view.alive[:view.size])
+                if not len(alive_rows):
+                    return False
+                index = self.index.empty_copy(build_directory)
+                rng = np.random.default_rng(0)
+                sample_size = index.training_sample_size(len(alive_rows))
+                sample = np.sort(rng.choice(alive_rows, size=sample_size, replace=False))
+                index.train(np.asarray(view.vectors[sample], dtype=np.float32), len(alive_rows), len(view.alive))
+                for start in range(0, len(alive_rows), self.search_block_size):
+                    rows = alive_rows[start:start + self.search_block_size]
+                    index.add(rows, np.asarray(view.vectors[rows], dtype=np.float32))
+
+                with self._lock:
+                    if self._closed:
+                        return False
+                    changed = np.unique(np.asarray(self._rows_during_build, dtype=np.int64))
+                    changed = changed[self._alive[changed]]
+                    index.resize(self._capacity)
+                    if len(changed):
+                        index.add(changed, np.asarray(self._vectors[changed], dtype=np.float32))
+                    self._install_index(index)
+                    self._ivf_trained_rows = len(alive_rows)
+                    self._set_info("ivf_trained_rows", len(alive_rows))
+            finally:
+                with self._lock:
+                    self._rows_during_build = None
+                shutil.rmtree(build_directory, ignore_errors=True)
+
+        logger.info(f"Built IVF index with {len(index.centroids)} lists for {len(alive_rows)} vectors")
+        return True
+
+    def _install_index(self, index: IVFIndex) -> None:
+        """学習済みのインデックスのディレクトリを所定の場所に移して参照を差し替える（ロックの中で呼ぶ）"""
+        retired_directory = f"{self._ivf_directory}.old-{uuid.uuid4().hex[:8]}"
+        if os.path.exists(self._ivf_directory):
+            os.rename(self._ivf_directory, retired_directory)
+        # 開いているメモリマップはディレクトリを移しても読める
+        os.rename(index.directory, self._ivf_directory)
+        index.directory = self._ivf_directory
+        # 古いインデックスは走査中の検索が読み終わるまで参照されるため、閉じずに手放す
+        self.index = index
+        shutil.rmtree(retired_directory, ignore_errors=True)
+
+    def _index_build_due(self) -> bool:
+        if self.index is None:
+            return False
+        if not self.index.trained:
+            return self._count >= self.index.min_train_rows
+        return bool(self.ivf_retrain_growth) and self._count >= self.ivf_retrain_growth * self._ivf_trained_rows
+
+    def _maybe_start_index_build(self) -> None:
+        """学習の条件を満たしたらバックグラウンドでIVFを学習（取り込みの書き込みを待たせない）"""
+        with self._lock:
+            if self._closed or not self._index_build_due():
+                return
+            if self._build_thread is not None and self._build_thread.is_alive():
+                return
+            self._build_thread = threading.Thread(target=self._build_in_background, daemon=True)
+            self._build_thread.start()
+
+    def _build_in_background(self) -> None:
+        try:
+            self.build_ann_index()
+        except Exception as e:
+            logger.error(f"Error building IVF index: {str(e)}")
+
+    def wait_for_index_build(self, timeout: Optional[float] = None) -> None:
+        """バックグラウンドの学習が終わるまで待つ"""
+        thread = self._build_thread
+        if thread is not None:
+            thread.join(timeout)
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def _rows_for(self, ids: Sequence[str]) -> Dict[str, int]:
+        rows = {}
+        for i in range(0, len(ids), _SQLITE_BATCH):
+            batch = list(ids[i:i + _SQLITE_BATCH])
+            placeholders = ",".join("?" * len(batch))
+            rows.update(self.conn.execute(
+                f"SELECT id, row FROM chunks WHERE id IN ({placeholders})", batch
+            ).fetchall())
+        return rows
+
+    def add_texts(self, texts, metadatas, ids, embeddings=None):
+        if not ids:
+            return []
+        if embeddings is None:
+            embeddings = self.embedding_function.embed_documents(list(texts))
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        embeddings = self._normalize(embeddings)
+
+        with self._lock:
+            existing = self._rows_for(ids)
+            rows = []
+            next_row = self._size
+            for doc_id in ids:
+                if doc_id in existing:
+                    rows.append(existing[doc_id])
+                elif self._free_rows:
+                    rows.append(self._free_rows.pop())
+                else:
+                    rows.append(next_row)
+                    next_row += 1
+
+            self._ensure_capacity(next_row, embeddings.shape[1])
+            self._vectors[rows] = embeddings.astype(self.dtype)
+            self._vectors.flush()
+            if self.quantizer is not None:
+                if not self.quantizer.fitted:
+                    self.quantizer.fit(embeddings)
+                    self._set_info("quantizer_fit_rows", len(embeddings))
+                self._codes[rows] = self.quantizer.encode(embeddings)
+                self._codes.flush()
+
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO chunks (id, row, source, document, metadata) VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (doc_id, row, (meta or {}).get("source"), text, json.dumps(meta or {}, ensure_ascii=False))
+                        for doc_id, row, text, meta in zip(ids, rows, texts, metadatas)
+                    ]
+                )
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO store_info (key, value) VALUES ('size', ?)", (next_row,)
+                )
+
+            alive = self._alive.copy()
+            alive[rows] = True
+            self._size = next_row
+            self._count += len(ids) - len(existing)
+            self._alive = alive
+
+            # 少ない件数で決めたスケールは件数が倍になるたびに求め直す
+            if self.quantizer is not None and self.quantizer.needs_calibration:
+                fit_rows = int(self._info("quantizer_fit_rows", 0))
+                if fit_rows < _CALIBRATION_ROWS and self._count >= 2 * fit_rows:
+                    self.refit_quantizer()
+
+            if self.index is not None:
+                if self.index.trained:
+                    self.index.add(np.asarray(rows), embeddings)
+                if self._rows_during_build is not None:
+                    self._rows_during_build.extend(rows)
+            self._publish()
+        self._maybe_start_index_build()
+        return list(ids)
+
+    def update_metadatas(self, ids, metadatas):
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "UPDATE chunks SET metadata = ?, source = ? WHERE id = ?",
+                [
+                    (json.dumps(meta or {}, ensure_ascii=False), (meta or {}).get("source"), doc_id)
+                    for doc_id, meta in zip(ids, metadatas)
+                ]
+            )
+
+    def delete(self, ids):
+        if not ids:
+            return
+        with self._lock:
+            rows = self._rows_for(list(ids))
+            with self.conn:
+                self.conn.executemany("DELETE FROM chunks WHERE id = ?", [(doc_id,) for doc_id in rows])
+            alive = self._alive.copy()
+            alive[list(rows.values())] = False
+            self._alive = alive
+            self._free_rows.extend(sorted(rows.values(), reverse=True))
+            self._count -= len(rows)
+            self._publish()
+
+    def get(self, ids=None, where=None, include=("documents", "metadatas")):
+        sql = "SELECT id, document, metadata FROM chunks"
+        params: List = []
+        if where:
+            if set(where) != {"source"}:
+                raise ValueError("NumpyVectorStore only supports filtering by 'source'")
+            sql += " WHERE source = ?"
+            params.append(where["source"])
+
+        conn = self._reader()
+        if ids is not None:
+            rows = []
+            ids = list(ids)
+            for i in range(0, len(ids), _SQLITE_BATCH):
+                batch = ids[i:i + _SQLITE_BATCH]
+                clause = " AND " if where else " WHERE "
+                rows.extend(conn.execute(
+                    f"{sql}{clause}id IN ({','.join('?' * len(batch))})", params + batch
+                ).fetchall())
+        else:
+            rows = conn.execute(sql, params).fetchall()
+
+        result = {"ids": [row[0] for row in rows]}
+        if "documents" in include:
+            result["documents"] = [row[1] for row in rows]
+        if "metadatas" in include:
+            result["metadatas"] = [json.loads(row[2]) for row in rows]
+        return result
+
+    def _scan(self, view: _SearchView, matrix: np.ndarray, score_fn, n: int) -> tuple:
+        """行列をブロックごとにスコアリングし、上位n行の(行番号, スコア)を返す"""
+        best_rows = np.zeros(0, dtype=np.int64)
+        best_scores = np.zeros(0, dtype=np.float32)
+        for start in range(0, view.size, self.search_block_size):
+            end = min(start + self.search_block_size, view.size)
+            scores = score_fn(matrix[start:end]).astype(np.float32, copy=False)
+            scores[~view.alive[start:end]] = -np.inf
+
+            if len(scores) > n:
+                top = np.argpartition(-scores, n - 1)[:n]
+            else:
+                top = np.arange(len(scores))
+            best_rows = np.concatenate([best_rows, top + start])
+            best_scores = np.concatenate([best_scores, scores[top]])
+            if len(best_scores) > n:
+                keep = np.argpartition(-best_scores, n - 1)[:n]
+                best_rows, best_scores = best_rows[keep], best_scores[keep]
+
+        alive = best_scores != -np.inf
+        return best_rows[alive], best_scores[alive]
+
+    @staticmethod
+    def _float_scores(block: np.ndarray, query: np.ndarray) -> np.ndarray:
+        if block.dtype != np.float32:
+            block = block.astype(np.float32)
+        return block @ query
+
+    def _top_rows(self, query: np.ndarray, k: int, view: Optional[_SearchView] = None) -> List[tuple]:
+        """上位k行を(行番号, コサイン)で返す（取り出した時点の状態だけを読む）"""
+        view = view or self._view
+        quantizer, index = view.quantizer, self.index
+        if index is not None and index.trained:
+            rows = index.candidates(query)
+            rows = rows[rows < view.size]
+            rows = rows[view.alive[rows]]
+            n_candidates = k * self.oversample
+            if quantizer is not None and len(rows) > n_candidates:
+                codes_scores = quantizer.scores(view.codes[rows], quantizer.prepare_query(query))
+                rows = np.sort(rows[np.argpartition(-codes_scores, n_candidates - 1)[:n_candidates]])
+            scores = self._float_scores(view.vectors[rows], query) if len(rows) else np.zeros(0, dtype=np.float32)
+        elif quantizer is None:
+            rows, scores = self._scan(view, view.vectors, lambda block: self._float_scores(block, query), k)
+        else:
+            # 量子化コードで候補を絞り、候補のみを完全精度で再スコア
+            prepared = quantizer.prepare_query(query)
+            candidates, _ = self._scan(
+                view, view.codes, lambda block: quantizer.scores(block, prepared), k * self.oversample
+            )
+            rows = np.sort(candidates)
+            scores = self._float_scores(view.vectors[rows], query) if len(rows) else np.zeros(0, dtype=np.float32)
+
+        order = np.argsort(-scores)[:k]
+        return [(int(rows[i]), float(scores[i])) for i in order]
+
+    def _hits_for_rows(self, scored_rows: List[tuple]) -> List[SearchHit]:
+        if not scored_rows:
+            return []
+        placeholders = ",".join("?" * len(scored_rows))
+        found = {
+            row: (doc_id, document, metadata)
+            for doc_id, row, document, metadata in self._reader().execute(
+                f"SELECT id, row, document, metadata FROM chunks WHERE row IN ({placeholders})",
+                [row for row, _ in scored_rows]
+            )
+        }
+        hits = []
+        for row, cosine in scored_rows:
+            if row in found:
+                doc_id, document, metadata = found[row]
+                hits.append(SearchHit(
+                    id=doc_id, content=document, metadata=json.loads(metadata),
+                    score=cosine_to_relevance(cosine)
+                ))
+        return hits
+
+    def similarity_search_by_vector(self, embedding, k=4):
+        view = self._view
+        if view.count == 0:
+            return []
+        query = self._normalize(np.asarray([embedding], dtype=np.float32))[0]
+        return self._hits_for_rows(self._top_rows(query, k, view))
+
+    def count(self):
+        return self._count
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            thread = self._build_thread
+        # 学習中のインデックスがディレクトリに書き込み終えるのを待つ（閉じた後の削除と競合しないように）
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        with self._lock:
+            self._vectors = None
+            self._codes = None
+            if self.index is not None:
+                self.index.close()
+            self.conn.close()
+            with self._readers_lock:
+                for conn in self._reader_conns:
+                    conn.close()
+                self._reader_conns = []
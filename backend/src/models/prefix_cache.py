@@ -0,0 +1,174 @@
+from typing import Deque, Dict, List, Optional, Sequence, Tuple
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+import copy
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_MB = 1024 ** 2
+
+
+@dataclass
+class _PrefixEntry:
+    token_ids: Tuple[int, ...]
+    past_key_values: object
+    nbytes: int
+    prefill_seconds: float  # この接頭辞を計算するのにかかった時間
+
+
+def _common_prefix_length(a: Sequence[int], b: Sequence[int]) -> int:
+    n = min(len(a), len(b))
+    for i in range(n):
+        if a[i] != b[i]:
+            return i
+    return n
+
+
+def _cache_nbytes(past_key_values) -> int:
+    legacy = past_key_values.to_legacy_cache() if hasattr(past_key_values, "to_legacy_cache") else past_key_values
+    return sum(tensor.numel() * tensor.element_size() for layer in legacy for tensor in layer)
+
+
+class PrefixKVCache:
+    """プロンプトの共通の接頭辞に対するKVキャッシュ（メモリ量によるLRU）
+
+    直近のプロンプトとの最長共通接頭辞がmin_prefix_tokens以上あれば、その接頭辞だけを
+    1回プリフィルして保存する。以降のリクエストは最長一致する接頭辞のキャッシュの
+    コピーから生成を始め、残りのトークンだけをプリフィルする。RAGのプロンプトでは
+    固定の前置き（システムプロンプト）がここで共有される。
+    """
+
+    def __init__(self, max_bytes: int, min_prefix_tokens: int = 16, recent_prompts: int = 16):
+        self.max_bytes = max_bytes
+        self.min_prefix_tokens = min_prefix_tokens
+        self._entries: "OrderedDict[Tuple[int, ...], _PrefixEntry]" = OrderedDict()  # 最近使ったものが末尾
+        self._recent: Deque[Tuple[int, ...]] = deque(maxlen=recent_prompts)
+        self._lock = threading.Lock()
+        self._saved: Deque[float] = deque(maxlen=1000)
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "inserts": 0,
+            "evictions": 0,
+            "reused_tokens": 0,
+            "prefill_seconds_saved": 0.0,
+        }
+
+    @classmethod
+    def from_config(cls, config: Dict) -> "PrefixKVCache":
+        return cls(
+            max_bytes=int(config.get('max_mb', 512) * _MB),
+            min_prefix_tokens=config.get('min_prefix_tokens', 16),
+            recent_prompts=config.get('recent_prompts', 16)
+        )
+
+    @property
+    def used_bytes(self) -> int:
+        return sum(entry.nbytes for entry in self._entries.values())
+
+    def lookup(self, token_ids: Sequence[int]) -> Optional[_PrefixEntry]:
+        """最長一致する接頭辞のエントリ（最後の1トークンは必ず残す）"""
+        with self._lock:
+            best = None
+            for prefix, entry in self._entries.items():
+                if len(prefix) < len(token_ids) and (best is None or len(prefix) > len(best.token_ids)):
+                    if tuple(token_ids[:len(prefix)]) == prefix:
+                        best = entry
+            if best is not None:
+                self._entries.move_to_end(best.token_ids)
+            return best
+
+    def shared_prefix_length(self, token_ids: Sequence[int]) -> int:
+        """直近のプロンプトとの最長共通接頭辞の長さ（min_prefix_tokens未満なら0）"""
+        with self._lock:
+            length = max((_common_prefix_length(token_ids, recent) for recent in self._recent), default=0)
+        length = min(length, len(token_ids) - 1)
+        return length if length >= self.min_prefix_tokens else 0
+
+    def remember(self, token_ids: Sequence[int]) -> None:
+        with self._lock:
+            self._recent.append(tuple(token_ids))
+
+    def insert(self, token_ids: Sequence[int], past_key_values, nbytes: int, prefill_seconds: float) -> None:
+        """接頭辞のKVキャッシュを保存し、上限を超えたら古いものから削除"""
+        if nbytes > self.max_bytes:
+            return
+        key = tuple(token_ids)
+        with self._lock:
+            self._entries[key] = _PrefixEntry(key, past_key_values, nbytes, prefill_seconds)
+            self._entries.move_to_end(key)
+            self._stats["inserts"] += 1
+            while self.used_bytes > self.max_bytes:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def record_hit(self, entry: _PrefixEntry, copy_seconds: float) -> None:
+        saved = max(0.0, entry.prefill_seconds - copy_seconds)
+        with self._lock:
+            self._stats["hits"] += 1
+            self._stats["reused_tokens"] += len(entry.token_ids)
+            self._stats["prefill_seconds_saved"] += saved
+            self._saved.append(saved)
+
+    def record_miss(self) -> None:
+        with self._lock:
+            self._stats["misses"] += 1
+
+    def prepare(self, model, token_ids: List[int]) -> Dict:
+        """model.generateに渡す追加の引数（共通の接頭辞があればそのKVキャッシュのコピー）
+
+        キャッシュが無くても直近のプロンプトと十分に長い接頭辞を共有していれば、
+        ここでその接頭辞をプリフィルして保存する。
+        """
+        import torch
+        from transformers import DynamicCache
+
+        entry = self.lookup(token_ids)
+        if entry is None:
+            prefix_length = self.shared_prefix_length(token_ids)
+            self.remember(token_ids)
+            if not prefix_length:
+                self.record_miss()
+                return {}
+            start = time.perf_counter()
+            with torch.inference_mode():
+                output = model(
+                    input_ids=torch.tensor([token_ids[:prefix_length]], device=model.device),
+                    past_key_values=DynamicCache(),
+                    use_cache=True
+                )
+            prefill_seconds = time.perf_counter() - start
+            past_key_values = output.past_key_values
+            self.insert(token_ids[:prefix_length], past_key_values, _cache_nbytes(past_key_values), prefill_seconds)
+            logger.info(f"Cached KV for a {prefix_length}-token prompt prefix ({prefill_seconds * 1000:.1f} ms)")
+            self.record_miss()
+            # 今回の生成はこのキャッシュから続ける（保存したものは書き換えない）
+            return {"past_key_values": copy.deepcopy(past_key_values)}
+
+        self.remember(token_ids)
+        start = time.perf_counter()
+        past_key_values = copy.deepcopy(entry.past_key_values)
+        self.record_hit(entry, time.perf_counter() - start)
+        return {"past_key_values": past_key_values}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._recent.clear()
+
+    def get_metrics(self) -> Dict:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            saved = sorted(self._saved)
+            return {
+                **self._stats,
+                "hit_rate": self._stats["hits"] / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "used_bytes": self.used_bytes,
+                "max_bytes": self.max_bytes,
+                "mean_saved_ms_per_hit": 1000 * sum(saved) / len(saved) if saved else 0.0,
+                "p50_saved_ms_per_hit": 1000 * saved[len(saved) // 2] if saved else 0.0,
+            }
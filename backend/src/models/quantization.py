@@ -0,0 +1,96 @@
+from typing import Optional
+import logging
+import os
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# NumPy 2.0未満にはbitwise_countが無いため、バイト単位の表で代用する
+_POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+class Int8Quantizer:
+    """次元ごとのスケールでint8に変換するスカラー量子化
+
+    スケールは保存済みベクトルの各次元の最大絶対値から決め（ストア側で件数が
+    増えるたびに求め直す）、範囲外の値はクリップする。スコアは内積の近似値。
+    """
+
+    name = "int8"
+    dtype = np.int8
+    needs_calibration = True
+
+    def __init__(self, path: str):
+        self.path = path
+        self.scale: Optional[np.ndarray] = np.load(path) if os.path.exists(path) else None
+
+    @property
+    def fitted(self) -> bool:
+        return self.scale is not None
+
+    def code_width(self, dim: int) -> int:
+        return dim
+
+    def fit(self, vectors: np.ndarray) -> None:
+        scale = np.abs(vectors).max(axis=0) / 127.0
+        self.scale = np.maximum(scale, 1e-6).astype(np.float32)
+        np.save(self.path, self.scale)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        return np.clip(np.rint(vectors / self.scale), -127, 127).astype(np.int8)
+
+    def prepare_query(self, query: np.ndarray) -> np.ndarray:
+        # 逆量子化をクエリ側に畳み込む: (code * scale) · q = code · (scale * q)
+        return (query * self.scale).astype(np.float32)
+
+    def scores(self, codes: np.ndarray, prepared_query: np.ndarray) -> np.ndarray:
+        return codes.astype(np.float32) @ prepared_query
+
+
+class BinaryQuantizer:
+    """符号ビットのみを保存する1ビット量子化（ハミング距離で候補を選ぶ）"""
+
+    name = "binary"
+    dtype = np.uint8
+    needs_calibration = False
+
+    def __init__(self, path: str):
+        self.path = path
+
+    @property
+    def fitted(self) -> bool:
+        return True
+
+    def code_width(self, dim: int) -> int:
+        return (dim + 7) // 8
+
+    def fit(self, vectors: np.ndarray) -> None:
+        pass
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        return np.packbits(vectors > 0, axis=1)
+
+    def prepare_query(self, query: np.ndarray) -> np.ndarray:
+        return np.packbits(query > 0)
+
+    def scores(self, codes: np.ndarray, prepared_query: np.ndarray) -> np.ndarray:
+        xor = np.bitwise_xor(codes, prepared_query)
+        if hasattr(np, "bitwise_count"):
+            if xor.shape[1] % 8 == 0:
+                xor = xor.view(np.uint64)
+            distances = np.bitwise_count(xor).sum(axis=1, dtype=np.int32)
+        else:
+            distances = _POPCOUNT_TABLE[xor].sum(axis=1, dtype=np.int32)
+        return -distances.astype(np.float32)
+
+
+def create_quantizer(kind: str, directory: str):
+    """設定名から量子化器を作成（'none'ならNone）"""
+    if kind in (None, "none"):
+        return None
+    if kind == "int8":
+        return Int8Quantizer(os.path.join(directory, "int8_scale.npy"))
+    if kind == "binary":
+        return BinaryQuantizer(os.path.join(directory, "binary.npy"))
+    raise ValueError(f"Unknown quantization: {kind}")
@@ -1,44 +1,99 @@
-from typing import Dict, List, Optional
+from typing import AsyncIterator, Callable, Dict, List, Optional
 from datetime import datetime
-from langchain_chroma import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
-from .llm_model import LlamaModel, CodeLlamaModel  # CodeLlamaModelをインポート
-import requests
-from bs4 import BeautifulSoup
+from .embedding_cache import build_cached_embeddings
+from .embedding_backends import create_embeddings
+from .embedding_batcher import EmbeddingBatcher
+from .chunker import TokenChunker
+from .answer_cache import SemanticAnswerCache
+from .lexical_index import LexicalIndex, reciprocal_rank_fusion
+from .vector_store import VectorStore, create_vector_store
+from .source_registry import SourceRegistry
+from .ingestion_queue import IngestionQueue, IngestionWorkers, PermanentIngestionError
+from .model_pool import ModelPool
+from .generation_executor import GenerationExecutor, GenerationQueueFull
+from .context_packer import CONTEXT_SEPARATOR, ContextPacker
+from .generation_control import classify_query
+from ..utils.rag_config import RAG_CONFIG
+from ..utils.text_utils import content_hash, make_chunk_id, source_fingerprint
+from collections import Counter
+from contextlib import contextmanager
+import asyncio
+import glob
 import logging
 import os
 import io
+import re
+import shutil
+import threading
+import time
+import uuid
 import numpy as np
-from PyPDF2 import PdfReader
-from transformers import AutoTokenizer
+
+# torch・transformers・bs4・PyPDF2などの重いモジュールは使う時点でインポートする
+# （APIサーバーがモデルのロード前に起動できるように）
 
 logger = logging.getLogger(__name__)
 
+# 生成時のmax_length（プロンプトはLLM側でこの半分に切り詰められる）
+_GENERATION_MAX_LENGTH = 2048
+# 1回のdeleteで渡すチャンクIDの数
+_DELETE_BATCH_SIZE = 500
+# クリアで作り直したストアのディレクトリ名（<persist_dir>.gen-xxxxxxxx）
+_GENERATION_SUFFIX = ".gen-"
+# 使用中のストアのディレクトリ名を記録するファイル（<persist_dir>.current、無ければ<persist_dir>を使う）
+_CURRENT_SUFFIX = ".current"
+# 以前の版でクリア時に退避したディレクトリ名（<persist_dir>.trash-xxxxxxxx）
+_TRASH_SUFFIX = ".trash-"
+
 class RAGSystem:
     def __init__(self, model_type: str = "llama"):
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name="intfloat/multilingual-e5-small",
-            model_kwargs={'device': 'cuda'}
+        from .llm_model import LlamaModel, CodeLlamaModel
+
+        # 埋め込みモデル（バックエンドとデバイスは設定で選択）
+        embedding_model = RAG_CONFIG['embedding_model']
+        embedding_config = RAG_CONFIG['embedding']
+        self.embeddings = create_embeddings(embedding_model, embedding_config)
+
+        # 埋め込みキャッシュ（再取り込み時の再計算を避ける）
+        # 基準以外のバックエンドは許容誤差内でも値が異なるため、キャッシュのキーを分ける
+        cache_namespace = embedding_model
+        if embedding_config['backend'] != 'sentence_transformers':
+            cache_namespace = f"{embedding_model}#{embedding_config['backend']}"
+        cached_embeddings = build_cached_embeddings(
+            self.embeddings, cache_namespace, RAG_CONFIG['embedding_cache']
         )
+        self.embedding_cache = cached_embeddings.cache if cached_embeddings else None
+
+        # 同時に届いたクエリの埋め込みをまとめる（クエリはキャッシュを通さない）
+        batching_config = RAG_CONFIG['query_batching']
+        self.query_batcher = EmbeddingBatcher.from_config(
+            self.embeddings.embed_documents, batching_config
+        ) if batching_config['enabled'] else None
+        # 埋め込みモデルが読み込んだトークナイザーをチャンク分割でも共用する
+        self.tokenizer = self._embedding_tokenizer(self.embeddings, embedding_model)
+        if cached_embeddings:
+            self.embeddings = cached_embeddings
         
         # 2つのベクトルストアのパスを設定
         self.persist_directory_general = "./data/chroma_db_general"
         self.persist_directory_code = "./data/chroma_db_code"
-        os.makedirs(self.persist_directory_general, exist_ok=True)
-        os.makedirs(self.persist_directory_code, exist_ok=True)
+        # クリアで作り直したストアは別のディレクトリに作るため、カテゴリごとに使用中の場所を持つ
+        self._store_directories = {
+            "general": self._current_store_directory(self.persist_directory_general),
+            "code": self._current_store_directory(self.persist_directory_code)
+        }
+        for directory in self._store_directories.values():
+            os.makedirs(directory, exist_ok=True)
+        self._maintenance_lock = threading.Lock()
+        # ストアを使用中の処理の数（差し替えたストアは使用中が無くなってから閉じる）
+        self._store_lock = threading.Lock()
+        self._store_users: Dict[int, int] = {}
+        self._retired_stores: Dict[int, tuple] = {}
+        self._purge_retired_directories()
         
         # 2つのベクトルストアの初期化
-        self.vectorstore_general = Chroma(
-            persist_directory=self.persist_directory_general,
-            embedding_function=self.embeddings,
-            collection_name="general_documents"
-        )
-        
-        self.vectorstore_code = Chroma(
-            persist_directory=self.persist_directory_code,
-            embedding_function=self.embeddings,
-            collection_name="code_documents"
-        )
+        self.vectorstore_general = self._create_vector_store("general")
+        self.vectorstore_code = self._create_vector_store("code")
         
         # モデルの初期化
         self.model_classes = {
@@ -46,21 +101,122 @@ class RAGSystem:
             "codellama": CodeLlamaModel
         }
         
+        # 既定のモデル（リクエストで指定が無い場合に使用）
         self.model_type = model_type
-        self.llm = self._initialize_model(model_type)
+        # 生成のワーカープール（全モデルで共有し、同時に実行する生成の数を制限）
+        self.generation_executor = GenerationExecutor.from_config(RAG_CONFIG['generation'])
+        # 生成が止まった理由ごとの回数（/api/metrics用）
+        self.stop_reasons = Counter()
+        # モデルプール（複数モデルをメモリ予算内で常駐させる）
+        self.model_pool = ModelPool.from_config(self._initialize_model, RAG_CONFIG['model_pool'])
         
-        # ソース管理用（カテゴリ別）
-        self.sources = {
-            "general": {},
-            "code": {}
-        }
+        # ソース管理用（SQLiteに永続化、無ければベクトルストアから構築）
+        self.source_registry = SourceRegistry(RAG_CONFIG['source_registry']['path'])
+        for category, vectorstore in (("general", self.vectorstore_general), ("code", self.vectorstore_code)):
+            if not self.source_registry.has_counters(category):
+                self._rebuild_source_registry(category, vectorstore)
         
+        # URLの取り込みキュー（SQLiteに永続化し、専用のワーカーで処理）
+        self.ingestion_config = RAG_CONFIG['ingestion']
+        self.ingestion_queue = IngestionQueue(
+            self.ingestion_config['path'], max_attempts=self.ingestion_config['max_attempts']
+        )
+        self.ingestion_workers = IngestionWorkers.from_config(
+            self.ingestion_queue, self._run_ingestion_job, self.ingestion_config
+        )
+
         # チャンクサイズの設定
         self.chunk_size = 500
         self.chunk_overlap = 50
         
-        # トークナイザーの初期化
-        self.tokenizer = AutoTokenizer.from_pretrained("intfloat/multilingual-e5-small")
+        self.chunker = TokenChunker(self.tokenizer, self.chunk_size, self.chunk_overlap)
+
+        # 検索結果のコンテキストをトークン数の予算内にまとめる
+        packing_config = RAG_CONFIG['context_packing']
+        self.context_packer = ContextPacker.from_config(packing_config) if packing_config['enabled'] else None
+        if self.context_packer and self.context_packer.max_prompt_tokens > _GENERATION_MAX_LENGTH // 2:
+            logger.warning(f"max_prompt_tokens exceeds the prompt limit; using {_GENERATION_MAX_LENGTH // 2}")
+            self.context_packer.max_prompt_tokens = _GENERATION_MAX_LENGTH // 2
+
+        # 意味的回答キャッシュ
+        cache_config = RAG_CONFIG['answer_cache']
+        self.answer_cache = SemanticAnswerCache(
+            similarity_threshold=cache_config['similarity_threshold'],
+            max_entries=cache_config['max_entries'],
+            ttl_seconds=cache_config['ttl_seconds'],
+            require_term_match=cache_config['require_term_match']
+        ) if cache_config['enabled'] else None
+
+        # 語彙インデックス（BM25、各コレクションと同じディレクトリに保存）
+        self.lexical_indexes = {}
+        if RAG_CONFIG['hybrid_search']['enabled']:
+            self.lexical_indexes = {
+                "general": self._load_lexical_index(self._store_directories["general"], self.vectorstore_general),
+                "code": self._load_lexical_index(self._store_directories["code"], self.vectorstore_code)
+            }
+
+    @staticmethod
+    def _embedding_tokenizer(embeddings, model_name: str):
+        """埋め込みモデルのトークナイザー（取得できなければ読み込む）"""
+        tokenizer = getattr(embeddings, "tokenizer", None)
+        if tokenizer is None:
+            tokenizer = getattr(getattr(embeddings, "_client", None), "tokenizer", None)
+        if tokenizer is not None:
+            return tokenizer
+        from transformers import AutoTokenizer
+        return AutoTokenizer.from_pretrained(model_name)
+
+    def _create_vector_store(self, category: str, persist_directory: Optional[str] = None) -> VectorStore:
+        """設定されたバックエンドでカテゴリのベクトルストアを作成（既定は使用中のディレクトリ）"""
+        store_config = RAG_CONFIG['vector_store']
+        backend = store_config['backend']
+        persist_directory = persist_directory or self._store_directories[category]
+        return create_vector_store(
+            backend,
+            persist_directory,
+            self.embeddings,
+            collection_name=f"{category}_documents",
+            options=store_config.get(backend, {})
+        )
+
+    def _load_lexical_index(self, persist_directory: str, vectorstore: VectorStore) -> LexicalIndex:
+        """語彙インデックスの読み込み（無ければベクトルストアから構築）"""
+        hybrid_config = RAG_CONFIG['hybrid_search']
+        index = LexicalIndex(
+            os.path.join(persist_directory, "lexical_index"),
+            k1=hybrid_config['bm25_k1'],
+            b=hybrid_config['bm25_b']
+        )
+        if len(index) == 0 and vectorstore.count() > 0:
+            logger.info(f"Building lexical index from {persist_directory}")
+            existing = vectorstore.get(include=["documents"])
+            index.add(existing["ids"], existing["documents"])
+            index.save()
+        return index
+
+    def _rebuild_source_registry(self, category: str, vectorstore: VectorStore) -> None:
+        """ベクトルストアのメタデータからソース・チャンク・カウンタを作り直す"""
+        total_chunks = vectorstore.count()
+        sources = {}
+        chunks = []
+        if total_chunks > 0:
+            logger.info(f"Rebuilding source registry for {category} from {total_chunks} chunks")
+            existing = vectorstore.get(include=["metadatas"])
+            for chunk_id, meta in zip(existing["ids"], existing["metadatas"]):
+                if not meta or not meta.get("source"):
+                    continue
+                url = meta["source"]
+                chunks.append((chunk_id, url, meta.get('chunk_index'), meta.get('content_hash')))
+                info = sources.setdefault(url, {
+                    'title': meta.get('title', url),
+                    'chunk_count': 0,
+                    'added_at': meta.get('timestamp'),
+                    'content_type': 'pdf' if url.lower().endswith('.pdf') else 'web',
+                    'category': category,
+                    'fingerprint': meta.get('source_fingerprint')
+                })
+                info['chunk_count'] += 1
+        self.source_registry.rebuild(category, sources.items(), chunks, total_chunks)
 
     def _initialize_model(self, model_type: str):
         """モデルの初期化"""
@@ -68,36 +224,126 @@ class RAGSystem:
             raise ValueError(f"Unknown model type: {model_type}")
         
         model_class = self.model_classes[model_type]
-        return model_class()
+        return model_class(
+            executor=self.generation_executor,
+            batching=RAG_CONFIG['generation']['continuous_batching'],
+            prefix_cache=RAG_CONFIG['generation']['prefix_cache'],
+            stopping=RAG_CONFIG['generation']['stopping'],
+            speculative=RAG_CONFIG['generation']['speculative'].get(model_type),
+            inference={
+                'profile': RAG_CONFIG['inference']['profiles'].get(model_type, 'auto'),
+                'num_threads': RAG_CONFIG['inference']['num_threads'],
+                'num_interop_threads': RAG_CONFIG['inference']['num_interop_threads']
+            }
+        )
+
+    def _get_vectorstore(self, category: str) -> VectorStore:
+        return self.vectorstore_code if category == "code" else self.vectorstore_general
+
+    @contextmanager
+    def _use_vectorstore(self, category: str):
+        """カテゴリのストアを借りる（借りている間はクリアで差し替えられても閉じない）"""
+        with self._store_lock:
+            store = self._get_vectorstore(category)
+            self._store_users[id(store)] = self._store_users.get(id(store), 0) + 1
+        try:
+            yield store
+        finally:
+            with self._store_lock:
+                key = id(store)
+                self._store_users[key] -= 1
+                if self._store_users[key] == 0:
+                    del self._store_users[key]
+                    retired = self._retired_stores.pop(key, None)
+                    if retired is not None:
+                        self._start_dispose(*retired)
+
+    @staticmethod
+    def _current_store_directory(base_directory: str) -> str:
+        """使用中のストアのディレクトリ（クリア後は記録されたディレクトリ）"""
+        try:
+            with open(base_directory + _CURRENT_SUFFIX, encoding="utf-8") as f:
+                name = f.read().strip()
+        except FileNotFoundError:
+            return base_directory
+        return os.path.join(os.path.dirname(base_directory), name) if name else base_directory
+
+    def _swap_in_fresh_store(self, category: str) -> None:
+        """空のストアを新しいディレクトリに作って参照を差し替え、古いストアを退役させる
+
+        古いストアのディレクトリは開いたまま動かさず、借りている処理が無くなってから
+        閉じてディレクトリごと削除する。
+        """
+        base_directory = self.persist_directory_code if category == "code" else self.persist_directory_general
+        with self._maintenance_lock:
+            new_directory = f"{base_directory}{_GENERATION_SUFFIX}{uuid.uuid4().hex[:8]}"
+            os.makedirs(new_directory)
+            new_store = self._create_vector_store(category, new_directory)
+            new_lexical_index = None
+            if category in self.lexical_indexes:
+                new_lexical_index = self._load_lexical_index(new_directory, new_store)
+
+            # 再起動後も新しいディレクトリを使うように記録する
+            pointer_path = base_directory + _CURRENT_SUFFIX
+            with open(pointer_path + ".tmp", "w", encoding="utf-8") as f:
+                f.write(os.path.basename(new_directory))
+            os.replace(pointer_path + ".tmp", pointer_path)
+
+            with self._store_lock:
+                old_store = self._get_vectorstore(category)
+                old_directory = self._store_directories[category]
+                # 検索は借りた参照を使うので、代入で新しいストアに切り替わる
+                setattr(self, f"vectorstore_{category}", new_store)
+                self._store_directories[category] = new_directory
+                if new_lexical_index is not None:
+                    self.lexical_indexes[category] = new_lexical_index
+                if self._store_users.get(id(old_store), 0) > 0:
+                    self._retired_stores[id(old_store)] = (old_store, old_directory)
+                else:
+                    self._start_dispose(old_store, old_directory)
+            self.source_registry.clear(category)
+            if self.answer_cache:
+                self.answer_cache.invalidate(category)
+
+    def _start_dispose(self, old_store: Optional[VectorStore], directory: str) -> None:
+        """退役したストアの後片付けをバックグラウンドで始める"""
+        threading.Thread(target=self._dispose_store, args=(old_store, directory), daemon=True).start()
+
+    @staticmethod
+    def _dispose_store(old_store: Optional[VectorStore], directory: str) -> None:
+        """退役したストアを閉じてディレクトリを削除"""
+        if old_store is not None:
+            old_store.close()
+        shutil.rmtree(directory, ignore_errors=True)
+        logger.info(f"Removed retired store directory {directory}")
+
+    def _purge_retired_directories(self) -> None:
+        """前回までの起動で削除しきれなかった古いストアのディレクトリを削除"""
+        for category, base_directory in (("general", self.persist_directory_general),
+                                         ("code", self.persist_directory_code)):
+            current = os.path.normpath(self._store_directories[category])
+            pattern = glob.escape(base_directory)
+            directories = glob.glob(f"{pattern}{_GENERATION_SUFFIX}*") + glob.glob(f"{pattern}{_TRASH_SUFFIX}*")
+            if os.path.isdir(base_directory):
+                directories.append(base_directory)
+            for directory in directories:
+                if os.path.normpath(directory) != current:
+                    self._start_dispose(None, directory)
+
     async def clear_database(self, category: str = None) -> bool:
-        """データベースのクリア（カテゴリ指定可能）"""
+        """データベースのクリア（カテゴリ指定可能）
+
+        新しい空のストアへの差し替えはスレッドで行い、古いストアは使用中の検索が
+        終わってからバックグラウンドで閉じて削除するため、実行中も検索を処理し続けられる。
+        """
         try:
             logger.info(f"Clearing database for category: {category if category else 'all'}")
-            
-            if category in ['general', None]:
-                if os.path.exists(self.persist_directory_general):
-                    import shutil
-                    shutil.rmtree(self.persist_directory_general)
-                    os.makedirs(self.persist_directory_general, exist_ok=True)
-                self.vectorstore_general = Chroma(
-                    persist_directory=self.persist_directory_general,
-                    embedding_function=self.embeddings,
-                    collection_name="general_documents"
-                )
-                self.sources["general"] = {}
-                
-            if category in ['code', None]:
-                if os.path.exists(self.persist_directory_code):
-                    import shutil
-                    shutil.rmtree(self.persist_directory_code)
-                    os.makedirs(self.persist_directory_code, exist_ok=True)
-                self.vectorstore_code = Chroma(
-                    persist_directory=self.persist_directory_code,
-                    embedding_function=self.embeddings,
-                    collection_name="code_documents"
-                )
-                self.sources["code"] = {}
-            
+
+            for name in ['general', 'code']:
+                if category not in [name, None]:
+                    continue
+                await asyncio.to_thread(self._swap_in_fresh_store, name)
+
             logger.info("Database cleared successfully")
             return True
             
@@ -106,147 +352,346 @@ class RAGSystem:
             logger.exception(e)
             return False
 
+    def _delete_source_chunks(self, category: str, url: str) -> Optional[int]:
+        """URLのチャンクをストア・語彙インデックス・レジストリから削除（無ければNone）
+
+        取り込みの保存やクリアと同じロックの中で行い、途中の状態を他の更新に見せない。
+        """
+        with self._maintenance_lock:
+            if self.source_registry.get_source(category, url) is None:
+                return None
+
+            chunk_ids = self.source_registry.get_chunk_ids(category, url)
+            vectorstore = self._get_vectorstore(category)
+            # 検索がストアのロックを長く待たないようにバッチに分ける
+            for start in range(0, len(chunk_ids), _DELETE_BATCH_SIZE):
+                vectorstore.delete(chunk_ids[start:start + _DELETE_BATCH_SIZE])
+
+            lexical_index = self.lexical_indexes.get(category)
+            if lexical_index is not None:
+                lexical_index.remove(chunk_ids)
+                lexical_index.save()
+
+            self.source_registry.remove_source(category, url)
+            if self.answer_cache:
+                self.answer_cache.invalidate(category)
+        return len(chunk_ids)
+
+    async def rebuild_ann_index(self, category: Optional[str] = None) -> Dict[str, bool]:
+        """近似最近傍インデックスを現在の全チャンクで学習し直す（検索・取り込みは止めない）"""
+        rebuilt = {}
+        for name in ['general', 'code']:
+            if category not in [name, None]:
+                continue
+            with self._use_vectorstore(name) as vectorstore:
+                build = getattr(vectorstore, "build_ann_index", None)
+                rebuilt[name] = bool(build) and await asyncio.to_thread(build)
+            logger.info(f"Rebuilt ANN index for {name}: {rebuilt[name]}")
+        return rebuilt
+
+    async def delete_source(self, url: str, category: str = "general") -> bool:
+        """URLのチャンクをIDでバッチ削除（スレッドで実行し、イベントループを止めない）"""
+        try:
+            if category not in ["general", "code"]:
+                logger.error(f"Invalid category: {category}")
+                return False
+
+            deleted = await asyncio.to_thread(self._delete_source_chunks, category, url)
+            if deleted is None:
+                logger.warning(f"Source not found: {url} ({category})")
+                return False
+
+            logger.info(f"Deleted {deleted} chunks of {url} from {category} database")
+            return True
+
+        except Exception as e:
+            logger.error(f"Error deleting source: {str(e)}")
+            logger.exception(e)
+            return False
+
     def chunk_text(self, text: str) -> List[str]:
         """テキストを指定されたトークン数で分割"""
         try:
-            tokens = self.tokenizer.encode(text)
-            chunks = []
-            
-            start = 0
-            while start < len(tokens):
-                end = start + self.chunk_size
-                chunk_tokens = tokens[start:end]
-                chunk_text = self.tokenizer.decode(chunk_tokens, skip_special_tokens=True)
-                chunks.append(chunk_text)
-                start += (self.chunk_size - self.chunk_overlap)
-            
-            return chunks
+            return self.chunker.chunk(text)
             
         except Exception as e:
             logger.error(f"Error chunking text: {str(e)}")
             return [text]
 
-    async def add_from_url(self, url: str, category: str = "general") -> bool:
-        """URLからコンテンツを追加（カテゴリ指定可能）"""
+    def chunk_texts(self, texts: List[str]) -> List[List[str]]:
+        """複数のテキストをまとめて分割"""
         try:
-            logger.info(f"Scraping content from URL: {url} for category: {category}")
-            
-            if category not in ["general", "code"]:
-                logger.error(f"Invalid category: {category}")
-                return False
-            
-            # Webページの取得
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+            return self.chunker.chunk_many(texts)
+
+        except Exception as e:
+            logger.error(f"Error chunking texts: {str(e)}")
+            return [[text] for text in texts]
+
+    def _process_pdf(self, content: bytes, url: str):
+        """PDFからテキストを抽出して分割"""
+        from PyPDF2 import PdfReader
+
+        reader = PdfReader(io.BytesIO(content))
+        pages = [page.extract_text() or "" for page in reader.pages]
+        text = "\n\n".join(page.strip() for page in pages if page.strip())
+
+        title = url
+        if reader.metadata and reader.metadata.title:
+            title = reader.metadata.title
+        return self.chunk_text(text) if text else [], title
+
+    def _process_wikipedia(self, content: bytes, url: str):
+        """Wikipediaの記事本文を抽出して分割"""
+        from bs4 import BeautifulSoup
+
+        soup = BeautifulSoup(content, 'html.parser')
+        heading = soup.find(id='firstHeading')
+        title = heading.get_text(strip=True) if heading else url
+
+        body = soup.find(id='mw-content-text') or soup
+        for tag in body.select('script, style, sup.reference, span.mw-editsection, table, div.navbox'):
+            tag.decompose()
+
+        blocks = [
+            element.get_text(" ", strip=True)
+            for element in body.find_all(['h2', 'h3', 'p', 'li'])
+        ]
+        text = "\n\n".join(block for block in blocks if block)
+        return self.chunk_text(text) if text else [], title
+
+    def _process_webpage(self, content: bytes, url: str):
+        """通常のWebページのテキストを抽出して分割"""
+        from bs4 import BeautifulSoup
+
+        soup = BeautifulSoup(content, 'html.parser')
+        title = (soup.title.get_text(strip=True) if soup.title else "") or url
+
+        for tag in soup(['script', 'style', 'header', 'footer', 'nav', 'aside', 'iframe']):
+            tag.decompose()
+
+        text = soup.get_text("\n")
+        text = re.sub(r'[ \t]+', ' ', text)
+        text = re.sub(r'\n\s*\n+', '\n\n', text).strip()
+        return self.chunk_text(text) if text else [], title
+
+    def ingest_url(self, url: str, category: str = "general",
+                   report: Optional[Callable[[str, float], None]] = None) -> Dict:
+        """URLからコンテンツを取り込む（取得・解析・埋め込み・保存の各段階をreportに通知）
+
+        ワーカーのスレッドで実行する同期処理で、失敗は例外で返す。
+        再試行しても成功しない失敗は PermanentIngestionError にする。
+        """
+        report = report or (lambda stage, fraction=0.0: None)
+        if category not in ["general", "code"]:
+            raise PermanentIngestionError(f"Invalid category: {category}")
+        logger.info(f"Scraping content from URL: {url} for category: {category}")
+
+        # Webページの取得
+        report("fetch", 0.0)
+        import requests
+        headers = {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+        }
+        response = requests.get(url, headers=headers, timeout=self.ingestion_config['fetch_timeout_seconds'])
+        if 400 <= response.status_code < 500 and response.status_code not in (408, 429):
+            raise PermanentIngestionError(f"HTTP {response.status_code} for {url}")
+        response.raise_for_status()
+
+        report("parse", 0.0)
+        # PDFの処理
+        if url.lower().endswith('.pdf'):
+            text_content, title = self._process_pdf(response.content, url)
+        # Wikipediaの処理
+        elif 'wikipedia.org' in url:
+            text_content, title = self._process_wikipedia(response.content, url)
+        # 通常のWebページの処理
+        else:
+            text_content, title = self._process_webpage(response.content, url)
+
+        if not text_content:
+            raise PermanentIngestionError(f"No content extracted from {url}")
+
+        logger.info(f"Extracted {len(text_content)} chunks from {url}")
+
+        # チャンクIDとソースの指紋（再取り込み時の差分検出用）
+        chunk_hashes = [content_hash(text) for text in text_content]
+        chunk_ids = [make_chunk_id(url, i, h) for i, h in enumerate(chunk_hashes)]
+        fingerprint = source_fingerprint(chunk_hashes)
+
+        # メタデータの準備
+        metadata = [
+            {
+                'source': url,
+                'title': title,
+                'timestamp': datetime.now().isoformat(),
+                'chunk_index': i,
+                'total_chunks': len(text_content),
+                'category': category,
+                'content_hash': chunk_hashes[i],
+                'source_fingerprint': fingerprint
             }
-            response = requests.get(url, headers=headers, timeout=100)
-            response.raise_for_status()
-            
-            text_content = []
-            title = url
-
-            # PDFの処理
-            if url.lower().endswith('.pdf'):
-                text_content, title = self._process_pdf(response.content, url)
-            # Wikipediaの処理
-            elif 'wikipedia.org' in url:
-                text_content, title = self._process_wikipedia(response.content, url)
-            # 通常のWebページの処理
-            else:
-                text_content, title = self._process_webpage(response.content, url)
-
-            if not text_content:
-                logger.warning(f"No content extracted from {url}")
-                return False
+            for i in range(len(text_content))
+        ]
 
-            logger.info(f"Extracted {len(text_content)} chunks from {url}")
-            
-            # メタデータの準備
-            metadata = [
-                {
-                    'source': url,
-                    'title': title,
-                    'timestamp': datetime.now().isoformat(),
-                    'chunk_index': i,
-                    'total_chunks': len(text_content),
-                    'category': category
-                }
-                for i in range(len(text_content))
-            ]
-            
-            # カテゴリに応じたベクトルストアを選択
-            vectorstore = self.vectorstore_code if category == "code" else self.vectorstore_general
-            
-            # ベクトルストアに追加
-            try:
+        # 差分はこの時点のストアとレジストリに対して求め、保存の直前に変わっていないか確かめる
+        vectorstore = self._get_vectorstore(category)
+        registered = self.source_registry.get_source(category, url)
+        existing_ids = set(self.source_registry.get_chunk_ids(category, url))
+
+        source_info = {
+            'title': title,
+            'chunk_count': len(text_content),
+            'added_at': datetime.now().isoformat(),
+            'content_type': 'pdf' if url.lower().endswith('.pdf') else 'web',
+            'category': category,
+            'fingerprint': fingerprint
+        }
+
+        if registered and registered['fingerprint'] == fingerprint and existing_ids == set(chunk_ids):
+            logger.info(f"Content of {url} is unchanged, skipping re-ingestion")
+            return {"chunks": len(chunk_ids), "new": 0, "unchanged": len(chunk_ids), "removed": 0}
+
+        new_indices = [i for i, chunk_id in enumerate(chunk_ids) if chunk_id not in existing_ids]
+        kept_indices = [i for i, chunk_id in enumerate(chunk_ids) if chunk_id in existing_ids]
+        stale_ids = list(existing_ids - set(chunk_ids))
+
+        # 変更されたチャンクのみ埋め込む（小さいバッチに分けて検索の埋め込みを長く待たせない）
+        report("embed", 0.0)
+        new_texts = [text_content[i] for i in new_indices]
+        batch_size = self.ingestion_config['embed_batch_size']
+        vectors = []
+        for start in range(0, len(new_texts), batch_size):
+            vectors.extend(self.embeddings.embed_documents(new_texts[start:start + batch_size]))
+            report("embed", (start + batch_size) / len(new_texts))
+
+        # カテゴリに応じたベクトルストアに保存
+        report("store", 0.0)
+        # ストア・語彙インデックス・レジストリの更新はクリアやソースの削除と排他にする
+        with self._maintenance_lock:
+            # 埋め込みの間にストアの差し替えや同じソースの削除・取り込みがあれば差分が古いので再試行する
+            if (self._get_vectorstore(category) is not vectorstore
+                    or set(self.source_registry.get_chunk_ids(category, url)) != existing_ids):
+                raise RuntimeError(f"{category} database changed while ingesting {url}")
+
+            if new_indices:
                 vectorstore.add_texts(
-                    texts=text_content,
-                    metadatas=metadata
+                    texts=new_texts,
+                    metadatas=[metadata[i] for i in new_indices],
+                    ids=[chunk_ids[i] for i in new_indices],
+                    embeddings=vectors
                 )
-                
-                # ソース情報の保存
-                self.sources[category][url] = {
-                    'title': title,
-                    'chunk_count': len(text_content),
-                    'added_at': datetime.now().isoformat(),
-                    'content_type': 'pdf' if url.lower().endswith('.pdf') else 'web',
-                    'category': category
-                }
-                
-                logger.info(f"Successfully added content from {url} with {len(text_content)} chunks to {category} database")
-                return True
-                
-            except Exception as e:
-                logger.error(f"Error adding chunks to vector store: {str(e)}")
-                return False
-                
+            # 変更の無いチャンクは再埋め込みせずメタデータのみ更新
+            if kept_indices:
+                vectorstore.update_metadatas(
+                    ids=[chunk_ids[i] for i in kept_indices],
+                    metadatas=[metadata[i] for i in kept_indices]
+                )
+            if stale_ids:
+                vectorstore.delete(ids=stale_ids)
+
+            lexical_index = self.lexical_indexes.get(category)
+            if lexical_index is not None:
+                lexical_index.add([chunk_ids[i] for i in new_indices], new_texts)
+                lexical_index.remove(stale_ids)
+                lexical_index.save()
+
+            # ソース情報とチャンクの保存
+            self.source_registry.upsert_source(
+                category, url, source_info,
+                chunks=[(chunk_id, i, chunk_hashes[i]) for i, chunk_id in enumerate(chunk_ids)]
+            )
+
+            # 内容が変わったのでキャッシュ済みの回答を破棄
+            if self.answer_cache:
+                self.answer_cache.invalidate(category)
+
+        logger.info(
+            f"Successfully added content from {url} to {category} database: "
+            f"{len(new_indices)} new, {len(kept_indices)} unchanged, {len(stale_ids)} removed chunks"
+        )
+        return {
+            "chunks": len(chunk_ids), "new": len(new_indices),
+            "unchanged": len(kept_indices), "removed": len(stale_ids)
+        }
+
+    async def add_from_url(self, url: str, category: str = "general") -> bool:
+        """URLからコンテンツを追加（カテゴリ指定可能、キューを通さずに直接実行）"""
+        try:
+            await asyncio.to_thread(self.ingest_url, url, category)
+            return True
         except Exception as e:
             logger.error(f"Error adding content from URL: {str(e)}")
             return False
 
-    async def generate_answer(self, query: str, k: int = 2, model_type: str = None) -> Dict:
-        """Generate an answer using the specified model"""
-        try:
-            if model_type and model_type != self.model_type:
-                self.model_type = model_type
-                self.llm = self._initialize_model(model_type)
+    def enqueue_urls(self, urls: List[str], category: str = "general") -> List[str]:
+        """URLを取り込みキューに登録し、ジョブIDを返す"""
+        job_ids = self.ingestion_queue.enqueue_many([(url, category) for url in urls])
+        self.ingestion_workers.notify()
+        return job_ids
 
-            # モデルタイプに応じてベクトルストアを選択
-            vectorstore = self.vectorstore_code if model_type == "codellama" else self.vectorstore_general
-            
-            # 関連文書の検索
-            docs = vectorstore.similarity_search_with_relevance_scores(query, k=k)
-            
-            if not docs:
-                return {
-                    'answer': f"申し訳ありません。お探しの情報が見つかりませんでした。",
-                    'sources': []
-                }
+    def _run_ingestion_job(self, job: Dict, report: Callable[[str, float], None]) -> Dict:
+        return self.ingest_url(job["url"], job["category"], report)
 
-            relevant_docs = []
-            for doc, score in docs:
-                if score >= 0.5:
-                    relevant_docs.append({
-                        'content': doc.page_content,
-                        'metadata': doc.metadata,
-                        'score': score
-                    })
+    def start_ingestion(self) -> None:
+        """取り込みキューのワーカーを起動（イベントループ上で呼ぶ）"""
+        self.ingestion_workers.start()
 
-            if not relevant_docs:
-                return {
-                    'answer': f"関連する情報が見つかりませんでした。",
-                    'sources': []
+    async def stop_ingestion(self) -> None:
+        await self.ingestion_workers.stop()
+
+    def _retrieve(self, query: str, query_vector: List[float], k: int, category: str,
+                  vectorstore: VectorStore) -> List[Dict]:
+        """関連チャンクの検索（語彙インデックスがあればRRFで統合）"""
+        hybrid_config = RAG_CONFIG['hybrid_search']
+        lexical_index = self.lexical_indexes.get(category)
+        use_hybrid = lexical_index is not None and len(lexical_index) > 0
+        n_candidates = k * hybrid_config['candidate_multiplier'] if use_hybrid else k
+
+        dense_hits = {}
+        for hit in vectorstore.similarity_search_by_vector(query_vector, k=n_candidates):
+            if hit.score >= 0.5:
+                dense_hits[hit.id] = {
+                    'content': hit.content,
+                    'metadata': hit.metadata,
+                    'score': hit.score
                 }
 
-            # コンテキストの構築
-            context = "\n\n---\n\n".join([
-                f"{doc['content']}\nSource: {doc['metadata'].get('source', 'Unknown')}"
-                for doc in relevant_docs
-            ])
+        if not use_hybrid:
+            return list(dense_hits.values())
+
+        lexical_hits = lexical_index.search(query, k=n_candidates)
+        fused = reciprocal_rank_fusion(
+            [list(dense_hits), [doc_id for doc_id, _ in lexical_hits]],
+            k=hybrid_config['rrf_k']
+        )[:k]
 
-            # モデルに応じてプロンプトを選択
-            if model_type == "codellama":
-                prompt = f"""You are an expert programmer. Please answer the following question about programming or technical topics based on the provided context.
+        # 語彙検索のみでヒットしたチャンクは本文を取得する
+        lexical_only = [doc_id for doc_id, _ in fused if doc_id not in dense_hits]
+        fetched = {}
+        if lexical_only:
+            result = vectorstore.get(ids=lexical_only, include=["documents", "metadatas"])
+            for doc_id, content, meta in zip(result["ids"], result["documents"], result["metadatas"]):
+                fetched[doc_id] = {'content': content, 'metadata': meta, 'score': 0.0}
+
+        relevant_docs = []
+        for doc_id, fusion_score in fused:
+            doc = dense_hits.get(doc_id) or fetched.get(doc_id)
+            if doc:
+                relevant_docs.append(dict(doc, fusion_score=fusion_score))
+        return relevant_docs
+
+    async def _embed_query(self, query: str) -> List[float]:
+        """クエリの埋め込み（バッチャーが有効なら他のリクエストとまとめる）"""
+        if self.query_batcher:
+            return await self.query_batcher.embed(query)
+        return self.embeddings.embed_query(query)
+
+    @staticmethod
+    def _build_prompt(query: str, context: str, model_type: str) -> str:
+        """コンテキストからモデルに応じたプロンプトを作る"""
+        # モデルに応じてプロンプトを選択
+        if model_type == "codellama":
+            return f"""You are an expert programmer. Please answer the following question about programming or technical topics based on the provided context.
 
 Question: {query}
 
@@ -254,8 +699,7 @@ Context:
 {context}
 
 Answer:"""
-            else:
-                prompt = f"""You are medical expert Assistant. Please answer the following question based on the provided context.
+        return f"""You are medical expert Assistant. Please answer the following question based on the provided context.
 
 Question: {query}
 
@@ -264,12 +708,89 @@ Context:
 
 Answer:"""
 
-            response = await self.llm.generate_response(
-                prompt,
-                max_length=2048,
-                temperature=0.7,
-                top_p=0.9
+    def _prepare_prompt(self, llm, query: str, relevant_docs: List[Dict], model_type: str) -> str:
+        """検索結果をトークン数の予算内のコンテキストにまとめてプロンプトを作る"""
+        if self.context_packer is None or llm.tokenizer is None:
+            context = CONTEXT_SEPARATOR.join(
+                ContextPacker.format_span(doc['content'], doc['metadata'].get('source', 'Unknown'))
+                for doc in relevant_docs
             )
+            return self._build_prompt(query, context, model_type)
+
+        # 質問とテンプレート（モデル側の書式を含む）の分を先に確保する
+        template = llm._format_prompt(self._build_prompt(query, "", model_type))
+        reserved_tokens = len(llm.tokenizer(template)["input_ids"])
+        packed = self.context_packer.pack(llm.tokenizer, relevant_docs, reserved_tokens)
+        packed = self.context_packer.fit(
+            llm.tokenizer, packed, lambda context: llm._format_prompt(self._build_prompt(query, context, model_type))
+        )
+        logger.debug(
+            f"Packed {len(packed.spans)} spans into {packed.context_tokens}/{packed.budget_tokens} tokens "
+            f"({packed.merged} merged, {packed.duplicates} duplicates, {packed.dropped} dropped)"
+        )
+        return self._build_prompt(query, packed.context, model_type)
+
+    @staticmethod
+    def _max_new_tokens(query: str, model_type: str) -> int:
+        """質問の種類ごとの生成トークン数の上限"""
+        limits = RAG_CONFIG['generation']['max_new_tokens']
+        return limits.get(classify_query(query, model_type), limits['default'])
+
+    @staticmethod
+    def _format_sources(relevant_docs: List[Dict]) -> List[Dict]:
+        return [
+            {
+                'content': doc['content'],
+                'metadata': doc['metadata'],
+                'relevance_score': float(doc['score']),
+                **({'fusion_score': doc['fusion_score']} if 'fusion_score' in doc else {})
+            }
+            for doc in relevant_docs
+        ]
+
+    async def generate_answer(self, query: str, k: int = 2, model_type: str = None) -> Dict:
+        """Generate an answer using the specified model"""
+        try:
+            model_type = model_type or self.model_type
+            if model_type not in self.model_classes:
+                raise ValueError(f"Unknown model type: {model_type}")
+
+            start_time = time.perf_counter()
+            category = "code" if model_type == "codellama" else "general"
+
+            # クエリの埋め込み（キャッシュ照合と検索で共用）
+            query_vector = await self._embed_query(query)
+
+            # 類似クエリのキャッシュ済み回答を確認
+            if self.answer_cache:
+                cache_epoch = self.answer_cache.epoch(category)
+                cached = self.answer_cache.lookup(query_vector, model_type, category, k, query=query)
+                if cached:
+                    return cached
+
+            # 関連文書の検索（密ベクトル＋語彙のハイブリッド、検索中にクリアされてもストアは閉じない）
+            with self._use_vectorstore(category) as vectorstore:
+                relevant_docs = await asyncio.to_thread(self._retrieve, query, query_vector, k, category, vectorstore)
+
+            if not relevant_docs:
+                return {
+                    'answer': f"関連する情報が見つかりませんでした。",
+                    'sources': []
+                }
+
+            # プールからモデルを借りる（他のリクエストのモデルには影響しない）
+            async with self.model_pool.use(model_type) as llm:
+                prompt = self._prepare_prompt(llm, query, relevant_docs, model_type)
+                generation = await llm.generate(
+                    prompt,
+                    max_length=_GENERATION_MAX_LENGTH,
+                    temperature=0.7,
+                    top_p=0.9,
+                    max_new_tokens=self._max_new_tokens(query, model_type)
+                )
+            response = generation.output
+            if generation.stop_reason:
+                self.stop_reasons[generation.stop_reason] += 1
 
             if not response:
                 return {
@@ -277,18 +798,35 @@ Answer:"""
                     'sources': []
                 }
 
-            return {
+            result = {
                 'answer': response,
-                'sources': [
-                    {
-                        'content': doc['content'],
-                        'metadata': doc['metadata'],
-                        'relevance_score': float(doc['score'])
-                    }
-                    for doc in relevant_docs
-                ]
+                'sources': self._format_sources(relevant_docs)
+            }
+
+            if self.answer_cache:
+                self.answer_cache.store(
+                    query_vector, model_type, category, k, result,
+                    generation_time=time.perf_counter() - start_time,
+                    epoch=cache_epoch,
+                    query=query
+                )
+            return {
+                **result,
+                'timings': {
+                    'generation_queue_wait': generation.queue_seconds,
+                    'generation_run': generation.run_seconds
+                },
+                'stop_reason': generation.stop_reason,
+                'generated_tokens': generation.generated_tokens,
+                'generation_stats': {
+                    'tokens_per_second': generation.generated_tokens / generation.run_seconds
+                    if generation.run_seconds else 0.0,
+                    **(generation.speculative or {})
+                }
             }
 
+        except GenerationQueueFull:
+            raise
         except Exception as e:
             logger.error(f"Error generating answer: {str(e)}")
             logger.exception(e)
@@ -297,41 +835,172 @@ Answer:"""
                 'sources': []
             }
 
-    def get_statistics(self) -> Dict:
-        """システムの統計情報を取得（カテゴリ別）"""
+    async def stream_answer(self, query: str, k: int = 2, model_type: str = None) -> AsyncIterator[Dict]:
+        """検索結果を先に返し、生成したテキストを逐次返す（SSE用のイベント列）
+
+        イベントは sources → token（複数）→ done の順。doneには回答全体と
+        検索・最初のトークンまで・全体の所要時間を含む。途中で閉じると生成を止める。
+        """
+        start_time = time.perf_counter()
+        timings = {}
         try:
-            stats = {
-                "general": {
-                    "total_documents": len(self.sources["general"]),
-                    "total_chunks": len(self.vectorstore_general.get()["ids"]),
-                    "sources": [
-                        {
-                            "url": url,
-                            "title": info["title"],
-                            "chunks": info["chunk_count"],
-                            "added_at": info["added_at"]
-                        }
-                        for url, info in self.sources["general"].items()
-                    ]
-                },
-                "code": {
-                    "total_documents": len(self.sources["code"]),
-                    "total_chunks": len(self.vectorstore_code.get()["ids"]),
+            model_type = model_type or self.model_type
+            if model_type not in self.model_classes:
+                raise ValueError(f"Unknown model type: {model_type}")
+            category = "code" if model_type == "codellama" else "general"
+
+            query_vector = await self._embed_query(query)
+            if self.answer_cache:
+                cache_epoch = self.answer_cache.epoch(category)
+                cached = self.answer_cache.lookup(query_vector, model_type, category, k, query=query)
+                if cached:
+                    yield {'event': 'sources', 'data': {'sources': cached['sources']}}
+                    yield {'event': 'token', 'data': {'text': cached['answer']}}
+                    timings['total'] = time.perf_counter() - start_time
+                    yield {'event': 'done', 'data': {'answer': cached['answer'], 'cached': True, 'timings': timings}}
+                    return
+
+            with self._use_vectorstore(category) as vectorstore:
+                relevant_docs = await asyncio.to_thread(
+                    self._retrieve, query, query_vector, k, category, vectorstore
+                )
+            sources = self._format_sources(relevant_docs)
+            timings['retrieval'] = time.perf_counter() - start_time
+            yield {'event': 'sources', 'data': {'sources': sources}}
+
+            if not relevant_docs:
+                answer = "関連する情報が見つかりませんでした。"
+                yield {'event': 'token', 'data': {'text': answer}}
+                timings['total'] = time.perf_counter() - start_time
+                yield {'event': 'done', 'data': {'answer': answer, 'cached': False, 'timings': timings}}
+                return
+
+            pieces = []
+            async with self.model_pool.use(model_type) as llm:
+                prompt = self._prepare_prompt(llm, query, relevant_docs, model_type)
+                conditions = llm.stop_conditions()
+                generation_stats = {}
+                stream = llm.stream(
+                    prompt, max_length=_GENERATION_MAX_LENGTH, temperature=0.7, top_p=0.9,
+                    max_new_tokens=self._max_new_tokens(query, model_type),
+                    conditions=conditions, stats=generation_stats
+                )
+                try:
+                    async for text in stream:
+                        if not pieces:
+                            timings['time_to_first_token'] = time.perf_counter() - start_time
+                        pieces.append(text)
+                        yield {'event': 'token', 'data': {'text': text}}
+                finally:
+                    await stream.aclose()
+
+            answer = "".join(pieces).strip()
+            timings['total'] = time.perf_counter() - start_time
+            if conditions.reason:
+                self.stop_reasons[conditions.reason] += 1
+            if answer and self.answer_cache:
+                self.answer_cache.store(
+                    query_vector, model_type, category, k, {'answer': answer, 'sources': sources},
+                    generation_time=timings['total'],
+                    epoch=cache_epoch,
+                    query=query
+                )
+            yield {'event': 'done', 'data': {
+                'answer': answer, 'cached': False, 'timings': timings,
+                'stop_reason': conditions.reason, 'generated_tokens': conditions.generated_tokens,
+                'generation_stats': generation_stats
+            }}
+
+        except GenerationQueueFull as e:
+            yield {'event': 'error', 'data': {'detail': str(e), 'status_code': 503}}
+        except Exception as e:
+            logger.error(f"Error streaming answer: {str(e)}")
+            logger.exception(e)
+            yield {'event': 'error', 'data': {'detail': '回答の生成中にエラーが発生しました。', 'status_code': 500}}
+
+    async def warm_up_model(self, model_type: Optional[str] = None) -> None:
+        """モデルをロードし、短い生成を実行して初回リクエストの遅延を無くす（プロファイルの計測も行う）"""
+        model_type = model_type or self.model_type
+        async with self.model_pool.use(model_type) as llm:
+            await llm.generate_response("Question: warm up\n\nAnswer:", max_length=32)
+            # ウォームアップ後の生成でプロファイルのメモリ使用量とtokens/secを記録
+            result = await llm.generate("Question: What is insulin?\n\nAnswer:", max_length=96, max_new_tokens=32)
+            if llm.model is not None:
+                llm.record_profile(result.generated_tokens, result.run_seconds)
+
+    def get_metrics(self) -> Dict:
+        """実行時のメトリクス（モデルプール・生成のワーカープールなど）"""
+        metrics = {
+            "model_pool": self.model_pool.get_metrics()
+        }
+        metrics["generation"] = self.generation_executor.get_metrics()
+        metrics["stop_reasons"] = dict(self.stop_reasons)
+        schedulers = {
+            model_type: llm.scheduler.get_metrics()
+            for model_type, llm in self.model_pool.resident_models().items()
+            if getattr(llm, "scheduler", None) is not None
+        }
+        if schedulers:
+            metrics["batch_schedulers"] = schedulers
+        prefix_caches = {
+            model_type: llm.prefix_cache.get_metrics()
+            for model_type, llm in self.model_pool.resident_models().items()
+            if getattr(llm, "prefix_cache", None) is not None
+        }
+        if prefix_caches:
+            metrics["prefix_caches"] = prefix_caches
+        metrics["inference_profiles"] = {
+            model_type: llm.profile_report or {"profile": llm.profile.name}
+            for model_type, llm in self.model_pool.resident_models().items()
+            if getattr(llm, "profile", None) is not None
+        }
+        speculative = {
+            model_type: llm.speculative_decoder.get_metrics()
+            for model_type, llm in self.model_pool.resident_models().items()
+            if getattr(llm, "speculative_decoder", None) is not None
+        }
+        if speculative:
+            metrics["speculative_decoding"] = speculative
+        if self.context_packer:
+            metrics["context_packer"] = self.context_packer.get_metrics()
+        if self.query_batcher:
+            metrics["query_batcher"] = self.query_batcher.get_metrics()
+        metrics["ingestion"] = self.ingestion_workers.get_metrics()
+        return metrics
+
+    def list_sources(self, category: Optional[str] = None, cursor: Optional[str] = None,
+                     limit: int = 50, **filters) -> Dict:
+        """ソース一覧をカーソルで分割して取得（url・added_after・added_beforeで絞り込み可能）"""
+        sources, next_cursor = self.source_registry.list_sources(category, cursor, limit, **filters)
+        return {"sources": sources, "next_cursor": next_cursor}
+
+    def get_statistics(self, limit: int = 50) -> Dict:
+        """システムの統計情報を取得（カテゴリ別、ソース一覧は先頭limit件）"""
+        try:
+            stats = {}
+            for category in ("general", "code"):
+                page = self.list_sources(category, limit=limit)
+                stats[category] = {
+                    **self.source_registry.get_counts(category),
                     "sources": [
                         {
-                            "url": url,
-                            "title": info["title"],
-                            "chunks": info["chunk_count"],
-                            "added_at": info["added_at"]
+                            "url": source["url"],
+                            "title": source["title"],
+                            "chunks": source["chunk_count"],
+                            "added_at": source["added_at"]
                         }
-                        for url, info in self.sources["code"].items()
-                    ]
+                        for source in page["sources"]
+                    ],
+                    "next_cursor": page["next_cursor"]
                 }
-            }
+            if self.embedding_cache:
+                stats["embedding_cache"] = self.embedding_cache.get_stats()
+            if self.answer_cache:
+                stats["answer_cache"] = self.answer_cache.get_stats()
             return stats
         except Exception as e:
             logger.error(f"Error getting statistics: {str(e)}")
             return {
-                "general": {"total_documents": 0, "total_chunks": 0, "sources": []},
-                "code": {"total_documents": 0, "total_chunks": 0, "sources": []}
-            }
\ No newline at end of file
+                "general": {"total_documents": 0, "total_chunks": 0, "sources": [], "next_cursor": None},
+                "code": {"total_documents": 0, "total_chunks": 0, "sources": [], "next_cursor": None}
+            }
@@ -0,0 +1,241 @@
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import logging
+import os
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+CATEGORIES = ("general", "code")
+
+_SOURCE_COLUMNS = "category, url, title, chunk_count, added_at, content_type, fingerprint"
+
+
+class SourceRegistry:
+    """ソースとチャンクのメタデータをSQLite（WALモード）に永続化するレジストリ
+
+    ソースごとの概要、チャンクID・内容ハッシュ、カテゴリ別の件数カウンタを保持する。
+    ソースの登録・削除はチャンクの行とカウンタを含めて1トランザクションで行うため、
+    統計の取得はコーパスの大きさに依らず1行の読み出しで済み、再起動後もそのまま使える。
+    ソース一覧は (category, url) の主キー順にカーソルで分割して返す。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS sources (
+                category TEXT NOT NULL,
+                url TEXT NOT NULL,
+                title TEXT,
+                chunk_count INTEGER NOT NULL,
+                added_at TEXT,
+                content_type TEXT,
+                fingerprint TEXT,
+                PRIMARY KEY (category, url)
+            );
+            CREATE INDEX IF NOT EXISTS idx_sources_url ON sources(url);
+            CREATE INDEX IF NOT EXISTS idx_sources_added_at ON sources(category, added_at);
+            CREATE TABLE IF NOT EXISTS chunks (
+                id TEXT PRIMARY KEY,
+                category TEXT NOT NULL,
+                url TEXT NOT NULL,
+                chunk_index INTEGER,
+                content_hash TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_chunks_source ON chunks(category, url);
+            CREATE TABLE IF NOT EXISTS counters (
+                category TEXT PRIMARY KEY,
+                documents INTEGER NOT NULL DEFAULT 0,
+                chunks INTEGER NOT NULL DEFAULT 0
+            );
+            """
+        )
+        self.conn.commit()
+
+    def has_counters(self, category: str) -> bool:
+        with self._lock:
+            return self.conn.execute(
+                "SELECT 1 FROM counters WHERE category = ?", (category,)
+            ).fetchone() is not None
+
+    def _add_to_counters(self, category: str, documents: int, chunks: int) -> None:
+        self.conn.execute(
+            """
+            INSERT INTO counters (category, documents, chunks) VALUES (?, ?, ?)
+            ON CONFLICT(category) DO UPDATE SET
+                documents = documents + excluded.documents,
+                chunks = chunks + excluded.chunks
+            """,
+            (category, documents, chunks)
+        )
+
+    @staticmethod
+    def _source_row(category: str, url: str, info: Dict) -> tuple:
+        return (
+            category, url, info.get("title"), info["chunk_count"], info.get("added_at"),
+            info.get("content_type"), info.get("fingerprint")
+        )
+
+    def get_source(self, category: str, url: str) -> Optional[Dict]:
+        with self._lock:
+            row = self.conn.execute(
+                f"SELECT {_SOURCE_COLUMNS} FROM sources WHERE category = ? AND url = ?", (category, url)
+            ).fetchone()
+        return self._row_to_source(row) if row else None
+
+    def get_chunk_ids(self, category: str, url: str) -> List[str]:
+        """ソースに属するチャンクID"""
+        with self._lock:
+            return [
+                chunk_id for (chunk_id,) in self.conn.execute(
+                    "SELECT id FROM chunks WHERE category = ? AND url = ?", (category, url)
+                )
+            ]
+
+    def upsert_source(self, category: str, url: str, info: Dict,
+                      chunks: Optional[Sequence[Tuple[str, int, str]]] = None) -> None:
+        """ソースを登録・更新し、同じトランザクションでチャンクとカウンタを更新
+
+        chunksは (チャンクID, チャンク番号, 内容ハッシュ) の列で、指定した場合は
+        ソースのチャンクをこの内容に置き換える。
+        """
+        with self._lock, self.conn:
+            row = self.conn.execute(
+                "SELECT chunk_count FROM sources WHERE category = ? AND url = ?", (category, url)
+            ).fetchone()
+            old_chunks = row[0] if row else 0
+            self.conn.execute(
+                f"INSERT OR REPLACE INTO sources ({_SOURCE_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                self._source_row(category, url, info)
+            )
+            if chunks is not None:
+                self.conn.execute("DELETE FROM chunks WHERE category = ? AND url = ?", (category, url))
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO chunks (id, category, url, chunk_index, content_hash) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    [(chunk_id, category, url, index, chunk_hash) for chunk_id, index, chunk_hash in chunks]
+                )
+            self._add_to_counters(category, 0 if row else 1, info["chunk_count"] - old_chunks)
+
+    def remove_source(self, category: str, url: str) -> bool:
+        """ソースとそのチャンクを削除し、カウンタから差し引く"""
+        with self._lock, self.conn:
+            row = self.conn.execute(
+                "SELECT chunk_count FROM sources WHERE category = ? AND url = ?", (category, url)
+            ).fetchone()
+            if row is None:
+                return False
+            self.conn.execute("DELETE FROM sources WHERE category = ? AND url = ?", (category, url))
+            self.conn.execute("DELETE FROM chunks WHERE category = ? AND url = ?", (category, url))
+            self._add_to_counters(category, -1, -row[0])
+            return True
+
+    def clear(self, category: Optional[str] = None) -> None:
+        """カテゴリ（省略時は全て）のソース・チャンク・カウンタを初期化"""
+        categories = [category] if category else list(CATEGORIES)
+        with self._lock, self.conn:
+            for name in categories:
+                self.conn.execute("DELETE FROM sources WHERE category = ?", (name,))
+                self.conn.execute("DELETE FROM chunks WHERE category = ?", (name,))
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO counters (category, documents, chunks) VALUES (?, 0, 0)", (name,)
+                )
+
+    def rebuild(self, category: str, sources: Iterable[Tuple[str, Dict]],
+                chunks: Iterable[Tuple[str, str, int, str]], total_chunks: int) -> None:
+        """既存のベクトルストアの内容からカテゴリを作り直す（一括挿入を1トランザクションで）
+
+        chunksは (チャンクID, URL, チャンク番号, 内容ハッシュ) の列。
+        """
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM sources WHERE category = ?", (category,))
+            self.conn.execute("DELETE FROM chunks WHERE category = ?", (category,))
+            self.conn.executemany(
+                f"INSERT OR REPLACE INTO sources ({_SOURCE_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [self._source_row(category, url, info) for url, info in sources]
+            )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO chunks (id, category, url, chunk_index, content_hash) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(chunk_id, category, url, index, chunk_hash) for chunk_id, url, index, chunk_hash in chunks]
+            )
+            documents = self.conn.execute(
+                "SELECT COUNT(*) FROM sources WHERE category = ?", (category,)
+            ).fetchone()[0]
+            self.conn.execute(
+                "INSERT OR REPLACE INTO counters (category, documents, chunks) VALUES (?, ?, ?)",
+                (category, documents, total_chunks)
+            )
+
+    def get_counts(self, category: str) -> Dict[str, int]:
+        """文書数とチャンク数（カウンタの1行を読むだけ）"""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT documents, chunks FROM counters WHERE category = ?", (category,)
+            ).fetchone()
+        documents, chunks = row if row else (0, 0)
+        return {"total_documents": documents, "total_chunks": chunks}
+
+    def list_sources(self, category: Optional[str] = None, cursor: Optional[str] = None, limit: int = 50,
+                     url: Optional[str] = None, added_after: Optional[str] = None,
+                     added_before: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+        """ソース一覧を1ページ分返す（次ページのカーソルも返す）
+
+        カーソルは直前のページの最後の "category:url"。条件はいずれもインデックスで
+        絞り込むため、ページの取得コストは登録済みソースの数に依存しない。
+        """
+        conditions, params = [], []
+        if category:
+            conditions.append("category = ?")
+            params.append(category)
+        if url:
+            conditions.append("url = ?")
+            params.append(url)
+        if added_after:
+            conditions.append("added_at >= ?")
+            params.append(added_after)
+        if added_before:
+            conditions.append("added_at < ?")
+            params.append(added_before)
+        if cursor:
+            cursor_category, _, cursor_url = cursor.partition(":")
+            conditions.append("(category, url) > (?, ?)")
+            params.extend([cursor_category, cursor_url])
+
+        sql = f"SELECT {_SOURCE_COLUMNS} FROM sources"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY category, url LIMIT ?"
+        params.append(limit + 1)
+
+        with self._lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        page = [self._row_to_source(row) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = page[-1]
+            next_cursor = f"{last['category']}:{last['url']}"
+        return page, next_cursor
+
+    @staticmethod
+    def _row_to_source(row) -> Dict:
+        category, url, title, chunk_count, added_at, content_type, fingerprint = row
+        return {
+            "url": url,
+            "title": title,
+            "chunk_count": chunk_count,
+            "added_at": added_at,
+            "content_type": content_type,
+            "category": category,
+            "fingerprint": fingerprint
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self.conn.close()
@@ -0,0 +1,234 @@
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from dataclasses import dataclass
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SpeculativeOutput:
+    token_ids: List[int]
+    finish_reason: str  # 'eos', 'stop', 'length'
+    proposed_tokens: int  # ドラフトモデルが提案したトークン数
+    accepted_tokens: int  # そのうち対象モデルが受け入れた数
+    steps: int  # 対象モデルの順伝播（検証）の回数
+    seconds: float
+
+    @property
+    def acceptance_rate(self) -> float:
+        return self.accepted_tokens / self.proposed_tokens if self.proposed_tokens else 0.0
+
+    @property
+    def tokens_per_second(self) -> float:
+        return len(self.token_ids) / self.seconds if self.seconds else 0.0
+
+    def stats(self) -> Dict:
+        return {
+            "acceptance_rate": self.acceptance_rate,
+            "tokens_per_second": self.tokens_per_second,
+            "proposed_tokens": self.proposed_tokens,
+            "accepted_tokens": self.accepted_tokens,
+            "tokens_per_step": len(self.token_ids) / self.steps if self.steps else 0.0,
+        }
+
+
+def next_draft_length(current: int, accepted: int, proposed: int, maximum: int) -> int:
+    """次に提案するトークン数（全て受け入れられたら増やし、外れたら減らす）"""
+    if proposed and accepted == proposed:
+        return min(maximum, current + 2)
+    return max(1, current - 1)
+
+
+class SpeculativeDecoder:
+    """投機的デコード（バッチサイズ1）
+
+    小さいドラフトモデルが数トークンを逐次提案し、対象モデルはそれらを1回の順伝播でまとめて検証する。
+    貪欲法では対象モデルのargmaxと一致する所まで、サンプリングでは確率の比 p/q で受け入れ、
+    外れた位置では残差分布 max(0, p - q) から選び直すため、出力の分布は対象モデルだけの場合と同じになる。
+    両モデルのKVキャッシュは確定したトークンの長さに切り詰めて次の提案に使う。
+    """
+
+    def __init__(self, target, draft, num_draft_tokens: int = 4, max_draft_tokens: int = 8,
+                 adaptive: bool = True):
+        self.target = target
+        self.draft = draft
+        self.num_draft_tokens = num_draft_tokens
+        self.max_draft_tokens = max(max_draft_tokens, num_draft_tokens)
+        self.adaptive = adaptive
+        self._lock = threading.Lock()
+        self._stats = {
+            "requests": 0,
+            "generated_tokens": 0,
+            "proposed_tokens": 0,
+            "accepted_tokens": 0,
+            "steps": 0,
+            "seconds": 0.0,
+        }
+
+    @classmethod
+    def from_config(cls, target, draft, config: Dict) -> "SpeculativeDecoder":
+        return cls(
+            target,
+            draft,
+            num_draft_tokens=config.get('num_draft_tokens', 4),
+            max_draft_tokens=config.get('max_draft_tokens', 8),
+            adaptive=config.get('adaptive', True)
+        )
+
+    def generate(
+        self,
+        prompt_ids: Sequence[int],
+        max_new_tokens: int,
+        temperature: float = 0.0,
+        top_p: float = 1.0,
+        eos_token_ids: Sequence[int] = (),
+        should_stop: Optional[Callable[[int], bool]] = None,
+        on_token: Optional[Callable[[int], None]] = None
+    ) -> SpeculativeOutput:
+        """prompt_idsの続きを生成する（temperatureが0以下なら貪欲法）"""
+        import torch
+        from transformers import DynamicCache
+
+        start = time.perf_counter()
+        tokens = list(prompt_ids)
+        generated: List[int] = []
+        target_cache, draft_cache = DynamicCache(), DynamicCache()
+        # 各キャッシュに入っているトークン数（最後に確定したトークンは次の入力にするので入らない）
+        target_length = draft_length = 0
+        draft_tokens_per_step = self.num_draft_tokens
+        proposed = accepted = steps = 0
+        finish_reason = "length"
+        eos_token_ids = set(eos_token_ids)
+
+        with torch.inference_mode():
+            while len(generated) < max_new_tokens:
+                # 対象モデルが必ず1トークン追加するので、提案はその分を残す
+                k = min(draft_tokens_per_step, max_new_tokens - len(generated) - 1)
+                draft_tokens, draft_probs = [], []
+                pending = tokens[draft_length:]
+                for _ in range(k):
+                    logits = self.draft(
+                        input_ids=torch.tensor([pending], device=self.draft.device),
+                        past_key_values=draft_cache,
+                        use_cache=True
+                    ).logits[0, -1]
+                    draft_length += len(pending)
+                    token, probs = self._choose(logits, temperature, top_p)
+                    draft_tokens.append(token)
+                    draft_probs.append(probs)
+                    pending = [token]
+
+                verify_input = tokens[target_length:] + draft_tokens
+                logits = self.target(
+                    input_ids=torch.tensor([verify_input], device=self.target.device),
+                    past_key_values=target_cache,
+                    use_cache=True
+                ).logits[0, len(verify_input) - k - 1:]
+                n_accepted, next_token = self._verify(logits, draft_tokens, draft_probs, temperature, top_p)
+                steps += 1
+                proposed += k
+                accepted += n_accepted
+
+                base = len(tokens)
+                finished = False
+                for token in draft_tokens[:n_accepted] + [next_token]:
+                    tokens.append(token)
+                    generated.append(token)
+                    if on_token is not None:
+                        on_token(token)
+                    if token in eos_token_ids:
+                        finish_reason, finished = "eos", True
+                    elif should_stop is not None and should_stop(token):
+                        finish_reason, finished = "stop", True
+                    if finished or len(generated) >= max_new_tokens:
+                        break
+                if finished:
+                    break
+
+                # 確定したトークンの分だけを残す（外れた提案の分を捨てる）
+                target_length = base + n_accepted
+                target_cache.crop(target_length)
+                draft_length = min(draft_length, base + n_accepted)
+                draft_cache.crop(draft_length)
+                if self.adaptive:
+                    draft_tokens_per_step = next_draft_length(
+                        draft_tokens_per_step, n_accepted, k, self.max_draft_tokens
+                    )
+
+        output = SpeculativeOutput(
+            token_ids=generated,
+            finish_reason=finish_reason,
+            proposed_tokens=proposed,
+            accepted_tokens=accepted,
+            steps=steps,
+            seconds=time.perf_counter() - start
+        )
+        with self._lock:
+            self._stats["requests"] += 1
+            self._stats["generated_tokens"] += len(generated)
+            self._stats["proposed_tokens"] += proposed
+            self._stats["accepted_tokens"] += accepted
+            self._stats["steps"] += steps
+            self._stats["seconds"] += output.seconds
+        return output
+
+    @staticmethod
+    def _distribution(logits, temperature: float, top_p: float):
+        """温度とtop_pを適用した確率分布"""
+        import torch
+
+        probs = torch.softmax(logits.float() / temperature, dim=-1)
+        if top_p < 1.0:
+            sorted_probs, sorted_ids = probs.sort(descending=True)
+            outside = sorted_probs.cumsum(dim=-1) - sorted_probs > top_p
+            probs = probs.scatter(0, sorted_ids, sorted_probs.masked_fill(outside, 0.0))
+            probs = probs / probs.sum()
+        return probs
+
+    def _choose(self, logits, temperature: float, top_p: float) -> Tuple[int, Optional[object]]:
+        """ドラフトモデルの提案（サンプリングでは検証に使う確率分布も返す）"""
+        import torch
+
+        if temperature <= 0:
+            return int(logits.argmax()), None
+        probs = self._distribution(logits, temperature, top_p)
+        return int(torch.multinomial(probs, 1)), probs
+
+    def _verify(self, logits, draft_tokens: List[int], draft_probs: List, temperature: float,
+                top_p: float) -> Tuple[int, int]:
+        """受け入れた提案の数と、その次に置く対象モデルのトークン"""
+        import torch
+
+        if temperature <= 0:
+            predicted = logits.argmax(dim=-1).tolist()
+            n_accepted = 0
+            while n_accepted < len(draft_tokens) and draft_tokens[n_accepted] == predicted[n_accepted]:
+                n_accepted += 1
+            return n_accepted, predicted[n_accepted]
+
+        for i, token in enumerate(draft_tokens):
+            p = self._distribution(logits[i], temperature, top_p)
+            q = draft_probs[i].to(p.device)
+            # ドラフトモデルの語彙が小さい場合、対象モデルにしか無いトークンの提案確率は0
+            if q.shape[0] < p.shape[0]:
+                q = torch.nn.functional.pad(q, (0, p.shape[0] - q.shape[0]))
+            q = q[:p.shape[0]]
+            if torch.rand(()) * q[token] <= p[token]:
+                continue
+            residual = torch.clamp(p - q, min=0.0)
+            residual = residual / residual.sum() if residual.sum() > 0 else p
+            return i, int(torch.multinomial(residual, 1))
+        p = self._distribution(logits[len(draft_tokens)], temperature, top_p)
+        return len(draft_tokens), int(torch.multinomial(p, 1))
+
+    def get_metrics(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+        return {
+            **stats,
+            "acceptance_rate": stats["accepted_tokens"] / stats["proposed_tokens"] if stats["proposed_tokens"] else 0.0,
+            "tokens_per_second": stats["generated_tokens"] / stats["seconds"] if stats["seconds"] else 0.0,
+            "tokens_per_step": stats["generated_tokens"] / stats["steps"] if stats["steps"] else 0.0,
+        }
@@ -0,0 +1,138 @@
+from typing import Dict, List, Optional, Sequence
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+import logging
+import math
+
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SearchHit:
+    id: str
+    content: str
+    metadata: Dict
+    score: float  # 関連度（0〜1、大きいほど関連が高い）
+
+
+def cosine_to_relevance(cosine: float) -> float:
+    """コサイン類似度をChroma（L2距離）と同じ尺度の関連度に変換
+
+    正規化済みベクトルでは二乗L2距離 = 2 - 2cos となり、
+    LangChainのChromaは 1 - 距離 / √2 を関連度として返す。
+    既存の閾値（0.5）をそのまま使えるように同じ変換を行う。
+    """
+    return 1.0 - (2.0 - 2.0 * cosine) / math.sqrt(2)
+
+
+class VectorStore(ABC):
+    """RAGSystemが利用するベクトルストアのインターフェース"""
+
+    def __init__(self, persist_directory: str, embedding_function: Embeddings):
+        self.persist_directory = persist_directory
+        self.embedding_function = embedding_function
+
+    @abstractmethod
+    def add_texts(self, texts: Sequence[str], metadatas: Sequence[Dict], ids: Sequence[str],
+                  embeddings: Optional[Sequence[Sequence[float]]] = None) -> List[str]:
+        """テキストを埋め込んで追加（同じIDは上書き、埋め込み済みならembeddingsを渡す）"""
+
+    @abstractmethod
+    def update_metadatas(self, ids: Sequence[str], metadatas: Sequence[Dict]) -> None:
+        """埋め込みを変更せずにメタデータのみ更新"""
+
+    @abstractmethod
+    def delete(self, ids: Sequence[str]) -> None:
+        """IDを指定して削除"""
+
+    @abstractmethod
+    def get(self, ids: Optional[Sequence[str]] = None, where: Optional[Dict] = None,
+            include: Sequence[str] = ("documents", "metadatas")) -> Dict:
+        """IDまたはメタデータ条件で取得（Chromaのget()と同じ形式の辞書を返す）"""
+
+    @abstractmethod
+    def similarity_search_by_vector(self, embedding: Sequence[float], k: int = 4) -> List[SearchHit]:
+        """埋め込みベクトルで類似検索"""
+
+    @abstractmethod
+    def count(self) -> int:
+        """格納されているチャンク数"""
+
+    def similarity_search(self, query: str, k: int = 4) -> List[SearchHit]:
+        return self.similarity_search_by_vector(self.embedding_function.embed_query(query), k)
+
+    def close(self) -> None:
+        """ファイルなどのリソースを解放"""
+
+
+class ChromaVectorStore(VectorStore):
+    """langchain_chroma.Chromaのアダプター"""
+
+    def __init__(self, persist_directory: str, embedding_function: Embeddings, collection_name: str):
+        super().__init__(persist_directory, embedding_function)
+        from langchain_chroma import Chroma
+        from chromadb.api.client import SharedSystemClient
+
+        # クリア後に同じパスで作り直す際、退避済みの古いクライアントを再利用しないようにする
+        SharedSystemClient.clear_system_cache()
+        self.store = Chroma(
+            persist_directory=persist_directory,
+            embedding_function=embedding_function,
+            collection_name=collection_name
+        )
+        self._relevance_fn = self.store._select_relevance_score_fn()
+
+    def add_texts(self, texts, metadatas, ids, embeddings=None):
+        if embeddings is None:
+            return self.store.add_texts(texts=list(texts), metadatas=list(metadatas), ids=list(ids))
+        self.store._collection.upsert(
+            ids=list(ids), embeddings=[list(vector) for vector in embeddings],
+            metadatas=list(metadatas), documents=list(texts)
+        )
+        return list(ids)
+
+    def update_metadatas(self, ids, metadatas):
+        self.store._collection.update(ids=list(ids), metadatas=list(metadatas))
+
+    def delete(self, ids):
+        if ids:
+            self.store.delete(ids=list(ids))
+
+    def get(self, ids=None, where=None, include=("documents", "metadatas")):
+        return self.store.get(
+            ids=list(ids) if ids is not None else None,
+            where=where,
+            include=list(include)
+        )
+
+    def similarity_search_by_vector(self, embedding, k=4):
+        if self.count() == 0:
+            return []
+        result = self.store._collection.query(
+            query_embeddings=[list(embedding)],
+            n_results=k,
+            include=["documents", "metadatas", "distances"]
+        )
+        return [
+            SearchHit(id=doc_id, content=content, metadata=meta or {}, score=self._relevance_fn(distance))
+            for doc_id, content, meta, distance in zip(
+                result["ids"][0], result["documents"][0], result["metadatas"][0], result["distances"][0]
+            )
+        ]
+
+    def count(self):
+        return self.store._collection.count()
+
+
+def create_vector_store(backend: str, persist_directory: str, embedding_function: Embeddings,
+                        collection_name: str, options: Optional[Dict] = None) -> VectorStore:
+    """設定に応じたベクトルストアを作成"""
+    options = options or {}
+    if backend == "chroma":
+        return ChromaVectorStore(persist_directory, embedding_function, collection_name)
+    if backend == "numpy":
+        from .numpy_vector_store import NumpyVectorStore
+        return NumpyVectorStore(persist_directory, embedding_function, **options)
+    raise ValueError(f"Unknown vector store backend: {backend}")
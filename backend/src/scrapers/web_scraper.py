@@ -1,4 +1,4 @@
-import requests
+import httpx
 from bs4 import BeautifulSoup, MarkupResemblesLocatorWarning
 from readability import Document
 import trafilatura
@@ -6,15 +6,19 @@ from typing import Dict, Optional, List, Union
 import re
 from urllib.parse import urlparse
 import concurrent.futures
-from functools import lru_cache
+from contextlib import asynccontextmanager
 import logging
 from datetime import datetime
 import hashlib
+import random
+import time
 import warnings
 from dataclasses import dataclass
 import json
 import asyncio
 
+from ..utils.scraping_config import SCRAPING_CONFIG
+
 warnings.filterwarnings("ignore", category=MarkupResemblesLocatorWarning)
 
 logging.basicConfig(
@@ -23,6 +27,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# 再試行するHTTPステータス
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
 @dataclass
 class ScrapingResult:
     title: str
@@ -43,100 +50,252 @@ class ScrapingResult:
     def to_json(self) -> str:
         return json.dumps(self.to_dict(), ensure_ascii=False, indent=2)
 
+
+# 解析処理はワーカープロセスで実行するため、インスタンスに依存しないモジュール関数にする
+
+def _decode(content: bytes, encoding: Optional[str]) -> str:
+    """レスポンスの本文を文字列に変換（charsetの指定が無ければ推定）"""
+    if encoding:
+        try:
+            return content.decode(encoding, errors='replace')
+        except LookupError:
+            pass
+    try:
+        from charset_normalizer import from_bytes
+        match = from_bytes(content).best()
+        if match is not None:
+            return str(match)
+    except ImportError:
+        pass
+    return content.decode('utf-8', errors='replace')
+
+
+def _extract_with_readability(html: str) -> Optional[Dict]:
+    """Readabilityを使用してメインコンテンツを抽出"""
+    try:
+        doc = Document(html)
+        return {
+            'title': doc.title(),
+            'content': doc.summary()
+        }
+    except Exception as e:
+        logger.error(f"Readability extraction error: {str(e)}")
+        return None
+
+
+def _clean_text(text: str) -> str:
+    """テキストのクリーニング処理"""
+    if not isinstance(text, str):
+        return ""
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        text = BeautifulSoup(text, 'html.parser').get_text()
+
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'　', ' ', text)
+
+    # 英語と日本語の両方を許可
+    text = re.sub(r'[^\w\s。、々ぁ-んァ-ン一-龥()（）\[\]「」『』.,\-\'\"0-9A-Za-z]', '', text)
+
+    return text.strip()
+
+
+def _is_valid_content(text: str) -> bool:
+    """コンテンツの妥当性チェック"""
+    if not text or len(text) < 30:  # 最小文字数を30に変更
+        return False
+
+    # 日本語または英語の文字が含まれているかチェック
+    has_japanese = bool(re.search(r'[ぁ-んァ-ン一-龥]', text))
+    has_english = bool(re.search(r'[A-Za-z]', text))
+
+    return has_japanese or has_english
+
+
+def parse_page(content: bytes, encoding: Optional[str]) -> Optional[Dict]:
+    """HTMLからタイトルと本文の段落を抽出"""
+    readability_result = _extract_with_readability(_decode(content, encoding))
+    if not readability_result:
+        return None
+
+    soup = BeautifulSoup(readability_result['content'], 'html.parser')
+    paragraphs = []
+
+    for p in soup.find_all(['p', 'article', 'section', 'div']):
+        text = _clean_text(p.get_text())
+        if _is_valid_content(text):
+            paragraphs.append(text)
+
+    return {'title': readability_result['title'], 'paragraphs': paragraphs}
+
+
+class DomainLimiter:
+    """ドメインごとの同時リクエスト数とリクエスト開始の最小間隔を制限"""
+
+    def __init__(self, concurrency: int, min_interval: float = 0.0):
+        self.concurrency = concurrency
+        self.min_interval = min_interval
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._next_start: Dict[str, float] = {}
+
+    @asynccontextmanager
+    async def acquire(self, domain: str):
+        semaphore = self._semaphores.setdefault(domain, asyncio.Semaphore(self.concurrency))
+        async with semaphore:
+            if self.min_interval > 0:
+                # 開始時刻を予約してから待つ（同じドメインのリクエストを間隔を空けて順に開始する）
+                now = asyncio.get_running_loop().time()
+                start = max(now, self._next_start.get(domain, 0.0))
+                self._next_start[domain] = start + self.min_interval
+                if start > now:
+                    await asyncio.sleep(start - now)
+            yield
+
+
 class WebScraper:
-    def __init__(self):
+    """非同期HTTPクライアント（接続プール・キープアライブ）で並列に取得するスクレイパー
+
+    同時リクエスト数は全体（max_workers）とドメインごと（per_domain_concurrency）に制限し、
+    接続エラー・タイムアウト・5xx・429はジッター付きの指数バックオフで再試行する。
+    HTMLの解析はCPUを使うため、イベントループを止めないようにワーカープロセスで実行する。
+    HTTPクライアントは最初に使ったイベントループに結び付くため、別のループで使う前に aclose() を呼ぶ。
+    """
+
+    def __init__(self, config: Optional[Dict] = None):
+        self.config = {**SCRAPING_CONFIG, **(config or {})}
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
             'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
             'Accept-Language': 'ja,en-US;q=0.7,en;q=0.3',
         }
-        self.session = requests.Session()
         self.cache = {}
+        self.max_workers = self.config['max_workers']
+        self.max_retries = self.config['max_retries']
 
-    def _get_url_content(self, url: str) -> Optional[str]:
-        """URLからコンテンツを取得"""
-        try:
-            response = self.session.get(url, headers=self.headers, timeout=10)
-            response.raise_for_status()
-            response.encoding = response.apparent_encoding or 'utf-8'
-            return response.text
-        except Exception as e:
-            logger.error(f"Error fetching URL {url}: {str(e)}")
-            return None
+        # クライアントとセマフォはイベントループに結び付くため、使う時点で作成する
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._domains: Optional[DomainLimiter] = None
+        self._parser_pool: Optional[concurrent.futures.ProcessPoolExecutor] = None
 
-    def _extract_with_readability(self, html: str) -> Optional[Dict]:
-        """Readabilityを使用してメインコンテンツを抽出"""
-        try:
-            doc = Document(html)
-            return {
-                'title': doc.title(),
-                'content': doc.summary()
-            }
-        except Exception as e:
-            logger.error(f"Readability extraction error: {str(e)}")
-            return None
+        # メトリクス
+        self.metrics = {
+            'requests': 0, 'retries': 0, 'errors': 0, 'bytes': 0,
+            'fetch_seconds': 0.0, 'parse_seconds': 0.0
+        }
 
-    def _clean_text(self, text: str) -> str:
-        """テキストのクリーニング処理"""
-        if not isinstance(text, str):
-            return ""
-
-        with warnings.catch_warnings():
-            warnings.simplefilter("ignore")
-            text = BeautifulSoup(text, 'html.parser').get_text()
-
-        text = re.sub(r'\s+', ' ', text)
-        text = re.sub(r'　', ' ', text)
-        
-        # 英語と日本語の両方を許可
-        text = re.sub(r'[^\w\s。、々ぁ-んァ-ン一-龥()（）\[\]「」『』.,\-\'\"0-9A-Za-z]', '', text)
-        
-        return text.strip()
-
-    def _is_valid_content(self, text: str) -> bool:
-        """コンテンツの妥当性チェック"""
-        if not text or len(text) < 30:  # 最小文字数を30に変更
-            return False
-        
-        # 日本語または英語の文字が含まれているかチェック
-        has_japanese = bool(re.search(r'[ぁ-んァ-ン一-龥]', text))
-        has_english = bool(re.search(r'[A-Za-z]', text))
-        
-        return has_japanese or has_english
+    def _ensure_client(self) -> httpx.AsyncClient:
+        """実行中のイベントループ用のクライアントと同時実行数の制限を用意（別のループのものが開いていればエラー）"""
+        loop = asyncio.get_running_loop()
+        if self._client is not None and self._loop is not loop:
+            # 接続は元のループのものなので、このループからは閉じられない
+            raise RuntimeError("WebScraper is bound to another event loop; call aclose() on that loop first")
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                headers=self.headers,
+                timeout=self.config['timeout'],
+                follow_redirects=True,
+                limits=httpx.Limits(
+                    max_connections=self.max_workers,
+                    max_keepalive_connections=self.max_workers,
+                    keepalive_expiry=self.config['keepalive_expiry']
+                )
+            )
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_workers)
+            self._domains = DomainLimiter(
+                self.config['per_domain_concurrency'], self.config['per_domain_interval']
+            )
+        return self._client
+
+    def _retry_delay(self, attempt: int, response: Optional[httpx.Response] = None) -> float:
+        """再試行までの待ち時間（Retry-Afterがあればそれに従う）"""
+        if response is not None:
+            retry_after = response.headers.get('Retry-After', '')
+            if retry_after.isdigit():
+                return min(float(retry_after), self.config['retry_max_delay'])
+        delay = min(self.config['retry_max_delay'], self.config['retry_base_delay'] * (2 ** attempt))
+        # 同時に失敗したリクエストの再試行が揃わないように揺らす
+        return delay * random.uniform(0.5, 1.0)
+
+    async def _fetch(self, url: str) -> Optional[httpx.Response]:
+        """URLを取得（一時的な失敗は再試行し、最終的に失敗したらNone）"""
+        client = self._ensure_client()
+        domain = urlparse(url).netloc
+        for attempt in range(self.max_retries + 1):
+            response, error = None, None
+            # ドメインの枠を先に取る（同じドメインの待ちで全体の枠を塞がない）
+            async with self._domains.acquire(domain), self._semaphore:
+                start = time.perf_counter()
+                try:
+                    self.metrics['requests'] += 1
+                    response = await client.get(url)
+                except httpx.TransportError as e:
+                    error = e
+                finally:
+                    self.metrics['fetch_seconds'] += time.perf_counter() - start
+
+            if response is not None and response.status_code not in RETRY_STATUSES:
+                if response.is_success:
+                    self.metrics['bytes'] += len(response.content)
+                    return response
+                logger.error(f"Error fetching URL {url}: HTTP {response.status_code}")
+                break
+            if attempt == self.max_retries:
+                reason = str(error) if error else f"HTTP {response.status_code}"
+                logger.error(f"Error fetching URL {url} after {attempt + 1} attempts: {reason}")
+                break
+            self.metrics['retries'] += 1
+            await asyncio.sleep(self._retry_delay(attempt, response))
+
+        self.metrics['errors'] += 1
+        return None
+
+    async def _parse(self, response: httpx.Response) -> Optional[Dict]:
+        """HTMLの解析をワーカープロセスで実行（parser_workersが0ならスレッド）"""
+        start = time.perf_counter()
+        try:
+            if self.config['parser_workers'] > 0:
+                if self._parser_pool is None:
+                    self._parser_pool = concurrent.futures.ProcessPoolExecutor(
+                        max_workers=self.config['parser_workers']
+                    )
+                return await asyncio.get_running_loop().run_in_executor(
+                    self._parser_pool, parse_page, response.content, response.charset_encoding
+                )
+            return await asyncio.to_thread(parse_page, response.content, response.charset_encoding)
+        finally:
+            self.metrics['parse_seconds'] += time.perf_counter() - start
 
     async def scrape(self, url: str) -> Optional[ScrapingResult]:
         """メインのスクレイピング処理"""
+        self._ensure_client()
         try:
             logger.info(f"Starting scrape of URL: {url}")
-            
+
             cache_key = hashlib.md5(url.encode()).hexdigest()
             if cache_key in self.cache:
                 logger.info(f"Cache hit for URL: {url}")
                 cached_result = self.cache[cache_key]
                 return ScrapingResult(**cached_result)
 
-            html = self._get_url_content(url)
-            if not html:
+            response = await self._fetch(url)
+            if response is None:
                 return None
 
-            readability_result = self._extract_with_readability(html)
-            if not readability_result:
+            parsed = await self._parse(response)
+            if not parsed:
                 return None
 
-            soup = BeautifulSoup(readability_result['content'], 'html.parser')
-            paragraphs = []
-            
-            for p in soup.find_all(['p', 'article', 'section', 'div']):
-                text = self._clean_text(p.get_text())
-                if self._is_valid_content(text):
-                    paragraphs.append(text)
-
+            paragraphs = parsed['paragraphs']
             if not paragraphs:
                 logger.warning(f"No valid content found for URL: {url}")
                 return None
 
             result = ScrapingResult(
-                title=readability_result['title'],
+                title=parsed['title'],
                 content=paragraphs,
                 url=url,
                 scraped_at=datetime.now().isoformat(),
@@ -147,7 +306,7 @@ class WebScraper:
             )
 
             self.cache[cache_key] = result.to_dict()
-            
+
             logger.info(f"Successfully scraped URL: {url}")
             return result
 
@@ -156,22 +315,36 @@ class WebScraper:
             return None
 
     async def bulk_scrape(self, urls: List[str]) -> Dict[str, Optional[ScrapingResult]]:
-        """複数URLの一括スクレイピング"""
-        results = {}
-        tasks = []
-        for url in urls:
-            task = asyncio.create_task(self.scrape(url))
-            tasks.append((url, task))
-        
-        for url, task in tasks:
-            try:
-                results[url] = await task
-            except Exception as e:
-                logger.error(f"Error processing {url}: {str(e)}")
-                results[url] = None
-        
-        return results
+        """複数URLの一括スクレイピング（同時実行数はmax_workersとドメインごとの上限まで）"""
+        self._ensure_client()
+        results = await asyncio.gather(*(self.scrape(url) for url in urls), return_exceptions=True)
+        output = {}
+        for url, result in zip(urls, results):
+            if isinstance(result, Exception):
+                logger.error(f"Error processing {url}: {str(result)}")
+                result = None
+            output[url] = result
+        return output
+
+    def get_metrics(self) -> Dict:
+        return dict(self.metrics)
+
+    async def aclose(self) -> None:
+        """HTTPクライアントと解析用のワーカープロセスを閉じる"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._loop = self._semaphore = self._domains = None
+        if self._parser_pool is not None:
+            self._parser_pool.shutdown(wait=False, cancel_futures=True)
+            self._parser_pool = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
 
     def clear_cache(self):
         """キャッシュのクリア"""
-        self.cache.clear()
\ No newline at end of file
+        self.cache.clear()
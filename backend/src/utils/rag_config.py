@@ -0,0 +1,181 @@
+# RAGシステム設定
+RAG_CONFIG = {
+    # 埋め込みモデル
+    'embedding_model': 'intfloat/multilingual-e5-small',
+
+    # 埋め込みの実行バックエンド
+    #   'sentence_transformers': 基準（既存のコレクションと同じベクトル）
+    #   'torch' / 'onnx': 基準とのコサイン距離 1e-4 以内
+    #   'torch_int8' / 'onnx_int8': 線形層を動的int8量子化したCPU向け（コサイン距離 0.02 以内）
+    'embedding': {
+        'backend': 'sentence_transformers',
+        'device': 'auto',  # 'auto' ならCUDAが使えればcuda、無ければcpu
+        'batch_size': 32,
+        'max_length': 512,
+        'num_threads': 0,  # CPUのスレッド数（0ならライブラリの既定値）
+        'onnx_path': './data/onnx/multilingual-e5-small.onnx',  # 無ければ初回に書き出す
+    },
+
+    # ベクトルストア（'chroma' または 'numpy'）
+    'vector_store': {
+        'backend': 'chroma',
+        # NumPyのメモリマップ行列による総当たり検索
+        'numpy': {
+            'dtype': 'float32',  # 'float16' でディスク・メモリ使用量を半分に
+            'search_block_size': 65536,
+            # 'int8'（1/4）または 'binary'（1/32）の量子化コードで候補を選び、
+            # k × oversample 件をfloatベクトルで再スコアする
+            'quantization': 'none',
+            'oversample': 4,
+            # 'ivf' でk-meansの転置リストによる近似検索（学習前は総当たり）
+            # nlist=0 なら学習時の件数から 4√n を使い、nprobeを増やすほど再現率が上がる
+            'index': 'flat',
+            'nlist': 0,
+            'nprobe': 16,
+            'ivf_min_train_rows': 20_000,
+            # 前回の学習時からこの倍率まで件数が増えたらバックグラウンドで学習し直す（0で無効）
+            'ivf_retrain_growth': 4.0,
+        },
+    },
+
+    # 埋め込みキャッシュ（モデル名＋正規化テキストのハッシュをキーにディスク保存）
+    'embedding_cache': {
+        'enabled': True,
+        'path': './data/embedding_cache/embeddings.sqlite3',
+        'max_entries': 500_000,  # 上限を超えたら最終アクセスの古い順に削除
+    },
+
+    # 意味的回答キャッシュ（類似クエリへの回答を再利用）
+    # 医療の質問は1語の違いで答えが変わるため既定では無効
+    'answer_cache': {
+        'enabled': False,
+        'similarity_threshold': 0.95,  # コサイン類似度
+        'require_term_match': True,  # 保存時のクエリと語の並びが一致する場合だけ再利用
+        'max_entries': 1000,
+        'ttl_seconds': 3600,
+    },
+
+    # ハイブリッド検索（BM25語彙インデックス＋密ベクトル、RRFで統合）
+    'hybrid_search': {
+        'enabled': True,
+        'candidate_multiplier': 4,  # 各検索で k × この数の候補を取得
+        'rrf_k': 60,
+        'bm25_k1': 1.2,
+        'bm25_b': 0.75,
+    },
+
+    # 検索結果のコンテキストの組み立て（同じソースの隣接チャンクの結合・重複除去・予算内への詰め込み）
+    'context_packing': {
+        'enabled': True,
+        # 質問とテンプレートを含むプロンプト全体のトークン数（LLM側の切り詰め max_length // 2 以下にする）
+        # 組み立てたプロンプトは数え直し、超えた分は最後のスパンから削る
+        'max_prompt_tokens': 1024,
+        'min_span_tokens': 32,  # 予算の残りがこれ未満なら途中で切ったチャンクは入れない
+        'min_overlap_chars': 16,  # 隣接チャンクの重なりとみなす最小の文字数
+    },
+
+    # ソース一覧と文書数・チャンク数のカウンタ（/api/stats用）
+    'source_registry': {
+        'path': './data/source_registry.sqlite3',
+    },
+
+    # URLの取り込みキュー（ジョブの状態は GET /api/jobs/{id}、件数と処理量は /api/metrics）
+    'ingestion': {
+        'path': './data/ingestion_jobs.sqlite3',
+        'num_workers': 2,  # 同時に取り込むURLの数（検索の処理と競合しないよう少なめにする）
+        'max_attempts': 5,  # 一時的な失敗（接続エラー・5xx・429など）の試行回数の上限
+        'retry_base_seconds': 2,  # 再試行までの待ち時間（失敗ごとに倍、上限retry_max_seconds）
+        'retry_max_seconds': 300,
+        'poll_interval_seconds': 0.5,
+        'fetch_timeout_seconds': 100,
+        'embed_batch_size': 64,  # 1回に埋め込むチャンク数
+        'max_bulk_urls': 10_000,  # 一括登録の1リクエストあたりのURL数
+    },
+
+    # モデルプール（予算内で複数のLLMを常駐させ、超えたら最終使用の古い順に解放）
+    'model_pool': {
+        'memory_budget_gb': 20,
+        # ロード前に空きを作るための見積もり（ロード後は実測値を使用）
+        'estimated_sizes_gb': {
+            'llama': 2.5,
+            'codellama': 14,
+        },
+    },
+
+    # LLMの推論プロファイル（モデルごとに選択）
+    #   'gpu_fp16': float16でGPUに自動配置（従来の設定）
+    #   'fp32': CPUでfloat32
+    #   'bf16': CPUでbfloat16（重みのメモリは半分、AVX512-BF16/AMXのあるCPUで速い）
+    #   'int8': CPUで線形層を動的int8量子化（線形層の重みは約1/4、出力はわずかに変わる）
+    #   'auto': CUDAが使えればgpu_fp16、無ければfp32
+    # 各プロファイルのメモリ使用量とtokens/secは benchmarks/bench_inference_profiles.py で比較できる
+    'inference': {
+        'profiles': {
+            'llama': 'auto',
+            'codellama': 'auto',
+        },
+        'num_threads': 0,  # intra-opスレッド数（0ならライブラリの既定値）
+        'num_interop_threads': 0,
+    },
+
+    # クエリ埋め込みのマイクロバッチ（同時に届いたクエリを1回の順伝播でまとめて埋め込む）
+    'query_batching': {
+        'enabled': True,
+        'max_batch_size': 32,
+        'max_wait_ms': 2,  # 最初のクエリから後続を待つ最大時間（低負荷時の遅延の上限）
+    },
+
+    # LLMの生成を実行するワーカープール（HTTPの同時接続数とは別に生成の並列数を決める）
+    'generation': {
+        'max_workers': 1,  # 同時に実行する生成の数
+        'max_queue': 32,  # 待機できる生成の数（超えたら503）
+        # 連続バッチング（同時のリクエストを1つのバッチでデコードし、ステップごとに追加・除外する）
+        # 有効にするとワーカープールの代わりにモデルごとのスケジューラで生成する
+        'continuous_batching': {
+            'enabled': False,
+            'max_batch_size': 8,
+            'max_prefill_tokens': 4096,  # 1ステップでプリフィルするプロンプトのトークン数の上限
+            'max_queue': 64,
+        },
+        # 生成するトークン数の上限（質問の種類ごと、プロンプトの残りの長さの方が短ければそちら）
+        'max_new_tokens': {
+            'factoid': 128,  # 誰・いつ・何など
+            'explanation': 384,  # なぜ・どのように・説明・比較など
+            'code': 512,  # codellama
+            'default': 256,
+        },
+        # 生成を止める条件（止まった理由は回答のstop_reasonと/api/metricsに出る）
+        'stopping': {
+            'stop_strings': ['\nQuestion:', '\nContext:'],  # ベースモデルが次の質問を書き始めたら止める
+            'repeat_ngram_size': 8,  # 同じ8トークンの並びが
+            'max_ngram_repeats': 3,  # 3回出たら止める
+            'max_seconds': 60,  # 生成開始からの経過時間
+        },
+        # 投機的デコード（小さいドラフトモデルが提案した数トークンを対象モデルの1回の順伝播で検証する）
+        # ドラフトモデルは対象モデルとトークナイザーが同じものに限る。連続バッチングが有効な場合は使わない
+        # 効果はドラフトの受け入れ率次第なので benchmarks/bench_speculative.py で確認してから有効にする
+        'speculative': {
+            'llama': {
+                'enabled': False,
+                'draft_model_id': None,  # Llama-3.2-1Bより小さい同じトークナイザーのモデルを指定する
+                'num_draft_tokens': 4,
+                'max_draft_tokens': 8,
+                'adaptive': True,  # 全て受け入れられたら提案数を増やし、外れたら減らす
+            },
+            'codellama': {
+                'enabled': False,
+                'draft_model_id': 'TinyLlama/TinyLlama_v1.1',  # Llama 2と同じ32kトークナイザー
+                'num_draft_tokens': 4,
+                'max_draft_tokens': 8,
+                'adaptive': True,
+            },
+        },
+        # プロンプトの共通の接頭辞（固定の前置き）のKVキャッシュ（モデルごと、メモリ量でLRU）
+        'prefix_cache': {
+            'enabled': True,
+            'max_mb': 512,
+            'min_prefix_tokens': 16,  # 直近のプロンプトとこれ以上共通していれば保存する
+            'recent_prompts': 16,
+        },
+    },
+}
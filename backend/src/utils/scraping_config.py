@@ -5,12 +5,20 @@ SCRAPING_CONFIG = {
     # 一般設定
     'timeout': 10,
     'min_text_length': 50,
-    'max_retries': 3,
+    'max_retries': 3,  # 最初の取得に加えて再試行する回数
     'cache_size': 100,
     
     # 並列処理設定
-    'max_workers': 5,
+    'max_workers': 5,  # 全体の同時リクエスト数（接続プールの大きさ）
+    'per_domain_concurrency': 2,  # 同じドメインへの同時リクエスト数
+    'per_domain_interval': 0.0,  # 同じドメインへのリクエスト開始の最小間隔（秒）
+    'keepalive_expiry': 30,  # 使っていない接続を保持する秒数
+    'parser_workers': 2,  # HTML解析のワーカープロセス数（0ならスレッドで解析）
     'chunk_size': 10,
+
+    # 再試行設定（接続エラー・タイムアウト・5xx・429、待ち時間は失敗ごとに倍）
+    'retry_base_delay': 0.5,
+    'retry_max_delay': 10,
     
     # 除外するタグ
     'exclude_tags': [
@@ -0,0 +1,26 @@
+from typing import List
+import hashlib
+import re
+import unicodedata
+
+
+def normalize_text(text: str) -> str:
+    """ハッシュ計算用のテキスト正規化（NFKC・空白の統一）"""
+    text = unicodedata.normalize('NFKC', text)
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def content_hash(text: str) -> str:
+    """正規化したテキストのSHA-256ハッシュ"""
+    return hashlib.sha256(normalize_text(text).encode('utf-8')).hexdigest()
+
+
+def make_chunk_id(url: str, chunk_index: int, chunk_hash: str) -> str:
+    """(URL, チャンク番号, 内容ハッシュ)から決定的なチャンクIDを生成"""
+    payload = f"{url}\0{chunk_index}\0{chunk_hash}".encode('utf-8')
+    return hashlib.sha256(payload).hexdigest()[:32]
+
+
+def source_fingerprint(chunk_hashes: List[str]) -> str:
+    """ソース全体の指紋（チャンクハッシュ列のハッシュ）"""
+    return hashlib.sha256("\n".join(chunk_hashes).encode('utf-8')).hexdigest()
@@ -0,0 +1,77 @@
+import pytest
+
+from src.models.answer_cache import SemanticAnswerCache
+
+ANSWER = {"answer": "アセトアミノフェンは解熱鎮痛薬です。", "sources": []}
+
+
+def test_similar_query_hits():
+    """類似度が閾値以上のクエリでキャッシュが使われることのテスト"""
+    cache = SemanticAnswerCache(similarity_threshold=0.9)
+    cache.store([1.0, 0.0, 0.0], "llama", "general", 2, ANSWER, generation_time=3.0)
+
+    assert cache.lookup([0.99, 0.05, 0.0], "llama", "general", 2) == ANSWER
+    assert cache.lookup([0.0, 1.0, 0.0], "llama", "general", 2) is None
+    assert cache.lookup([1.0, 0.0, 0.0], "codellama", "general", 2) is None
+    assert cache.lookup([1.0, 0.0, 0.0], "llama", "code", 2) is None
+
+    stats = cache.get_stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 3
+    assert stats["saved_generation_seconds"] == 3.0
+
+
+def test_ttl_and_lru_eviction():
+    """TTL切れと件数上限による削除のテスト"""
+    cache = SemanticAnswerCache(similarity_threshold=0.9, max_entries=2, ttl_seconds=60)
+    cache.store([1.0, 0.0], "llama", "general", 2, ANSWER, 1.0)
+    cache.store([0.0, 1.0], "llama", "general", 2, ANSWER, 1.0)
+    cache.lookup([1.0, 0.0], "llama", "general", 2)  # 1件目を最近使用に
+    cache.store([-1.0, 0.0], "llama", "general", 2, ANSWER, 1.0)
+
+    assert cache.lookup([1.0, 0.0], "llama", "general", 2) is not None
+    assert cache.lookup([0.0, 1.0], "llama", "general", 2) is None
+
+    cache.ttl_seconds = -1
+    assert cache.lookup([1.0, 0.0], "llama", "general", 2) is None
+    assert cache.get_stats()["entries"] == 0
+
+
+def test_invalidation_by_category():
+    """取り込み・クリア時の無効化のテスト"""
+    cache = SemanticAnswerCache(similarity_threshold=0.9)
+    cache.store([1.0, 0.0], "llama", "general", 2, ANSWER, 1.0)
+    cache.store([1.0, 0.0], "codellama", "code", 2, ANSWER, 1.0)
+
+    cache.invalidate("general")
+    assert cache.lookup([1.0, 0.0], "llama", "general", 2) is None
+    assert cache.lookup([1.0, 0.0], "codellama", "code", 2) is not None
+
+    # 生成中に無効化された回答は保存しない
+    epoch = cache.epoch("code")
+    cache.invalidate()
+    cache.store([1.0, 0.0], "codellama", "code", 2, ANSWER, 1.0, epoch=epoch)
+    assert cache.lookup([1.0, 0.0], "codellama", "code", 2) is None
+
+
+@pytest.mark.parametrize("other", [
+    "Can I take ibuprofen with warfarin?",
+    "Can I take aspirin with warfarin 10 mg?",
+    "Can I not take aspirin with warfarin?",
+    "Can I take warfarin with aspirin?",
+    "アスピリンとワルファリンは併用できませんか？",
+])
+def test_near_identical_questions_do_not_share_answers(other):
+    """埋め込みがほぼ同じでも薬剤・用量・否定・語順が違う質問には回答を返さないことのテスト"""
+    cache = SemanticAnswerCache(similarity_threshold=0.9)
+    question = "Can I take aspirin with warfarin?" if other.isascii() else "アスピリンとワルファリンは併用できますか？"
+    cache.store([1.0, 0.0], "llama", "general", 2, ANSWER, 1.0, query=question)
+
+    assert cache.lookup([1.0, 0.0], "llama", "general", 2, query=other) is None
+    # 表記の揺れだけなら同じ質問として再利用する
+    variant = "ＣＡＮ  I take Aspirin with warfarin" if other.isascii() else "アスピリンとワルファリンは併用できますか?"
+    assert cache.lookup([0.99, 0.05], "llama", "general", 2, query=variant) == ANSWER
+
+
+if __name__ == "__main__":
+    pytest.main(["-v", "test_answer_cache.py"])
@@ -1,15 +1,38 @@
+import time
 import pytest
 from fastapi.testclient import TestClient
 from src.api.main import app
 
 client = TestClient(app)
 
+
+@pytest.fixture(scope="module", autouse=True)
+def started_client():
+    """起動処理（バックグラウンドのウォームアップ）を開始し、準備完了まで待つ"""
+    with client:
+        deadline = time.time() + 600
+        while time.time() < deadline:
+            state = client.get("/api/ready").json()
+            if state["ready"] or state["stage"] == "failed":
+                break
+            time.sleep(1)
+        yield client
+
 def test_health_check():
     """ヘルスチェックエンドポイントのテスト"""
     response = client.get("/api/health")
     assert response.status_code == 200
     assert response.json()["status"] == "healthy"
 
+def test_ready_check():
+    """レディネスチェックエンドポイントのテスト"""
+    response = client.get("/api/ready")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["ready"]
+    assert data["stage"] == "ready"
+    assert data["timings"]["time_to_ready"] > 0
+
 def test_add_document():
     """ドキュメント追加エンドポイントのテスト"""
     url = "https://ja.wikipedia.org/wiki/Python"
@@ -38,6 +61,17 @@ def test_search():
     assert "results" in data
     assert len(data["results"]) > 0
 
+def test_search_stream():
+    """ストリーミング検索エンドポイントのテスト（sources → token → done の順）"""
+    query = "Pythonプログラミング言語の特徴は？"
+    with client.stream("POST", "/api/search/stream", json={"query": query, "k": 3}) as response:
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = [line[len("event: "):] for line in response.iter_lines() if line.startswith("event: ")]
+
+    assert events[0] == "sources"
+    assert events[-1] == "done"
+
 def test_stats():
     """統計情報エンドポイントのテスト"""
     response = client.get("/api/stats")
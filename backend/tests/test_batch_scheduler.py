@@ -0,0 +1,120 @@
+import asyncio
+
+import pytest
+
+torch = pytest.importorskip("torch")
+transformers = pytest.importorskip("transformers")
+
+from src.models.batch_scheduler import ContinuousBatchScheduler, SamplingParams
+
+
+@pytest.fixture(scope="module")
+def tiny_model():
+    """CPUで動く小さなランダム初期化のLlama"""
+    torch.manual_seed(0)
+    config = transformers.LlamaConfig(
+        vocab_size=96,
+        hidden_size=32,
+        intermediate_size=64,
+        num_hidden_layers=2,
+        num_attention_heads=4,
+        num_key_value_heads=2,
+        max_position_embeddings=256,
+        pad_token_id=0,
+        eos_token_id=None,
+        bos_token_id=None
+    )
+    model = transformers.LlamaForCausalLM(config).eval()
+    model.generation_config.eos_token_id = None
+    model.generation_config.pad_token_id = 0
+    return model
+
+
+def reference_greedy(model, prompt_ids, max_new_tokens):
+    """1件ずつmodel.generateで貪欲法デコードした結果"""
+    with torch.inference_mode():
+        output = model.generate(
+            torch.tensor([prompt_ids]),
+            max_new_tokens=max_new_tokens,
+            do_sample=False
+        )
+    return output[0, len(prompt_ids):].tolist()
+
+
+PROMPTS = [
+    [5, 17, 33, 2, 9],
+    [40, 41],
+    [7, 8, 9, 10, 11, 12, 13, 14, 15, 16, 17],
+    [60],
+]
+
+
+@pytest.mark.asyncio
+async def test_batched_greedy_matches_one_at_a_time(tiny_model):
+    """長さの違う同時リクエストをまとめても1件ずつの貪欲法と同じトークンになることのテスト"""
+    scheduler = ContinuousBatchScheduler(tiny_model, max_batch_size=8, eos_token_ids=[])
+    lengths = [6, 12, 3, 9]
+    results = await asyncio.gather(*(
+        scheduler.submit(prompt, SamplingParams(max_new_tokens=n, temperature=0.0))
+        for prompt, n in zip(PROMPTS, lengths)
+    ))
+
+    for prompt, n, result in zip(PROMPTS, lengths, results):
+        assert result.token_ids == reference_greedy(tiny_model, prompt, n)
+        assert result.finish_reason == "length"
+
+    metrics = scheduler.get_metrics()
+    assert metrics["completed"] == 4
+    assert metrics["batch_size_histogram"]["mean"] > 1
+    scheduler.stop()
+
+
+@pytest.mark.asyncio
+async def test_requests_join_a_running_batch(tiny_model):
+    """デコード中のバッチに後から加わったリクエストも正しく生成されることのテスト"""
+    scheduler = ContinuousBatchScheduler(tiny_model, max_batch_size=2, eos_token_ids=[])
+    first = asyncio.create_task(scheduler.submit(PROMPTS[2], SamplingParams(max_new_tokens=40, temperature=0.0)))
+    await asyncio.sleep(0.05)
+    # バッチの上限を超える分は空きができてから入る
+    others = [
+        asyncio.create_task(scheduler.submit(prompt, SamplingParams(max_new_tokens=5, temperature=0.0)))
+        for prompt in (PROMPTS[0], PROMPTS[1], PROMPTS[3])
+    ]
+    # サンプリングのリクエストが混ざっても貪欲法の結果は変わらない
+    sampled = asyncio.create_task(
+        scheduler.submit(PROMPTS[1], SamplingParams(max_new_tokens=8, temperature=1.0, top_p=0.5))
+    )
+
+    assert (await first).token_ids == reference_greedy(tiny_model, PROMPTS[2], 40)
+    for prompt, task in zip((PROMPTS[0], PROMPTS[1], PROMPTS[3]), others):
+        assert (await task).token_ids == reference_greedy(tiny_model, prompt, 5)
+    assert len((await sampled).token_ids) == 8
+    histogram = scheduler.get_metrics()["batch_size_histogram"]
+    assert histogram["buckets"]["<=1"] + histogram["buckets"]["<=2"] == histogram["count"]
+    scheduler.stop()
+
+
+@pytest.mark.asyncio
+async def test_stop_tokens_and_cancellation(tiny_model):
+    """停止トークンで終了し、キャンセルしたリクエストがバッチから外れることのテスト"""
+    scheduler = ContinuousBatchScheduler(tiny_model, max_batch_size=4, eos_token_ids=[])
+    expected = reference_greedy(tiny_model, PROMPTS[0], 10)
+    stop_token = expected[3]
+
+    cancelled = asyncio.create_task(scheduler.submit(PROMPTS[2], SamplingParams(max_new_tokens=200, temperature=0.0)))
+    result = await scheduler.submit(
+        PROMPTS[0], SamplingParams(max_new_tokens=10, temperature=0.0, stop_token_ids=[stop_token])
+    )
+    assert result.finish_reason == "eos"
+    assert result.token_ids == expected[:expected.index(stop_token) + 1]
+
+    cancelled.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await cancelled
+    await asyncio.sleep(0.1)
+    assert scheduler.get_metrics()["active"] == 0
+    scheduler.stop()
+
+
+if __name__ == "__main__":
+    pytest.main(["-v", "test_batch_scheduler.py"])
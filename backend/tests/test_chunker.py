@@ -0,0 +1,37 @@
+import pytest
+
+from src.models.chunker import TokenChunker
+
+
+def test_chunks_slice_original_text(make_tokenizer):
+    """チャンクが元テキストの部分文字列で、重複を持つことのテスト"""
+    words = [f"w{i}" for i in range(23)]
+    text = "\n".join(" ".join(words[i:i + 5]) for i in range(0, len(words), 5))
+    chunker = TokenChunker(make_tokenizer(words), chunk_size=10, chunk_overlap=3)
+
+    chunks = chunker.chunk(text)
+    assert len(chunks) == 3
+    assert all(chunk in text for chunk in chunks)
+    assert "\n" in chunks[0]  # 改行などの書式が保持される
+    assert chunks[0].split()[-3:] == chunks[1].split()[:3]
+    assert chunks[-1].split()[-1] == "w22"
+
+
+def test_chunk_many_matches_single(make_tokenizer):
+    """一括分割と個別分割の結果が一致することのテスト"""
+    words = ["alpha", "beta", "gamma", "delta"]
+    texts = ["alpha beta gamma delta " * 5, "", "gamma delta"]
+    chunker = TokenChunker(make_tokenizer(words), chunk_size=6, chunk_overlap=2)
+
+    assert chunker.chunk_many(texts, batch_size=2) == [chunker.chunk(t) for t in texts]
+    assert chunker.chunk("") == []
+    assert chunker.chunk("gamma delta") == ["gamma delta"]
+
+
+def test_invalid_overlap(make_tokenizer):
+    with pytest.raises(ValueError):
+        TokenChunker(make_tokenizer(["a"]), chunk_size=5, chunk_overlap=5)
+
+
+if __name__ == "__main__":
+    pytest.main(["-v", "test_chunker.py"])
@@ -0,0 +1,137 @@
+import pytest
+
+from src.models.chunker import TokenChunker
+from src.models.context_packer import ContextPacker
+
+
+WORDS = [f"w{i}" for i in range(60)]
+
+
+@pytest.fixture
+def tokenizer(make_tokenizer):
+    return make_tokenizer(WORDS + ["Source", ":", "---", "a", "b"])
+
+
+def make_docs(tokenizer, source, text, indices, scores):
+    chunks = TokenChunker(tokenizer, chunk_size=10, chunk_overlap=3).chunk(text)
+    return [
+        {'content': chunks[i], 'metadata': {'source': source, 'chunk_index': i}, 'score': score}
+        for i, score in zip(indices, scores)
+    ]
+
+
+def test_adjacent_chunks_are_merged_without_overlap(tokenizer):
+    """同じソースの隣接チャンクが重複部分を1回だけ含む1つのスパンになることのテスト"""
+    text = " ".join(WORDS[:30])
+    docs = make_docs(tokenizer, "a", text, [1, 0, 3], [0.9, 0.8, 0.7])
+    packer = ContextPacker(min_overlap_chars=4)
+
+    spans, duplicates, merged = packer.merge(docs)
+    assert merged == 1 and duplicates == 0
+    assert [span.chunk_indices for span in spans] == [[0, 1], [3]]
+    assert spans[0].text == " ".join(WORDS[:17])
+    assert spans[0].score == 0.9
+
+
+def test_duplicates_are_dropped(tokenizer):
+    """同じ内容のチャンクや他のスパンに含まれるチャンクが除かれることのテスト"""
+    text = " ".join(WORDS[:20])
+    chunk = make_docs(tokenizer, "a", text, [0], [0.9])[0]
+    mirror = {'content': chunk['content'], 'metadata': {'source': 'b', 'chunk_index': 5}, 'score': 0.5}
+    part = {'content': " ".join(WORDS[2:6]), 'metadata': {'source': 'b'}, 'score': 0.95}
+
+    spans, duplicates, _ = ContextPacker().merge([chunk, mirror, part])
+    assert duplicates == 2
+    assert len(spans) == 1
+    # 含まれていたチャンクのスコアを引き継ぐ
+    assert spans[0].score == 0.95
+
+
+def test_pack_respects_budget_by_score(tokenizer):
+    """スコアの高い順に予算内で詰め、収まらない分は途中で切るか除くことのテスト"""
+    docs = [
+        {'content': " ".join(WORDS[:10]), 'metadata': {'source': 'a'}, 'score': 0.5},
+        {'content': " ".join(WORDS[20:40]), 'metadata': {'source': 'b'}, 'score': 0.9},
+        {'content': " ".join(WORDS[40:45]), 'metadata': {'source': 'a'}, 'score': 0.7},
+    ]
+    # 出典の行 "Source: a" は3トークン、区切りの "---" は1トークン
+    packer = ContextPacker(max_prompt_tokens=52, min_span_tokens=4)
+
+    packed = packer.pack(tokenizer, docs, reserved_tokens=10)
+    assert packed.budget_tokens == 42
+    assert [span.source for span in packed.spans] == ["b", "a", "a"]
+    assert [span.tokens for span in packed.spans] == [23, 9, 10]
+    assert [span.truncated for span in packed.spans] == [False, False, True]
+    assert packed.spans[-1].text == " ".join(WORDS[:6])
+    assert packed.context_tokens == 42
+    assert len(tokenizer(packed.context, add_special_tokens=False)["input_ids"]) == 42
+
+    # 残りがmin_span_tokens未満なら途中で切らずに除く
+    packed = ContextPacker(max_prompt_tokens=45, min_span_tokens=4).pack(tokenizer, docs, reserved_tokens=10)
+    assert [span.source for span in packed.spans] == ["b", "a"]
+    assert packed.dropped == 1
+
+    # 質問だけで予算を使い切る場合はコンテキストを入れない
+    packed = packer.pack(tokenizer, docs, reserved_tokens=60)
+    assert packed.context == "" and packed.budget_tokens == 0
+
+
+def test_fit_trims_prompt_that_overshoots_after_retokenizing(tokenizer):
+    """部分ごとの合計より全体のトークン数が多くても、最後のスパンを削って予算に収めることのテスト"""
+    docs = [
+        {'content': " ".join(WORDS[:20]), 'metadata': {'source': 'a'}, 'score': 0.9},
+        {'content': " ".join(WORDS[20:40]), 'metadata': {'source': 'b'}, 'score': 0.5},
+    ]
+    packer = ContextPacker(max_prompt_tokens=50, min_span_tokens=4)
+
+    def render(context):
+        return f"a b a b a b\n{context}\nb"
+
+    # 結合で3トークン増えた場合を、質問とテンプレートの分を少なく見積もって再現する
+    reserved = len(tokenizer(render(""))["input_ids"]) - 3
+    packed = packer.pack(tokenizer, docs, reserved)
+    assert len(tokenizer(render(packed.context))["input_ids"]) == 53
+
+    packed = packer.fit(tokenizer, packed, render)
+    prompt = render(packed.context)
+    assert len(tokenizer(prompt)["input_ids"]) <= 50
+    assert prompt.endswith("\nb")
+    assert [span.source for span in packed.spans] == ["a", "b"] and packed.spans[-1].truncated
+    assert packer.get_metrics()["overflow_trims"] == 1
+
+    # 削ると min_span_tokens を下回るスパンは除く
+    packer.min_span_tokens = 17
+    packed = packer.fit(tokenizer, packer.pack(tokenizer, docs, reserved), render)
+    assert [span.source for span in packed.spans] == ["a"] and packed.dropped == 1
+    assert len(tokenizer(render(packed.context))["input_ids"]) <= 50
+
+
+def test_full_prompt_fits_generation_limit(tokenizer):
+    """設定の予算で組み立てたモデル書式のプロンプト全体がLLM側の切り詰め（max_length // 2）に収まることのテスト"""
+    from src.models import rag_system
+    from src.models.rag_system import RAGSystem
+    from src.utils.rag_config import RAG_CONFIG
+
+    class FakeLLM:
+        @staticmethod
+        def _format_prompt(prompt):
+            return f"<s>[INST] {prompt} [/INST]"
+    FakeLLM.tokenizer = tokenizer
+
+    rag = RAGSystem.__new__(RAGSystem)
+    rag.context_packer = ContextPacker.from_config(RAG_CONFIG['context_packing'])
+    docs = [
+        {'content': " ".join(WORDS * 4), 'metadata': {'source': f"s{i}", 'chunk_index': 0}, 'score': 1 - i / 10}
+        for i in range(8)
+    ]
+    for i, doc in enumerate(docs):
+        doc['content'] = f"w{i} " + doc['content']
+
+    for model_type in ("llama", "codellama"):
+        prompt = FakeLLM._format_prompt(rag._prepare_prompt(FakeLLM, "w1 w2 ?", docs, model_type))
+        assert len(tokenizer(prompt)["input_ids"]) <= rag_system._GENERATION_MAX_LENGTH // 2
+        assert prompt.endswith("Answer: [/INST]")
+
+
+if __name__ == "__main__":
+    pytest.main(["-v", "test_context_packer.py"])
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+from tokenizers import Tokenizer, models, pre_tokenizers
+from transformers import PreTrainedTokenizerFast
+
+from src.models.embedding_backends import BucketedEmbeddings, OnnxEmbeddings, max_cosine_distance
+
+WORDS = ["python", "java", "rust", "薬", "症状", "治療", "副作用"]
+TEXTS = ["python", "薬 症状 治療 副作用 python java", "rust java", "治療", "python rust 薬 症状"]
+
+
+def make_tokenizer():
+    """単語単位のテスト用トークナイザー（パディングあり）"""
+    vocab = {"[PAD]": 0, "[UNK]": 1}
+    for word in WORDS:
+        vocab[word] = len(vocab)
+    tokenizer = Tokenizer(models.WordLevel(vocab=vocab, unk_token="[UNK]"))
+    tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+    return PreTrainedTokenizerFast(tokenizer_object=tokenizer, unk_token="[UNK]", pad_token="[PAD]")
+
+
+TABLE = np.random.default_rng(0).standard_normal((len(WORDS) + 2, 8)).astype(np.float32)
+
+
+class TableEmbeddings(BucketedEmbeddings):
+    """トークンごとに固定のベクトルを返すテスト用のモデル"""
+
+    def __init__(self, **kwargs):
+        super().__init__(make_tokenizer(), **kwargs)
+        self.batch_shapes = []
+
+    def _forward(self, input_ids, attention_mask):
+        self.batch_shapes.append(input_ids.shape)
+        # パディング位置は平均に含まれないことを確かめるため大きな値にする
+        return np.where(attention_mask[:, :, None] == 1, TABLE[input_ids], 100.0)
+
+
+def expected_vector(text):
+    ids = [WORDS.index(word) + 2 for word in text.split()]
+    vector = TABLE[ids].mean(axis=0)
+    return vector / np.linalg.norm(vector)
+
+
+def test_bucketed_batches_match_single_texts():
+    """長さで並べ替えたバッチでも元の順序・単独実行と同じベクトルになることのテスト"""
+    embeddings = TableEmbeddings(batch_size=2)
+    vectors = np.array(embeddings.embed_documents(TEXTS))
+
+    for text, vector in zip(TEXTS, vectors):
+        np.testing.assert_allclose(vector, expected_vector(text), atol=1e-6)
+    np.testing.assert_allclose(embeddings.embed_query(TEXTS[1]), vectors[1], atol=1e-6)
+
+    # 長さの近いテキストがまとめられ、パディングが少ない
+    assert embeddings.batch_shapes[:3] == [(2, 1), (2, 4), (1, 6)]
+    assert embeddings.embed_documents([]) == []
+
+
+def test_onnx_backend_runs_exported_graph(tmp_path):
+    """ONNX Runtimeのバックエンドが書き出し済みグラフの出力をプーリングすることのテスト"""
+    onnx = pytest.importorskip("onnx")
+    pytest.importorskip("onnxruntime")
+    from onnx import TensorProto, helper, numpy_helper
+
+    graph = helper.make_graph(
+        [helper.make_node("Gather", ["table", "input_ids"], ["last_hidden_state"])],
+        "table_lookup",
+        [
+            helper.make_tensor_value_info("input_ids", TensorProto.INT64, ["batch", "sequence"]),
+            helper.make_tensor_value_info("attention_mask", TensorProto.INT64, ["batch", "sequence"]),
+        ],
+        [helper.make_tensor_value_info("last_hidden_state", TensorProto.FLOAT, ["batch", "sequence", 8])],
+        initializer=[numpy_helper.from_array(TABLE, "table")]
+    )
+    path = str(tmp_path / "model.onnx")
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 17)])
+    model.ir_version = 8  # 古いONNX Runtimeでも読めるように
+    onnx.save(model, path)
+
+    embeddings = OnnxEmbeddings(path, make_tokenizer(), num_threads=1, batch_size=4)
+    assert max_cosine_distance(embeddings, TableEmbeddings(), TEXTS) < 1e-6
+
+
+if __name__ == "__main__":
+    pytest.main(["-v", "test_embedding_backends.py"])
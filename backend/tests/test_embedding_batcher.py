@@ -0,0 +1,72 @@
+import asyncio
+import time
+
+import pytest
+
+from src.models.embedding_batcher import EmbeddingBatcher, Histogram
+
+
+class FakeEmbedder:
+    """呼び出しごとのバッチを記録する埋め込み（テキストの長さをベクトルにする）"""
+
+    def __init__(self, delay=0.01):
+        self.delay = delay
+        self.calls = []
+
+    def __call__(self, texts):
+        time.sleep(self.delay)
+        self.calls.append(list(texts))
+        return [[float(len(text)), 1.0] for text in texts]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_queries_share_batches():
+    """同時のクエリがまとめて埋め込まれ、各自のベクトルが返ることのテスト"""
+    embedder = FakeEmbedder()
+    batcher = EmbeddingBatcher(embedder, max_batch_size=8, max_wait_ms=5)
+    texts = ["q" * (i + 1) for i in range(20)]
+
+    vectors = await asyncio.gather(*(batcher.embed(text) for text in texts))
+
+    assert vectors == [[float(len(text)), 1.0] for text in texts]
+    assert sum(len(call) for call in embedder.calls) == 20
+    assert len(embedder.calls) < 20
+    assert max(len(call) for call in embedder.calls) <= 8
+
+    metrics = batcher.get_metrics()
+    assert metrics["requests"] == 20
+    assert metrics["batches"] == len(embedder.calls)
+    assert metrics["batch_size_histogram"]["count"] == len(embedder.calls)
+    assert metrics["queue_depth"] == 0
+    await batcher.close()
+
+
+@pytest.mark.asyncio
+async def test_errors_reach_every_waiting_request():
+    """埋め込みの失敗がバッチ内の全リクエストに伝わり、以降も処理できることのテスト"""
+    def failing(texts):
+        if any(text == "bad" for text in texts):
+            raise RuntimeError("embedding failed")
+        return [[1.0] for _ in texts]
+
+    batcher = EmbeddingBatcher(failing, max_batch_size=4, max_wait_ms=5)
+    results = await asyncio.gather(batcher.embed("bad"), batcher.embed("ok"), return_exceptions=True)
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+    assert await batcher.embed("ok") == [1.0]
+    assert batcher.get_metrics()["errors"] == 1
+    await batcher.close()
+
+
+def test_histogram_buckets():
+    """ヒストグラムが上限以下の最初のバケットに数えることのテスト"""
+    histogram = Histogram((1, 4))
+    for value in (1, 2, 4, 9):
+        histogram.observe(value)
+    result = histogram.to_dict()
+    assert result["buckets"] == {"<=1": 1, "<=4": 2, ">4": 1}
+    assert result["mean"] == 4.0
+
+
+if __name__ == "__main__":
+    pytest.main(["-v", "test_embedding_batcher.py"])
@@ -0,0 +1,74 @@
+import pytest
+from typing import List
+from langchain_core.embeddings import Embeddings
+
+from src.models.embedding_cache import EmbeddingCache, CachedEmbeddings
+
+
+class CountingEmbeddings(Embeddings):
+    """埋め込み呼び出し回数を数えるテスト用モデル"""
+
+    def __init__(self):
+        self.embedded = 0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.embedded += len(texts)
+        return [[float(len(text)), 1.0, 0.5] for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return [float(len(text)), 1.0, 0.5]
+
+
+def test_cache_hits_after_restart(tmp_path):
+    """再起動後もキャッシュが効くことのテスト"""
+    path = str(tmp_path / "cache.sqlite3")
+    base = CountingEmbeddings()
+
+    cached = CachedEmbeddings(base, EmbeddingCache(path), "e5")
+    first = cached.embed_documents(["Python", "機械学習", "Python"])
+    assert base.embedded == 2  # 同一テキストは1回だけ埋め込む
+    cached.cache.close()
+
+    cache = EmbeddingCache(path)
+    cached = CachedEmbeddings(base, cache, "e5")
+    second = cached.embed_documents(["Python ", "機械学習"])
+    assert base.embedded == 2
+    assert second == first[:2]
+    assert cache.get_stats()["hits"] == 2
+    assert cache.get_stats()["misses"] == 0
+
+
+def test_cache_is_keyed_by_model(tmp_path):
+    """モデル名が異なればキャッシュを共有しないことのテスト"""
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"))
+    base = CountingEmbeddings()
+
+    CachedEmbeddings(base, cache, "model-a").embed_documents(["text"])
+    CachedEmbeddings(base, cache, "model-b").embed_documents(["text"])
+    assert base.embedded == 2
+
+
+def test_lru_eviction(tmp_path):
+    """上限を超えたら最も古いエントリが削除されることのテスト"""
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"), max_entries=2)
+    base = CountingEmbeddings()
+    cached = CachedEmbeddings(base, cache, "e5")
+
+    cached.embed_documents(["a"])
+    cached.embed_documents(["b"])
+    cached.embed_documents(["a"])  # aを最近使用に更新
+    cached.embed_documents(["c"])  # bが削除される
+
+    stats = cache.get_stats()
+    assert stats["entries"] == 2
+    assert stats["evictions"] == 1
+
+    base.embedded = 0
+    cached.embed_documents(["a", "c"])
+    assert base.embedded == 0
+    cached.embed_documents(["b"])
+    assert base.embedded == 1
+
+
+if __name__ == "__main__":
+    pytest.main(["-v", "test_embedding_cache.py"])
@@ -0,0 +1,90 @@
+import time
+
+import pytest
+
+from src.models.generation_control import (
+    StopConditions, StopStringFilter, classify_query, resolve_max_new_tokens
+)
+
+# トークンIDをそのまま1文字に対応させるデコード
+VOCAB = {i: ch for i, ch in enumerate("abcdefghij\nQ:uestion ")}
+
+
+def decode(token_ids):
+    return "".join(VOCAB[i] for i in token_ids)
+
+
+def encode(text):
+    inverse = {ch: i for i, ch in VOCAB.items()}
+    return [inverse[ch] for ch in text]
+
+
+def test_query_classes_and_budget():
+    """質問の種類の判定と、生成トークン数がプロンプトの残りで制限されることのテスト"""
+    assert classify_query("Why does insulin lower blood sugar?") == "explanation"
+    assert classify_query("糖尿病の仕組みを説明してください") == "explanation"
+    assert classify_query("What is the normal dose of aspirin?") == "factoid"
+    assert classify_query("インスリンとは") == "factoid"
+    assert classify_query("aspirin side effects") == "default"
+    assert classify_query("What is a decorator?", model_type="codellama") == "code"
+
+    assert resolve_max_new_tokens(128, prompt_tokens=900, max_length=2048) == 128
+    assert resolve_max_new_tokens(512, prompt_tokens=1900, max_length=2048) == 148
+    assert resolve_max_new_tokens(None, prompt_tokens=2000, max_length=2048) == 48
+    assert resolve_max_new_tokens(64, prompt_tokens=4000, max_length=2048) == 1
+
+
+def test_stop_string_and_trim():
+    """停止文字列が生成されたら止まり、回答からそれ以降が除かれることのテスト"""
+    conditions = StopConditions(stop_strings=["\nQuestion:"])
+    reasons = [conditions.update(token, decode) for token in encode("abc\nQuestion: d")]
+
+    assert reasons.index("stop") == len("abc\nQuestion:") - 1
+    assert conditions.reason == "stop"
+    assert conditions.generated_tokens == len("abc\nQuestion:")
+    assert conditions.trim("abc\nQuestion: d") == "abc"
+    # 条件で止まった場合は終了時の理由で上書きしない
+    assert conditions.finish("length") == "stop"
+
+
+def test_repeated_ngrams_stop_generation():
+    """同じn-gramが規定回数出たら 'repetition' で止まることのテスト"""
+    conditions = StopConditions(repeat_ngram_size=3, max_ngram_repeats=3)
+    tokens = encode("abcdabcdabcdabcd")
+    stopped_at = next(i for i, token in enumerate(tokens) if conditions.update(token, decode))
+
+    assert conditions.reason == "repetition"
+    assert stopped_at == len("abcdabcdabc") - 1
+
+    conditions = StopConditions(repeat_ngram_size=3, max_ngram_repeats=3)
+    assert not any(conditions.update(token, decode) for token in encode("abcdefghij"))
+    assert conditions.finish("eos") == "eos"
+
+
+def test_deadline():
+    """締め切りを過ぎたら 'deadline' で止まることのテスト"""
+    conditions = StopConditions(max_seconds=0.01)
+    conditions.start()
+    assert conditions.update(0, decode) is None
+    time.sleep(0.02)
+    assert conditions.update(1, decode) == "deadline"
+
+
+def test_stream_filter_holds_back_partial_stop_strings():
+    """逐次出力で停止文字列の途中までは保留し、停止文字列以降は出力しないことのテスト"""
+    text_filter = StopStringFilter(["\nQuestion:"])
+    emitted = [text_filter.feed(piece) for piece in ("The answer", " is 42.\nQue", "stion: next", " more")]
+
+    assert emitted == ["The answer", " is 42.", "", ""]
+    assert text_filter.stopped
+    assert text_filter.flush() == ""
+
+    text_filter = StopStringFilter(["\nQuestion:"])
+    assert text_filter.feed("line\nQu") == "line"
+    assert text_filter.feed("ite") == "\nQuite"
+    assert text_filter.feed(" good\n") == " good"
+    assert text_filter.flush() == "\n"
+
+
+if __name__ == "__main__":
+    pytest.main(["-v", "test_generation_control.py"])
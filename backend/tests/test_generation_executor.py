@@ -0,0 +1,110 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from src.models.generation_executor import GenerationExecutor, GenerationQueueFull
+
+
+def blocking_generate(prompt, delay=0.1):
+    """イベントループを止めてしまう同期的な生成を模す"""
+    time.sleep(delay)
+    return f"answer to {prompt}"
+
+
+@pytest.mark.asyncio
+async def test_event_loop_stays_responsive():
+    """生成中もイベントループが他の処理を進められることのテスト"""
+    executor = GenerationExecutor(max_workers=1, max_queue=4)
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    task = asyncio.create_task(ticker())
+    result = await executor.run(blocking_generate, "q", delay=0.2)
+    task.cancel()
+
+    assert result.output == "answer to q"
+    assert result.run_seconds >= 0.2
+    assert ticks >= 10
+    executor.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_concurrency_limit_and_separate_timings():
+    """同時実行数が上限に収まり、待ち時間と実行時間が別々に記録されることのテスト"""
+    executor = GenerationExecutor(max_workers=2, max_queue=8)
+    lock = threading.Lock()
+    running = peak = 0
+
+    def tracked(prompt):
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        time.sleep(0.05)
+        with lock:
+            running -= 1
+        return prompt
+
+    results = await asyncio.gather(*(executor.run(tracked, i) for i in range(6)))
+
+    assert [result.output for result in results] == list(range(6))
+    assert peak == 2
+    # 後から投入したものほど長く待つ
+    assert max(result.queue_seconds for result in results) >= 0.08
+    metrics = executor.get_metrics()
+    assert metrics["completed"] == 6
+    assert metrics["queue_wait"]["count"] == 6
+    assert metrics["run_time"]["count"] == 6
+    assert metrics["queued"] == 0 and metrics["running"] == 0
+    executor.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_rejects_when_queue_is_full():
+    """待機数の上限を超える投入が拒否されることのテスト"""
+    executor = GenerationExecutor(max_workers=1, max_queue=1)
+    first = asyncio.create_task(executor.run(blocking_generate, "a"))
+    second = asyncio.create_task(executor.run(blocking_generate, "b"))
+    await asyncio.sleep(0.01)
+
+    with pytest.raises(GenerationQueueFull):
+        await executor.run(blocking_generate, "c")
+
+    await asyncio.gather(first, second)
+    assert executor.get_metrics()["rejected"] == 1
+    executor.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_cancelled_while_queued_is_not_run():
+    """待機中にキャンセルされた生成が実行されないことのテスト"""
+    executor = GenerationExecutor(max_workers=1, max_queue=4)
+    calls = []
+
+    def record(prompt):
+        calls.append(prompt)
+        time.sleep(0.05)
+
+    first = asyncio.create_task(executor.run(record, "a"))
+    queued = asyncio.create_task(executor.run(record, "b"))
+    await asyncio.sleep(0.01)
+    queued.cancel()
+    await first
+    await asyncio.sleep(0.1)
+
+    assert calls == ["a"]
+    metrics = executor.get_metrics()
+    assert metrics["cancelled"] == 1
+    assert metrics["queued"] == 0
+    executor.shutdown()
+
+
+if __name__ == "__main__":
+    pytest.main(["-v", "test_generation_executor.py"])
@@ -0,0 +1,68 @@
+import pytest
+
+from src.models.inference_profiles import (
+    INFERENCE_PROFILES, apply_profile, load_causal_lm, model_memory_bytes, resident_memory_bytes, resolve_profile
+)
+
+
+def test_resolve_profile():
+    """プロファイル名の解決と 'auto' の選択のテスト"""
+    assert resolve_profile('auto', cuda_available=True).name == 'gpu_fp16'
+    assert resolve_profile('auto', cuda_available=False).name == 'fp32'
+    assert resolve_profile('int8').quantize_int8
+    assert resolve_profile('bf16').dtype == 'bfloat16'
+    assert all(profile.device == 'cpu' for name, profile in INFERENCE_PROFILES.items() if name != 'gpu_fp16')
+    with pytest.raises(ValueError):
+        resolve_profile('fp8')
+
+
+def test_resident_memory_is_reported():
+    assert resident_memory_bytes() > 0
+
+
+def build_tiny_llama():
+    torch = pytest.importorskip("torch")
+    transformers = pytest.importorskip("transformers")
+    torch.manual_seed(0)
+    config = transformers.LlamaConfig(
+        vocab_size=96, hidden_size=64, intermediate_size=256, num_hidden_layers=2,
+        num_attention_heads=4, num_key_value_heads=2, max_position_embeddings=128,
+        tie_word_embeddings=False
+    )
+    return transformers.LlamaForCausalLM(config).eval()
+
+
+def test_profiles_reduce_model_memory():
+    """bf16で約1/2、int8で線形層が約1/4になり、量子化後も生成できることのテスト"""
+    torch = pytest.importorskip("torch")
+    build = build_tiny_llama
+
+    sizes = {name: model_memory_bytes(apply_profile(build(), INFERENCE_PROFILES[name]))
+             for name in ('fp32', 'bf16', 'int8')}
+    assert sizes['bf16'] == pytest.approx(sizes['fp32'] / 2, rel=0.05)
+    assert sizes['int8'] < sizes['fp32'] / 2.5
+
+    model = apply_profile(build(), INFERENCE_PROFILES['int8'])
+    with torch.inference_mode():
+        output = model.generate(torch.tensor([[1, 2, 3]]), max_new_tokens=4, do_sample=False)
+    assert output.shape == (1, 7)
+
+
+def test_load_causal_lm_applies_profile(tmp_path):
+    """保存したモデルをプロファイルのdtype・量子化で読み込めることのテスト"""
+    torch = pytest.importorskip("torch")
+    build_tiny_llama().save_pretrained(tmp_path)
+
+    bf16 = load_causal_lm(str(tmp_path), INFERENCE_PROFILES['bf16'])
+    assert bf16.dtype == torch.bfloat16 and not bf16.training
+
+    int8 = load_causal_lm(str(tmp_path), INFERENCE_PROFILES['int8'])
+    fp32 = load_causal_lm(str(tmp_path), INFERENCE_PROFILES['fp32'])
+    assert model_memory_bytes(int8) < model_memory_bytes(fp32) / 2.5
+    with torch.inference_mode():
+        output = int8.generate(torch.tensor([[1, 2, 3]]), max_new_tokens=4, do_sample=False)
+    assert output.shape == (1, 7)
+
+
+if __name__ == "__main__":
+    pytest.main(["-v", "test_inference_profiles.py"])
@@ -0,0 +1,179 @@
+import os
+import threading
+import time
+
+import pytest
+
+from src.models.lexical_index import LexicalIndex
+from src.models.numpy_vector_store import NumpyVectorStore
+from src.models.rag_system import RAGSystem
+from src.models.source_registry import SourceRegistry
+from test_vector_store import BagOfWordsEmbeddings
+
+URL = "https://example.com/page"
+
+
+class RecordingEmbeddings(BagOfWordsEmbeddings):
+    """埋め込んだテキストを記録するテスト用の埋め込み"""
+
+    def __init__(self):
+        self.embedded = []
+        self.on_embed = None
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        if self.on_embed:
+            self.on_embed()
+        return super().embed_documents(texts)
+
+
+class FakeResponse:
+    status_code = 200
+
+    def __init__(self, content: bytes):
+        self.content = content
+
+    def raise_for_status(self):
+        pass
+
+
+def make_rag(tmp_path, monkeypatch, pages):
+    """ingest_url が使う属性だけを持つRAGシステム（取得と解析はスタブ）"""
+    rag = RAGSystem.__new__(RAGSystem)
+    rag.ingestion_config = {'fetch_timeout_seconds': 5, 'embed_batch_size': 2}
+    rag.embeddings = RecordingEmbeddings()
+    rag.vectorstore_general = NumpyVectorStore(str(tmp_path / "general"), rag.embeddings, initial_capacity=2)
+    rag.lexical_indexes = {"general": LexicalIndex(str(tmp_path / "general" / "lexical_index"))}
+    rag.source_registry = SourceRegistry(str(tmp_path / "sources.sqlite3"))
+    rag.answer_cache = None
+    rag._maintenance_lock = threading.Lock()
+    rag.persist_directory_general = str(tmp_path / "general")
+    rag._store_directories = {"general": rag.persist_directory_general}
+    rag._store_lock = threading.Lock()
+    rag._store_users = {}
+    rag._retired_stores = {}
+
+    # ページの1行目をタイトル、空行で区切った段落をチャンクとして扱う
+    monkeypatch.setattr("requests.get", lambda url, **kwargs: FakeResponse(pages[url].encode("utf-8")))
+
+    def process_webpage(content, url):
+        title, *chunks = content.decode("utf-8").split("\n\n")
+        return chunks, title
+    monkeypatch.setattr(rag, "_process_webpage", process_webpage)
+    return rag
+
+
+def test_reingest_only_embeds_changed_chunks(tmp_path, monkeypatch):
+    """再取り込みで変更の無いページは埋め込まずに飛ばし、変更されたチャンクだけを入れ替えることのテスト"""
+    pages = {URL: "Page\n\npython java\n\nrust 薬\n\n症状 治療"}
+    rag = make_rag(tmp_path, monkeypatch, pages)
+    store, lexical_index = rag.vectorstore_general, rag.lexical_indexes["general"]
+
+    assert rag.ingest_url(URL) == {"chunks": 3, "new": 3, "unchanged": 0, "removed": 0}
+    assert rag.embeddings.embedded == ["python java", "rust 薬", "症状 治療"]
+    old_ids = rag.source_registry.get_chunk_ids("general", URL)
+
+    # 同じ内容なら何も埋め込まない
+    rag.embeddings.embedded.clear()
+    assert rag.ingest_url(URL) == {"chunks": 3, "new": 0, "unchanged": 3, "removed": 0}
+    assert rag.embeddings.embedded == []
+
+    # 2番目のチャンクとタイトルだけが変わったページ
+    pages[URL] = "Page v2\n\npython java\n\nrust rust\n\n症状 治療"
+    assert rag.ingest_url(URL) == {"chunks": 3, "new": 1, "unchanged": 2, "removed": 1}
+    assert rag.embeddings.embedded == ["rust rust"]
+
+    new_ids = rag.source_registry.get_chunk_ids("general", URL)
+    (stale_id,) = set(old_ids) - set(new_ids)
+    kept_ids = sorted(set(old_ids) & set(new_ids))
+    assert len(kept_ids) == 2
+
+    # 変更の無いチャンクはメタデータだけが更新される
+    kept = store.get(ids=kept_ids)
+    assert sorted(kept["documents"]) == ["python java", "症状 治療"]
+    assert all(meta["title"] == "Page v2" for meta in kept["metadatas"])
+    fingerprint = rag.source_registry.get_source("general", URL)["fingerprint"]
+    assert all(meta["source_fingerprint"] == fingerprint for meta in kept["metadatas"])
+
+    # 古いチャンクはストア・語彙インデックス・レジストリのすべてから消える
+    assert store.get(ids=[stale_id])["ids"] == []
+    assert store.count() == 3
+    assert lexical_index.search("薬", k=5) == []
+    assert len(lexical_index.search("rust", k=5)) == 1
+    assert rag.source_registry.get_counts("general") == {"total_documents": 1, "total_chunks": 3}
+
+
+@pytest.mark.asyncio
+async def test_delete_during_ingest_is_not_overwritten(tmp_path, monkeypatch):
+    """埋め込み中にソースが削除されたら取り込みは保存せずに失敗し（再試行される）、削除が残ることのテスト"""
+    pages = {URL: "Page\n\npython java\n\nrust 薬"}
+    rag = make_rag(tmp_path, monkeypatch, pages)
+    rag.ingest_url(URL)
+    store = rag.vectorstore_general
+
+    pages[URL] = "Page\n\npython java\n\nrust rust"
+    rag.embeddings.on_embed = lambda: rag._delete_source_chunks("general", URL)
+    with pytest.raises(RuntimeError):
+        rag.ingest_url(URL)
+    assert store.count() == 0
+    assert rag.source_registry.get_source("general", URL) is None
+    assert rag.lexical_indexes["general"].search("python", k=5) == []
+
+    # 再試行では削除後の状態から取り込み直す
+    rag.embeddings.on_embed = None
+    assert rag.ingest_url(URL)["new"] == 2
+    assert await rag.delete_source(URL)
+    assert not await rag.delete_source(URL)
+    assert store.count() == 0
+    assert rag.source_registry.get_counts("general") == {"total_documents": 0, "total_chunks": 0}
+
+
+def test_store_swapped_during_ingest(tmp_path, monkeypatch):
+    """埋め込み中にストアが差し替えられたら古いストアにもレジストリにも書かずに失敗することのテスト"""
+    pages = {URL: "Page\n\npython java"}
+    rag = make_rag(tmp_path, monkeypatch, pages)
+    old_store = rag.vectorstore_general
+    new_store = NumpyVectorStore(str(tmp_path / "fresh"), rag.embeddings, initial_capacity=2)
+
+    def swap():
+        with rag._maintenance_lock:
+            rag.vectorstore_general = new_store
+    rag.embeddings.on_embed = swap
+    with pytest.raises(RuntimeError):
+        rag.ingest_url(URL)
+    assert old_store.count() == 0 and new_store.count() == 0
+    assert rag.source_registry.get_source("general", URL) is None
+
+
+def test_cleared_store_is_closed_after_last_use(tmp_path, monkeypatch):
+    """クリアで差し替えたストアは借りている検索が終わるまで閉じず、その後ディレクトリごと削除されることのテスト"""
+    pages = {URL: "Page\n\npython java"}
+    rag = make_rag(tmp_path, monkeypatch, pages)
+    monkeypatch.setattr(rag, "_create_vector_store", lambda category, directory: NumpyVectorStore(
+        directory, rag.embeddings, initial_capacity=2
+    ))
+    rag.ingest_url(URL)
+    old_store, old_directory = rag.vectorstore_general, rag._store_directories["general"]
+
+    with rag._use_vectorstore("general") as store:
+        rag._swap_in_fresh_store("general")
+        time.sleep(0.1)
+        # 使用中のストアのディレクトリは動かさず、検索も続けられる
+        assert store is old_store and os.path.isdir(old_directory)
+        assert store.similarity_search("python", k=1)[0].content == "python java"
+
+    deadline = time.monotonic() + 5
+    while os.path.exists(old_directory) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not os.path.exists(old_directory)
+    assert old_store._closed
+
+    new_directory = rag._store_directories["general"]
+    assert rag.vectorstore_general is not old_store and rag.vectorstore_general.count() == 0
+    assert rag.source_registry.get_source("general", URL) is None
+    # 再起動後も新しいディレクトリを使う
+    assert RAGSystem._current_store_directory(rag.persist_directory_general) == new_directory
+
+
+if __name__ == "__main__":
+    pytest.main(["-v", "test_ingest.py"])
@@ -0,0 +1,145 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from src.api import main
+from src.models.ingestion_queue import (
+    FAILED, QUEUED, RUNNING, SUCCEEDED, IngestionQueue, IngestionWorkers, PermanentIngestionError,
+    backoff_delay, stage_progress
+)
+
+
+def test_backoff_and_stage_progress():
+    """再試行の待ち時間が倍々に増えて上限で止まり、進捗が段階から求まることのテスト"""
+    assert backoff_delay(1, 2.0, 300.0, jitter=0) == 2.0
+    assert backoff_delay(4, 2.0, 300.0, jitter=0) == 16.0
+    assert backoff_delay(20, 2.0, 300.0, jitter=0) == 300.0
+    assert 1.8 <= backoff_delay(1, 2.0, 300.0) <= 2.2
+    assert stage_progress("fetch") == 0.0
+    assert stage_progress("embed", 0.5) == pytest.approx(0.625)
+    assert stage_progress("store", 2.0) == 1.0
+
+
+def test_claim_order_retry_and_recover(tmp_path):
+    """登録順の取り出し、同じソースの同時実行の排除、再試行、再起動後の復旧のテスト"""
+    path = str(tmp_path / "jobs.sqlite3")
+    queue = IngestionQueue(path, max_attempts=2)
+    first, duplicate, other = queue.enqueue_many([
+        ("https://a", "general"), ("https://a", "general"), ("https://b", "code")
+    ])
+
+    job = queue.claim()
+    assert job["id"] == first and job["status"] == RUNNING and job["attempts"] == 1
+    # 同じURLのジョブは実行中のものが終わるまで取り出さない
+    assert queue.claim()["id"] == other
+    assert queue.claim() is None
+
+    queue.update_progress(first, "embed", 0.6)
+    assert queue.get_job(first)["stage"] == "embed"
+
+    # 1回目の失敗は再試行、待ち時間が過ぎるまで取り出さない
+    assert queue.fail(first, "fetch: timeout", retry_delay=30)
+    assert queue.get_job(first)["status"] == QUEUED
+    assert queue.claim()["id"] == duplicate
+    assert queue.claim() is None
+    queue.complete(duplicate, {"chunks": 3})
+    assert queue.claim(now=time.time() + 60)["id"] == first
+    # 試行回数の上限に達したら失敗で終わる
+    assert not queue.fail(first, "fetch: timeout", retry_delay=30)
+    assert queue.get_job(first)["status"] == FAILED
+    assert queue.get_job(duplicate)["result"] == {"chunks": 3}
+
+    # 実行中のまま終了したジョブは再起動時にキューに戻る
+    queue.close()
+    queue = IngestionQueue(path, max_attempts=2)
+    assert queue.get_job(other)["status"] == RUNNING
+    assert queue.recover() == 1
+    assert queue.counts() == {QUEUED: 1, RUNNING: 0, SUCCEEDED: 1, FAILED: 1, "retry_waiting": 1}
+    assert queue.get_job("missing") is None
+
+
+@pytest.mark.asyncio
+async def test_workers_process_jobs_with_retries(tmp_path):
+    """ワーカーがジョブを並列に処理し、一時的な失敗は再試行、恒久的な失敗は再試行しないことのテスト"""
+    queue = IngestionQueue(str(tmp_path / "jobs.sqlite3"), max_attempts=3)
+    failures = {"https://flaky": 1}
+    lock = threading.Lock()
+
+    def handler(job, report):
+        for stage in ("fetch", "parse", "embed", "store"):
+            report(stage, 0.0)
+        if job["url"] == "https://missing":
+            raise PermanentIngestionError("HTTP 404")
+        with lock:
+            if failures.get(job["url"], 0) > 0:
+                failures[job["url"]] -= 1
+                raise ConnectionError("reset")
+        time.sleep(0.01)
+        return {"chunks": 1}
+
+    workers = IngestionWorkers(
+        queue, handler, num_workers=2, poll_interval=0.01, retry_base_seconds=0.01, retry_max_seconds=0.05
+    )
+    workers.start()
+    job_ids = queue.enqueue_many(
+        [(f"https://page/{i}", "general") for i in range(10)] + [("https://flaky", "general"), ("https://missing", "general")]
+    )
+    workers.notify()
+
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        counts = queue.counts()
+        if counts[SUCCEEDED] + counts[FAILED] == len(job_ids):
+            break
+        await asyncio.sleep(0.02)
+    await workers.stop()
+
+    flaky, missing = queue.get_job(job_ids[-2]), queue.get_job(job_ids[-1])
+    assert flaky["status"] == SUCCEEDED and flaky["attempts"] == 2
+    assert missing["status"] == FAILED and missing["attempts"] == 1
+    assert missing["error"] == "store: HTTP 404"
+
+    metrics = workers.get_metrics()
+    assert metrics["completed"] == 11
+    assert metrics["failed"] == 1
+    assert metrics["retried"] == 1
+    assert metrics["jobs_per_minute"] > 0
+    assert metrics["queue"][SUCCEEDED] == 11
+    assert not metrics["running"]
+
+
+class FakeRAG:
+    """取り込みキューだけを持つRAGシステム"""
+
+    def __init__(self, path):
+        self.ingestion_queue = IngestionQueue(path)
+        self.ingestion_config = {'max_bulk_urls': 3}
+
+    def enqueue_urls(self, urls, category="general"):
+        return self.ingestion_queue.enqueue_many([(url, category) for url in urls])
+
+
+def test_job_endpoints(monkeypatch, tmp_path):
+    """追加でジョブIDが返り、GET /api/jobs/{id} で状態を取得できることのテスト"""
+    rag = FakeRAG(str(tmp_path / "jobs.sqlite3"))
+    monkeypatch.setattr(main, "rag_system", rag)
+    client = TestClient(main.app)
+
+    response = client.post("/api/documents/add", json={"url": "https://example.com/a", "category": "code"})
+    assert response.status_code == 200
+    job_id = response.json()["job_id"]
+    job = client.get(f"/api/jobs/{job_id}").json()
+    assert job["status"] == QUEUED
+    assert job["category"] == "code"
+
+    response = client.post("/api/documents/bulk", json={"urls": ["https://example.com/b", "https://example.com/c"]})
+    assert [job["url"] for job in response.json()["jobs"]] == ["https://example.com/b", "https://example.com/c"]
+    assert client.post("/api/documents/bulk", json={"urls": ["https://example.com/"] * 4}).status_code == 413
+    assert client.get("/api/jobs/unknown").status_code == 404
+
+
+if __name__ == "__main__":
+    pytest.main(["-v", "test_ingestion_queue.py"])
@@ -0,0 +1,134 @@
+import json
+
+import pytest
+
+from src.models.lexical_index import LexicalIndex, reciprocal_rank_fusion, tokenize
+
+
+def test_tokenize_japanese_and_english():
+    """日本語は文字bigram、英語は単語単位でトークン化されることのテスト"""
+    assert tokenize("機械学習") == ["機械", "械学", "学習"]
+    assert tokenize("Error E1102 in torch.nn.Linear") == [
+        "error", "e1102", "in", "torch.nn.linear", "torch", "nn", "linear"
+    ]
+    assert tokenize("ＡＢＣ　薬") == ["abc", "薬"]
+
+
+def test_compound_identifiers_match_their_parts():
+    """. _ - でつないだ識別子が全体でも部分でも検索できることのテスト"""
+    assert tokenize("max_new_tokens gpt-4") == ["max_new_tokens", "max", "new", "tokens", "gpt-4", "gpt", "4"]
+    index = LexicalIndex()
+    index.add(
+        ["a", "b"],
+        ["Wrap layers with torch.nn.Linear and set max_new_tokens.", "A linear model of tokens."]
+    )
+    assert [doc_id for doc_id, _ in index.search("nn", k=2)] == ["a"]
+    assert [doc_id for doc_id, _ in index.search("new", k=2)] == ["a"]
+    assert index.search("max_new_tokens", k=2)[0][0] == "a"
+    assert {doc_id for doc_id, _ in index.search("linear", k=2)} == {"a", "b"}
+
+
+def test_index_from_older_tokenizer_is_not_loaded(tmp_path):
+    """古いトークン化で保存したインデックスは読み込まず、空から作り直すことのテスト"""
+    index = LexicalIndex(str(tmp_path))
+    index.add(["a"], ["torch.nn.Linear"])
+    index.save()
+    assert len(LexicalIndex(str(tmp_path))) == 1
+
+    meta_path = tmp_path / "lexical_index.json"
+    meta = json.loads(meta_path.read_text(encoding="utf-8"))
+    del meta["tokenizer"]
+    meta_path.write_text(json.dumps(meta), encoding="utf-8")
+    assert len(LexicalIndex(str(tmp_path))) == 0
+
+
+def test_bm25_finds_exact_terms():
+    """固有名詞や識別子の完全一致が上位に来ることのテスト"""
+    index = LexicalIndex()
+    index.add(
+        ["a", "b", "c"],
+        [
+            "アセトアミノフェンは解熱鎮痛薬として使われる。",
+            "イブプロフェンは非ステロイド性抗炎症薬である。",
+            "Error code E1102 means the upstream server timed out.",
+        ]
+    )
+    assert index.search("アセトアミノフェンの副作用", k=1)[0][0] == "a"
+    assert index.search("what is E1102?", k=1)[0][0] == "c"
+    assert index.search("unknownterm") == []
+
+
+def test_incremental_add_remove_and_merge():
+    """追加・削除・マージ後も検索結果が一貫していることのテスト"""
+    index = LexicalIndex(merge_threshold=1)
+    index.add(["a", "b"], ["python programming", "java programming"])
+    index.add(["c"], ["python snakes"])
+    assert {doc_id for doc_id, _ in index.search("python")} == {"a", "c"}
+
+    index.remove(["a"])
+    assert [doc_id for doc_id, _ in index.search("python")] == ["c"]
+    assert len(index) == 2
+
+    index.add(["c"], ["rust programming"])  # 置き換え
+    assert index.search("python") == []
+    index.merge()
+    assert {doc_id for doc_id, _ in index.search("programming")} == {"b", "c"}
+
+
+def test_persistence(tmp_path):
+    """保存と読み込みのテスト"""
+    index = LexicalIndex(str(tmp_path))
+    index.add(["a", "b"], ["薬の飲み合わせ", "python error handling"])
+    index.remove(["a"])
+    index.add(["c"], ["薬の副作用"])
+    index.save()
+
+    loaded = LexicalIndex(str(tmp_path))
+    assert len(loaded) == 2
+    assert loaded.search("副作用")[0][0] == "c"
+    assert loaded.search("python")[0][0] == "b"
+
+
+def test_save_appends_log_until_merge(tmp_path):
+    """マージが無ければ保存は操作をログに追記するだけで、マージ後にスナップショットを書き直すことのテスト"""
+    index = LexicalIndex(str(tmp_path), merge_threshold=1000)
+    index.add(["a", "b"], ["python error handling", "java programming"])
+    index.save()
+    arrays_path = tmp_path / "lexical_index.npz"
+    snapshot_mtime = arrays_path.stat().st_mtime_ns
+
+    for i in range(5):
+        index.add([f"doc{i}"], [f"python tutorial part{i}"])
+        index.save()
+    index.remove(["a"])
+    index.add(["b"], ["rust programming"])  # 置き換え
+    index.save()
+    assert arrays_path.stat().st_mtime_ns == snapshot_mtime
+
+    loaded = LexicalIndex(str(tmp_path), merge_threshold=1000)
+    assert len(loaded) == 6
+    assert {doc_id for doc_id, _ in loaded.search("python", k=10)} == {f"doc{i}" for i in range(5)}
+    assert loaded.search("rust")[0][0] == "b"
+    assert loaded.search("java") == []
+
+    # マージ後の保存でスナップショットを書き直し、ログは未マージの文書だけになる
+    loaded.merge()
+    loaded.add(["c"], ["薬の副作用"])
+    loaded.save()
+    log_lines = (tmp_path / "lexical_index.log").read_text(encoding="utf-8").splitlines()
+    assert len(log_lines) == 2
+    reloaded = LexicalIndex(str(tmp_path))
+    assert len(reloaded) == 7
+    assert reloaded.search("副作用")[0][0] == "c"
+    assert reloaded.search("rust")[0][0] == "b"
+
+
+def test_reciprocal_rank_fusion():
+    """両方のリストで上位の文書が最上位になることのテスト"""
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "d"]])
+    assert fused[0][0] == "b"
+    assert {doc_id for doc_id, _ in fused} == {"a", "b", "c", "d"}
+
+
+if __name__ == "__main__":
+    pytest.main(["-v", "test_lexical_index.py"])
@@ -0,0 +1,97 @@
+import asyncio
+import time
+
+import pytest
+
+from src.models.model_pool import ModelPool
+
+
+class FakeModel:
+    """ロード時間とメモリ使用量だけを模したモデル"""
+
+    loads = 0
+
+    def __init__(self, model_type, size):
+        self.model_type = model_type
+        self.size = size
+        self.loaded = False
+
+    def load_model(self):
+        time.sleep(0.05)
+        FakeModel.loads += 1
+        self.loaded = self.model_type != "broken"
+        return self.loaded
+
+    def memory_footprint(self):
+        return self.size
+
+    def unload(self):
+        self.loaded = False
+
+
+def make_pool(budget=100):
+    sizes = {"llama": 40, "codellama": 50, "other": 30, "broken": 10}
+    return ModelPool(lambda model_type: FakeModel(model_type, sizes[model_type]), memory_budget_bytes=budget)
+
+
+@pytest.mark.asyncio
+async def test_single_flight_load_and_hits():
+    """同時要求が1回のロードを共有し、以降はヒットになることのテスト"""
+    FakeModel.loads = 0
+    pool = make_pool()
+    models = await asyncio.gather(*(pool.get("llama") for _ in range(5)))
+    assert FakeModel.loads == 1
+    assert all(model is models[0] for model in models)
+
+    assert await pool.get("llama") is models[0]
+    metrics = pool.get_metrics()
+    assert metrics["loads"] == 1
+    assert metrics["shared_loads"] == 4
+    assert metrics["hits"] == 1
+    assert metrics["used_bytes"] == 40
+
+
+@pytest.mark.asyncio
+async def test_lru_eviction_within_budget():
+    """予算を超えると最終使用の古いモデルから解放されることのテスト"""
+    pool = make_pool(budget=100)
+    llama = await pool.get("llama")
+    await pool.get("codellama")
+    await pool.get("llama")  # codellamaが最も古くなる
+
+    await pool.get("other")
+    assert pool.is_resident("llama") and pool.is_resident("other")
+    assert not pool.is_resident("codellama")
+    assert llama.loaded
+    assert pool.get_metrics()["evictions"] == 1
+    assert pool.used_bytes <= 100
+
+
+@pytest.mark.asyncio
+async def test_models_in_use_are_not_evicted():
+    """使用中のモデルは予算を超えても解放されないことのテスト"""
+    pool = make_pool(budget=60)
+    async with pool.use("llama") as llama:
+        async with pool.use("codellama"):
+            assert llama.loaded
+            assert pool.is_resident("llama")
+        assert pool.get_metrics()["resident"]["llama"]["in_use"] == 1
+    # 使用が終わると次のロードで解放される
+    await pool.get("other")
+    assert pool.used_bytes <= 60
+
+
+@pytest.mark.asyncio
+async def test_load_failure_is_reported():
+    """ロードに失敗した場合に例外となり、次の要求で再試行されることのテスト"""
+    pool = make_pool()
+    with pytest.raises(RuntimeError):
+        await pool.get("broken")
+    assert pool.get_metrics()["load_failures"] == 1
+    assert not pool.is_resident("broken")
+    with pytest.raises(RuntimeError):
+        await pool.get("broken")
+
+
+if __name__ == "__main__":
+    pytest.main(["-v", "test_model_pool.py"])
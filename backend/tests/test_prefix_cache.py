@@ -0,0 +1,103 @@
+import pytest
+
+from src.models.prefix_cache import PrefixKVCache
+
+
+def test_longest_prefix_lookup():
+    """最長一致する接頭辞が返り、プロンプト全体とは一致させないことのテスト"""
+    cache = PrefixKVCache(max_bytes=1000)
+    cache.insert([1, 2, 3], "short", nbytes=10, prefill_seconds=0.1)
+    cache.insert([1, 2, 3, 4, 5], "long", nbytes=10, prefill_seconds=0.2)
+
+    assert cache.lookup([1, 2, 3, 4, 5, 6]).past_key_values == "long"
+    assert cache.lookup([1, 2, 3, 9]).past_key_values == "short"
+    # 最後のトークンはプリフィルに残す必要がある
+    assert cache.lookup([1, 2, 3, 4, 5]).past_key_values == "short"
+    assert cache.lookup([7, 1, 2, 3]) is None
+
+
+def test_lru_eviction_by_bytes():
+    """合計バイト数が上限を超えると最終使用の古いものから削除されることのテスト"""
+    cache = PrefixKVCache(max_bytes=100)
+    cache.insert([1], "a", nbytes=40, prefill_seconds=0.0)
+    cache.insert([2], "b", nbytes=40, prefill_seconds=0.0)
+    cache.lookup([1, 9])  # aを最近使ったものにする
+    cache.insert([3], "c", nbytes=40, prefill_seconds=0.0)
+
+    assert cache.lookup([1, 9]) is not None
+    assert cache.lookup([2, 9]) is None
+    assert cache.lookup([3, 9]) is not None
+    metrics = cache.get_metrics()
+    assert metrics["evictions"] == 1
+    assert metrics["used_bytes"] == 80
+
+    # 上限より大きいものは保存しない
+    cache.insert([4], "d", nbytes=200, prefill_seconds=0.0)
+    assert cache.lookup([4, 9]) is None
+
+
+def test_shared_prefix_with_recent_prompts():
+    """直近のプロンプトとの共通接頭辞がmin_prefix_tokens以上のときだけ長さを返すことのテスト"""
+    cache = PrefixKVCache(max_bytes=1000, min_prefix_tokens=4)
+    preamble = [10, 11, 12, 13, 14]
+    assert cache.shared_prefix_length(preamble + [1, 2]) == 0
+
+    cache.remember(preamble + [1, 2])
+    assert cache.shared_prefix_length(preamble + [3, 4]) == 5
+    assert cache.shared_prefix_length([10, 11, 99]) == 0
+    # 同じプロンプトでも最後の1トークンは残す
+    assert cache.shared_prefix_length(preamble + [1, 2]) == 6
+
+
+def test_saved_prefill_time_is_recorded():
+    """ヒットごとに節約したプリフィル時間が記録されることのテスト"""
+    cache = PrefixKVCache(max_bytes=1000)
+    cache.insert([1, 2], "kv", nbytes=10, prefill_seconds=0.05)
+    entry = cache.lookup([1, 2, 3])
+    cache.record_hit(entry, copy_seconds=0.01)
+
+    metrics = cache.get_metrics()
+    assert metrics["hits"] == 1
+    assert metrics["reused_tokens"] == 2
+    assert metrics["prefill_seconds_saved"] == pytest.approx(0.04)
+    assert metrics["mean_saved_ms_per_hit"] == pytest.approx(40.0)
+
+
+def test_generation_from_cached_prefix_matches_full_prefill():
+    """キャッシュした接頭辞から生成しても全体をプリフィルした場合と同じ結果になることのテスト"""
+    torch = pytest.importorskip("torch")
+    transformers = pytest.importorskip("transformers")
+
+    torch.manual_seed(0)
+    config = transformers.LlamaConfig(
+        vocab_size=96, hidden_size=32, intermediate_size=64, num_hidden_layers=2,
+        num_attention_heads=4, num_key_value_heads=2, max_position_embeddings=256,
+        pad_token_id=0, eos_token_id=None, bos_token_id=None
+    )
+    model = transformers.LlamaForCausalLM(config).eval()
+    model.generation_config.pad_token_id = 0
+
+    def generate(token_ids, **kwargs):
+        with torch.inference_mode():
+            output = model.generate(
+                torch.tensor([token_ids]), attention_mask=torch.ones(1, len(token_ids), dtype=torch.long),
+                max_new_tokens=8, do_sample=False, **kwargs
+            )
+        return output[0, len(token_ids):].tolist()
+
+    cache = PrefixKVCache(max_bytes=10 * 1024 ** 2, min_prefix_tokens=4)
+    preamble = list(range(1, 30))
+    first, second = preamble + [40, 41, 42], preamble + [50, 51]
+
+    assert cache.prepare(model, first) == {}
+    second_kwargs = cache.prepare(model, second)  # 共通の接頭辞をここで保存する
+    assert "past_key_values" in second_kwargs
+    assert generate(second, **second_kwargs) == generate(second)
+
+    third = preamble + [60, 61, 62, 63]
+    assert generate(third, **cache.prepare(model, third)) == generate(third)
+    assert cache.get_metrics()["hits"] == 1
+
+
+if __name__ == "__main__":
+    pytest.main(["-v", "test_prefix_cache.py"])
@@ -88,12 +88,38 @@ async def test_system_statistics():
     for source in stats['sources']:
         print(f"- {source['title']}: {source['paragraphs']} paragraphs")
 
+@pytest.mark.asyncio
+async def test_delete_source_and_clear():
+    """URL単位の削除とデータベースのクリアのテスト"""
+    rag = RAGSystem()
+    url = "https://ja.wikipedia.org/wiki/Python"
+
+    assert await rag.add_from_url(url, "general")
+    before = rag.source_registry.get_counts("general")
+    chunk_ids = rag.source_registry.get_chunk_ids("general", url)
+    assert chunk_ids
+
+    print("\nTesting source deletion...")
+    assert await rag.delete_source(url, "general")
+    assert rag.source_registry.get_source("general", url) is None
+    assert rag.vectorstore_general.get(ids=chunk_ids)["ids"] == []
+    after = rag.source_registry.get_counts("general")
+    assert after["total_chunks"] == before["total_chunks"] - len(chunk_ids)
+    assert not await rag.delete_source(url, "general")
+
+    print("\nTesting database clear...")
+    assert await rag.add_from_url(url, "general")
+    assert await rag.clear_database("general")
+    assert rag.vectorstore_general.count() == 0
+    assert rag.source_registry.get_counts("general") == {"total_documents": 0, "total_chunks": 0}
+
 def main():
     """すべてのテストを実行"""
     asyncio.run(test_document_addition())
     asyncio.run(test_document_search())
     asyncio.run(test_response_generation())
     asyncio.run(test_system_statistics())
+    asyncio.run(test_delete_source_and_clear())
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,7 +1,11 @@
 import os
 import sys
 import asyncio
+import threading
+import time
 import pytest
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
 
 project_root = str(Path(__file__).parent.parent)
@@ -85,6 +89,135 @@ async def test_caching():
     print(f"First access time: {time1:.2f}s")
     print(f"Cached access time: {time2:.2f}s")
 
+class StubHandler(BaseHTTPRequestHandler):
+    """遅延のあるHTMLを返すローカルのスタブサーバー（同時リクエスト数を記録）"""
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # ヘッダーと本文の別々の書き込みでキープアライブの応答が遅れないように
+
+    def do_GET(self):
+        server = self.server
+        host = self.headers["Host"].split(":")[0]
+        with server.lock:
+            server.in_flight[host] += 1
+            server.max_in_flight[host] = max(server.max_in_flight[host], server.in_flight[host])
+            server.total_in_flight += 1
+            server.max_total = max(server.max_total, server.total_in_flight)
+            server.hits[self.path] += 1
+            hits = server.hits[self.path]
+        time.sleep(server.latency)
+        with server.lock:
+            server.in_flight[host] -= 1
+            server.total_in_flight -= 1
+
+        if self.path == "/missing":
+            status, body = 404, b"not found"
+        elif self.path == "/flaky" and hits <= 2:
+            status, body = 503, b"busy"
+        else:
+            paragraph = f"This is the body text of the page {self.path} used for scraping tests."
+            body = (
+                f"<html><head><title>Page {self.path}</title></head><body><article>"
+                + "".join(f"<p>{paragraph} Paragraph {i}.</p>" for i in range(5))
+                + "</article></body></html>"
+            ).encode("utf-8")
+            status = 200
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.latency = 0.05
+    server.in_flight, server.max_in_flight, server.hits = Counter(), Counter(), Counter()
+    server.total_in_flight = server.max_total = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.asyncio
+async def test_bulk_scrape_runs_concurrently(stub_server):
+    """一括スクレイピングが全体の上限まで並列に取得されることのテスト"""
+    port = stub_server.server_address[1]
+    urls = [f"http://127.0.0.1:{port}/page/{i}" for i in range(16)]
+
+    async with WebScraper({'max_workers': 4, 'per_domain_concurrency': 8, 'parser_workers': 0}) as scraper:
+        start = time.perf_counter()
+        results = await scraper.bulk_scrape(urls)
+        elapsed = time.perf_counter() - start
+
+    assert all(results[url] is not None for url in urls)
+    assert results[urls[3]].title == "Page /page/3"
+    assert stub_server.max_total == 4
+    # 1件ずつなら 16 × 0.05秒以上かかる
+    assert elapsed < 16 * stub_server.latency * 0.75
+
+
+@pytest.mark.asyncio
+async def test_per_domain_limit(stub_server):
+    """同じドメインへの同時リクエスト数がドメインごとの上限に収まることのテスト"""
+    port = stub_server.server_address[1]
+    urls = [f"http://{host}:{port}/page/{i}" for host in ("127.0.0.1", "localhost") for i in range(6)]
+
+    async with WebScraper({'max_workers': 8, 'per_domain_concurrency': 2, 'parser_workers': 0}) as scraper:
+        results = await scraper.bulk_scrape(urls)
+
+    assert all(result is not None for result in results.values())
+    assert stub_server.max_in_flight["127.0.0.1"] == 2
+    assert stub_server.max_in_flight["localhost"] == 2
+
+
+@pytest.mark.asyncio
+async def test_retries_transient_errors(stub_server):
+    """503は再試行して成功し、404は再試行しないことのテスト"""
+    port = stub_server.server_address[1]
+    config = {'max_retries': 3, 'retry_base_delay': 0.01, 'parser_workers': 0}
+
+    async with WebScraper(config) as scraper:
+        assert await scraper.scrape(f"http://127.0.0.1:{port}/flaky") is not None
+        assert await scraper.scrape(f"http://127.0.0.1:{port}/missing") is None
+        metrics = scraper.get_metrics()
+
+    assert stub_server.hits["/flaky"] == 3
+    assert stub_server.hits["/missing"] == 1
+    assert metrics["retries"] == 2
+    assert metrics["errors"] == 1
+
+
+def test_client_is_bound_to_one_event_loop(stub_server):
+    """クライアントを閉じずに別のイベントループで使うとエラーになり、aclose後は使い回せることのテスト"""
+    url = f"http://127.0.0.1:{stub_server.server_address[1]}/page/1"
+    scraper = WebScraper({'parser_workers': 0})
+
+    async def scrape_and_close():
+        try:
+            return await scraper.scrape(url)
+        finally:
+            await scraper.aclose()
+
+    # 閉じずにループが終わると、次のループでは使えない
+    asyncio.run(scraper.bulk_scrape([]))
+    with pytest.raises(RuntimeError):
+        asyncio.run(scraper.scrape(url))
+    asyncio.run(scraper.aclose())  # まだ接続が無いので別のループからでも閉じられる
+
+    # 同じループの中で閉じれば同じインスタンスを別のループで使い回せる
+    for _ in range(2):
+        assert asyncio.run(scrape_and_close()).title == "Page /page/1"
+        scraper.clear_cache()
+    assert stub_server.hits["/page/1"] == 2
+
 if __name__ == '__main__':
     asyncio.run(test_single_url_scraping())
     asyncio.run(test_bulk_scraping())
@@ -0,0 +1,63 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from src.api import main
+
+
+class FakeRAG:
+    """stream_answerのイベント列だけを返すRAGシステム"""
+
+    def __init__(self):
+        self.closed = False
+
+    async def stream_answer(self, query, k=2, model_type=None):
+        try:
+            yield {'event': 'sources', 'data': {'sources': [{'content': 'doc', 'metadata': {'source': 'x'}}]}}
+            for text in ("こん", "にちは"):
+                yield {'event': 'token', 'data': {'text': text}}
+            yield {'event': 'done', 'data': {'answer': 'こんにちは', 'timings': {'total': 0.1}}}
+        finally:
+            self.closed = True
+
+
+def parse_events(body: str):
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+@pytest.fixture
+def fake_rag(monkeypatch):
+    rag = FakeRAG()
+    monkeypatch.setattr(main, "rag_system", rag)
+    return rag
+
+
+def test_stream_sends_sources_tokens_and_done(fake_rag):
+    """SSEでsources → token → doneの順にイベントが送られることのテスト"""
+    client = TestClient(main.app)
+    response = client.post("/api/search/stream", json={"query": "挨拶は？"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = parse_events(response.text)
+    assert [name for name, _ in events] == ["sources", "token", "token", "done"]
+    assert "".join(data["text"] for name, data in events if name == "token") == "こんにちは"
+    assert events[-1][1]["timings"]["total"] == 0.1
+    assert fake_rag.closed
+
+
+def test_stream_before_ready_returns_503(monkeypatch):
+    """RAGシステムの作成前は503になることのテスト"""
+    monkeypatch.setattr(main, "rag_system", None)
+    client = TestClient(main.app)
+    response = client.post("/api/search/stream", json={"query": "挨拶は？"})
+    assert response.status_code == 503
+
+
+if __name__ == "__main__":
+    pytest.main(["-v", "test_search_stream.py"])
@@ -0,0 +1,109 @@
+import pytest
+
+from src.models.source_registry import SourceRegistry
+
+
+def make_info(chunk_count, title="Title"):
+    return {
+        "title": title,
+        "chunk_count": chunk_count,
+        "added_at": "2024-01-01T00:00:00",
+        "content_type": "web",
+        "fingerprint": "fp"
+    }
+
+
+def test_counters_follow_upsert_remove_and_clear(tmp_path):
+    """追加・更新・削除・クリアでカウンタが更新されることのテスト"""
+    registry = SourceRegistry(str(tmp_path / "registry.sqlite3"))
+    assert not registry.has_counters("general")
+    assert registry.get_counts("general") == {"total_documents": 0, "total_chunks": 0}
+
+    registry.upsert_source("general", "https://a", make_info(10))
+    registry.upsert_source("general", "https://b", make_info(5))
+    registry.upsert_source("code", "https://c", make_info(7))
+    # 再取り込みで件数が変わった場合は差分だけ反映される
+    registry.upsert_source("general", "https://a", make_info(4))
+    assert registry.get_counts("general") == {"total_documents": 2, "total_chunks": 9}
+    assert registry.get_source("general", "https://a")["chunk_count"] == 4
+
+    assert registry.remove_source("general", "https://b")
+    assert not registry.remove_source("general", "https://b")
+    assert registry.get_counts("general") == {"total_documents": 1, "total_chunks": 4}
+
+    registry.clear("general")
+    assert registry.get_counts("general") == {"total_documents": 0, "total_chunks": 0}
+    assert registry.get_counts("code") == {"total_documents": 1, "total_chunks": 7}
+    registry.close()
+
+    # 再起動後もカウンタが残る
+    reopened = SourceRegistry(str(tmp_path / "registry.sqlite3"))
+    assert reopened.has_counters("general")
+    assert reopened.get_counts("code") == {"total_documents": 1, "total_chunks": 7}
+
+
+def test_list_sources_pagination(tmp_path):
+    """カーソルによるソース一覧のページ分割のテスト"""
+    registry = SourceRegistry(str(tmp_path / "registry.sqlite3"))
+    registry.rebuild(
+        "general", [(f"https://example.com/{i:02d}", make_info(1)) for i in range(7)],
+        [(f"c{i}", f"https://example.com/{i:02d}", 0, "h") for i in range(7)], 7
+    )
+    registry.upsert_source("code", "https://code.example.com", make_info(3))
+    assert registry.get_counts("general") == {"total_documents": 7, "total_chunks": 7}
+
+    urls, cursor = [], None
+    while True:
+        page, cursor = registry.list_sources("general", cursor, limit=3)
+        urls.extend(source["url"] for source in page)
+        if cursor is None:
+            break
+    assert urls == [f"https://example.com/{i:02d}" for i in range(7)]
+
+    # カテゴリ指定なしでは (category, url) 順に全カテゴリを辿る
+    page, cursor = registry.list_sources(limit=1)
+    assert page[0]["category"] == "code"
+    page, cursor = registry.list_sources(cursor=cursor, limit=10)
+    assert [source["category"] for source in page] == ["general"] * 7
+    assert cursor is None
+
+
+
+def test_chunks_replaced_with_source_and_filters(tmp_path):
+    """チャンクの置き換え・再構築・URLと追加日時での絞り込みのテスト"""
+    path = str(tmp_path / "registry.sqlite3")
+    registry = SourceRegistry(path)
+    assert registry.conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+    registry.upsert_source(
+        "general", "https://a", make_info(3), chunks=[("a0", 0, "h0"), ("a1", 1, "h1"), ("a2", 2, "h2")]
+    )
+    # 再取り込みでチャンクが入れ替わる
+    registry.upsert_source("general", "https://a", make_info(2), chunks=[("a0", 0, "h0"), ("a3", 1, "h3")])
+    assert sorted(registry.get_chunk_ids("general", "https://a")) == ["a0", "a3"]
+    assert registry.get_counts("general")["total_chunks"] == 2
+
+    newer = {**make_info(1), "added_at": "2024-06-01T00:00:00"}
+    registry.upsert_source("general", "https://b", newer, chunks=[("b0", 0, "h")])
+    page, _ = registry.list_sources("general", added_after="2024-03-01")
+    assert [source["url"] for source in page] == ["https://b"]
+    page, _ = registry.list_sources(url="https://a")
+    assert page[0]["chunk_count"] == 2
+
+    registry.remove_source("general", "https://a")
+    assert registry.get_chunk_ids("general", "https://a") == []
+    registry.close()
+
+    # 再起動後もチャンクが残り、再構築でまとめて置き換えられる
+    reopened = SourceRegistry(path)
+    assert reopened.get_chunk_ids("general", "https://b") == ["b0"]
+    reopened.rebuild(
+        "general", [("https://c", make_info(2))], [("c0", "https://c", 0, "x"), ("c1", "https://c", 1, "y")], 2
+    )
+    assert reopened.get_chunk_ids("general", "https://b") == []
+    assert sorted(reopened.get_chunk_ids("general", "https://c")) == ["c0", "c1"]
+    assert reopened.get_counts("general") == {"total_documents": 1, "total_chunks": 2}
+
+
+if __name__ == "__main__":
+    pytest.main(["-v", "test_source_registry.py"])
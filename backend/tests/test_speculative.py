@@ -0,0 +1,83 @@
+import pytest
+
+from src.models.speculative import SpeculativeDecoder, next_draft_length
+
+
+def tiny_llama(seed, hidden_size=32, layers=2):
+    """CPUで動く小さなランダム初期化のLlama"""
+    torch = pytest.importorskip("torch")
+    transformers = pytest.importorskip("transformers")
+    torch.manual_seed(seed)
+    config = transformers.LlamaConfig(
+        vocab_size=96, hidden_size=hidden_size, intermediate_size=hidden_size * 2, num_hidden_layers=layers,
+        num_attention_heads=4, num_key_value_heads=2, max_position_embeddings=256,
+        pad_token_id=0, eos_token_id=None, bos_token_id=None
+    )
+    model = transformers.LlamaForCausalLM(config).eval()
+    model.generation_config.pad_token_id = 0
+    return model
+
+
+def reference_greedy(model, prompt_ids, max_new_tokens):
+    import torch
+    with torch.inference_mode():
+        output = model.generate(torch.tensor([prompt_ids]), max_new_tokens=max_new_tokens, do_sample=False)
+    return output[0, len(prompt_ids):].tolist()
+
+
+PROMPT = [5, 17, 33, 2, 9, 40, 41]
+
+
+def test_draft_length_adapts_to_acceptance():
+    """全て受け入れられたら提案数を増やし、外れたら減らすことのテスト"""
+    assert next_draft_length(4, accepted=4, proposed=4, maximum=8) == 6
+    assert next_draft_length(7, accepted=7, proposed=7, maximum=8) == 8
+    assert next_draft_length(4, accepted=2, proposed=4, maximum=8) == 3
+    assert next_draft_length(1, accepted=0, proposed=1, maximum=8) == 1
+
+
+def test_greedy_output_matches_target_model():
+    """ドラフトが外れても、貪欲法の出力が対象モデルだけの場合と同じになることのテスト"""
+    target = tiny_llama(0, hidden_size=64)
+    draft = tiny_llama(1)
+    decoder = SpeculativeDecoder(target, draft, num_draft_tokens=3)
+
+    output = decoder.generate(PROMPT, max_new_tokens=20, temperature=0.0)
+    assert output.token_ids == reference_greedy(target, PROMPT, 20)
+    assert output.finish_reason == "length"
+    assert output.steps <= 20
+    assert 0.0 <= output.acceptance_rate <= 1.0
+
+
+def test_identical_draft_accepts_everything():
+    """対象モデルと同じドラフトでは提案が全て受け入れられ、検証の回数が減ることのテスト"""
+    target = tiny_llama(0)
+    decoder = SpeculativeDecoder(target, target, num_draft_tokens=4, adaptive=False)
+
+    output = decoder.generate(PROMPT, max_new_tokens=21, temperature=0.0)
+    assert output.token_ids == reference_greedy(target, PROMPT, 21)
+    assert output.acceptance_rate == 1.0
+    assert output.steps == 5  # 1回の検証で提案4＋対象モデルの1トークン
+
+    metrics = decoder.get_metrics()
+    assert metrics["requests"] == 1
+    assert metrics["tokens_per_step"] == pytest.approx(21 / 5)
+
+
+def test_sampling_and_stop_callback():
+    """サンプリングでも生成でき、停止の判定で途中で止まることのテスト"""
+    target = tiny_llama(0)
+    decoder = SpeculativeDecoder(target, tiny_llama(1), num_draft_tokens=4)
+    seen = []
+
+    output = decoder.generate(
+        PROMPT, max_new_tokens=30, temperature=0.8, top_p=0.9,
+        should_stop=lambda token: len(seen) >= 7, on_token=seen.append
+    )
+    assert output.finish_reason == "stop"
+    assert output.token_ids == seen
+    assert len(seen) == 7
+
+
+if __name__ == "__main__":
+    pytest.main(["-v", "test_speculative.py"])
@@ -0,0 +1,31 @@
+import pytest
+
+from src.utils.text_utils import content_hash, make_chunk_id, source_fingerprint
+
+
+def test_content_hash_ignores_whitespace_differences():
+    """空白や全角/半角の違いを無視してハッシュが一致することのテスト"""
+    assert content_hash("Python  は\nプログラミング言語") == content_hash("Python は プログラミング言語")
+    assert content_hash("ＡＢＣ") == content_hash("ABC")
+    assert content_hash("Python") != content_hash("Java")
+
+
+def test_chunk_ids_are_deterministic():
+    """同じ入力から常に同じチャンクIDが生成されることのテスト"""
+    url = "https://ja.wikipedia.org/wiki/Python"
+    h = content_hash("チャンク本文")
+    assert make_chunk_id(url, 0, h) == make_chunk_id(url, 0, h)
+    assert make_chunk_id(url, 0, h) != make_chunk_id(url, 1, h)
+    assert make_chunk_id(url, 0, h) != make_chunk_id(url + "?x", 0, h)
+
+
+def test_source_fingerprint_detects_changes():
+    """チャンクの変更・並び替えで指紋が変わることのテスト"""
+    hashes = [content_hash(t) for t in ["a", "b", "c"]]
+    assert source_fingerprint(hashes) == source_fingerprint(list(hashes))
+    assert source_fingerprint(hashes) != source_fingerprint(hashes[::-1])
+    assert source_fingerprint(hashes) != source_fingerprint(hashes[:2])
+
+
+if __name__ == "__main__":
+    pytest.main(["-v", "test_text_utils.py"])
@@ -0,0 +1,268 @@
+import pytest
+import concurrent.futures
+from typing import List
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from src.models import ann_index
+from src.models.numpy_vector_store import NumpyVectorStore
+
+WORDS = ["python", "java", "rust", "薬", "症状", "治療"]
+
+
+class BagOfWordsEmbeddings(Embeddings):
+    """単語の出現でベクトルを作るテスト用の埋め込み"""
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return [float(text.count(word)) + 0.01 for word in WORDS]
+
+
+class FixedEmbeddings(BagOfWordsEmbeddings):
+    """テキスト（行番号の文字列）に対応するベクトルを返すテスト用の埋め込み"""
+
+    def __init__(self, vectors: np.ndarray):
+        self.vectors = vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self.vectors[int(text)].tolist() for text in texts]
+
+
+def make_store(path, **options):
+    return NumpyVectorStore(str(path), BagOfWordsEmbeddings(), initial_capacity=2, **options)
+
+
+def test_add_search_and_reopen(tmp_path):
+    """追加・検索・再オープン後の検索のテスト"""
+    store = make_store(tmp_path)
+    store.add_texts(
+        ["python python", "java", "薬 症状", "rust"],
+        [{"source": "a"}, {"source": "b"}, {"source": "c"}, {"source": "d"}],
+        ["1", "2", "3", "4"]
+    )
+    assert store.count() == 4
+
+    hits = store.similarity_search("python", k=2)
+    assert hits[0].id == "1"
+    assert hits[0].metadata == {"source": "a"}
+    assert 0.5 < hits[0].score <= 1.0
+    store.close()
+
+    reopened = make_store(tmp_path)
+    assert reopened.count() == 4
+    assert reopened.similarity_search("症状", k=1)[0].content == "薬 症状"
+
+
+def test_upsert_delete_and_get(tmp_path):
+    """上書き・削除・source条件での取得のテスト"""
+    store = make_store(tmp_path, dtype="float16", search_block_size=2)
+    store.add_texts(["python", "java", "rust"], [{"source": "x"}, {"source": "x"}, {"source": "y"}], ["1", "2", "3"])
+    store.add_texts(["治療"], [{"source": "x"}], ["1"])
+    assert store.count() == 3
+    assert store.get(ids=["1"])["documents"] == ["治療"]
+
+    store.delete(["2"])
+    assert store.count() == 2
+    assert sorted(store.get(where={"source": "x"})["ids"]) == ["1"]
+    assert all(hit.id != "2" for hit in store.similarity_search("java", k=3))
+
+    store.update_metadatas(["3"], [{"source": "z", "title": "Rust"}])
+    assert store.get(where={"source": "z"}, include=["metadatas"])["metadatas"] == [{"source": "z", "title": "Rust"}]
+
+
+def test_deleted_rows_are_reused(tmp_path):
+    """削除した行が次の追加で再利用され、行列が生きている件数以上に増えないことのテスト"""
+    store = make_store(tmp_path, quantization="int8")
+    store.add_texts(["python", "java", "rust", "薬"], [{"source": "a"}] * 4, ["1", "2", "3", "4"])
+    capacity = store._capacity
+
+    # 再取り込みで内容が変わったチャンクは新しいIDで追加され、古いIDは削除される
+    for generation in range(5):
+        store.delete(["2", "3"] if generation == 0 else [f"2-{generation - 1}", f"3-{generation - 1}"])
+        store.add_texts(["症状", "治療"], [{"source": "a"}] * 2, [f"2-{generation}", f"3-{generation}"])
+    assert store.count() == 4
+    assert store._size == 4
+    assert store._capacity == capacity
+    assert store.similarity_search("治療", k=1)[0].id == "3-4"
+    store.close()
+
+    reopened = make_store(tmp_path, quantization="int8")
+    reopened.delete(["1"])
+    reopened.add_texts(["java"], [{"source": "b"}], ["5"])
+    assert reopened._size == 4
+    assert reopened.similarity_search("java", k=1)[0].id == "5"
+    assert reopened.similarity_search("python", k=4)[0].id != "1"
+
+
+def test_search_does_not_wait_for_writes(tmp_path):
+    """検索が書き込みのロックを待たず、取り出した後に行列が差し替えられても走査できることのテスト"""
+    store = make_store(tmp_path, quantization="int8")
+    store.add_texts(["python", "java"], [{}, {}], ["1", "2"])
+    view = store._view
+
+    # 書き込みがロックを持っている間も検索は終わる
+    with store._lock, concurrent.futures.ThreadPoolExecutor(1) as executor:
+        hits = executor.submit(store.similarity_search, "java", 1).result(timeout=5)
+    assert hits[0].id == "2"
+
+    # 拡張と量子化の学習し直しの後も、先に取り出した状態の配列はそのまま読める
+    store.add_texts(["rust", "薬", "症状"], [{}] * 3, ["3", "4", "5"])
+    store.refit_quantizer()
+    assert store._view.vectors is not view.vectors and store._view.codes is not view.codes
+    query = store._normalize(np.asarray([store.embedding_function.embed_query("java")], dtype=np.float32))[0]
+    assert store._top_rows(query, 1, view)[0][0] == 1
+    assert len(store._top_rows(query, 5, view)) == 2
+    assert store.similarity_search("症状", k=1)[0].id == "5"
+
+
+def test_add_precomputed_embeddings(tmp_path):
+    """埋め込み済みのベクトルを渡した場合は再計算せずにそのまま使うことのテスト"""
+    class CountingEmbeddings(BagOfWordsEmbeddings):
+        calls = 0
+
+        def embed_documents(self, texts):
+            CountingEmbeddings.calls += 1
+            return super().embed_documents(texts)
+
+    embeddings = CountingEmbeddings()
+    store = NumpyVectorStore(str(tmp_path), embeddings, initial_capacity=2)
+    texts = ["python", "rust rust"]
+    store.add_texts(texts, [{}, {}], ["1", "2"], embeddings=embeddings.embed_documents(texts))
+    assert CountingEmbeddings.calls == 1
+    assert store.similarity_search("rust", k=1)[0].id == "2"
+
+
+def test_search_matches_brute_force(tmp_path):
+    """ブロック分割検索が全件の厳密検索と一致することのテスト"""
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((50, len(WORDS)))
+
+    store = NumpyVectorStore(str(tmp_path), FixedEmbeddings(vectors), search_block_size=7)
+    store.add_texts([str(i) for i in range(50)], [{}] * 50, [str(i) for i in range(50)])
+
+    query = rng.standard_normal(len(WORDS))
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    expected = np.argsort(-(normalized @ (query / np.linalg.norm(query))))[:5]
+    assert [hit.id for hit in store.similarity_search_by_vector(query, k=5)] == [str(i) for i in expected]
+
+
+@pytest.mark.parametrize("quantization", ["int8", "binary"])
+def test_quantized_search_rescoring(tmp_path, quantization):
+    """量子化コードで候補を選び、完全精度で再スコアした結果のテスト"""
+    rng = np.random.default_rng(1)
+    centers = rng.standard_normal((10, 64))
+    vectors = np.repeat(centers, 30, axis=0) + 0.3 * rng.standard_normal((300, 64))
+
+    store = NumpyVectorStore(
+        str(tmp_path), FixedEmbeddings(vectors), quantization=quantization, oversample=10, search_block_size=64
+    )
+    for start in range(0, 300, 50):
+        ids = [str(i) for i in range(start, start + 50)]
+        store.add_texts(ids, [{}] * len(ids), ids)
+
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    recall = []
+    for query in vectors[::37]:
+        exact = np.argsort(-(normalized @ (query / np.linalg.norm(query))))[:5]
+        found = [int(hit.id) for hit in store.similarity_search_by_vector(query, k=5)]
+        recall.append(len(set(found) & set(exact)) / 5)
+        # 再スコア後の関連度は完全精度のコサインから計算される
+        assert found[0] == exact[0]
+    assert np.mean(recall) >= 0.8
+
+    # 再オープン後もコードが使われる
+    store.close()
+    reopened = NumpyVectorStore(str(tmp_path), FixedEmbeddings(vectors), quantization=quantization)
+    assert reopened.similarity_search_by_vector(vectors[0], k=1)[0].id == "0"
+
+
+
+def test_ivf_index_incremental_and_reopen(tmp_path):
+    """IVFインデックスの学習・追加・削除・再オープンのテスト"""
+    rng = np.random.default_rng(2)
+    centers = rng.standard_normal((20, 32))
+    vectors = np.repeat(centers, 40, axis=0) + 0.2 * rng.standard_normal((800, 32))
+
+    def open_store():
+        return NumpyVectorStore(
+            str(tmp_path), FixedEmbeddings(vectors), index="ivf", nlist=20, nprobe=3, ivf_min_train_rows=400
+        )
+
+    store = open_store()
+    store.add_texts([str(i) for i in range(0, 800, 2)], [{}] * 400, [str(i) for i in range(0, 800, 2)])
+    # 学習はバックグラウンドで行われる
+    store.wait_for_index_build()
+    assert store.index.trained
+    # 学習後の追加は最も近いリストに入る
+    store.add_texts([str(i) for i in range(1, 800, 2)], [{}] * 400, [str(i) for i in range(1, 800, 2)])
+
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    recall = []
+    for query in vectors[::41]:
+        exact = np.argsort(-(normalized @ (query / np.linalg.norm(query))))[:10]
+        found = [int(hit.id) for hit in store.similarity_search_by_vector(query, k=10)]
+        recall.append(len(set(found) & set(exact)) / 10)
+    assert np.mean(recall) >= 0.9
+
+    store.delete(["1"])
+    assert all(hit.id != "1" for hit in store.similarity_search_by_vector(vectors[1], k=5))
+    store.close()
+
+    reopened = open_store()
+    assert reopened.index.trained
+    assert reopened.similarity_search_by_vector(vectors[3], k=1)[0].id == "3"
+    # 全リストを走査すれば総当たりと一致する
+    reopened.index.nprobe = 20
+    query = vectors[5]
+    exact = np.argsort(-(normalized @ (query / np.linalg.norm(query))))[:6]
+    exact = [str(i) for i in exact if i != 1][:5]
+    assert [hit.id for hit in reopened.similarity_search_by_vector(query, k=5)] == exact
+
+
+def test_ivf_builds_off_the_write_path_and_retrains(tmp_path, monkeypatch):
+    """IVFの学習が書き込みを止めずに行われ、学習中の追加も割り当てられ、件数が増えると学習し直すことのテスト"""
+    rng = np.random.default_rng(3)
+    centers = rng.standard_normal((10, 16))
+    vectors = np.repeat(centers, 40, axis=0) + 0.1 * rng.standard_normal((400, 16))
+
+    def open_store():
+        return NumpyVectorStore(
+            str(tmp_path), FixedEmbeddings(vectors), index="ivf", nprobe=100, ivf_min_train_rows=100
+        )
+
+    # 学習の途中で別のスレッドから追加する（学習がストアのロックを持っていると終わらない）
+    store = open_store()
+    kmeans = ann_index.spherical_kmeans
+    def kmeans_with_concurrent_add(*args, **kwargs):
+        if store.count() == 100:
+            with concurrent.futures.ThreadPoolExecutor(1) as executor:
+                executor.submit(store.add_texts, ["100", "101"], [{}, {}], ["100", "101"]).result(timeout=5)
+        return kmeans(*args, **kwargs)
+    monkeypatch.setattr(ann_index, "spherical_kmeans", kmeans_with_concurrent_add)
+
+    ids = [str(i) for i in range(100)]
+    store.add_texts(ids, [{}] * 100, ids)
+    store.wait_for_index_build()
+    first_index = store.index
+    assert first_index.trained and len(first_index.centroids) == 40  # 4√100
+    assert store.similarity_search_by_vector(vectors[101], k=1)[0].id == "101"
+
+    # 学習時の4倍まで増えたら学習し直した新しいインデックスに差し替わる
+    ids = [str(i) for i in range(102, 400)]
+    store.add_texts(ids, [{}] * len(ids), ids)
+    store.wait_for_index_build()
+    assert store.index is not first_index
+    assert len(store.index.centroids) == 80  # 4√400
+    assert store.similarity_search_by_vector(vectors[399], k=1)[0].id == "399"
+    store.close()
+
+    reopened = open_store()
+    assert len(reopened.index.centroids) == 80
+    assert reopened.similarity_search_by_vector(vectors[250], k=1)[0].id == "250"
+    assert not reopened._index_build_due()
+
+
+if __name__ == "__main__":
+    pytest.main(["-v", "test_vector_store.py"])
@@ -28,7 +28,10 @@ export interface StatsResponse {
     title: string;
     chunk_count: number;
     added_at: string;
+    category?: string;
   }>;
+  categories?: Record<string, { total_documents: number; total_chunks: number }>;
+  next_cursor?: string | null;
 }
 
 export interface HealthResponse {
@@ -39,7 +42,25 @@ export interface HealthResponse {
 export interface AddDocumentResponse {
   status: string;
   message: string;
+  job_id: string;
   url: string;
+  category: string;
+}
+
+export interface IngestionJob {
+  id: string;
+  url: string;
+  category: string;
+  status: 'queued' | 'running' | 'succeeded' | 'failed';
+  stage: 'fetch' | 'parse' | 'embed' | 'store' | null;
+  progress: number;
+  attempts: number;
+  max_attempts: number;
+  created_at: string;
+  started_at: string | null;
+  finished_at: string | null;
+  error: string | null;
+  result: { chunks: number; new: number; unchanged: number; removed: number } | null;
 }
 
 // リクエスト型の定義
@@ -66,6 +87,59 @@ export const search = (request: SearchRequest): Promise<AxiosResponse<SearchResp
     });
 };
 
+// ストリーミング検索（Server-Sent Events）のイベント
+export interface SearchStreamHandlers {
+  onSources?: (sources: SearchResponse['sources']) => void;
+  onToken?: (text: string) => void;
+  onDone?: (data: {
+    answer: string;
+    cached?: boolean;
+    timings: Record<string, number>;
+    stop_reason?: string;
+    generated_tokens?: number;
+  }) => void;
+  onError?: (detail: string) => void;
+}
+
+// 検索結果を先に受け取り、回答をトークンごとに受け取る（signalで中断すると生成も止まる）
+export const searchStream = async (
+  request: SearchRequest & { k?: number; model?: string },
+  handlers: SearchStreamHandlers,
+  signal?: AbortSignal
+): Promise<void> => {
+  const response = await fetch(`${API_CONFIG.BASE_URL}/search/stream`, {
+    method: 'POST',
+    headers: API_CONFIG.DEFAULT_HEADERS,
+    body: JSON.stringify(request),
+    signal,
+  });
+  if (!response.ok || !response.body) {
+    const error = await response.json().catch(() => ({ detail: response.statusText }));
+    throw new Error(error.detail || 'An unexpected error occurred');
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  for (;;) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    let boundary;
+    while ((boundary = buffer.indexOf('\n\n')) >= 0) {
+      const block = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      const event = block.match(/^event: (.*)$/m)?.[1];
+      const data = JSON.parse(block.match(/^data: (.*)$/m)?.[1] ?? '{}');
+      if (event === 'sources') handlers.onSources?.(data.sources);
+      else if (event === 'token') handlers.onToken?.(data.text);
+      else if (event === 'done') handlers.onDone?.(data);
+      else if (event === 'error') handlers.onError?.(data.detail);
+    }
+  }
+};
+
 // モデル切り替え用の新しい関数
 export const switchModel = (model_type: string) => 
   apiClient.post('/model/switch', { model_type });
@@ -73,6 +147,9 @@ export const switchModel = (model_type: string) =>
 export const addDocument = (request: AddDocumentRequest): Promise<AxiosResponse<AddDocumentResponse>> => 
   apiClient.post<AddDocumentResponse>('/documents/add', request);
 
+export const getJob = (jobId: string): Promise<AxiosResponse<IngestionJob>> => 
+  apiClient.get<IngestionJob>(`/jobs/${jobId}`);
+
 export const getStats = (): Promise<AxiosResponse<StatsResponse>> => 
   apiClient.get<StatsResponse>('/stats');
 